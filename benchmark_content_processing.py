@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Benchmark Content Processing
+----------------------------
+Measures block detection and processing throughput of the content
+processor registry on large synthetic Markdown documents.
+
+With --adversarial, block detection is timed on pathological inputs
+(unclosed delimiters, long lines of almost-matches) that take quadratic
+time with backtracking patterns. Detection time must stay linear in the
+document size for all of them.
+"""
+
+import time
+import argparse
+from logging_config import get_logger
+from content_processors import registry
+
+logger = get_logger()
+
+SAMPLE_SECTION = """
+## Section {index}
+
+Some text with inline math $a_{index} + b^2$ and a price of $5 and $6 in prose.
+More text with an image ![Figure {index}](images/figure_{index}.png "Figure") here.
+
+| Column A | Column B | Column C |
+|----------|----------|----------|
+| {index}  | value    | $x$      |
+| more     | rows     | here     |
+
+```python
+def function_{index}(x):
+    # A dollar sign in code: $HOME
+    return x * {index}
+```
+
+```mermaid
+graph TD;
+    A{index}-->B{index};
+```
+
+$$
+\\int_0^{index} x^2 \\, dx
+$$
+
+<video src="clip_{index}.mp4" controls></video>
+
+```plotly
+{{"data": [{{"x": [1, 2, 3], "y": [{index}, 2, 3], "type": "scatter"}}]}}
+```
+
+Plain paragraph text that no processor cares about, repeated to make the
+document look like real prose with long stretches of ordinary words.
+"""
+
+# Pathological inputs: each builder repeats an almost-matching construct up to the given length
+ADVERSARIAL_CASES = {
+    'unclosed_video': lambda size: ("<video src=a>\n" * (size // 14))[:size],
+    'unclosed_svg': lambda size: ("text <svg x\n" * (size // 12))[:size],
+    'unclosed_display_math': lambda size: ("$$ a\n\n" * (size // 6))[:size],
+    'dollars_one_line': lambda size: ("$5 and $$ and $" * (size // 15))[:size],
+    'img_tag_without_end': lambda size: ("<img a " * (size // 7))[:size],
+    'img_src_without_quote': lambda size: ('<img src="a ' * (size // 12))[:size],
+    'image_one_line': lambda size: ("![a](b " * (size // 7))[:size],
+    'image_title_quotes': lambda size: ('![a](b "c" ' * (size // 11))[:size],
+    'unclosed_fences': lambda size: ("```js\n" * (size // 6))[:size],
+    'inline_backticks': lambda size: ("see ```js``` here\n" * (size // 18))[:size],
+    'table_pipes_long_line': lambda size: (("|" + "a|" * 2000 + "x\n") * (size // 4003))[:size],
+    'table_header_only': lambda size: ("| a | b |\n" * (size // 10))[:size],
+    'closed_fences': lambda size: ("```\n" * (size // 4))[:size],
+    'code_dense': lambda size: (("Some prose about the code below.\n\n```python\nx = 1\n```\n\n" * (size // 55))
+                                [:size - 4] + "\n$a$"),
+}
+
+
+def build_document(size_mb: float) -> str:
+    """
+    Build a synthetic document of roughly the given size
+    
+    Args:
+        size_mb: Target size in megabytes
+    
+    Returns:
+        Markdown content
+    """
+    target = int(size_mb * 1024 * 1024)
+    sections = []
+    length = 0
+    index = 0
+    while length < target:
+        section = SAMPLE_SECTION.format(index=index)
+        sections.append(section)
+        length += len(section)
+        index += 1
+    return ''.join(sections)
+
+
+def time_call(func, repeat: int) -> float:
+    """Return the best wall-clock time of several runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_adversarial(processors, size_mb: float, repeat: int) -> None:
+    """
+    Time block detection on every pathological input
+    
+    Args:
+        processors: Processors to scan with
+        size_mb: Size of each input in megabytes
+        repeat: Number of runs per input
+    """
+    size = int(size_mb * 1024 * 1024)
+    for name, build in ADVERSARIAL_CASES.items():
+        content = build(size)
+        elapsed = time_call(lambda: registry.scan_content(content, processors), repeat)
+        mb = len(content) / (1024 * 1024)
+        print(f"{name:24s} {elapsed:.2f} s ({elapsed / mb:.2f} s/MB)")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Benchmark content processing')
+    parser.add_argument('--size-mb', type=float, default=10.0, help='Document size in MB (default: 10)')
+    parser.add_argument('--format', choices=['preview', 'pdf', 'html', 'docx', 'epub'], default='html',
+                        help='Format for the full processing run (default: html)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per measurement (default: 3)')
+    parser.add_argument('--skip-processing', action='store_true', help='Only measure block detection')
+    parser.add_argument('--adversarial', action='store_true',
+                        help='Measure block detection on pathological inputs of --size-mb each')
+    args = parser.parse_args()
+    
+    if args.adversarial:
+        benchmark_adversarial(registry.get_all_processors(), args.size_mb, args.repeat)
+        return
+    
+    content = build_document(args.size_mb)
+    size_mb = len(content) / (1024 * 1024)
+    processors = registry.get_all_processors()
+    print(f"Document: {size_mb:.1f} MB, {len(processors)} processors")
+    
+    # Every processor scanning the whole document on its own
+    def detect_separately():
+        return [processor.detect(content) for processor in processors]
+    
+    separate = time_call(detect_separately, args.repeat)
+    print(f"Per-processor detect(): {separate:.2f} s ({size_mb / separate:.1f} MB/s)")
+    
+    # One pass for all processors
+    blocks = registry.scan_content(content, processors)
+    unified = time_call(lambda: registry.scan_content(content, processors), args.repeat)
+    print(f"Unified scan:           {unified:.2f} s ({size_mb / unified:.1f} MB/s), {len(blocks)} blocks")
+    
+    if not args.skip_processing:
+        processed = time_call(lambda: registry.process_content(content, args.format), 1)
+        print(f"process_content({args.format}): {processed:.2f} s ({size_mb / processed:.1f} MB/s)")
+
+        # Unchanged blocks come from the block cache on the next run
+        cached = time_call(lambda: registry.process_content(content, args.format), args.repeat)
+        print(f"process_content({args.format}), cached: {cached:.2f} s ({size_mb / cached:.1f} MB/s)")
+        print(f"Block cache: {registry.get_cache_stats()}")
+
+
+if __name__ == '__main__':
+    main()
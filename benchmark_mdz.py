@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Benchmark MDZ Saving
+--------------------
+Measures the time and peak Python memory of saving a .mdz bundle with the
+streaming writer, compared with the previous approach of writing the
+content to a temporary directory, building the tar archive in memory and
+compressing it in one call.
+
+Bundles are built from a synthetic document plus random (incompressible)
+binary assets, so the result reflects documents with embedded images.
+
+With --resave, the bundle is saved once and then saved again after a
+one-line text edit, which only appends the changed file and a new index.
+
+With --dictionary, the text entries of sample bundles are compressed with
+and without the shipped text dictionary instead, and the ratio and speed
+of both are reported. By default the samples are bundles built from
+documents the dictionary was not trained on (DICTIONARY_HOLDOUT); bundles
+from the training corpus, such as those in mdz_validation_results, only
+give an upper bound.
+"""
+
+import os
+import io
+import time
+import shutil
+import tarfile
+import tempfile
+import argparse
+import tracemalloc
+import zstandard as zstd
+from mdz_bundle import MDZBundle
+from mdz_container import TEXT_EXTENSIONS
+from mdz_dictionary import default_dictionary
+from unified_mdz import UnifiedMDZ
+from benchmark_content_processing import build_document
+
+# Documents held out of the training of the shipped dictionary, which used the bundles in
+# mdz_validation_results and output/, test_files/, the sample and test documents and the MDZ guides
+DICTIONARY_HOLDOUT = ['INTEGRATION_GUIDE.md', 'MDZ_EDITOR_INTEGRATION.md', 'MDZ_INTEGRATION_TESTING.md', 'TESTING.md',
+                      'README_TESTING.md', 'comprehensive_test_plan.md', 'implementation_plan.md',
+                      'pagination_implementation_guide.md', 'test_page_rendering.md', 'test_report.md']
+
+
+def build_bundle(size_mb: float, assets: int, document_mb: float = None) -> MDZBundle:
+    """
+    Build a bundle of roughly the given size
+
+    Args:
+        size_mb: Target size in megabytes, split between the document and the assets
+        assets: Number of binary assets
+        document_mb: Size of the document (default: half the bundle, or all of it without assets)
+
+    Returns:
+        MDZBundle instance
+    """
+    bundle = MDZBundle()
+    if document_mb is None:
+        document_mb = size_mb / 2 if assets else size_mb
+    bundle.create_from_markdown(build_document(document_mb))
+
+    if assets:
+        asset_size = int((size_mb - document_mb) * 1024 * 1024 / assets)
+        bundle.content["images/"] = {}
+        for index in range(assets):
+            bundle.content[f"images/asset_{index}.bin"] = os.urandom(asset_size)
+    return bundle
+
+
+def legacy_save(bundle: MDZBundle, output_path: str) -> None:
+    """Save the way bundles were saved before the streaming writer"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for path, content in bundle.content.items():
+            full_path = os.path.join(temp_dir, path)
+            if isinstance(content, dict):
+                os.makedirs(full_path, exist_ok=True)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                mode = 'wb' if isinstance(content, bytes) else 'w'
+                with open(full_path, mode) as f:
+                    f.write(content)
+
+        tar_data = io.BytesIO()
+        with tarfile.open(fileobj=tar_data, mode='w') as tar:
+            for root, dirs, files in os.walk(temp_dir):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    tar.add(file_path, arcname=os.path.relpath(file_path, temp_dir))
+
+        compressor = zstd.ZstdCompressor(level=bundle.compression_level)
+        with open(output_path, 'wb') as f:
+            f.write(compressor.compress(tar_data.getvalue()))
+
+
+def measure(func, repeat: int):
+    """Return the best wall-clock time of several runs and the peak traced memory of one"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def load_text_entries(paths) -> list:
+    """Read the text entries of sample bundles, Markdown documents are bundled first"""
+    entries = []
+    for path in paths:
+        bundle = UnifiedMDZ()
+        if path.endswith('.md'):
+            with open(path, 'r', encoding='utf-8') as f:
+                bundle.create_from_markdown(f.read(), {"title": os.path.splitext(os.path.basename(path))[0]})
+        else:
+            bundle.load(path)
+        for name in bundle.get_file_list():
+            content = bundle.content[name]
+            if name.endswith(TEXT_EXTENSIONS) and content:
+                entries.append(content.encode('utf-8') if isinstance(content, str) else content)
+        bundle.cleanup()
+    return entries
+
+
+def benchmark_dictionary(paths, levels, repeat: int) -> None:
+    """Compare compressing text entries one by one with and without the text dictionary"""
+    dictionary = default_dictionary()
+    if dictionary is None:
+        print("The text dictionary is not installed")
+        return
+    entries = load_text_entries(paths)
+    size = sum(len(entry) for entry in entries)
+    print(f"Text entries: {len(entries)} from {len(paths)} samples, {size / 1024:.1f} KB, "
+          f"dictionary {dictionary.dict_id()} ({len(dictionary) / 1024:.0f} KB)")
+
+    for level in levels:
+        for name, dict_data in (('no dictionary', None), ('dictionary', dictionary)):
+            compressor = zstd.ZstdCompressor(level=level, dict_data=dict_data)
+            decompressor = zstd.ZstdDecompressor(dict_data=dict_data)
+            frames = [compressor.compress(entry) for entry in entries]
+            compress_time, _ = measure(lambda: [compressor.compress(entry) for entry in entries], repeat)
+            decompress_time, _ = measure(lambda: [decompressor.decompress(frame) for frame in frames], repeat)
+            compressed = sum(len(frame) for frame in frames)
+            print(f"Level {level:2d}, {name:13s} {compressed / 1024:7.1f} KB (ratio {size / compressed:.2f}x), "
+                  f"compress {size / compress_time / (1024 * 1024):6.1f} MB/s, "
+                  f"decompress {size / decompress_time / (1024 * 1024):6.1f} MB/s")
+
+
+def benchmark_resave(bundle: MDZBundle, output_path: str, size_mb: float) -> None:
+    """Compare the first save of a bundle with saving it again after a text edit"""
+    start = time.perf_counter()
+    bundle.save(output_path)
+    full = time.perf_counter() - start
+    print(f"{'First save':26s} {full:.3f} s ({size_mb / full:.1f} MB/s)")
+
+    for attempt in range(3):
+        bundle.content["index.md"] = bundle.content["index.md"] + f"\nEdit {attempt}\n"
+        start = time.perf_counter()
+        bundle.save(output_path)
+        elapsed = time.perf_counter() - start
+        print(f"{'Save after a text edit':26s} {elapsed * 1000:.1f} ms, "
+              f"{os.path.getsize(output_path) / (1024 * 1024):.1f} MB on disk")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Benchmark MDZ saving')
+    parser.add_argument('--size-mb', type=float, default=50.0, help='Bundle size in MB (default: 50)')
+    parser.add_argument('--assets', type=int, default=20, help='Number of binary assets (default: 20)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per measurement (default: 3)')
+    parser.add_argument('--resave', action='store_true', help='Benchmark saving again after a text edit')
+    parser.add_argument('--dictionary', nargs='*', metavar='BUNDLE',
+                        help='Benchmark the text dictionary on sample bundles or Markdown documents '
+                             '(default: documents held out of its training)')
+    parser.add_argument('--levels', type=int, nargs='+', default=[3, 5],
+                        help='Compression levels for --dictionary (default: 3 5)')
+    args = parser.parse_args()
+
+    if args.dictionary is not None:
+        benchmark_dictionary(args.dictionary or [path for path in DICTIONARY_HOLDOUT if os.path.exists(path)],
+                             args.levels, args.repeat)
+        return
+
+    # Documents with large assets are what resaving is for
+    bundle = build_bundle(args.size_mb, args.assets, 1.0 if args.resave and args.assets else None)
+    size_mb = sum(len(value) for value in bundle.content.values() if not isinstance(value, dict)) / (1024 * 1024)
+    print(f"Bundle: {size_mb:.1f} MB in {len(bundle.content)} entries")
+
+    output_dir = tempfile.mkdtemp(prefix="mdz_benchmark_")
+    try:
+        output_path = os.path.join(output_dir, "bundle.mdz")
+        if args.resave:
+            benchmark_resave(bundle, output_path, size_mb)
+            return
+        for name, save in (('Temp dir + in-memory tar', legacy_save), ('Streaming writer', MDZBundle.save)):
+            elapsed, peak = measure(lambda: save(bundle, output_path), args.repeat)
+            print(f"{name:26s} {elapsed:.2f} s ({size_mb / elapsed:.1f} MB/s), "
+                  f"peak memory {peak / (1024 * 1024):.1f} MB, {os.path.getsize(output_path) / (1024 * 1024):.1f} MB on disk")
+    finally:
+        shutil.rmtree(output_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,11 @@ Integration of the content processing system with the main application.
 """
 
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, List, Optional
 from logging_config import get_logger
 from content_processors import registry
 from plugin_system import PluginSystem
+from render_utils import RenderUtils
 
 logger = get_logger()
 
@@ -67,6 +68,39 @@ class ContentProcessingIntegration:
         logger.debug(f"Processing content for export: {format_type}")
         return registry.process_content(content, format_type)
     
+    def export_stream(self, chunks: Iterable[str], format_type: str, output_path: str,
+                      pandoc_args: Optional[List[str]] = None, pandoc_path: str = 'pandoc',
+                      timeout: int = 600) -> bool:
+        """
+        Process a document as a stream and pipe the result into pandoc
+        
+        The document is never held in memory as a whole: processed segments
+        are written to pandoc's stdin as soon as they are ready.
+        
+        Args:
+            chunks: The content in chunks of any size, e.g. an open file
+            format_type: Export format type (pdf, html, docx, etc.)
+            output_path: File pandoc writes
+            pandoc_args: Additional pandoc arguments (template, engine, ...), these
+                override the ones the processors need (e.g. --highlight-style)
+            pandoc_path: Pandoc executable
+            timeout: Seconds the export may take
+        
+        Returns:
+            True if pandoc succeeded, False otherwise
+        """
+        logger.debug(f"Streaming content to pandoc for export: {format_type}")
+        command = [pandoc_path, '--from', 'markdown', '--output', output_path]
+        command += registry.get_pandoc_args() + list(pandoc_args or [])
+        stdout, stderr, error, returncode = RenderUtils.run_process_with_input_stream(
+            command, registry.process_stream(chunks, format_type), timeout=timeout
+        )
+        
+        if error or returncode != 0:
+            logger.error(f"Pandoc export failed: {error or stderr}")
+            return False
+        return True
+    
     def get_required_scripts(self) -> str:
         """
         Get all required JavaScript scripts
@@ -6,7 +6,7 @@ Package for content processors in the Markdown to PDF converter.
 """
 
 from content_processors.processor_registry import ProcessorRegistry
-from content_processors.base_processor import ContentProcessor
+from content_processors.base_processor import ContentProcessor, CostClass
 from content_processors.mermaid_processor import MermaidContentProcessor
 from content_processors.math_processor import MathContentProcessor
 from content_processors.image_processor import ImageContentProcessor
@@ -26,4 +26,4 @@ registry.register_processor(MediaContentProcessor, priority=50)
 registry.register_processor(VisualizationProcessor, priority=60)
 
 # Export the registry
-__all__ = ['registry', 'ContentProcessor', 'ProcessorRegistry']
+__all__ = ['registry', 'ContentProcessor', 'CostClass', 'ProcessorRegistry']
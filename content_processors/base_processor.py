@@ -5,12 +5,27 @@ Content Processor Base Class
 Base class for all content processors in the Markdown to PDF converter.
 """
 
+import re
+import json
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Tuple, Union
 from logging_config import get_logger
+from content_processors.block_lexer import LexMatch, PatternRule, Rule, scan_blocks
 
 logger = get_logger()
 
+class CostClass:
+    """How expensive processing a block is, which decides where the registry runs it"""
+    
+    # Fast Python code, processed inline
+    CHEAP = 'cheap'
+    
+    # Long-running Python code, processed in a worker process
+    HEAVY_CPU = 'heavy_cpu'
+    
+    # Waits on an external program, processed in a bounded thread pool
+    SUBPROCESS = 'subprocess'
+
 class ContentProcessor(ABC):
     """Base class for all content processors"""
     
@@ -18,12 +33,33 @@ class ContentProcessor(ABC):
         """
         Initialize the content processor
         
+        Processors are long-lived: the registry creates one instance per
+        class and reuses it for every document. Construction must therefore
+        be cheap, with external tools probed lazily on first use.
+        
         Args:
             config: Optional configuration dictionary
         """
-        self.config = config or {}
         self.name = self.__class__.__name__
         logger.debug(f"Initializing {self.name}")
+        self.configure(config)
+    
+    def configure(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Apply a new configuration to this processor
+        
+        Subclasses that derive settings from the configuration override this,
+        call the base implementation and re-read their settings, so a changed
+        configuration does not need a new instance.
+        
+        Args:
+            config: Configuration dictionary, or None for the defaults
+        """
+        self.config = dict(config or {})
+    
+    def cleanup(self):
+        """Release temporary files and other resources held by this processor"""
+        pass
     
     @abstractmethod
     def detect(self, content: str) -> List[Tuple[int, int, Dict[str, Any]]]:
@@ -67,6 +103,131 @@ class ContentProcessor(ABC):
         """
         pass
     
+    def get_rules(self) -> List[Rule]:
+        """
+        Get the lexer rules this processor detects blocks with
+        
+        The registry scans the rules of all processors in a single
+        linear-time pass. By default the rules are made from get_patterns().
+        Processors that return no rules are scanned with detect() instead.
+        
+        Returns:
+            List of rules from content_processors.block_lexer, in detection order
+        """
+        return [PatternRule(block_type, pattern, flags) for block_type, pattern, flags in self.get_patterns()]
+    
+    def get_patterns(self) -> List[Tuple[str, str, int]]:
+        """
+        Get regular expressions to detect blocks with, for processors without get_rules()
+        
+        Patterns are only tried where they can start and never match into
+        a fenced code block, but are otherwise not linear: a lazy wildcard
+        scans to the end of the document from every opener without a
+        closer. Prefer the rules of content_processors.block_lexer.
+        
+        Returns:
+            List of (block_type, pattern, flags) tuples, in detection order
+        """
+        return []
+    
+    def build_metadata(self, block_type: str, match: Union[LexMatch, re.Match]) -> Optional[Dict[str, Any]]:
+        """
+        Build the metadata for a block matched by one of get_rules()
+        
+        Args:
+            block_type: Block type of the rule that matched
+            match: Match object of the rule
+        
+        Returns:
+            Metadata dictionary, or None to leave the matched text to other processors
+        """
+        return {'type': block_type, 'content': match.group(0)}
+    
+    def detect_with_patterns(self, content: str) -> List[Tuple[int, int, Dict[str, Any]]]:
+        """
+        Detect blocks by scanning the content with get_rules()
+        
+        Args:
+            content: The content to scan
+        
+        Returns:
+            List of tuples containing (start_index, end_index, metadata)
+        """
+        blocks = scan_blocks(content, [(self, rule) for rule in self.get_rules()])
+        return [(block['start'], block['end'], block['metadata']) for block in blocks]
+    
+    def get_stream_delimiters(self) -> List[Tuple[str, str]]:
+        """
+        Get the delimiters of multi-line blocks that may contain blank lines
+        
+        When a document is processed as a stream, it is cut into segments at
+        blank lines. Fenced code blocks are never cut. Processors whose blocks
+        use other delimiters declare them here so their blocks are not cut
+        either.
+        
+        Returns:
+            List of (opening, closing) strings
+        """
+        return []
+    
+    def get_cost_class(self, metadata: Dict[str, Any], format_type: str) -> str:
+        """
+        Get the cost class of processing a block
+        
+        Blocks classed HEAVY_CPU are processed in another process by a fresh
+        instance of the processor with the same configuration, so their
+        output must not depend on state set up by prepare_blocks().
+        
+        Args:
+            metadata: Metadata of the block
+            format_type: 'preview' or export format type
+        
+        Returns:
+            One of the CostClass values
+        """
+        return CostClass.CHEAP
+    
+    def get_cache_fingerprint(self) -> str:
+        """
+        Get a fingerprint of everything besides the block text that affects the output
+        
+        The registry caches processed blocks per fingerprint, so a processor
+        whose output depends on more than its configuration should include
+        that state here.
+        
+        Returns:
+            Fingerprint string
+        """
+        return json.dumps(self.config, sort_keys=True, default=repr)
+    
+    def get_file_dependencies(self, metadata: Dict[str, Any]) -> List[str]:
+        """
+        Get the local files the output of a block depends on
+        
+        Cached output of the block is discarded when one of these files
+        changes.
+        
+        Args:
+            metadata: Metadata of the block
+        
+        Returns:
+            List of file paths
+        """
+        return []
+    
+    def prepare_blocks(self, blocks: List[Dict[str, Any]], format_type: str) -> None:
+        """
+        Prepare all blocks detected in a document before they are processed
+        
+        Processors that call out to external renderers can override this to
+        batch the work for the whole document instead of once per block.
+        
+        Args:
+            blocks: List of metadata dictionaries returned by detect()
+            format_type: 'preview' or export format type (pdf, html, docx, etc.)
+        """
+        pass
+    
     def get_required_scripts(self) -> List[str]:
         """
         Get required JavaScript scripts for this processor
@@ -85,6 +246,15 @@ class ContentProcessor(ABC):
         """
         return []
     
+    def get_pandoc_args(self) -> List[str]:
+        """
+        Get pandoc arguments this processor needs for export
+        
+        Returns:
+            List of command-line arguments
+        """
+        return []
+    
     def get_dependencies(self) -> List[str]:
         """
         Get required external dependencies for this processor
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Block Output Cache
+------------------
+Memoizes the output of content processors per block.
+
+Entries are keyed by processor, block content hash, format type and the
+processor's configuration fingerprint, and evicted least recently used
+first once the entry or size limit is exceeded. Entries that depend on
+local files remember their modification times and are dropped as soon as
+one of the files changes.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from logging_config import get_logger
+
+logger = get_logger()
+
+CacheKey = Tuple[str, str, str, str]
+
+
+def hash_block(content: str) -> str:
+    """
+    Hash the text of a block
+    
+    Args:
+        content: Block text
+    
+    Returns:
+        Hex digest of the block
+    """
+    return hashlib.sha256(content.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    """Get the modification time and size of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class BlockCache:
+    """LRU cache of processed blocks, bounded by entry count and total size"""
+    
+    def __init__(self, max_entries: int = 16384, max_chars: int = 32 * 1024 * 1024):
+        """
+        Initialize the cache
+        
+        Args:
+            max_entries: Maximum number of cached blocks (0 disables the cache)
+            max_chars: Maximum total length of the cached output
+        """
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: CacheKey) -> Optional[str]:
+        """
+        Look up the output of a block
+        
+        Args:
+            key: (processor name, block hash, format type, config fingerprint)
+        
+        Returns:
+            Cached output, or None if the block is not cached or one of the
+            files it depends on changed
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                output, files = entry
+                if all(_file_stamp(path) == stamp for path, stamp in files):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return output
+                self._remove(key)
+            self.misses += 1
+            return None
+    
+    def put(self, key: CacheKey, output: str, files: Iterable[str] = ()) -> None:
+        """
+        Store the output of a block
+        
+        Args:
+            key: (processor name, block hash, format type, config fingerprint)
+            output: Processed block
+            files: Local files the output depends on
+        """
+        if self.max_entries <= 0 or len(output) > self.max_chars:
+            return
+        
+        stamps = tuple((path, _file_stamp(path)) for path in files)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (output, stamps)
+            self._size += len(output)
+            
+            while len(self._entries) > self.max_entries or self._size > self.max_chars:
+                self._remove(next(iter(self._entries)))
+    
+    def invalidate(self, processor_name: Optional[str] = None, path: Optional[str] = None) -> int:
+        """
+        Drop cached blocks
+        
+        Args:
+            processor_name: Only drop blocks of this processor
+            path: Only drop blocks that depend on this file
+        
+        Returns:
+            Number of dropped blocks
+        """
+        if path is not None:
+            path = os.path.abspath(path)
+        
+        with self._lock:
+            keys = [
+                key for key, (_, files) in self._entries.items()
+                if (processor_name is None or key[0] == processor_name)
+                and (path is None or any(os.path.abspath(file) == path for file, _ in files))
+            ]
+            for key in keys:
+                self._remove(key)
+        
+        if keys:
+            logger.debug(f"Invalidated {len(keys)} cached blocks")
+        return len(keys)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get cache statistics
+        
+        Returns:
+            Dictionary with entries, size, hits and misses
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size': self._size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+    
+    def _remove(self, key: CacheKey) -> None:
+        """Remove an entry, the lock must be held"""
+        output, _ = self._entries.pop(key)
+        self._size -= len(output)
@@ -0,0 +1,804 @@
+#!/usr/bin/env python3
+"""
+Block Lexer
+-----------
+Linear-time detection of the blocks handled by the content processors.
+
+Processors describe their blocks with rules instead of regular expressions
+with lazy wildcards. A pattern such as <video\\s+.*?</video> scans to the
+end of the document from every opener that has no closer, so a stray $ or
+an unclosed element makes detection quadratic, and nested lazy groups make
+it worse. The rules here find closing delimiters with forward searches
+whose results are remembered for the whole scan, so the time spent is
+linear in the length of the text however it is formed.
+
+Fenced code blocks are found first, in one pass over the lines. Nothing
+inside a fence is detected as another block and no block closes inside a
+fence. An unclosed fence runs to the end of the document, as in CommonMark
+and pandoc.
+"""
+
+import re
+import bisect
+import itertools
+from abc import ABC, abstractmethod
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+Span = Optional[Tuple[int, int]]
+
+# Fence line indented at most three spaces: the fence characters and the rest
+# of the line. Lines are found by their line break, which the engine searches
+# for quickly, unlike a leading ^ that is tried at every position.
+_FENCE_LINE = re.compile(r'\n {0,3}(```+|~~~+)([^\n]*)')
+_FIRST_FENCE_LINE = re.compile(r' {0,3}(```+|~~~+)([^\n]*)')
+
+# Separator row of a pipe table
+_TABLE_SEPARATOR = re.compile(r'\|[-:| ]+\|')
+
+# Whitespace before the opening quote of an image title
+_TITLE_OPENING = re.compile(r'\s"')
+
+
+def _first_chars(items, flags: int) -> Optional[set]:
+    """
+    Find the characters a parsed pattern can start with
+    
+    Args:
+        items: Parsed pattern items from sre_parse
+        flags: Flags in effect
+    
+    Returns:
+        Set of possible first characters, or None if they cannot be determined
+    """
+    for op, av in items:
+        name = getattr(op, 'name', str(op))
+        if name in ('AT', 'ASSERT', 'ASSERT_NOT'):
+            # Zero-width, the next item consumes the first character
+            continue
+        
+        if name == 'LITERAL':
+            chars = {chr(av)}
+        elif name == 'IN':
+            chars = set()
+            for in_op, in_av in av:
+                in_name = getattr(in_op, 'name', str(in_op))
+                if in_name == 'LITERAL':
+                    chars.add(chr(in_av))
+                elif in_name == 'RANGE' and in_av[1] - in_av[0] < 256:
+                    chars.update(chr(code) for code in range(in_av[0], in_av[1] + 1))
+                else:
+                    return None
+        elif name == 'SUBPATTERN':
+            return _first_chars(av[-1], (flags | av[1]) & ~av[2])
+        elif name == 'BRANCH':
+            chars = set()
+            for branch in av[1]:
+                branch_chars = _first_chars(branch, flags)
+                if branch_chars is None:
+                    return None
+                chars |= branch_chars
+            return chars
+        elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') and av[0] >= 1:
+            return _first_chars(av[2], flags)
+        else:
+            return None
+        
+        if flags & re.IGNORECASE:
+            chars |= {char.lower() for char in chars} | {char.upper() for char in chars}
+        return chars
+    
+    return None
+
+
+def _find_fences(text: str) -> List[Tuple[int, int, str, Tuple[Span, ...]]]:
+    """
+    Find the fenced code blocks of a text
+    
+    Args:
+        text: The text to scan
+    
+    Returns:
+        List of (start, end, language, spans) tuples, where start is the
+        position of the opening fence characters, end the end of the closing
+        line (of the text for an unclosed fence), language is lowercase and
+        spans are those of the whole fence, the language, the body and the
+        info string
+    """
+    fences = []
+    opening = None
+    length = len(text)
+    lines = _FENCE_LINE.finditer(text)
+    first = _FIRST_FENCE_LINE.match(text)
+    if first is not None:
+        lines = itertools.chain((first,), lines)
+    
+    for line in lines:
+        run, rest = line.groups()
+        if opening is None:
+            # A backtick line with more backticks after it is inline code
+            if run[0] == '`' and '`' in rest:
+                continue
+            opening = line.start(1)
+            opening_run = run
+            info_start = line.start(2) + len(rest) - len(rest.lstrip())
+            info_end = line.start(2) + len(rest.rstrip())
+            words = rest.split(None, 1)
+            language = words[0].lower() if words else ''
+            language_span = (info_start, info_start + (len(words[0]) if words else 0))
+            body_start = min(line.end() + 1, length)
+        elif run[0] == opening_run[0] and len(run) >= len(opening_run) and not rest.strip():
+            # The body ends before the line break of the closing line
+            body = (body_start, max(body_start, line.start()))
+            fences.append((opening, line.end(), language,
+                           ((opening, line.end()), language_span, body, (info_start, info_end))))
+            opening = None
+    
+    if opening is not None:
+        fences.append((opening, length, language,
+                       ((opening, length), language_span, (body_start, length), (info_start, info_end))))
+    return fences
+
+
+class LexMatch:
+    """
+    Block matched by a rule
+    
+    Provides the part of the re.Match interface build_metadata()
+    implementations use, so processors handle matches of rules and of
+    regular expressions alike.
+    """
+    
+    __slots__ = ('string', '_spans')
+    
+    def __init__(self, string: str, spans: Tuple[Span, ...]):
+        """
+        Initialize the match
+        
+        Args:
+            string: The scanned text
+            spans: (start, end) of the whole match followed by those of the
+                groups, None for groups that did not participate
+        """
+        self.string = string
+        self._spans = spans
+    
+    def group(self, index: int = 0, *indices):
+        """Get the text of the whole match or of groups, None for groups that did not participate"""
+        if indices:
+            return tuple(self._group(each) for each in (index,) + indices)
+        span = self._spans[index]
+        return None if span is None else self.string[span[0]:span[1]]
+    
+    def groups(self, default=None) -> Tuple:
+        """Get the text of all groups"""
+        return tuple(default if span is None else self.string[span[0]:span[1]] for span in self._spans[1:])
+    
+    def span(self, index: int = 0) -> Tuple[int, int]:
+        """Get the span of the whole match or of a group, (-1, -1) if the group did not participate"""
+        return self._spans[index] or (-1, -1)
+    
+    def start(self, index: int = 0) -> int:
+        """Get the start of the whole match or of a group"""
+        span = self._spans[index]
+        return -1 if span is None else span[0]
+    
+    def end(self, index: int = 0) -> int:
+        """Get the end of the whole match or of a group"""
+        span = self._spans[index]
+        return -1 if span is None else span[1]
+    
+    def _group(self, index: int) -> Optional[str]:
+        """Get the text of one group"""
+        span = self._spans[index]
+        return None if span is None else self.string[span[0]:span[1]]
+
+
+class ScanState:
+    """State of one scan shared by all rules: the text, its fences and remembered searches"""
+    
+    def __init__(self, text: str):
+        """
+        Initialize the state and find the fences of the text
+        
+        Args:
+            text: The text to scan
+        """
+        self.text = text
+        self.length = len(text)
+        
+        # Results rules remember for the rest of the scan
+        self.memo = {}
+        
+        self._searches = {}
+        self._fences = {}
+        for start, end, language, spans in _find_fences(text):
+            self._fences[start] = (end, language, spans)
+        self._fence_starts = sorted(self._fences)
+    
+    def search(self, key: Any, position: int, find: Callable[[str, int], int]) -> int:
+        """
+        Find the first position at or after a position that has some property
+        
+        The result of the last search for each key is remembered. A search
+        from anywhere between the start and the result of the last search
+        has the same answer, so as the scan moves forward each part of the
+        text is searched once per key instead of once per candidate.
+        
+        Args:
+            key: Identifies the property
+            position: Where to start searching
+            find: Function that searches the text from a position and
+                returns the first position with the property, or -1
+        
+        Returns:
+            First position with the property, or -1 if there is none
+        """
+        cached = self._searches.get(key)
+        if cached is not None:
+            searched_from, found = cached
+            if searched_from <= position and (found < 0 or position <= found):
+                return found
+        
+        found = find(self.text, position)
+        self._searches[key] = (position, found)
+        return found
+    
+    def find(self, literal: str, position: int) -> int:
+        """
+        Find a string at or after a position
+        
+        Args:
+            literal: The string to find
+            position: Where to start searching
+        
+        Returns:
+            Position of the string, or -1 if it does not occur
+        """
+        cached = self._searches.get(literal)
+        if cached is not None:
+            searched_from, found = cached
+            if searched_from <= position and (found < 0 or position <= found):
+                return found
+        
+        found = self.text.find(literal, position)
+        self._searches[literal] = (position, found)
+        return found
+    
+    def line_end(self, position: int) -> int:
+        """Get the position of the line break ending the line at a position, or the text length"""
+        found = self.find('\n', position)
+        return found if found >= 0 else self.length
+    
+    def fence_at(self, position: int) -> Optional[Tuple[int, str, Tuple[Span, ...]]]:
+        """
+        Get the fence starting at a position
+        
+        Args:
+            position: Position of the opening fence characters
+        
+        Returns:
+            Tuple of (end, lowercase language, spans of the fence and its
+            groups), or None if no fence starts there
+        """
+        return self._fences.get(position)
+    
+    def crosses_fence(self, start: int, end: int) -> bool:
+        """Check if a fence starts inside the span from start (exclusive) to end"""
+        index = bisect.bisect_right(self._fence_starts, start)
+        return index < len(self._fence_starts) and self._fence_starts[index] < end
+    
+    def next_fence_start(self, position: int) -> int:
+        """Get the start of the first fence after a position, or the text length"""
+        index = bisect.bisect_right(self._fence_starts, position)
+        return self._fence_starts[index] if index < len(self._fence_starts) else self.length
+    
+    def fence_start_from(self, position: int) -> int:
+        """Get the start of the first fence at or after a position, or -1"""
+        index = bisect.bisect_left(self._fence_starts, position)
+        return self._fence_starts[index] if index < len(self._fence_starts) else -1
+
+
+class Rule(ABC):
+    """
+    Base class of the lexer rules
+    
+    A rule recognizes one kind of block. The lexer calls match() at every
+    position found by the candidate pattern (or at the start of every fence
+    for rules with at_fences set) that holds one of first_chars.
+    """
+    
+    # Characters a block can start with, or None if it can start anywhere
+    first_chars: Optional[FrozenSet[str]] = None
+    
+    # Pattern finding the positions where a block may start, a character
+    # class of first_chars if None. Must not backtrack.
+    candidate: Optional[str] = None
+    
+    # Blocks start only at the start of a line
+    line_start = False
+    
+    # Blocks start only where a fence starts
+    at_fences = False
+    
+    def __init__(self, block_type: str):
+        """
+        Initialize the rule
+        
+        Args:
+            block_type: Block type passed to build_metadata()
+        """
+        self.block_type = block_type
+    
+    @abstractmethod
+    def match(self, state: ScanState, start: int):
+        """
+        Match a block at a position
+        
+        Must take time proportional to the length of the block, or constant
+        time when there is none, using the searches of the scan state.
+        
+        Args:
+            state: State of the scan
+            start: Position to match at
+        
+        Returns:
+            LexMatch or re.Match, or None if no block starts here
+        """
+        pass
+    
+    def accepts(self, language: str) -> bool:
+        """
+        Check if fences in a language may hold a block, for rules with at_fences set
+        
+        Args:
+            language: Lowercase language of the fence
+        
+        Returns:
+            True if match() should be tried on the fence
+        """
+        return True
+    
+    def next_start(self, state: ScanState, position: int) -> int:
+        """
+        Find where the next block may start, for rules without first_chars
+        
+        Args:
+            state: State of the scan
+            position: Where to start searching
+        
+        Returns:
+            Candidate position, or -1 if there is none
+        """
+        return position
+
+
+class FencedBlockRule(Rule):
+    """
+    Fenced code block, optionally only in some languages
+    
+    Group 1 is the language, group 2 the body and group 3 the whole info
+    string of the opening fence.
+    """
+    
+    first_chars = frozenset('`~')
+    at_fences = True
+    
+    def __init__(self, block_type: str, languages: Optional[Iterable[str]] = None):
+        """
+        Initialize the rule
+        
+        Args:
+            block_type: Block type passed to build_metadata()
+            languages: Languages to match (case-insensitive), None for all fences
+        """
+        super().__init__(block_type)
+        self.languages = None if languages is None else {language.lower() for language in languages}
+    
+    def accepts(self, language: str) -> bool:
+        return self.languages is None or language in self.languages
+    
+    def match(self, state: ScanState, start: int) -> Optional[LexMatch]:
+        fence = state.fence_at(start)
+        if fence is None or not self.accepts(fence[1]):
+            return None
+        
+        return LexMatch(state.text, fence[2])
+
+
+class DelimitedRule(Rule):
+    """
+    Block between an opening and a closing string, such as $$...$$ or <video ...>...</video>
+    
+    The block ends at the first closing string after the opening one, like
+    a lazy pattern would. Group 1 is the text between the delimiters.
+    """
+    
+    def __init__(self, block_type: str, opening: str, closing: str, space_after_opening: bool = False):
+        """
+        Initialize the rule
+        
+        Args:
+            block_type: Block type passed to build_metadata()
+            opening: Opening string
+            closing: Closing string
+            space_after_opening: Require whitespace after the opening
+                string, e.g. to tell <video from <videos
+        """
+        super().__init__(block_type)
+        self.opening = opening
+        self.closing = closing
+        self.space_after_opening = space_after_opening
+        self.first_chars = frozenset(opening[0])
+        self.candidate = re.escape(opening) + (r'\s' if space_after_opening else '')
+    
+    def match(self, state: ScanState, start: int) -> Optional[LexMatch]:
+        text = state.text
+        if not text.startswith(self.opening, start):
+            return None
+        
+        inner_start = start + len(self.opening)
+        if self.space_after_opening and not (inner_start < state.length and text[inner_start].isspace()):
+            return None
+        
+        closing = state.find(self.closing, inner_start)
+        if closing < 0:
+            return None
+        
+        end = closing + len(self.closing)
+        if state.crosses_fence(start, end):
+            return None
+        return LexMatch(text, ((start, end), (inner_start, closing)))
+
+
+class InlineMathRule(Rule):
+    """
+    Inline math between single dollar signs on one line
+    
+    Dollar signs next to another dollar sign neither open nor close inline
+    math. Group 1 is the expression.
+    """
+    
+    first_chars = frozenset('$')
+    
+    def match(self, state: ScanState, start: int) -> Optional[LexMatch]:
+        text = state.text
+        if not self._is_single(text, start):
+            return None
+        
+        closing = state.search(('single', '$'), start + 1, self._find_single)
+        if closing < 0 or closing > state.line_end(start):
+            return None
+        return LexMatch(text, ((start, closing + 1), (start + 1, closing)))
+    
+    @staticmethod
+    def _is_single(text: str, position: int) -> bool:
+        """Check if the dollar sign at a position is not next to another one"""
+        return (text.startswith('$', position)
+                and not text.startswith('$', position + 1)
+                and not (position > 0 and text[position - 1] == '$'))
+    
+    @staticmethod
+    def _find_single(text: str, position: int) -> int:
+        """Find the first dollar sign at or after a position that is not next to another one"""
+        index = text.find('$', position)
+        while index >= 0:
+            if text.startswith('$', index + 1):
+                # Skip the whole run of dollar signs
+                index += 2
+                while text.startswith('$', index):
+                    index += 1
+            elif index > 0 and text[index - 1] == '$':
+                index += 1
+            else:
+                return index
+            index = text.find('$', index)
+        return -1
+
+
+class MarkdownImageRule(Rule):
+    """
+    Markdown image ![alt](src "title") on one line
+    
+    Group 1 is the alt text, group 2 the source and group 3 the title.
+    """
+    
+    first_chars = frozenset('!')
+    candidate = r'!\['
+    
+    def match(self, state: ScanState, start: int) -> Optional[LexMatch]:
+        text = state.text
+        if not text.startswith('![', start):
+            return None
+        
+        line_end = state.line_end(start)
+        bracket = state.find('](', start + 2)
+        if bracket < 0 or bracket >= line_end:
+            return None
+        paren = state.find(')', bracket + 2)
+        if paren < 0 or paren >= line_end:
+            return None
+        
+        source = (bracket + 2, paren)
+        title = None
+        end = paren + 1
+        
+        # A title opens with whitespace and a quote before the first parenthesis,
+        # and runs to the first quote followed by a parenthesis
+        space = state.search('image_title', bracket + 2, self._find_title)
+        if 0 <= space < paren:
+            closing = state.find('")', space + 2)
+            if 0 <= closing < line_end:
+                while space > source[0] and text[space - 1].isspace():
+                    space -= 1
+                source = (source[0], space)
+                title = (text.index('"', space) + 1, closing)
+                end = closing + 2
+        
+        return LexMatch(text, ((start, end), (start + 2, bracket), source, title))
+    
+    @staticmethod
+    def _find_title(text: str, position: int) -> int:
+        """Find the whitespace before an opening title quote at or after a position"""
+        match = _TITLE_OPENING.search(text, position)
+        return match.start() if match is not None else -1
+
+
+class HtmlImageRule(Rule):
+    """
+    HTML <img> element with a double-quoted src attribute
+    
+    Group 1 is the source. Of several src attributes the last one wins.
+    """
+    
+    first_chars = frozenset('<')
+    candidate = r'<img\s'
+    
+    def match(self, state: ScanState, start: int) -> Optional[LexMatch]:
+        text = state.text
+        if not text.startswith('<img', start) or not (start + 4 < state.length and text[start + 4].isspace()):
+            return None
+        
+        # The attribute must be inside the tag, its value may contain >
+        tag_end = state.find('>', start + 5)
+        if tag_end < 0:
+            return None
+        key = ('img_src', tag_end)
+        sources = state.memo.get(key)
+        if sources is None:
+            # Tags ending at different > do not overlap, so each part of the text is searched once
+            tag_start = text.rfind('>', 0, tag_end) + 1
+            last = text.rfind('src="', tag_start, tag_end)
+            sources = state.memo[key] = (last, text.rfind('src="', tag_start, last) if last > tag_start else -1)
+        
+        source, previous = sources
+        if source < start + 5:
+            return None
+        quote = state.find('"', source + 5)
+        end = state.find('>', quote + 1) if quote >= 0 else -1
+        if end < 0:
+            # The value of the previous attribute ends at the latest at the quote of
+            # the last one, and the tag end follows
+            source = previous
+            if source < start + 5:
+                return None
+            quote = text.index('"', source + 5)
+            end = text.index('>', quote + 1)
+        if state.crosses_fence(start, end + 1):
+            return None
+        return LexMatch(text, ((start, end + 1), (source + 5, quote)))
+
+
+class PipeTableRule(Rule):
+    """
+    Pipe table with a header row, a separator row and at least one body row
+    
+    Every row starts with a pipe at the start of a line and ends with a
+    pipe. Group 1 is the whole table.
+    """
+    
+    first_chars = frozenset('|')
+    line_start = True
+    
+    def match(self, state: ScanState, start: int) -> Optional[LexMatch]:
+        text = state.text
+        if start > 0 and text[start - 1] != '\n':
+            return None
+        
+        header_end = state.find('\n', start)
+        if header_end - start < 3 or text[header_end - 1] != '|':
+            return None
+        
+        # Every pipe of the header row leads to the same rows
+        key = ('table', header_end)
+        if key not in state.memo:
+            state.memo[key] = self._find_end(state, header_end)
+        end = state.memo[key]
+        if end is None:
+            return None
+        return LexMatch(text, ((start, end), (start, end)))
+    
+    @staticmethod
+    def _find_end(state: ScanState, header_end: int) -> Optional[int]:
+        """Find the end of the table whose header row ends at a position"""
+        text = state.text
+        separator_end = state.find('\n', header_end + 1)
+        if separator_end < 0 or not _TABLE_SEPARATOR.fullmatch(text, header_end + 1, separator_end):
+            return None
+        
+        end = None
+        position = separator_end + 1
+        while text.startswith('|', position):
+            row_end = state.find('\n', position)
+            if row_end - position < 3 or text[row_end - 1] != '|':
+                break
+            end = position = row_end + 1
+        return end
+
+
+class PatternRule(Rule):
+    """
+    Block matched by a regular expression
+    
+    Used for processors that only declare get_patterns(). Matches are tried
+    only where the pattern can start and never run into a fence, but the
+    pattern itself is not made linear, so patterns with lazy wildcards
+    should be replaced by the other rules.
+    """
+    
+    def __init__(self, block_type: str, pattern: str, flags: int = 0):
+        """
+        Initialize the rule
+        
+        Args:
+            block_type: Block type passed to build_metadata()
+            pattern: Regular expression
+            flags: Regular expression flags
+        """
+        super().__init__(block_type)
+        self.pattern = re.compile(pattern, flags)
+        chars = _first_chars(sre_parse.parse(pattern, flags).data, flags)
+        self.first_chars = frozenset(chars) if chars else None
+    
+    def match(self, state: ScanState, start: int) -> Optional[re.Match]:
+        fence = state.fence_at(start)
+        limit = fence[0] if fence is not None else state.next_fence_start(start)
+        return self.pattern.match(state.text, start, limit)
+    
+    def next_start(self, state: ScanState, position: int) -> int:
+        return state.search(('pattern', self.pattern), position, self._search)
+    
+    def _search(self, text: str, position: int) -> int:
+        """Find the next match of the pattern"""
+        match = self.pattern.search(text, position)
+        return match.start() if match is not None else -1
+
+
+def scan_blocks(text: str, entries: List[Tuple[Any, Rule]]) -> List[Dict[str, Any]]:
+    """
+    Find the blocks of several processors in one pass over a text
+    
+    At every position the leftmost block wins, and when several rules match
+    at the same position the first entry whose processor accepts the match
+    wins. A processor declines a match by returning None from
+    build_metadata(), and the later entries get a chance at the same
+    position. A fence every processor declines is left as text as a whole.
+    
+    Args:
+        text: The text to scan
+        entries: (processor, rule) pairs in priority order
+    
+    Returns:
+        Non-overlapping blocks sorted by start position, each a dictionary
+        with 'start', 'end', 'processor' and 'metadata'
+    """
+    state = ScanState(text)
+    
+    # Rules are only tried where their blocks may start
+    anywhere = [entry for entry in entries if not entry[1].at_fences and entry[1].first_chars is None]
+    chars = set()
+    fragments = []
+    line_fragments = []
+    for _, rule in entries:
+        if rule.at_fences or rule.first_chars is None:
+            continue
+        chars |= rule.first_chars
+        fragment = rule.candidate or '[' + ''.join(re.escape(char) for char in sorted(rule.first_chars)) + ']'
+        found_in = line_fragments if rule.line_start else fragments
+        if fragment not in found_in:
+            found_in.append(fragment)
+    
+    # Line starts are searched with the preceding line break and reported by
+    # group 1: a ^ would make the engine try every position instead of
+    # skipping quickly to the first characters of the fragments
+    first_line = False
+    if line_fragments:
+        line_pattern = '|'.join(line_fragments)
+        first_line = re.match(line_pattern, text) is not None
+        fragments.append(f'\\n({line_pattern})')
+    candidates = re.compile('|'.join(fragments)) if fragments else None
+    
+    def find_candidate(text: str, position: int) -> int:
+        """Find where the next candidate block starts, a line start is found from its line break"""
+        if position and text[position - 1] == '\n':
+            candidate = candidates.search(text, position - 1)
+            if candidate is not None and candidate.start() < position and not candidate.lastindex:
+                candidate = candidates.search(text, position)
+        else:
+            candidate = candidates.search(text, position)
+        if candidate is None:
+            return -1
+        return candidate.start(1) if candidate.lastindex else candidate.start()
+    
+    dispatch = {
+        char: [entry for entry in entries
+               if not entry[1].at_fences and (entry[1].first_chars is None or char in entry[1].first_chars)]
+        for char in chars
+    }
+    # Filled per fence character and language on first use
+    fence_dispatch = {}
+    
+    fences = state._fences
+    blocks = []
+    position = 0
+    fence_start = state.fence_start_from(0)
+    while position <= state.length:
+        start = -1
+        if position == 0 and first_line:
+            start = 0
+        elif candidates is not None:
+            # Remembered until the scan passes it, fences before it do not search again
+            start = state.search(('candidates', candidates.pattern), position, find_candidate)
+        
+        # Fences are always visited, to skip the ones no processor claims
+        if 0 <= fence_start < position:
+            fence_start = state.fence_start_from(position)
+        if fence_start >= 0 and (start < 0 or fence_start < start):
+            start = fence_start
+        
+        for _, rule in anywhere:
+            found = rule.next_start(state, position)
+            if found >= 0 and (start < 0 or found < start):
+                start = found
+        if start < 0:
+            break
+        
+        fence = fences.get(start)
+        if fence is not None:
+            key = (text[start], fence[1])
+            candidates_here = fence_dispatch.get(key)
+            if candidates_here is None:
+                candidates_here = fence_dispatch[key] = [
+                    entry for entry in entries
+                    if (entry[1].accepts(key[1]) if entry[1].at_fences
+                        else entry[1].first_chars is None or key[0] in entry[1].first_chars)
+                ]
+        else:
+            candidates_here = dispatch.get(text[start:start + 1], anywhere)
+        
+        block = None
+        for processor, rule in candidates_here:
+            match = rule.match(state, start)
+            if match is None:
+                continue
+            metadata = processor.build_metadata(rule.block_type, match)
+            if metadata is not None:
+                block = {
+                    'start': start,
+                    'end': match.end(),
+                    'processor': processor,
+                    'metadata': metadata
+                }
+                break
+        
+        if block is not None:
+            blocks.append(block)
+            # Empty matches must still move the scan forward
+            position = block['end'] if block['end'] > start else start + 1
+        else:
+            position = fence[0] if fence is not None else start + 1
+    
+    return blocks
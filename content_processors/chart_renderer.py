@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Chart Render Service
+--------------------
+Static rendering of Plotly and Chart.js blocks for PDF/LaTeX/DOCX export.
+
+A single long-lived Node.js worker (resources/chart_worker.js) drives a
+headless browser with a small pool of pages that load the chart libraries
+once. All charts of a document are sent as one batch, and every rendered
+image is cached on disk by spec hash, format, size and DPI.
+"""
+
+import os
+import json
+import queue
+import atexit
+import base64
+import hashlib
+import threading
+import subprocess
+from urllib.parse import unquote
+from shutil import which
+from typing import Dict, List, Optional, Tuple
+from logging_config import get_logger
+
+logger = get_logger()
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NODE_MODULES_DIR = os.path.join(APP_DIR, "node_modules")
+WORKER_SCRIPT = os.path.join(APP_DIR, "resources", "chart_worker.js")
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".mdz", "cache", "charts")
+
+# Local copies are preferred, the CDN builds used by the preview are the fallback
+PLOTLY_SCRIPTS = [
+    os.path.join(APP_DIR, "resources", "plotly.min.js"),
+    os.path.join(NODE_MODULES_DIR, "plotly.js-dist-min", "plotly.min.js"),
+    os.path.join(NODE_MODULES_DIR, "plotly.js-dist", "plotly.js"),
+    "https://cdn.plot.ly/plotly-latest.min.js"
+]
+CHARTJS_SCRIPTS = [
+    os.path.join(APP_DIR, "resources", "chart.umd.min.js"),
+    os.path.join(NODE_MODULES_DIR, "chart.js", "dist", "chart.umd.js"),
+    "https://cdn.jsdelivr.net/npm/chart.js"
+]
+
+
+def _find_script(candidates: List[str]) -> str:
+    """Return the first local script that exists, or the CDN URL"""
+    for candidate in candidates[:-1]:
+        if os.path.isfile(candidate):
+            return candidate
+    return candidates[-1]
+
+
+class ChartRenderService:
+    """Persistent headless chart renderer with an on-disk cache"""
+    
+    def __init__(self, cache_dir: Optional[str] = None, pool_size: int = 2, timeout: float = 120.0):
+        """
+        Initialize the render service
+        
+        Args:
+            cache_dir: Directory for rendered images (defaults to ~/.mdz/cache/charts)
+            pool_size: Number of browser pages rendering in parallel
+            timeout: Seconds to wait for the worker to answer a batch
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._process = None
+        self._responses = None
+        self._request_id = 0
+        self._failed = False
+        self.node_path = which('node') or which('nodejs')
+    
+    def is_available(self) -> bool:
+        """
+        Check if Node.js and the worker script are available
+        
+        Returns:
+            True if charts can be rendered, False otherwise
+        """
+        return not self._failed and self.node_path is not None and os.path.isfile(WORKER_SCRIPT)
+    
+    def get_cache_path(self, vis_type: str, code: str, image_format: str, dpi: int,
+                       width: int, height: int) -> str:
+        """
+        Get the cache file path for a chart
+        
+        Args:
+            vis_type: 'plotly' or 'chartjs'
+            code: Chart specification
+            image_format: 'png' or 'svg'
+            dpi: Target resolution for raster output
+            width: Chart width in CSS pixels
+            height: Chart height in CSS pixels
+        
+        Returns:
+            Absolute path of the cached image
+        """
+        image_format = self._effective_format(vis_type, image_format)
+        key = "\0".join([vis_type, code, image_format, str(dpi), f"{width}x{height}"])
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{vis_type}-{digest}.{image_format}")
+    
+    def render_batch(self, charts: List[Tuple[str, str]], image_format: str = 'png', dpi: int = 300,
+                     width: int = 800, height: int = 400) -> Dict[Tuple[str, str], Optional[str]]:
+        """
+        Render many charts with one round trip to the worker
+        
+        Args:
+            charts: List of (vis_type, code) tuples
+            image_format: 'png' or 'svg' (Chart.js always renders to PNG)
+            dpi: Target resolution for raster output
+            width: Chart width in CSS pixels
+            height: Chart height in CSS pixels
+        
+        Returns:
+            Dictionary mapping (vis_type, code) to the rendered image path,
+            or None for charts that could not be rendered
+        """
+        results = {}
+        missing = []
+        
+        for key in charts:
+            if key in results:
+                continue
+            path = self.get_cache_path(key[0], key[1], image_format, dpi, width, height)
+            if os.path.isfile(path):
+                results[key] = path
+            else:
+                results[key] = None
+                missing.append((key, path))
+        
+        if not missing:
+            return results
+        
+        with self._lock:
+            if not self.is_available():
+                return results
+            
+            items = [{
+                'type': vis_type,
+                'code': code,
+                'format': self._effective_format(vis_type, image_format),
+                'width': width,
+                'height': height,
+                'scale': dpi / 96.0
+            } for (vis_type, code), _ in missing]
+            rendered = self._request(items)
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for (key, path), data in zip(missing, rendered):
+            if data is None:
+                continue
+            try:
+                self._write_data_url(data, path)
+                results[key] = path
+            except Exception as e:
+                logger.error(f"Error writing rendered chart {path}: {str(e)}")
+        
+        logger.debug(f"Rendered {len(missing)} charts, {len(charts) - len(missing)} served from cache")
+        return results
+    
+    def shutdown(self) -> None:
+        """Stop the worker process"""
+        process = self._process
+        self._process = None
+        if process is not None and process.poll() is None:
+            try:
+                process.stdin.close()
+                process.wait(timeout=5)
+            except Exception:
+                process.kill()
+    
+    @staticmethod
+    def _effective_format(vis_type: str, image_format: str) -> str:
+        """Chart.js draws on a canvas, so it can only produce PNG"""
+        if vis_type == 'plotly' and image_format == 'svg':
+            return 'svg'
+        return 'png'
+    
+    @staticmethod
+    def _write_data_url(data: str, path: str) -> None:
+        """Decode a data: URL returned by the worker into a file"""
+        header, _, payload = data.partition(',')
+        if ';base64' in header:
+            content = base64.b64decode(payload)
+        else:
+            content = unquote(payload).encode('utf-8')
+        
+        # Write to a temporary name first so a partial file never looks like a cache hit
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    
+    def _ensure_worker(self) -> bool:
+        """Start the worker process if it is not running"""
+        if self._process is not None and self._process.poll() is None:
+            return True
+        
+        scripts = [_find_script(PLOTLY_SCRIPTS), _find_script(CHARTJS_SCRIPTS)]
+        env = dict(os.environ)
+        env['NODE_PATH'] = os.pathsep.join(filter(None, [NODE_MODULES_DIR, env.get('NODE_PATH')]))
+        
+        try:
+            self._process = subprocess.Popen(
+                [self.node_path, WORKER_SCRIPT, json.dumps(scripts), str(self.pool_size)],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding='utf-8',
+                bufsize=1,
+                env=env
+            )
+        except Exception as e:
+            logger.error(f"Error starting chart worker: {str(e)}")
+            self._failed = True
+            return False
+        
+        # Read responses on a separate thread so a stuck browser cannot hang the export
+        self._responses = queue.Queue()
+        threading.Thread(
+            target=self._read_responses,
+            args=(self._process, self._responses),
+            daemon=True
+        ).start()
+        
+        try:
+            line = self._responses.get(timeout=self.timeout)
+            ready = json.loads(line) if line else {}
+        except Exception:
+            ready = {}
+        
+        if not ready.get('ready'):
+            logger.warning(f"Chart worker could not start a headless browser: {ready.get('error', 'no response')}")
+            self.shutdown()
+            self._failed = True
+            return False
+        
+        logger.info(f"Started chart worker (pid {self._process.pid}) with {self.pool_size} pages")
+        return True
+    
+    @staticmethod
+    def _read_responses(process, responses):
+        """Forward worker output lines to the response queue"""
+        for line in process.stdout:
+            responses.put(line)
+        responses.put(None)
+    
+    def _request(self, items: List[Dict]) -> List[Optional[str]]:
+        """Send one batch to the worker and wait for the answer"""
+        if not self._ensure_worker():
+            return [None] * len(items)
+        
+        self._request_id += 1
+        request = {'id': self._request_id, 'items': items}
+        
+        try:
+            self._process.stdin.write(json.dumps(request) + '\n')
+            self._process.stdin.flush()
+            
+            while True:
+                line = self._responses.get(timeout=self.timeout)
+                if line is None:
+                    raise RuntimeError("Chart worker exited")
+                response = json.loads(line)
+                if response.get('id') == self._request_id:
+                    break
+        except Exception as e:
+            logger.error(f"Chart worker failed: {str(e)}")
+            self.shutdown()
+            return [None] * len(items)
+        
+        rendered = []
+        for item, result in zip(items, response.get('results', [])):
+            if result.get('data') is None:
+                logger.warning(f"Could not render {item['type']} chart: {result.get('error')}")
+            rendered.append(result.get('data'))
+        return rendered
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_chart_service() -> ChartRenderService:
+    """
+    Get the shared chart render service
+    
+    Returns:
+        ChartRenderService instance
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ChartRenderService()
+            atexit.register(_service.shutdown)
+        return _service
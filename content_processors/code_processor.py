@@ -5,10 +5,11 @@ Code Block Content Processor
 Processor for code blocks with syntax highlighting in Markdown.
 """
 
-import re
 from typing import Dict, Any, List, Tuple, Optional
 from logging_config import get_logger
-from content_processors.base_processor import ContentProcessor
+from content_processors.base_processor import ContentProcessor, CostClass
+from content_processors.block_lexer import FencedBlockRule, LexMatch, Rule
+from content_processors.syntax_highlighter import get_syntax_highlighter, PYGMENTS_AVAILABLE
 
 logger = get_logger()
 
@@ -23,12 +24,36 @@ class CodeBlockProcessor(ContentProcessor):
             config: Optional configuration dictionary
         """
         super().__init__(config)
-        self.code_block_pattern = r'```(\w+)?\s*\n(.*?)\n```'
-        self.highlighter = self.config.get('highlighter', 'highlight.js')
+    
+    def configure(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Apply a new configuration to the Code Block processor
+        
+        Args:
+            config: Configuration dictionary, or None for the defaults
+        """
+        super().configure(config)
+        self.skip_languages = self.config.get('skip_languages', ['mermaid', 'plotly', 'chartjs', 'csv', 'plantuml'])
+        self.highlighter = self.config.get('highlighter', 'pygments' if PYGMENTS_AVAILABLE else 'highlight.js')
         
-        if self.highlighter not in ['highlight.js', 'prism.js']:
+        if self.highlighter not in ['pygments', 'highlight.js', 'prism.js']:
             logger.warning(f"Unknown syntax highlighter: {self.highlighter}, defaulting to highlight.js")
             self.highlighter = 'highlight.js'
+        
+        if self.highlighter == 'pygments' and not PYGMENTS_AVAILABLE:
+            logger.warning("Pygments not installed, falling back to highlight.js")
+            self.highlighter = 'highlight.js'
+        
+        # Server-side highlighting with a per-block cache
+        self.syntax_highlighter = None
+        if self.highlighter == 'pygments':
+            self.syntax_highlighter = get_syntax_highlighter(
+                theme=self.config.get('highlight_theme', 'default'),
+                chunk_lines=self.config.get('highlight_chunk_lines', 400)
+            )
+        
+        # Blocks at least this long are highlighted in a worker process
+        self.heavy_block_size = self.config.get('heavy_block_size', 1024 * 1024)
     
     def detect(self, content: str) -> List[Tuple[int, int, Dict[str, Any]]]:
         """
@@ -40,27 +65,57 @@ class CodeBlockProcessor(ContentProcessor):
         Returns:
             List of tuples containing (start_index, end_index, metadata)
         """
-        result = []
+        return self.detect_with_patterns(content)
+    
+    def get_rules(self) -> List[Rule]:
+        """
+        Get the rule for fenced code blocks
         
-        # Skip Mermaid code blocks (handled by MermaidContentProcessor)
-        for match in re.finditer(self.code_block_pattern, content, re.DOTALL):
-            start, end = match.span()
-            language = match.group(1) or ''
-            code = match.group(2)
-            
-            # Skip Mermaid code blocks
-            if language.lower() == 'mermaid':
-                continue
+        Returns:
+            List of lexer rules
+        """
+        return [FencedBlockRule('code')]
+    
+    def build_metadata(self, block_type: str, match: LexMatch) -> Optional[Dict[str, Any]]:
+        """
+        Build the metadata for a code block
+        
+        Args:
+            block_type: Always 'code'
+            match: Match object of the rule
             
-            result.append((
-                start, end, 
-                {
-                    'language': language,
-                    'code': code
-                }
-            ))
-        
-        return result
+        Returns:
+            Metadata dictionary, or None for languages handled by other processors
+        """
+        language = match.group(1)
+        
+        # Skip diagrams, charts and data blocks (handled by their own processors)
+        if language.lower() in self.skip_languages:
+            return None
+        
+        # Leave blocks with pandoc attributes such as {.python .numberLines} to pandoc
+        if language.startswith('{'):
+            return None
+        
+        return {
+            'language': language,
+            'code': match.group(2)
+        }
+    
+    def get_cost_class(self, metadata: Dict[str, Any], format_type: str) -> str:
+        """
+        Get the cost class of a code block
+        
+        Args:
+            metadata: Metadata of the block
+            format_type: 'preview' or export format type
+        
+        Returns:
+            HEAVY_CPU for long blocks highlighted with Pygments, CHEAP otherwise
+        """
+        if self.syntax_highlighter is not None and len(metadata.get('code', '')) >= self.heavy_block_size:
+            return CostClass.HEAVY_CPU
+        return CostClass.CHEAP
     
     def process_for_preview(self, content: str, metadata: Dict[str, Any]) -> str:
         """
@@ -76,6 +131,12 @@ class CodeBlockProcessor(ContentProcessor):
         language = metadata.get('language', '')
         code = metadata.get('code', '')
         
+        # Highlight in-process if possible
+        if self.syntax_highlighter is not None:
+            highlighted = self.syntax_highlighter.highlight_html(code, language)
+            if highlighted is not None:
+                return f'<div class="highlight"><pre><code class="language-{language}">{highlighted}</code></pre></div>'
+        
         # Escape HTML entities
         code = code.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
         
@@ -105,7 +166,8 @@ class CodeBlockProcessor(ContentProcessor):
             return self.process_for_preview(content, metadata)
         
         elif format_type in ['pdf', 'latex', 'docx']:
-            # For PDF/LaTeX/DOCX export, use Markdown format
+            # For PDF/LaTeX/DOCX export, use Markdown format and let pandoc
+            # highlight it (see get_pandoc_args)
             if language:
                 return f'```{language}\n{code}\n```'
             else:
@@ -124,7 +186,10 @@ class CodeBlockProcessor(ContentProcessor):
         Returns:
             List of JavaScript script URLs or inline scripts
         """
-        if self.highlighter == 'highlight.js':
+        if self.highlighter == 'pygments':
+            # Code is highlighted server-side, no scripts needed
+            return []
+        elif self.highlighter == 'highlight.js':
             return [
                 '<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/highlight.js@11.7.0/styles/default.min.css">',
                 '<script src="https://cdn.jsdelivr.net/npm/highlight.js@11.7.0/lib/highlight.min.js"></script>',
@@ -136,6 +201,29 @@ class CodeBlockProcessor(ContentProcessor):
                 '<script src="https://cdn.jsdelivr.net/npm/prismjs@1.29.0/prism.min.js"></script>'
             ]
     
+    def get_required_styles(self) -> List[str]:
+        """
+        Get required CSS styles for syntax highlighting
+        
+        Returns:
+            List of CSS style URLs or inline styles
+        """
+        if self.syntax_highlighter is not None:
+            return [self.syntax_highlighter.get_stylesheet()]
+        return []
+    
+    def get_pandoc_args(self) -> List[str]:
+        """
+        Get pandoc arguments for highlighting the fenced code blocks left for
+        PDF/LaTeX/DOCX export
+        
+        Returns:
+            List of command-line arguments
+        """
+        if self.syntax_highlighter is not None:
+            return ['--highlight-style', self.syntax_highlighter.get_pandoc_style()]
+        return ['--highlight-style', 'pygments']
+    
     def get_dependencies(self) -> List[str]:
         """
         Get required external dependencies
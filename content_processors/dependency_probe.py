@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+External Dependency Probes
+--------------------------
+Lazy, cached lookups of the external tools used by the content processors.
+
+Each probe runs at most once per process, the first time a processor needs
+the tool, instead of every time a processor is constructed. Call
+clear_probe_cache() after installing a tool to probe again.
+"""
+
+import os
+import re
+import threading
+import subprocess
+from functools import lru_cache, wraps
+from shutil import which
+from typing import Optional, Tuple
+from logging_config import get_logger
+
+logger = get_logger()
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# npx may try to reach the npm registry, so never wait on it for long
+PROBE_TIMEOUT = 20
+
+_probe_lock = threading.Lock()
+_probes = []
+
+
+def _cached_probe(func):
+    """Run a probe once, even when several threads ask for it at the same time"""
+    cached = lru_cache(maxsize=None)(func)
+    _probes.append(cached)
+    
+    @wraps(func)
+    def wrapper():
+        with _probe_lock:
+            return cached()
+    
+    return wrapper
+
+
+def _run_version(cmd, pattern: Optional[str] = None) -> Optional[str]:
+    """
+    Run a version command
+    
+    Args:
+        cmd: Command line as a list
+        pattern: Optional regular expression with the version in group 1
+    
+    Returns:
+        Version string, or None if the command failed
+    """
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=False, timeout=PROBE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.debug(f"Error running {' '.join(cmd)}: {str(e)}")
+        return None
+    
+    if result.returncode != 0:
+        return None
+    if pattern is None:
+        return result.stdout.strip()
+    
+    version_match = re.search(pattern, result.stdout + result.stderr)
+    return version_match.group(1) if version_match else "unknown"
+
+
+@_cached_probe
+def find_mermaid_cli() -> Tuple[Optional[str], Optional[str]]:
+    """
+    Find the Mermaid CLI
+    
+    Returns:
+        Tuple of (command, version), where command is an executable path or
+        'npx mmdc', or (None, None) if not found
+    """
+    candidates = [which('mmdc'), os.path.join(APP_DIR, "node_modules", ".bin", "mmdc")]
+    for mmdc_path in candidates:
+        if mmdc_path and os.path.isfile(mmdc_path):
+            version = _run_version([mmdc_path, '--version'])
+            if version is not None:
+                logger.info(f"Found Mermaid CLI: {mmdc_path}, version: {version}")
+                return mmdc_path, version
+    
+    if which('npx'):
+        version = _run_version(['npx', '--no-install', 'mmdc', '--version'])
+        if version is not None:
+            logger.info(f"Found Mermaid CLI via npx, version: {version}")
+            return 'npx mmdc', version
+    
+    logger.warning("Mermaid CLI not found, diagrams will be rendered client-side")
+    return None, None
+
+
+@_cached_probe
+def find_plantuml() -> Tuple[Optional[str], Optional[str]]:
+    """
+    Find the PlantUML executable or jar
+    
+    Returns:
+        Tuple of (command, version) or (None, None) if not found
+    """
+    version_pattern = r'PlantUML version (\d+\.\d+\.\d+)'
+    
+    if which('plantuml'):
+        version = _run_version(['plantuml', '-version'], version_pattern)
+        if version is not None:
+            logger.info(f"Found PlantUML: {version}")
+            return "plantuml", version
+    
+    # Check for plantuml.jar in common locations
+    common_paths = [
+        os.path.join(APP_DIR, "resources", "plantuml.jar"),
+        os.path.expanduser("~/plantuml.jar"),
+        "/usr/local/bin/plantuml.jar",
+        "C:\\Program Files\\PlantUML\\plantuml.jar"
+    ]
+    for path in common_paths:
+        if os.path.exists(path) and which('java'):
+            logger.info(f"Found PlantUML jar: {path}")
+            version = _run_version(['java', '-jar', path, '-version'], version_pattern)
+            return f"java -jar {path}", version or "unknown"
+    
+    logger.warning("PlantUML not found, diagrams will be rendered as code blocks")
+    return None, None
+
+
+@_cached_probe
+def find_mathjax() -> Optional[str]:
+    """
+    Find the local MathJax resources
+    
+    Returns:
+        Path of the MathJax directory, or None if MathJax is loaded from the CDN
+    """
+    mathjax_path = os.path.join(APP_DIR, "resources", "mathjax")
+    if os.path.exists(mathjax_path):
+        logger.info(f"Found MathJax resources: {mathjax_path}")
+        return mathjax_path
+    
+    logger.warning("MathJax resources not found, math equations will be rendered using online CDN")
+    return None
+
+
+def clear_probe_cache() -> None:
+    """Forget all probe results so the next lookup runs the probes again"""
+    with _probe_lock:
+        for probe in _probes:
+            probe.cache_clear()
@@ -13,20 +13,42 @@ Provides comprehensive support for various document elements:
 
 import re
 import os
-import csv
-import io
 import base64
 import json
+import shlex
 import tempfile
 import subprocess
+from functools import lru_cache
 from typing import Dict, List, Tuple, Any, Optional
 from pathlib import Path
 
 from logging_config import get_logger
-from content_processors.base_processor import ContentProcessor
+from content_processors.base_processor import ContentProcessor, CostClass
+from content_processors.block_lexer import FencedBlockRule, LexMatch, PipeTableRule, Rule
+from content_processors.dependency_probe import find_mermaid_cli, find_plantuml, find_mathjax
+from content_processors.table_renderer import (
+    ColumnarTable, iter_csv_rows, render_html_table, render_paged_pipe_tables, render_table, render_virtual_table
+)
 
 logger = get_logger()
 
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VIRTUAL_TABLE_SCRIPT = os.path.join(APP_DIR, "resources", "virtual_table.js")
+
+# Math within a single table cell, blocks are converted by MathContentProcessor
+CELL_MATH_PATTERN = re.compile(r'\$\$([^$]+)\$\$|\$([^$]+)\$')
+
+
+@lru_cache(maxsize=None)
+def _load_virtual_table_script() -> Optional[str]:
+    """Read the script of virtualized tables once"""
+    try:
+        with open(VIRTUAL_TABLE_SCRIPT, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError as e:
+        logger.warning(f"Could not read {VIRTUAL_TABLE_SCRIPT}: {str(e)}")
+        return None
+
 class EnhancedElementProcessor(ContentProcessor):
     """
     Enhanced processor for various document elements
@@ -41,121 +63,66 @@ class EnhancedElementProcessor(ContentProcessor):
             config: Configuration dictionary
         """
         super().__init__(config)
-        self.temp_dir = tempfile.mkdtemp(prefix="markdown2pdf_")
+        self._temp_dir = None
         
-        # Patterns for different elements
+        # Pattern for the pipe tables of a detected table block
         self.table_pattern = r'(\|[^\n]+\|\n\|[-:| ]+\|\n(?:\|[^\n]+\|\n)+)'
-        self.csv_pattern = r'```csv\s+(.*?)\s+```'
-        self.mermaid_pattern = r'```mermaid\s+(.*?)\s+```'
-        self.plantuml_pattern = r'```plantuml\s+(.*?)\s+```'
-        self.math_pattern = r'\$\$(.*?)\$\$|\$(.*?)\$'
-        
-        # Initialize renderers
-        self._init_renderers()
     
-    def _init_renderers(self):
-        """Initialize various renderers for different content types"""
-        # Check for mermaid CLI
-        self.mmdc_path, self.mmdc_version = self._find_mermaid_cli()
+    def configure(self, config=None):
+        """
+        Apply a new configuration to the enhanced element processor
         
-        # Check for PlantUML
-        self.plantuml_path, self.plantuml_version = self._find_plantuml()
+        Args:
+            config: Configuration dictionary
+        """
+        super().configure(config)
         
-        # Check for MathJax
-        self.mathjax_available = self._check_mathjax()
+        # Tables and CSV data at least this long are converted in a worker process
+        self.heavy_block_size = self.config.get('heavy_block_size', 1024 * 1024)
+        
+        # Row limits of CSV tables, None shows all rows. A max-rows option on the fence overrides them.
+        self.csv_preview_max_rows = self.config.get('csv_preview_max_rows', 1000)
+        self.csv_export_max_rows = self.config.get('csv_export_max_rows')
+        self.asset_paths = self.config.get('asset_paths', {})
+        
+        # Pipe tables with at least this many rows are virtualized in the preview,
+        # and split into tables of table_page_rows rows for HTML-based exports
+        self.large_table_rows = self.config.get('large_table_rows', 1000)
+        self.table_page_rows = self.config.get('table_page_rows', 50)
+        self.table_split_formats = self.config.get('table_split_formats', ['html', 'epub'])
     
-    def _find_mermaid_cli(self) -> Tuple[str, str]:
-        """Find Mermaid CLI executable"""
-        try:
-            # Try to find mmdc executable
-            result = subprocess.run(
-                ["mmdc", "--version"], 
-                capture_output=True, 
-                text=True, 
-                check=False
-            )
-            if result.returncode == 0:
-                version = result.stdout.strip()
-                logger.info(f"Found Mermaid CLI: {version}")
-                return "mmdc", version
-            
-            # Try npm global path
-            result = subprocess.run(
-                ["npm", "list", "-g", "@mermaid-js/mermaid-cli"], 
-                capture_output=True, 
-                text=True, 
-                check=False
-            )
-            if "@mermaid-js/mermaid-cli" in result.stdout:
-                version_match = re.search(r'@mermaid-js/mermaid-cli@(\d+\.\d+\.\d+)', result.stdout)
-                version = version_match.group(1) if version_match else "unknown"
-                logger.info(f"Found Mermaid CLI via npm: {version}")
-                return "npx mmdc", version
-            
-            logger.warning("Mermaid CLI not found, diagrams will be rendered as code blocks")
-            return "", ""
-        except Exception as e:
-            logger.error(f"Error finding Mermaid CLI: {str(e)}")
-            return "", ""
+    @property
+    def temp_dir(self) -> str:
+        """Temporary directory for rendered files, created on first use"""
+        if self._temp_dir is None:
+            self._temp_dir = tempfile.mkdtemp(prefix="markdown2pdf_")
+        return self._temp_dir
     
-    def _find_plantuml(self) -> Tuple[str, str]:
-        """Find PlantUML executable or jar"""
-        try:
-            # Try to find plantuml executable
-            result = subprocess.run(
-                ["plantuml", "-version"], 
-                capture_output=True, 
-                text=True, 
-                check=False
-            )
-            if result.returncode == 0:
-                version_match = re.search(r'PlantUML version (\d+\.\d+\.\d+)', result.stdout)
-                version = version_match.group(1) if version_match else "unknown"
-                logger.info(f"Found PlantUML: {version}")
-                return "plantuml", version
-            
-            # Check for plantuml.jar in common locations
-            common_paths = [
-                os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources", "plantuml.jar"),
-                os.path.expanduser("~/plantuml.jar"),
-                "/usr/local/bin/plantuml.jar",
-                "C:\\Program Files\\PlantUML\\plantuml.jar"
-            ]
-            
-            for path in common_paths:
-                if os.path.exists(path):
-                    logger.info(f"Found PlantUML jar: {path}")
-                    # Try to get version
-                    result = subprocess.run(
-                        ["java", "-jar", path, "-version"], 
-                        capture_output=True, 
-                        text=True, 
-                        check=False
-                    )
-                    version_match = re.search(r'PlantUML version (\d+\.\d+\.\d+)', result.stdout)
-                    version = version_match.group(1) if version_match else "unknown"
-                    return f"java -jar {path}", version
-            
-            logger.warning("PlantUML not found, diagrams will be rendered as code blocks")
-            return "", ""
-        except Exception as e:
-            logger.error(f"Error finding PlantUML: {str(e)}")
-            return "", ""
+    # External renderers are probed on first use and shared by all instances
+    @property
+    def mmdc_path(self) -> Optional[str]:
+        """Mermaid CLI command"""
+        return find_mermaid_cli()[0]
     
-    def _check_mathjax(self) -> bool:
-        """Check if MathJax is available"""
-        try:
-            # Check if MathJax resources exist
-            mathjax_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources", "mathjax")
-            if os.path.exists(mathjax_path):
-                logger.info(f"Found MathJax resources: {mathjax_path}")
-                return True
-            
-            logger.warning("MathJax resources not found, math equations will be rendered using online CDN")
-            return False
-        except Exception as e:
-            logger.error(f"Error checking MathJax: {str(e)}")
-            return False
+    @property
+    def mmdc_version(self) -> Optional[str]:
+        """Mermaid CLI version"""
+        return find_mermaid_cli()[1]
+    
+    @property
+    def plantuml_path(self) -> Optional[str]:
+        """PlantUML command"""
+        return find_plantuml()[0]
+    
+    @property
+    def plantuml_version(self) -> Optional[str]:
+        """PlantUML version"""
+        return find_plantuml()[1]
+    
+    @property
+    def mathjax_available(self) -> bool:
+        """Whether local MathJax resources exist"""
+        return find_mathjax() is not None
     
     def detect(self, content: str) -> List[Tuple[int, int, Dict[str, Any]]]:
         """
@@ -167,40 +134,121 @@ class EnhancedElementProcessor(ContentProcessor):
         Returns:
             List of tuples with (start_pos, end_pos, element_info)
         """
-        result = []
-        
-        # Detect tables
-        for match in re.finditer(self.table_pattern, content, re.DOTALL):
-            start, end = match.span()
-            table_content = match.group(1)
-            result.append((start, end, {'type': 'table', 'content': table_content}))
-        
-        # Detect CSV data
-        for match in re.finditer(self.csv_pattern, content, re.DOTALL):
-            start, end = match.span()
-            csv_content = match.group(1).strip()
-            result.append((start, end, {'type': 'csv', 'content': csv_content}))
-        
-        # Detect Mermaid diagrams
-        for match in re.finditer(self.mermaid_pattern, content, re.DOTALL):
-            start, end = match.span()
-            mermaid_code = match.group(1).strip()
-            result.append((start, end, {'type': 'mermaid', 'content': mermaid_code}))
-        
-        # Detect PlantUML diagrams
-        for match in re.finditer(self.plantuml_pattern, content, re.DOTALL):
-            start, end = match.span()
-            plantuml_code = match.group(1).strip()
-            result.append((start, end, {'type': 'plantuml', 'content': plantuml_code}))
-        
-        # Detect math equations
-        for match in re.finditer(self.math_pattern, content, re.DOTALL):
-            start, end = match.span()
-            math_content = match.group(1) or match.group(2)
-            is_block = match.group(1) is not None  # $$ for block, $ for inline
-            result.append((start, end, {'type': 'math', 'content': math_content, 'block': is_block}))
-        
-        return result
+        return self.detect_with_patterns(content)
+    
+    def get_rules(self) -> List[Rule]:
+        """
+        Get the rules for tables, CSV data and PlantUML diagrams
+        
+        Mermaid diagrams and math are left to MermaidContentProcessor and
+        MathContentProcessor, so every block has exactly one owner.
+        
+        Returns:
+            List of lexer rules
+        """
+        return [
+            PipeTableRule('table'),
+            FencedBlockRule('csv', ['csv']),
+            FencedBlockRule('plantuml', ['plantuml'])
+        ]
+    
+    def build_metadata(self, block_type: str, match: LexMatch) -> Optional[Dict[str, Any]]:
+        """
+        Build the metadata for an enhanced element
+        
+        Args:
+            block_type: 'table', 'csv' or 'plantuml'
+            match: Match object of the rule
+        
+        Returns:
+            Metadata dictionary
+        """
+        if block_type == 'table':
+            return {'type': 'table', 'content': match.group(1)}
+        if block_type == 'csv':
+            return self._build_csv_metadata(match.group(2).strip(), match.group(3))
+        return {'type': block_type, 'content': match.group(2).strip()}
+    
+    def _build_csv_metadata(self, content: str, info: str) -> Dict[str, Any]:
+        """
+        Build the metadata of a CSV block from its body and fence options
+        
+        The info string may follow the language with key=value options:
+        src (external CSV file), max-rows, delimiter and header (yes/no),
+        e.g. ```csv src="data/sales.csv" max-rows=500
+        
+        Args:
+            content: Inline CSV data
+            info: Info string of the opening fence
+        
+        Returns:
+            Metadata dictionary
+        """
+        try:
+            words = shlex.split(info)
+        except ValueError:
+            words = info.split()
+        options = dict(word.split('=', 1) for word in words[1:] if '=' in word)
+        
+        metadata = {
+            'type': 'csv',
+            'content': content,
+            'src': self.resolve_path(options['src']) if options.get('src') else None,
+            'delimiter': options.get('delimiter', ',')[:1] or ',',
+            'header': options.get('header', 'yes').lower() not in ('no', 'false', '0'),
+            'max_rows': None
+        }
+        if options.get('max-rows', '').isdigit():
+            metadata['max_rows'] = int(options['max-rows'])
+        return metadata
+    
+    def resolve_path(self, path: str) -> str:
+        """
+        Resolve a path using asset_paths
+        
+        Args:
+            path: The path to resolve
+        
+        Returns:
+            Resolved path
+        """
+        return self.asset_paths.get(path, path)
+    
+    def get_file_dependencies(self, metadata: Dict[str, Any]) -> List[str]:
+        """
+        Get the external CSV file of a block
+        
+        Args:
+            metadata: Metadata of the block
+        
+        Returns:
+            List with the CSV path, or an empty list for inline data
+        """
+        return [metadata['src']] if metadata.get('src') else []
+    
+    def get_cost_class(self, metadata: Dict[str, Any], format_type: str) -> str:
+        """
+        Get the cost class of an enhanced element
+        
+        Args:
+            metadata: Metadata of the block
+            format_type: 'preview' or export format type
+        
+        Returns:
+            SUBPROCESS for PlantUML previews, HEAVY_CPU for large tables and CSV data
+        """
+        element_type = metadata.get('type')
+        if element_type == 'plantuml':
+            return CostClass.SUBPROCESS if format_type == 'preview' else CostClass.CHEAP
+        size = len(metadata.get('content', ''))
+        if metadata.get('src'):
+            try:
+                size = os.path.getsize(metadata['src'])
+            except OSError:
+                pass
+        if size >= self.heavy_block_size:
+            return CostClass.HEAVY_CPU
+        return CostClass.CHEAP
     
     def process_for_preview(self, content: str, metadata: Dict[str, Any]) -> str:
         """
@@ -215,26 +263,14 @@ class EnhancedElementProcessor(ContentProcessor):
         """
         logger.debug("Processing enhanced elements for preview")
         
-        try:
-            # Process tables
-            content = self._enhance_tables_for_preview(content)
-            
-            # Process CSV data
-            content = self._process_csv_for_preview(content)
-            
-            # Process Mermaid diagrams
-            content = self._process_mermaid_for_preview(content)
-            
-            # Process PlantUML diagrams
-            content = self._process_plantuml_for_preview(content)
-            
-            # Process math equations
-            content = self._process_math_for_preview(content)
-            
-            return content
-        except Exception as e:
-            logger.error(f"Error processing enhanced elements for preview: {str(e)}")
-            return content
+        element_type = metadata.get('type')
+        if element_type == 'csv':
+            return self._render_csv_for_preview(metadata)
+        if element_type == 'table':
+            return self._enhance_tables_for_preview(content)
+        if element_type == 'plantuml':
+            return self._render_plantuml_for_preview(metadata.get('content', ''))
+        return content
     
     def process_for_export(self, content: str, metadata: Dict[str, Any], format_type: str) -> str:
         """
@@ -250,447 +286,171 @@ class EnhancedElementProcessor(ContentProcessor):
         """
         logger.debug(f"Processing enhanced elements for export to {format_type}")
         
-        try:
-            # Process tables
-            content = self._enhance_tables_for_export(content)
-            
-            # Process CSV data
-            content = self._process_csv_for_export(content)
-            
-            # Process Mermaid diagrams
-            content = self._process_mermaid_for_export(content)
-            
-            # Process PlantUML diagrams
-            content = self._process_plantuml_for_export(content)
-            
-            # Process math equations
-            content = self._process_math_for_export(content)
-            
-            return content
-        except Exception as e:
-            logger.error(f"Error processing enhanced elements for export: {str(e)}")
-            return content
+        element_type = metadata.get('type')
+        if element_type == 'csv':
+            return self._render_csv_for_export(metadata, format_type)
+        if element_type == 'table':
+            return self._enhance_tables_for_export(content, format_type)
+        # PlantUML blocks are kept as is, the export process handles them separately
+        return content
     
     def _enhance_tables_for_preview(self, content: str) -> str:
-        """Enhance tables for preview with better styling"""
+        """Enhance tables for preview with better styling, virtualizing large tables"""
         def replace_table(match):
-            table_content = match.group(1)
-            
-            # Parse the table
-            lines = table_content.strip().split('\n')
-            if len(lines) < 3:
+            table = ColumnarTable.from_pipe_table(match.group(1))
+            if table is None or not table.row_count:
                 return match.group(0)  # Not enough lines for a valid table
             
-            # Extract header and alignment
-            header_row = lines[0]
-            alignment_row = lines[1]
-            data_rows = lines[2:]
-            
-            # Parse alignment
-            alignments = []
-            for cell in alignment_row.split('|')[1:-1]:
-                cell = cell.strip()
-                if cell.startswith(':') and cell.endswith(':'):
-                    alignments.append('center')
-                elif cell.endswith(':'):
-                    alignments.append('right')
-                else:
-                    alignments.append('left')
-            
-            # Build enhanced HTML table
-            html = '<div class="enhanced-table-container">\n'
-            html += '<table class="enhanced-table">\n'
+            # Math is converted cell by cell, before the cells are laid out or serialized
+            if '$' in match.group(1):
+                convert = lambda cell: self._convert_cell_math(cell) if '$' in cell else cell
+                table.header = [convert(cell) for cell in table.header]
+                table.columns = [[convert(cell) for cell in column] for column in table.columns]
             
-            # Header
-            html += '<thead>\n<tr>\n'
-            header_cells = header_row.split('|')[1:-1]
-            for i, cell in enumerate(header_cells):
-                alignment = alignments[i] if i < len(alignments) else 'left'
-                html += f'<th style="text-align: {alignment}">{cell.strip()}</th>\n'
-            html += '</tr>\n</thead>\n'
-            
-            # Body
-            html += '<tbody>\n'
-            for row in data_rows:
-                html += '<tr>\n'
-                cells = row.split('|')[1:-1]
-                for i, cell in enumerate(cells):
-                    alignment = alignments[i] if i < len(alignments) else 'left'
-                    html += f'<td style="text-align: {alignment}">{cell.strip()}</td>\n'
-                html += '</tr>\n'
-            html += '</tbody>\n'
-            
-            html += '</table>\n</div>'
-            
-            # Add CSS for enhanced tables
-            css = """
-            <style>
-            .enhanced-table-container {
-                overflow-x: auto;
-                margin: 20px 0;
-            }
-            .enhanced-table {
-                border-collapse: collapse;
-                width: 100%;
-                border: 1px solid #ddd;
-            }
-            .enhanced-table th, .enhanced-table td {
-                padding: 8px;
-                border: 1px solid #ddd;
-            }
-            .enhanced-table thead {
-                background-color: #f2f2f2;
-                font-weight: bold;
-            }
-            .enhanced-table tr:nth-child(even) {
-                background-color: #f9f9f9;
-            }
-            .enhanced-table tr:hover {
-                background-color: #f1f1f1;
-            }
-            </style>
-            """
-            
-            return css + html
+            # Large tables only lay out the rows in view, styled by the shared stylesheet
+            if table.row_count >= self.large_table_rows:
+                return render_virtual_table(table, escape_cells=False)
+            return render_html_table(table.iter_rows(), 'enhanced-table', alignments=table.alignments, escape_cells=False)
         
         return re.sub(self.table_pattern, replace_table, content, flags=re.DOTALL)
     
-    def _enhance_tables_for_export(self, content: str) -> str:
-        """Enhance tables for export"""
-        # For export, we'll let the Markdown processor handle tables
-        # This is just a placeholder in case we need special handling
-        return content
-    
-    def _process_csv_for_preview(self, content: str) -> str:
-        """Process CSV data for preview"""
-        def replace_csv(match):
-            csv_content = match.group(1).strip()
-            
-            try:
-                # Parse CSV data
-                csv_reader = csv.reader(io.StringIO(csv_content))
-                rows = list(csv_reader)
-                
-                if not rows:
-                    return '<div class="csv-error">Empty CSV data</div>'
-                
-                # Build HTML table
-                html = '<div class="csv-table-container">\n'
-                html += '<table class="csv-table">\n'
-                
-                # Header (first row)
-                html += '<thead>\n<tr>\n'
-                for cell in rows[0]:
-                    html += f'<th>{cell}</th>\n'
-                html += '</tr>\n</thead>\n'
-                
-                # Body (remaining rows)
-                html += '<tbody>\n'
-                for row in rows[1:]:
-                    html += '<tr>\n'
-                    for cell in row:
-                        html += f'<td>{cell}</td>\n'
-                    html += '</tr>\n'
-                html += '</tbody>\n'
-                
-                html += '</table>\n</div>'
-                
-                # Add CSS for CSV tables
-                css = """
-                <style>
-                .csv-table-container {
-                    overflow-x: auto;
-                    margin: 20px 0;
-                }
-                .csv-table {
-                    border-collapse: collapse;
-                    width: 100%;
-                    border: 1px solid #ddd;
-                }
-                .csv-table th, .csv-table td {
-                    padding: 8px;
-                    border: 1px solid #ddd;
-                    text-align: left;
-                }
-                .csv-table thead {
-                    background-color: #f2f2f2;
-                    font-weight: bold;
-                }
-                .csv-table tr:nth-child(even) {
-                    background-color: #f9f9f9;
-                }
-                .csv-table tr:hover {
-                    background-color: #f1f1f1;
-                }
-                .csv-error {
-                    color: red;
-                    font-style: italic;
-                    padding: 10px;
-                    border: 1px solid #ffcccc;
-                    background-color: #ffeeee;
-                    margin: 10px 0;
-                }
-                </style>
-                """
-                
-                return css + html
-            except Exception as e:
-                logger.error(f"Error processing CSV data: {str(e)}")
-                return f'<div class="csv-error">Error processing CSV data: {str(e)}</div>'
-        
-        return re.sub(self.csv_pattern, replace_csv, content, flags=re.DOTALL)
-    
-    def _process_csv_for_export(self, content: str) -> str:
-        """Process CSV data for export"""
-        def replace_csv(match):
-            csv_content = match.group(1).strip()
-            
-            try:
-                # Parse CSV data
-                csv_reader = csv.reader(io.StringIO(csv_content))
-                rows = list(csv_reader)
-                
-                if not rows:
-                    return '**Empty CSV data**'
-                
-                # Convert to Markdown table
-                md_table = []
-                
-                # Header
-                header = ' | '.join(rows[0])
-                md_table.append(f'| {header} |')
-                
-                # Separator
-                separator = ' | '.join(['---'] * len(rows[0]))
-                md_table.append(f'| {separator} |')
-                
-                # Data rows
-                for row in rows[1:]:
-                    data = ' | '.join(row)
-                    md_table.append(f'| {data} |')
-                
-                return '\n'.join(md_table)
-            except Exception as e:
-                logger.error(f"Error processing CSV data for export: {str(e)}")
-                return f'**Error processing CSV data: {str(e)}**'
-        
-        return re.sub(self.csv_pattern, replace_csv, content, flags=re.DOTALL)
+    def _enhance_tables_for_export(self, content: str, format_type: str) -> str:
+        """Split large tables into page-sized tables that repeat the header"""
+        # Other formats keep a single table, pandoc writes it as a longtable for PDF
+        if format_type not in self.table_split_formats:
+            return content
+        
+        def replace_table(match):
+            table = ColumnarTable.from_pipe_table(match.group(1))
+            if table is None or table.row_count < self.large_table_rows:
+                return match.group(0)
+            return render_paged_pipe_tables(table, self.table_page_rows) + '\n'
+        
+        return re.sub(self.table_pattern, replace_table, content, flags=re.DOTALL)
     
-    def _process_mermaid_for_preview(self, content: str) -> str:
-        """Process Mermaid diagrams for preview"""
-        def replace_mermaid(match):
-            mermaid_code = match.group(1).strip()
-            
-            # If Mermaid CLI is not available, use client-side rendering
-            if not self.mmdc_path:
-                return f"""
-                <div class="mermaid-diagram">
-                    <div class="mermaid">
-                    {mermaid_code}
-                    </div>
-                </div>
-                <script src="https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js"></script>
-                <script>
-                    mermaid.initialize({{ startOnLoad: true }});
-                </script>
-                """
-            
-            try:
-                # Create a temporary file for the Mermaid code
-                with tempfile.NamedTemporaryFile(suffix='.mmd', delete=False, mode='w') as f:
-                    mmd_file = f.name
-                    f.write(mermaid_code)
-                
-                # Create a temporary file for the SVG output
-                svg_file = os.path.splitext(mmd_file)[0] + '.svg'
-                
-                # Run Mermaid CLI to generate SVG
-                cmd = f"{self.mmdc_path} -i {mmd_file} -o {svg_file}"
-                subprocess.run(cmd, shell=True, check=True)
-                
-                # Read the SVG content
-                with open(svg_file, 'r') as f:
-                    svg_content = f.read()
-                
-                # Clean up temporary files
-                os.unlink(mmd_file)
-                os.unlink(svg_file)
-                
-                return f"""
-                <div class="mermaid-diagram">
-                    {svg_content}
-                </div>
-                <style>
-                .mermaid-diagram {{
-                    text-align: center;
-                    margin: 20px 0;
-                }}
-                .mermaid-diagram svg {{
-                    max-width: 100%;
-                    height: auto;
-                }}
-                </style>
-                """
-            except Exception as e:
-                logger.error(f"Error rendering Mermaid diagram: {str(e)}")
-                return f"""
-                <div class="mermaid-error">
-                    <p>Error rendering Mermaid diagram: {str(e)}</p>
-                    <pre><code class="language-mermaid">{mermaid_code}</code></pre>
-                </div>
-                <style>
-                .mermaid-error {{
-                    color: red;
-                    font-style: italic;
-                    padding: 10px;
-                    border: 1px solid #ffcccc;
-                    background-color: #ffeeee;
-                    margin: 10px 0;
-                }}
-                </style>
-                """
-        
-        return re.sub(self.mermaid_pattern, replace_mermaid, content, flags=re.DOTALL)
+    def _csv_rows(self, metadata: Dict[str, Any]):
+        """Iterate over the rows of a CSV block, read from its external file if it has one"""
+        return iter_csv_rows(metadata.get('content', ''), metadata.get('src'), metadata.get('delimiter', ','))
     
-    def _process_mermaid_for_export(self, content: str) -> str:
-        """Process Mermaid diagrams for export"""
-        # For export, we'll keep the Mermaid code blocks as is
-        # The export process will handle them separately
-        return content
-    
-    def _process_plantuml_for_preview(self, content: str) -> str:
-        """Process PlantUML diagrams for preview"""
-        def replace_plantuml(match):
-            plantuml_code = match.group(1).strip()
-            
-            # If PlantUML is not available, show the code
-            if not self.plantuml_path:
-                return f"""
-                <div class="plantuml-code">
-                    <p><strong>PlantUML Diagram</strong> (PlantUML not available for rendering)</p>
-                    <pre><code class="language-plantuml">{plantuml_code}</code></pre>
-                </div>
-                <style>
-                .plantuml-code {{
-                    padding: 10px;
-                    border: 1px solid #ddd;
-                    background-color: #f8f8f8;
-                    margin: 10px 0;
-                }}
-                </style>
-                """
-            
-            try:
-                # Create a temporary file for the PlantUML code
-                with tempfile.NamedTemporaryFile(suffix='.puml', delete=False, mode='w') as f:
-                    puml_file = f.name
-                    f.write(plantuml_code)
-                
-                # Create a temporary file for the SVG output
-                svg_file = os.path.splitext(puml_file)[0] + '.svg'
-                
-                # Run PlantUML to generate SVG
-                cmd = f"{self.plantuml_path} -tsvg {puml_file}"
-                subprocess.run(cmd, shell=True, check=True)
-                
-                # Read the SVG content
-                with open(svg_file, 'r') as f:
-                    svg_content = f.read()
-                
-                # Clean up temporary files
-                os.unlink(puml_file)
-                os.unlink(svg_file)
-                
-                return f"""
-                <div class="plantuml-diagram">
-                    {svg_content}
-                </div>
-                <style>
-                .plantuml-diagram {{
-                    text-align: center;
-                    margin: 20px 0;
-                }}
-                .plantuml-diagram svg {{
-                    max-width: 100%;
-                    height: auto;
-                }}
-                </style>
-                """
-            except Exception as e:
-                logger.error(f"Error rendering PlantUML diagram: {str(e)}")
-                return f"""
-                <div class="plantuml-error">
-                    <p>Error rendering PlantUML diagram: {str(e)}</p>
-                    <pre><code class="language-plantuml">{plantuml_code}</code></pre>
-                </div>
-                <style>
-                .plantuml-error {{
-                    color: red;
-                    font-style: italic;
-                    padding: 10px;
-                    border: 1px solid #ffcccc;
-                    background-color: #ffeeee;
-                    margin: 10px 0;
-                }}
-                </style>
-                """
-        
-        return re.sub(self.plantuml_pattern, replace_plantuml, content, flags=re.DOTALL)
+    def _render_csv_for_preview(self, metadata: Dict[str, Any]) -> str:
+        """Render a CSV block as an HTML table styled by the shared stylesheet"""
+        max_rows = metadata.get('max_rows')
+        if self.csv_preview_max_rows is not None:
+            max_rows = min(max_rows if max_rows is not None else self.csv_preview_max_rows, self.csv_preview_max_rows)
+        
+        try:
+            html = render_html_table(self._csv_rows(metadata), 'csv-table', max_rows, metadata.get('header', True))
+            if '<tr>' not in html:
+                return '<div class="csv-error">Empty CSV data</div>'
+            return html
+        except Exception as e:
+            logger.error(f"Error processing CSV data: {str(e)}")
+            return f'<div class="csv-error">Error processing CSV data: {str(e)}</div>'
     
-    def _process_plantuml_for_export(self, content: str) -> str:
-        """Process PlantUML diagrams for export"""
-        # For export, we'll keep the PlantUML code blocks as is
-        # The export process will handle them separately
-        return content
+    def _render_csv_for_export(self, metadata: Dict[str, Any], format_type: str) -> str:
+        """Render a CSV block as a raw HTML or Word table, or as a pipe table for other formats"""
+        max_rows = metadata.get('max_rows')
+        if max_rows is None:
+            max_rows = self.csv_export_max_rows
+        
+        try:
+            table = render_table(self._csv_rows(metadata), format_type, max_rows, metadata.get('header', True))
+            return table or '**Empty CSV data**'
+        except Exception as e:
+            logger.error(f"Error processing CSV data for export: {str(e)}")
+            return f'**Error processing CSV data: {str(e)}**'
     
-    def _process_math_for_preview(self, content: str) -> str:
-        """Process math equations for preview"""
+    def _convert_cell_math(self, cell: str) -> str:
+        """Convert the math of a table cell to MathJax delimiters"""
         def replace_math(match):
-            math_content = match.group(1) or match.group(2)
-            is_block = match.group(1) is not None  # $$ for block, $ for inline
-            
-            # Use MathJax for rendering
-            if is_block:
-                return f"""
-                <div class="math-block">
-                    \\[{math_content}\\]
-                </div>
-                """
-            else:
-                return f"\\({math_content}\\)"
-        
-        # Replace math equations
-        content = re.sub(self.math_pattern, replace_math, content)
-        
-        # Add MathJax script if not already present
-        if "\\(" in content or "\\[" in content:
-            if "</body>" in content:
-                mathjax_script = """
-                <script src="https://polyfill.io/v3/polyfill.min.js?features=es6"></script>
-                <script id="MathJax-script" async src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"></script>
-                <style>
-                .math-block {
-                    text-align: center;
-                    margin: 20px 0;
-                    overflow-x: auto;
-                }
-                </style>
-                """
-                content = content.replace("</body>", mathjax_script + "</body>")
+            if match.group(1) is not None:
+                return f"\\[{match.group(1)}\\]"
+            return f"\\({match.group(2)}\\)"
         
-        return content
+        return CELL_MATH_PATTERN.sub(replace_math, cell)
     
-    def _process_math_for_export(self, content: str) -> str:
-        """Process math equations for export"""
-        # For export, we'll keep the math equations as is
-        # The export process will handle them separately
-        return content
+    def _render_plantuml_for_preview(self, plantuml_code: str) -> str:
+        """Render a PlantUML diagram as inline SVG, or show its code without PlantUML"""
+        # If PlantUML is not available, show the code
+        if not self.plantuml_path:
+            return f"""
+            <div class="plantuml-code">
+                <p><strong>PlantUML Diagram</strong> (PlantUML not available for rendering)</p>
+                <pre><code class="language-plantuml">{plantuml_code}</code></pre>
+            </div>
+            <style>
+            .plantuml-code {{
+                padding: 10px;
+                border: 1px solid #ddd;
+                background-color: #f8f8f8;
+                margin: 10px 0;
+            }}
+            </style>
+            """
+        
+        try:
+            # Create a temporary file for the PlantUML code
+            with tempfile.NamedTemporaryFile(suffix='.puml', delete=False, mode='w') as f:
+                puml_file = f.name
+                f.write(plantuml_code)
+            
+            # Create a temporary file for the SVG output
+            svg_file = os.path.splitext(puml_file)[0] + '.svg'
+            
+            # Run PlantUML to generate SVG
+            cmd = f"{self.plantuml_path} -tsvg {puml_file}"
+            subprocess.run(cmd, shell=True, check=True)
+            
+            # Read the SVG content
+            with open(svg_file, 'r') as f:
+                svg_content = f.read()
+            
+            # Clean up temporary files
+            os.unlink(puml_file)
+            os.unlink(svg_file)
+            
+            return f"""
+            <div class="plantuml-diagram">
+                {svg_content}
+            </div>
+            <style>
+            .plantuml-diagram {{
+                text-align: center;
+                margin: 20px 0;
+            }}
+            .plantuml-diagram svg {{
+                max-width: 100%;
+                height: auto;
+            }}
+            </style>
+            """
+        except Exception as e:
+            logger.error(f"Error rendering PlantUML diagram: {str(e)}")
+            return f"""
+            <div class="plantuml-error">
+                <p>Error rendering PlantUML diagram: {str(e)}</p>
+                <pre><code class="language-plantuml">{plantuml_code}</code></pre>
+            </div>
+            <style>
+            .plantuml-error {{
+                color: red;
+                font-style: italic;
+                padding: 10px;
+                border: 1px solid #ffcccc;
+                background-color: #ffeeee;
+                margin: 10px 0;
+            }}
+            </style>
+            """
     
     def cleanup(self):
         """Clean up temporary files"""
+        if self._temp_dir is None:
+            return
         try:
             import shutil
-            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
         except Exception as e:
             logger.error(f"Error cleaning up temporary files: {str(e)}")
     
@@ -710,6 +470,11 @@ class EnhancedElementProcessor(ContentProcessor):
         if not self.mmdc_path:
             scripts.append("https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js")
         
+        # Add the script of virtualized tables
+        script = _load_virtual_table_script()
+        if script:
+            scripts.append(f"<script>\n{script}</script>")
+        
         return scripts
     
     def get_required_styles(self) -> List[str]:
@@ -723,7 +488,7 @@ class EnhancedElementProcessor(ContentProcessor):
         
         # Add table styles
         styles.append("""
-        .enhanced-table-container {
+        .enhanced-table-container, .csv-table-container {
             overflow-x: auto;
             margin: 20px 0;
         }
@@ -749,6 +514,36 @@ class EnhancedElementProcessor(ContentProcessor):
         .csv-table tr:hover {
             background-color: #f1f1f1;
         }
+        .csv-table th, .csv-table td {
+            text-align: left;
+        }
+        .csv-table-note {
+            font-style: italic;
+            color: #666;
+        }
+        .virtual-table {
+            max-height: 70vh;
+            overflow-y: auto;
+            margin: 20px 0;
+        }
+        .virtual-table .enhanced-table-container {
+            overflow: visible;
+            margin: 0;
+        }
+        .virtual-table thead th {
+            position: sticky;
+            top: 0;
+            background-color: #f2f2f2;
+        }
+        @media print {
+            /* Long tables repeat their header on every page */
+            .enhanced-table thead, .csv-table thead {
+                display: table-header-group;
+            }
+            .enhanced-table tr, .csv-table tr {
+                page-break-inside: avoid;
+            }
+        }
         """)
         
         # Add diagram styles
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Image Optimizer
+---------------
+Produces downscaled derivatives of raster images: thumbnails for the
+preview and images resampled to the target DPI for PDF, DOCX and EPUB
+exports, so multi-megapixel photos are neither decoded at full size on
+every preview refresh nor embedded unscaled.
+
+Derivatives are cached on disk by source content hash, target width and
+quality, so they are reused across documents. Batches are converted in
+parallel on a thread pool; Pillow releases the GIL while decoding,
+resampling and encoding. Source files are never modified, MDZ bundles
+keep the originals.
+"""
+
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from logging_config import get_logger
+
+logger = get_logger()
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".mdz", "cache", "images")
+
+# Raster formats that are resampled, and the format of their derivatives.
+# JPEG stays JPEG, everything else becomes lossless PNG.
+RASTER_FORMATS = {
+    '.jpg': 'jpeg',
+    '.jpeg': 'jpeg',
+    '.png': 'png',
+    '.webp': 'png',
+    '.bmp': 'png',
+    '.tif': 'png',
+    '.tiff': 'png'
+}
+
+_EXTENSIONS = {'jpeg': 'jpg', 'png': 'png'}
+
+# EXIF tag of the image orientation
+_ORIENTATION = 0x0112
+
+
+class ImageOptimizer:
+    """Cached, parallel image downscaler"""
+    
+    def __init__(self, cache_dir: Optional[str] = None, max_workers: Optional[int] = None):
+        """
+        Initialize the optimizer
+        
+        Args:
+            cache_dir: Directory for derivatives (defaults to ~/.mdz/cache/images)
+            max_workers: Maximum number of parallel conversions
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self._digests = {}
+        self._unchanged = set()
+        self._lock = threading.Lock()
+    
+    def supports(self, path: str) -> bool:
+        """
+        Check if an image can be optimized
+        
+        Args:
+            path: Image path
+        
+        Returns:
+            True for local raster images when Pillow is installed
+        """
+        return PIL_AVAILABLE and os.path.splitext(path)[1].lower() in RASTER_FORMATS and os.path.isfile(path)
+    
+    def get_source_digest(self, path: str) -> str:
+        """
+        Get the content hash of a source image
+        
+        Hashes are remembered by modification time and size, so unchanged
+        files are only read once.
+        
+        Args:
+            path: Image path
+        
+        Returns:
+            Hex SHA-256 digest of the file
+        """
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+    
+    def get_cache_path(self, path: str, max_width: int, quality: int) -> str:
+        """
+        Get the cache file path of a derivative
+        
+        Args:
+            path: Source image path
+            max_width: Maximum width in pixels
+            quality: JPEG quality
+        
+        Returns:
+            Absolute path of the derivative
+        """
+        image_format = RASTER_FORMATS[os.path.splitext(path)[1].lower()]
+        digest = self.get_source_digest(path)
+        return os.path.join(self.cache_dir, f"{digest}-{max_width}-q{quality}.{_EXTENSIONS[image_format]}")
+    
+    def optimize(self, path: str, max_width: int, quality: int = 85) -> Optional[str]:
+        """
+        Get a derivative of a single image
+        
+        Args:
+            path: Source image path
+            max_width: Maximum width in pixels
+            quality: JPEG quality
+        
+        Returns:
+            Path of the derivative, or None if the original should be used
+        """
+        return self.optimize_batch([path], max_width, quality).get(path)
+    
+    def optimize_batch(self, paths: List[str], max_width: int, quality: int = 85) -> Dict[str, Optional[str]]:
+        """
+        Get derivatives of many images, converting the missing ones in parallel
+        
+        Args:
+            paths: Source image paths
+            max_width: Maximum width in pixels
+            quality: JPEG quality
+        
+        Returns:
+            Dictionary mapping source paths to derivative paths, or to None
+            for images that are small enough, unsupported or unreadable
+        """
+        results = {}
+        missing = []
+        
+        for path in paths:
+            if path in results:
+                continue
+            results[path] = None
+            if not self.supports(path):
+                continue
+            try:
+                cache_path = self.get_cache_path(path, max_width, quality)
+            except OSError as e:
+                logger.warning(f"Could not read image {path}: {str(e)}")
+                continue
+            if os.path.isfile(cache_path):
+                results[path] = cache_path
+            elif cache_path not in self._unchanged:
+                missing.append((path, cache_path))
+        
+        if not missing:
+            return results
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        workers = min(self.max_workers, len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            converted = executor.map(
+                lambda item: self._convert_to_cache(item[0], item[1], max_width, quality),
+                missing
+            )
+            for (path, _), cache_path in zip(missing, converted):
+                results[path] = cache_path
+        
+        logger.debug(f"Optimized {len(missing)} images to {max_width}px, {len(paths) - len(missing)} served from cache")
+        return results
+    
+    def _target_size(self, size: Tuple[int, int], max_width: int) -> Optional[Tuple[int, int]]:
+        """Get the downscaled size, or None if the image is not wider than max_width"""
+        width, height = size
+        if width <= max_width:
+            return None
+        return max_width, max(1, round(height * max_width / width))
+    
+    def _convert_to_cache(self, path: str, cache_path: str, max_width: int, quality: int) -> Optional[str]:
+        """Downscale one image into the cache"""
+        # Write to a temporary name first so a partial file never looks like a cache hit
+        image_format = RASTER_FORMATS[os.path.splitext(path)[1].lower()]
+        temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        
+        try:
+            with Image.open(path) as image:
+                # Only the header has been read so far. Photos are often stored
+                # rotated, with an EXIF orientation that swaps width and height.
+                rotated = image.getexif().get(_ORIENTATION) in (5, 6, 7, 8)
+                target = self._target_size(image.size[::-1] if rotated else image.size, max_width)
+                if target is None:
+                    with self._lock:
+                        self._unchanged.add(cache_path)
+                    return None
+                
+                # JPEG can decode directly at a fraction of the full size
+                image.draft(image.mode, target[::-1] if rotated else target)
+                image = ImageOps.exif_transpose(image).resize(target, Image.LANCZOS)
+                
+                if image_format == 'jpeg':
+                    image.convert('RGB').save(temp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+                else:
+                    if image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+                        image = image.convert('RGBA')
+                    image.save(temp_path, 'PNG', optimize=True)
+            
+            os.replace(temp_path, cache_path)
+            return cache_path
+        except Exception as e:
+            logger.warning(f"Could not optimize image {path}: {str(e)}")
+            return None
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+
+_optimizer = None
+_optimizer_lock = threading.Lock()
+
+
+def get_image_optimizer() -> ImageOptimizer:
+    """
+    Get the shared image optimizer
+    
+    Returns:
+        ImageOptimizer instance
+    """
+    global _optimizer
+    with _optimizer_lock:
+        if _optimizer is None:
+            _optimizer = ImageOptimizer()
+        return _optimizer
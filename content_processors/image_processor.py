@@ -8,12 +8,19 @@ Processor for images and SVG content in Markdown.
 import re
 import os
 import base64
+from pathlib import Path
 from typing import Dict, Any, List, Tuple, Optional
 from logging_config import get_logger
-from content_processors.base_processor import ContentProcessor
+from content_processors.base_processor import ContentProcessor, CostClass
+from content_processors.block_lexer import DelimitedRule, HtmlImageRule, LexMatch, MarkdownImageRule, Rule
+from content_processors.svg_converter import get_svg_converter
+from content_processors.image_optimizer import get_image_optimizer
 
 logger = get_logger()
 
+# Export formats that embed images, so they get images resampled to the export DPI
+EMBEDDING_FORMATS = ['pdf', 'latex', 'docx', 'epub']
+
 class ImageContentProcessor(ContentProcessor):
     """Processor for images and SVG content"""
     
@@ -25,10 +32,30 @@ class ImageContentProcessor(ContentProcessor):
             config: Optional configuration dictionary
         """
         super().__init__(config)
-        self.markdown_image_pattern = r'!\[(.*?)\]\((.*?)(?:\s+"(.*?)")?\)'
-        self.html_image_pattern = r'<img\s+[^>]*src="([^"]*)"[^>]*>'
-        self.svg_pattern = r'<svg\s+.*?</svg>'
+        self.svg_converter = get_svg_converter()
+        self.image_optimizer = get_image_optimizer()
+    
+    def configure(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Apply a new configuration to the Image processor
+        
+        Args:
+            config: Configuration dictionary, or None for the defaults
+        """
+        super().configure(config)
         self.asset_paths = self.config.get('asset_paths', {})
+        self.svg_dpi = self.config.get('svg_dpi', 300)
+        self.docx_svg_format = self.config.get('docx_svg_format', 'png')
+        self._converted_svgs = {}
+        
+        # Raster images are downscaled to thumbnails for the preview, and for
+        # export to the export DPI at the text width of the page (in inches)
+        self.optimize_images = self.config.get('optimize_images', True)
+        self.image_preview_width = self.config.get('image_preview_width', 1600)
+        self.image_export_dpi = self.config.get('image_export_dpi', 300)
+        self.image_export_width = self.config.get('image_export_width', 6.5)
+        self.image_quality = self.config.get('image_quality', 85)
+        self._optimized_images = {}
     
     def detect(self, content: str) -> List[Tuple[int, int, Dict[str, Any]]]:
         """
@@ -40,57 +67,107 @@ class ImageContentProcessor(ContentProcessor):
         Returns:
             List of tuples containing (start_index, end_index, metadata)
         """
-        result = []
+        return self.detect_with_patterns(content)
+    
+    def get_rules(self) -> List[Rule]:
+        """
+        Get the rules for Markdown images, HTML images and inline SVG
+        
+        Returns:
+            List of lexer rules
+        """
+        return [
+            MarkdownImageRule('markdown_image'),
+            HtmlImageRule('html_image'),
+            DelimitedRule('svg', '<svg', '</svg>', space_after_opening=True)
+        ]
+    
+    def build_metadata(self, block_type: str, match: LexMatch) -> Optional[Dict[str, Any]]:
+        """
+        Build the metadata for an image or SVG
         
-        # Detect Markdown images
-        for match in re.finditer(self.markdown_image_pattern, content):
-            start, end = match.span()
-            alt_text = match.group(1)
-            src = match.group(2)
-            title = match.group(3) if match.group(3) else ''
+        Args:
+            block_type: 'markdown_image', 'html_image' or 'svg'
+            match: Match object of the rule
             
+        Returns:
+            Metadata dictionary
+        """
+        if block_type == 'markdown_image':
             # Resolve path if it's in asset_paths
-            resolved_src = self.resolve_path(src)
-            
-            result.append((
-                start, end, 
-                {
-                    'type': 'markdown_image',
-                    'alt': alt_text,
-                    'src': resolved_src,
-                    'title': title
-                }
-            ))
-        
-        # Detect HTML images
-        for match in re.finditer(self.html_image_pattern, content):
-            start, end = match.span()
-            src = match.group(1)
-            
+            return {
+                'type': 'markdown_image',
+                'alt': match.group(1),
+                'src': self.resolve_path(match.group(2)),
+                'title': match.group(3) if match.group(3) else ''
+            }
+        
+        elif block_type == 'html_image':
             # Resolve path if it's in asset_paths
-            resolved_src = self.resolve_path(src)
-            
-            result.append((
-                start, end, 
-                {
-                    'type': 'html_image',
-                    'src': resolved_src,
-                    'original': match.group(0)
-                }
-            ))
-        
-        # Detect inline SVG
-        for match in re.finditer(self.svg_pattern, content, re.DOTALL):
-            start, end = match.span()
-            result.append((
-                start, end, 
-                {
-                    'type': 'svg',
-                    'content': match.group(0)
-                }
-            ))
-        
-        return result
+            return {
+                'type': 'html_image',
+                'src': self.resolve_path(match.group(1)),
+                'original': match.group(0)
+            }
+        
+        return {
+            'type': 'svg',
+            'content': match.group(0)
+        }
+    
+    def get_stream_delimiters(self) -> List[Tuple[str, str]]:
+        """
+        Get the delimiters of inline SVG, which may contain blank lines
+        
+        Returns:
+            List of (opening, closing) strings
+        """
+        return [('<svg', '</svg>')]
+    
+    def prepare_blocks(self, blocks: List[Dict[str, Any]], format_type: str) -> None:
+        """
+        Downscale the raster images and convert the SVG images of a document in parallel
+        
+        Args:
+            blocks: Metadata of all image blocks in the document
+            format_type: 'preview' or export format type
+        """
+        # Instances are reused for every document, only keep this document's results
+        self._converted_svgs = {}
+        self._optimized_images = {}
+        
+        max_width = self._get_image_width(format_type)
+        if max_width:
+            sources = [block['src'] for block in blocks if block.get('type') != 'svg' and block.get('src')]
+            optimized = self.image_optimizer.optimize_batch(sources, max_width, self.image_quality)
+            for src, path in optimized.items():
+                self._optimized_images[(src, max_width)] = path
+        
+        target_format = self.svg_converter.get_target_format(format_type, self.docx_svg_format)
+        if target_format is None:
+            return
+        
+        svgs = [svg for svg in (self._get_svg_source(block) for block in blocks) if svg]
+        if svgs:
+            converted = self.svg_converter.convert_batch(svgs, target_format, self.svg_dpi)
+            for svg_content, path in converted.items():
+                self._converted_svgs[(svg_content, target_format)] = path
+    
+    def get_cost_class(self, metadata: Dict[str, Any], format_type: str) -> str:
+        """
+        Get the cost class of an image
+        
+        Args:
+            metadata: Metadata of the block
+            format_type: 'preview' or export format type
+        
+        Returns:
+            SUBPROCESS when an SVG is converted for export, CHEAP otherwise
+        """
+        if self.svg_converter.get_target_format(format_type, self.docx_svg_format) is None:
+            return CostClass.CHEAP
+        is_svg = metadata.get('type') == 'svg' or metadata.get('src', '').lower().endswith('.svg')
+        return CostClass.SUBPROCESS if is_svg else CostClass.CHEAP
     
     def process_for_preview(self, content: str, metadata: Dict[str, Any]) -> str:
         """
@@ -106,12 +183,8 @@ class ImageContentProcessor(ContentProcessor):
         content_type = metadata.get('type', '')
         
         if content_type == 'markdown_image':
-            alt = metadata.get('alt', '')
-            src = metadata.get('src', '')
-            title = metadata.get('title', '')
-            
-            title_attr = f' title="{title}"' if title else ''
-            return f'<img src="{src}" alt="{alt}"{title_attr} class="markdown-image">'
+            thumbnail = self._get_optimized_image(metadata, 'preview')
+            return self._markdown_image_html(metadata, Path(os.path.abspath(thumbnail)).as_uri() if thumbnail else None)
         
         elif content_type == 'html_image':
             # For HTML images, just use the original HTML
@@ -139,18 +212,23 @@ class ImageContentProcessor(ContentProcessor):
         content_type = metadata.get('type', '')
         
         if format_type in ['html', 'epub']:
-            # For HTML/EPUB export, use the same format as preview
+            # For HTML/EPUB export, use the same format as preview, with the original or the resampled image
+            if content_type == 'markdown_image':
+                return self._markdown_image_html(metadata, self._get_optimized_image(metadata, format_type))
             return self.process_for_preview(content, metadata)
         
         elif format_type in ['pdf', 'latex']:
             # For PDF/LaTeX export, handle images and SVG differently
             if content_type == 'svg':
                 # For SVG, convert to embedded image if possible
+                converted_path = self._get_converted_svg(metadata, format_type)
+                if converted_path:
+                    return f"\n\n![]({converted_path})\n\n"
                 svg_content = metadata.get('content', '')
                 return f"\n\n{svg_content}\n\n"
             else:
-                # For images, use the src directly
-                src = metadata.get('src', '')
+                # For images, use the resampled image (or the PDF conversion of SVG files)
+                src = self._get_export_src(metadata, format_type)
                 alt = metadata.get('alt', '') if content_type == 'markdown_image' else ''
                 
                 # For Markdown images, use Markdown format
@@ -166,21 +244,107 @@ class ImageContentProcessor(ContentProcessor):
             # For DOCX export, use Markdown format for images
             if content_type == 'markdown_image':
                 alt = metadata.get('alt', '')
-                src = metadata.get('src', '')
+                src = self._get_export_src(metadata, format_type)
                 title = metadata.get('title', '')
                 title_part = f' "{title}"' if title else ''
                 return f'![{alt}]({src}{title_part})'
             elif content_type == 'html_image':
-                src = metadata.get('src', '')
+                src = self._get_export_src(metadata, format_type)
                 return f'![Image]({src})'
             elif content_type == 'svg':
-                # For SVG, convert to PNG if possible
-                # This is a simplified implementation
+                # For SVG, convert to PNG (or EMF) if possible
+                converted_path = self._get_converted_svg(metadata, format_type)
+                if converted_path:
+                    return f"\n\n![]({converted_path})\n\n"
                 return "\n\n[SVG Image]\n\n"
         
         # Default fallback
         return content
     
+    def _markdown_image_html(self, metadata: Dict[str, Any], src: Optional[str] = None) -> str:
+        """Build the <img> tag of a Markdown image, optionally pointing to a derivative"""
+        alt = metadata.get('alt', '')
+        title = metadata.get('title', '')
+        
+        title_attr = f' title="{title}"' if title else ''
+        return f'<img src="{src or metadata.get("src", "")}" alt="{alt}"{title_attr} class="markdown-image">'
+    
+    def _get_image_width(self, format_type: str) -> Optional[int]:
+        """Get the maximum image width in pixels for a format, or None to keep the originals"""
+        if not self.optimize_images:
+            return None
+        if format_type == 'preview':
+            return self.image_preview_width
+        if format_type in EMBEDDING_FORMATS:
+            return int(self.image_export_dpi * self.image_export_width)
+        return None
+    
+    def _get_optimized_image(self, metadata: Dict[str, Any], format_type: str) -> Optional[str]:
+        """Get the downscaled derivative of a raster image, downscaling it now if it was not batched"""
+        max_width = self._get_image_width(format_type)
+        src = metadata.get('src', '')
+        if not max_width or not src or metadata.get('type') == 'svg':
+            return None
+        
+        key = (src, max_width)
+        if key not in self._optimized_images:
+            self._optimized_images[key] = self.image_optimizer.optimize(src, max_width, self.image_quality)
+        
+        path = self._optimized_images[key]
+        # Pandoc accepts forward slashes on every platform
+        return path.replace('\\', '/') if path else None
+    
+    def _get_export_src(self, metadata: Dict[str, Any], format_type: str) -> str:
+        """Get the image file to embed: an SVG conversion, a resampled image or the original"""
+        return (self._get_converted_svg(metadata, format_type)
+                or self._get_optimized_image(metadata, format_type)
+                or metadata.get('src', ''))
+    
+    def _get_svg_source(self, metadata: Dict[str, Any]) -> Optional[str]:
+        """Get the SVG markup of an inline SVG or a local .svg image"""
+        if metadata.get('type') == 'svg':
+            return metadata.get('content') or None
+        
+        src = metadata.get('src', '')
+        if metadata.get('type') == 'markdown_image' and src.lower().endswith('.svg') and os.path.isfile(src):
+            try:
+                with open(src, 'r', encoding='utf-8') as f:
+                    return f.read()
+            except Exception as e:
+                logger.warning(f"Could not read SVG image {src}: {str(e)}")
+        return None
+    
+    def _get_converted_svg(self, metadata: Dict[str, Any], format_type: str) -> Optional[str]:
+        """Get the converted file for an SVG block, converting it now if it was not batched"""
+        target_format = self.svg_converter.get_target_format(format_type, self.docx_svg_format)
+        svg_content = self._get_svg_source(metadata) if target_format else None
+        if not svg_content:
+            return None
+        
+        key = (svg_content, target_format)
+        if key not in self._converted_svgs:
+            self._converted_svgs[key] = self.svg_converter.convert(svg_content, target_format, self.svg_dpi)
+        
+        path = self._converted_svgs[key]
+        # Pandoc accepts forward slashes on every platform
+        return path.replace('\\', '/') if path else None
+    
+    def get_file_dependencies(self, metadata: Dict[str, Any]) -> List[str]:
+        """
+        Get the local image file of a block
+        
+        Args:
+            metadata: Metadata of the block
+        
+        Returns:
+            List with the image path, or an empty list for inline SVG and remote images
+        """
+        src = metadata.get('src', '')
+        # URLs (http:, data:, ...) have a scheme, Windows drive letters are a single character
+        if not src or re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]+:', src):
+            return []
+        return [src]
+    
     def resolve_path(self, path: str) -> str:
         """
         Resolve a path using asset_paths
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+KaTeX Render Service
+--------------------
+Offline math pre-rendering backed by the bundled node_modules/katex.
+
+A single long-lived Node.js worker (resources/katex_worker.js) converts
+TeX expressions into static HTML+MathML. Requests are batched per document
+and results are cached per expression, so previews and HTML/EPUB exports
+need no math JavaScript and no network access.
+"""
+
+import os
+import json
+import queue
+import atexit
+import threading
+import subprocess
+from collections import OrderedDict
+from shutil import which
+from typing import Dict, List, Optional, Tuple
+from logging_config import get_logger
+
+logger = get_logger()
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KATEX_DIR = os.path.join(APP_DIR, "node_modules", "katex")
+KATEX_CSS_PATH = os.path.join(KATEX_DIR, "dist", "katex.min.css")
+WORKER_SCRIPT = os.path.join(APP_DIR, "resources", "katex_worker.js")
+
+
+class KatexRenderService:
+    """Persistent KaTeX worker with a per-expression cache"""
+    
+    def __init__(self, cache_size: int = 4096, timeout: float = 30.0):
+        """
+        Initialize the render service
+        
+        Args:
+            cache_size: Maximum number of rendered expressions kept in memory
+            timeout: Seconds to wait for the worker to answer a batch
+        """
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._process = None
+        self._responses = None
+        self._request_id = 0
+        self._failed = False
+        self.node_path = which('node')
+    
+    def is_available(self) -> bool:
+        """
+        Check if Node.js, KaTeX and the worker script are available
+        
+        Returns:
+            True if expressions can be rendered, False otherwise
+        """
+        return (
+            not self._failed
+            and self.node_path is not None
+            and os.path.isdir(KATEX_DIR)
+            and os.path.isfile(WORKER_SCRIPT)
+        )
+    
+    def render(self, tex: str, display: bool = False) -> Optional[str]:
+        """
+        Render a single expression
+        
+        Args:
+            tex: TeX source without delimiters
+            display: True for display math, False for inline math
+        
+        Returns:
+            Static HTML+MathML, or None if rendering failed
+        """
+        return self.render_batch([(tex, display)]).get((tex, display))
+    
+    def render_batch(self, expressions: List[Tuple[str, bool]]) -> Dict[Tuple[str, bool], Optional[str]]:
+        """
+        Render many expressions with one round trip to the worker
+        
+        Args:
+            expressions: List of (tex, display) tuples
+        
+        Returns:
+            Dictionary mapping (tex, display) to HTML, or None for expressions
+            KaTeX could not render
+        """
+        results = {}
+        missing = []
+        
+        with self._lock:
+            for key in expressions:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    results[key] = self._cache[key]
+                elif key not in results:
+                    results[key] = None
+                    missing.append(key)
+            
+            if not missing or not self.is_available():
+                return results
+            
+            rendered = self._request(missing)
+            for key, html in zip(missing, rendered):
+                results[key] = html
+                self._cache[key] = html
+            
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        
+        return results
+    
+    def get_stylesheet_url(self) -> Optional[str]:
+        """
+        Get the file URL of the local KaTeX stylesheet
+        
+        Returns:
+            file:// URL of katex.min.css, or None if it is not bundled
+        """
+        if os.path.isfile(KATEX_CSS_PATH):
+            return 'file:///' + KATEX_CSS_PATH.replace('\\', '/').lstrip('/')
+        return None
+    
+    def shutdown(self) -> None:
+        """Stop the worker process"""
+        process = self._process
+        self._process = None
+        if process is not None and process.poll() is None:
+            try:
+                process.stdin.close()
+                process.wait(timeout=2)
+            except Exception:
+                process.kill()
+    
+    def _ensure_worker(self) -> bool:
+        """Start the worker process if it is not running"""
+        if self._process is not None and self._process.poll() is None:
+            return True
+        
+        try:
+            self._process = subprocess.Popen(
+                [self.node_path, WORKER_SCRIPT, KATEX_DIR],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding='utf-8',
+                bufsize=1
+            )
+        except Exception as e:
+            logger.error(f"Error starting KaTeX worker: {str(e)}")
+            self._failed = True
+            return False
+        
+        # Read responses on a separate thread so a stuck worker cannot hang the preview
+        self._responses = queue.Queue()
+        threading.Thread(
+            target=self._read_responses,
+            args=(self._process, self._responses),
+            daemon=True
+        ).start()
+        logger.info(f"Started KaTeX worker (pid {self._process.pid})")
+        return True
+    
+    @staticmethod
+    def _read_responses(process, responses):
+        """Forward worker output lines to the response queue"""
+        for line in process.stdout:
+            responses.put(line)
+        responses.put(None)
+    
+    def _request(self, expressions: List[Tuple[str, bool]]) -> List[Optional[str]]:
+        """Send one batch to the worker and wait for the answer"""
+        if not self._ensure_worker():
+            return [None] * len(expressions)
+        
+        self._request_id += 1
+        request = {
+            'id': self._request_id,
+            'items': [{'tex': tex, 'display': display} for tex, display in expressions]
+        }
+        
+        try:
+            self._process.stdin.write(json.dumps(request) + '\n')
+            self._process.stdin.flush()
+            
+            while True:
+                line = self._responses.get(timeout=self.timeout)
+                if line is None:
+                    raise RuntimeError("KaTeX worker exited")
+                response = json.loads(line)
+                if response.get('id') == self._request_id:
+                    break
+        except Exception as e:
+            logger.error(f"KaTeX worker failed: {str(e)}")
+            self.shutdown()
+            return [None] * len(expressions)
+        
+        rendered = []
+        for (tex, _), result in zip(expressions, response.get('results', [])):
+            if result.get('html') is None:
+                logger.debug(f"KaTeX could not render {tex!r}: {result.get('error')}")
+            rendered.append(result.get('html'))
+        return rendered
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_katex_service() -> KatexRenderService:
+    """
+    Get the shared KaTeX render service
+    
+    Returns:
+        KatexRenderService instance
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = KatexRenderService()
+            atexit.register(_service.shutdown)
+        return _service
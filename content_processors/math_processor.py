@@ -5,10 +5,11 @@ Math Content Processor
 Processor for LaTeX math expressions in Markdown.
 """
 
-import re
 from typing import Dict, Any, List, Tuple, Optional
 from logging_config import get_logger
 from content_processors.base_processor import ContentProcessor
+from content_processors.block_lexer import DelimitedRule, InlineMathRule, LexMatch, Rule
+from content_processors.katex_renderer import get_katex_service
 
 logger = get_logger()
 
@@ -23,13 +24,27 @@ class MathContentProcessor(ContentProcessor):
             config: Optional configuration dictionary
         """
         super().__init__(config)
-        self.inline_math_pattern = r'(?<!\$)\$(?!\$)(.*?)(?<!\$)\$(?!\$)'
-        self.display_math_pattern = r'\$\$(.*?)\$\$'
+    
+    def configure(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Apply a new configuration to the Math processor
+        
+        Args:
+            config: Configuration dictionary, or None for the defaults
+        """
+        super().configure(config)
         self.math_engine = self.config.get('math_engine', 'mathjax')
         
         if self.math_engine not in ['mathjax', 'katex']:
             logger.warning(f"Unknown math engine: {self.math_engine}, defaulting to mathjax")
             self.math_engine = 'mathjax'
+        
+        # Pre-render math to static HTML+MathML with the local KaTeX worker
+        self.prerender_math = self.config.get('prerender_math', False)
+        self.katex_service = get_katex_service() if self.prerender_math else None
+        if self.katex_service is not None and not self.katex_service.is_available():
+            logger.warning("KaTeX worker not available, falling back to client-side math rendering")
+            self.katex_service = None
     
     def detect(self, content: str) -> List[Tuple[int, int, Dict[str, Any]]]:
         """
@@ -41,21 +56,55 @@ class MathContentProcessor(ContentProcessor):
         Returns:
             List of tuples containing (start_index, end_index, metadata)
         """
-        result = []
+        return self.detect_with_patterns(content)
+    
+    def get_rules(self) -> List[Rule]:
+        """
+        Get the rules for inline and display math
+        
+        Returns:
+            List of lexer rules
+        """
+        return [
+            InlineMathRule('inline'),
+            DelimitedRule('display', '$$', '$$')
+        ]
+    
+    def build_metadata(self, block_type: str, match: LexMatch) -> Optional[Dict[str, Any]]:
+        """
+        Build the metadata for a math expression
+        
+        Args:
+            block_type: 'inline' or 'display'
+            match: Match object of the rule
+        
+        Returns:
+            Metadata dictionary
+        """
+        return {'code': match.group(1), 'type': block_type}
+    
+    def get_stream_delimiters(self) -> List[Tuple[str, str]]:
+        """
+        Get the delimiters of display math, which may contain blank lines
         
-        # Detect inline math
-        for match in re.finditer(self.inline_math_pattern, content):
-            start, end = match.span()
-            math_code = match.group(1)
-            result.append((start, end, {'code': math_code, 'type': 'inline'}))
+        Returns:
+            List of (opening, closing) strings
+        """
+        return [('$$', '$$')]
+    
+    def prepare_blocks(self, blocks: List[Dict[str, Any]], format_type: str) -> None:
+        """
+        Pre-render all math expressions of a document in one batch
         
-        # Detect display math
-        for match in re.finditer(self.display_math_pattern, content, re.DOTALL):
-            start, end = match.span()
-            math_code = match.group(1)
-            result.append((start, end, {'code': math_code, 'type': 'display'}))
+        Args:
+            blocks: List of metadata dictionaries returned by detect()
+            format_type: 'preview' or export format type (pdf, html, docx, etc.)
+        """
+        if self.katex_service is None or format_type not in ['preview', 'html', 'epub']:
+            return
         
-        return result
+        expressions = [(block.get('code', ''), block.get('type') == 'display') for block in blocks]
+        self.katex_service.render_batch(expressions)
     
     def process_for_preview(self, content: str, metadata: Dict[str, Any]) -> str:
         """
@@ -71,6 +120,12 @@ class MathContentProcessor(ContentProcessor):
         math_code = metadata.get('code', '')
         math_type = metadata.get('type', 'inline')
         
+        # Use static KaTeX output when available (already cached after prepare_blocks)
+        if self.katex_service is not None:
+            rendered = self.katex_service.render(math_code, math_type == 'display')
+            if rendered is not None:
+                return rendered
+        
         if math_type == 'inline':
             return f"\\\\({math_code}\\\\)"
         else:  # display
@@ -123,6 +178,11 @@ class MathContentProcessor(ContentProcessor):
         Returns:
             List of JavaScript script URLs or inline scripts
         """
+        if self.katex_service is not None:
+            # Pre-rendered math only needs the local KaTeX stylesheet
+            stylesheet_url = self.katex_service.get_stylesheet_url()
+            return [f'<link rel="stylesheet" href="{stylesheet_url}">'] if stylesheet_url else []
+        
         if self.math_engine == 'mathjax':
             return [
                 '<script type="text/javascript" id="MathJax-script" async src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"></script>',
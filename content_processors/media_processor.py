@@ -5,10 +5,10 @@ Media Content Processor
 Processor for HTML5 media (video/audio) in Markdown.
 """
 
-import re
 from typing import Dict, Any, List, Tuple, Optional
 from logging_config import get_logger
 from content_processors.base_processor import ContentProcessor
+from content_processors.block_lexer import DelimitedRule, Rule
 
 logger = get_logger()
 
@@ -23,9 +23,15 @@ class MediaContentProcessor(ContentProcessor):
             config: Optional configuration dictionary
         """
         super().__init__(config)
-        self.video_pattern = r'<video\s+.*?</video>'
-        self.audio_pattern = r'<audio\s+.*?</audio>'
-        self.iframe_pattern = r'<iframe\s+.*?</iframe>'
+    
+    def configure(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Apply a new configuration to the Media processor
+        
+        Args:
+            config: Configuration dictionary, or None for the defaults
+        """
+        super().configure(config)
         self.asset_paths = self.config.get('asset_paths', {})
     
     def detect(self, content: str) -> List[Tuple[int, int, Dict[str, Any]]]:
@@ -38,42 +44,28 @@ class MediaContentProcessor(ContentProcessor):
         Returns:
             List of tuples containing (start_index, end_index, metadata)
         """
-        result = []
-        
-        # Detect video elements
-        for match in re.finditer(self.video_pattern, content, re.DOTALL):
-            start, end = match.span()
-            result.append((
-                start, end, 
-                {
-                    'type': 'video',
-                    'content': match.group(0)
-                }
-            ))
-        
-        # Detect audio elements
-        for match in re.finditer(self.audio_pattern, content, re.DOTALL):
-            start, end = match.span()
-            result.append((
-                start, end, 
-                {
-                    'type': 'audio',
-                    'content': match.group(0)
-                }
-            ))
+        return self.detect_with_patterns(content)
+    
+    def get_rules(self) -> List[Rule]:
+        """
+        Get the rules for video, audio and iframe elements
         
-        # Detect iframe elements
-        for match in re.finditer(self.iframe_pattern, content, re.DOTALL):
-            start, end = match.span()
-            result.append((
-                start, end, 
-                {
-                    'type': 'iframe',
-                    'content': match.group(0)
-                }
-            ))
+        Returns:
+            List of lexer rules
+        """
+        return [
+            DelimitedRule(tag, f'<{tag}', f'</{tag}>', space_after_opening=True)
+            for tag in ('video', 'audio', 'iframe')
+        ]
+    
+    def get_stream_delimiters(self) -> List[Tuple[str, str]]:
+        """
+        Get the delimiters of media elements, which may contain blank lines
         
-        return result
+        Returns:
+            List of (opening, closing) strings
+        """
+        return [('<video', '</video>'), ('<audio', '</audio>'), ('<iframe', '</iframe>')]
     
     def process_for_preview(self, content: str, metadata: Dict[str, Any]) -> str:
         """
@@ -5,14 +5,16 @@ Mermaid Content Processor
 Processor for Mermaid diagrams in Markdown.
 """
 
-import re
 import os
 import tempfile
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Tuple, Optional
-from shutil import which
 from logging_config import get_logger
-from content_processors.base_processor import ContentProcessor
+from content_processors.base_processor import ContentProcessor, CostClass
+from content_processors.block_lexer import FencedBlockRule, LexMatch, Rule
+from content_processors.svg_converter import get_svg_converter
+from content_processors.dependency_probe import find_mermaid_cli
 
 logger = get_logger()
 
@@ -27,8 +29,30 @@ class MermaidContentProcessor(ContentProcessor):
             config: Optional configuration dictionary
         """
         super().__init__(config)
-        self.mermaid_pattern = r'```mermaid\s+(.*?)\s+```'
-        self.mmdc_path, self.mmdc_version = self._find_mermaid_cli()
+        self.svg_converter = get_svg_converter()
+        self._rendered_svgs = {}
+    
+    def configure(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Apply a new configuration to the Mermaid processor
+        
+        Args:
+            config: Configuration dictionary, or None for the defaults
+        """
+        super().configure(config)
+        self.svg_dpi = self.config.get('svg_dpi', 300)
+        self.docx_svg_format = self.config.get('docx_svg_format', 'png')
+        self._converted_svgs = {}
+    
+    @property
+    def mmdc_path(self) -> Optional[str]:
+        """Mermaid CLI command, probed on first use"""
+        return self._find_mermaid_cli()[0]
+    
+    @property
+    def mmdc_version(self) -> Optional[str]:
+        """Mermaid CLI version, probed on first use"""
+        return self._find_mermaid_cli()[1]
     
     def detect(self, content: str) -> List[Tuple[int, int, Dict[str, Any]]]:
         """
@@ -40,12 +64,69 @@ class MermaidContentProcessor(ContentProcessor):
         Returns:
             List of tuples containing (start_index, end_index, metadata)
         """
-        result = []
-        for match in re.finditer(self.mermaid_pattern, content, re.DOTALL):
-            start, end = match.span()
-            mermaid_code = match.group(1).strip()
-            result.append((start, end, {'code': mermaid_code}))
-        return result
+        return self.detect_with_patterns(content)
+    
+    def get_rules(self) -> List[Rule]:
+        """
+        Get the rule for Mermaid code blocks
+        
+        Returns:
+            List of lexer rules
+        """
+        return [FencedBlockRule('mermaid', ['mermaid'])]
+    
+    def build_metadata(self, block_type: str, match: LexMatch) -> Optional[Dict[str, Any]]:
+        """
+        Build the metadata for a Mermaid diagram
+        
+        Args:
+            block_type: Always 'mermaid'
+            match: Match object of the rule
+        
+        Returns:
+            Metadata dictionary
+        """
+        return {'code': match.group(2).strip()}
+    
+    def prepare_blocks(self, blocks: List[Dict[str, Any]], format_type: str) -> None:
+        """
+        Render and convert all diagrams of a document in parallel for LaTeX/DOCX export
+        
+        Args:
+            blocks: Metadata of all Mermaid blocks in the document
+            format_type: 'preview' or export format type
+        """
+        # Instances are reused for every document, only keep this document's results
+        self._rendered_svgs = {}
+        self._converted_svgs = {}
+        target_format = self.svg_converter.get_target_format(format_type, self.docx_svg_format)
+        if target_format is None or not self.mmdc_path:
+            return
+        
+        codes = list(dict.fromkeys(block.get('code', '') for block in blocks))
+        with ThreadPoolExecutor(max_workers=self.svg_converter.max_workers) as executor:
+            for code, svg_content in zip(codes, executor.map(self.render_mermaid_to_svg, codes)):
+                self._rendered_svgs[code] = svg_content
+        
+        svgs = [svg for svg in self._rendered_svgs.values() if svg]
+        converted = self.svg_converter.convert_batch(svgs, target_format, self.svg_dpi)
+        for svg_content, path in converted.items():
+            self._converted_svgs[(svg_content, target_format)] = path
+    
+    def get_cost_class(self, metadata: Dict[str, Any], format_type: str) -> str:
+        """
+        Get the cost class of a Mermaid diagram
+        
+        Args:
+            metadata: Metadata of the block
+            format_type: 'preview' or export format type
+        
+        Returns:
+            SUBPROCESS when the diagram is rendered with the Mermaid CLI, CHEAP otherwise
+        """
+        if self.svg_converter.get_target_format(format_type, self.docx_svg_format) is None:
+            return CostClass.CHEAP
+        return CostClass.SUBPROCESS
     
     def process_for_preview(self, content: str, metadata: Dict[str, Any]) -> str:
         """
@@ -85,9 +166,12 @@ class MermaidContentProcessor(ContentProcessor):
         mermaid_code = metadata.get('code', '')
         
         if format_type in ['pdf', 'latex']:
-            # For PDF/LaTeX export, render to SVG
-            svg_content = self.render_mermaid_to_svg(mermaid_code)
-            if svg_content:
+            # For PDF/LaTeX export, render to SVG and convert to PDF
+            svg_content = self._get_svg(mermaid_code)
+            converted_path = self._get_converted_svg(svg_content, format_type)
+            if converted_path:
+                return f"\n\n![]({converted_path})\n\n"
+            elif svg_content:
                 return f"\n\n{svg_content}\n\n"
             else:
                 return "\n\n[Diagram Placeholder]\n\n"
@@ -97,10 +181,12 @@ class MermaidContentProcessor(ContentProcessor):
             return self.process_for_preview(content, metadata)
         
         elif format_type == 'docx':
-            # For DOCX export, render to SVG and convert to PNG
-            svg_content = self.render_mermaid_to_svg(mermaid_code)
-            if svg_content:
-                # In a real implementation, convert SVG to PNG here
+            # For DOCX export, render to SVG and convert to PNG (or EMF)
+            svg_content = self._get_svg(mermaid_code)
+            converted_path = self._get_converted_svg(svg_content, format_type)
+            if converted_path:
+                return f"\n\n![]({converted_path})\n\n"
+            elif svg_content:
                 return f"\n\n[Diagram Image]\n\n"
             else:
                 return "\n\n[Diagram Placeholder]\n\n"
@@ -108,6 +194,26 @@ class MermaidContentProcessor(ContentProcessor):
         # Default fallback
         return "\n\n```\n[Diagram code removed]\n```\n\n"
     
+    def _get_svg(self, mermaid_code: str) -> Optional[str]:
+        """Get the SVG for a diagram, rendering it now if it was not batched"""
+        if mermaid_code not in self._rendered_svgs:
+            self._rendered_svgs[mermaid_code] = self.render_mermaid_to_svg(mermaid_code)
+        return self._rendered_svgs[mermaid_code]
+    
+    def _get_converted_svg(self, svg_content: Optional[str], format_type: str) -> Optional[str]:
+        """Get the converted file for a diagram SVG, converting it now if it was not batched"""
+        target_format = self.svg_converter.get_target_format(format_type, self.docx_svg_format)
+        if not svg_content or target_format is None:
+            return None
+        
+        key = (svg_content, target_format)
+        if key not in self._converted_svgs:
+            self._converted_svgs[key] = self.svg_converter.convert(svg_content, target_format, self.svg_dpi)
+        
+        path = self._converted_svgs[key]
+        # Pandoc accepts forward slashes on every platform
+        return path.replace('\\', '/') if path else None
+    
     def get_required_scripts(self) -> List[str]:
         """
         Get required JavaScript scripts for Mermaid
@@ -142,41 +248,12 @@ class MermaidContentProcessor(ContentProcessor):
         """
         Find the Mermaid CLI executable
         
+        The lookup runs once per process and is shared by all processors.
+        
         Returns:
             Tuple of (path, version) or (None, None) if not found
         """
-        # Check for mmdc in PATH
-        mmdc_path = which('mmdc')
-        if mmdc_path:
-            try:
-                result = subprocess.run(
-                    [mmdc_path, '--version'],
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
-                version = result.stdout.strip()
-                logger.info(f"Found Mermaid CLI: {mmdc_path}, version: {version}")
-                return mmdc_path, version
-            except Exception as e:
-                logger.debug(f"Error checking Mermaid CLI version: {str(e)}")
-        
-        # Check for npx mmdc
-        try:
-            result = subprocess.run(
-                ['npx', 'mmdc', '--version'],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            version = result.stdout.strip()
-            logger.info(f"Found Mermaid CLI via npx, version: {version}")
-            return 'npx mmdc', version
-        except Exception as e:
-            logger.debug(f"Error checking npx Mermaid CLI: {str(e)}")
-        
-        logger.warning("Mermaid CLI not found")
-        return None, None
+        return find_mermaid_cli()
     
     def render_mermaid_to_svg(self, mermaid_code: str, timeout: int = 15) -> Optional[str]:
         """
@@ -5,23 +5,83 @@ Content Processor Registry
 Registry for all content processors in the Markdown to PDF converter.
 """
 
-from typing import Dict, List, Type, Optional, Any
+import os
+import re
+import atexit
+import bisect
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Type, Optional, Any
 from logging_config import get_logger
-from content_processors.base_processor import ContentProcessor
+from content_processors.base_processor import ContentProcessor, CostClass
+from content_processors.block_cache import BlockCache, hash_block
+from content_processors.block_lexer import scan_blocks
+from content_processors.stream_splitter import SEGMENT_SIZE, split_stream
 
 logger = get_logger()
 
+# Processor instances of a worker process, one per class
+_worker_processors = {}
+
+
+def _process_block_in_worker(processor_class: Type[ContentProcessor], config: Dict[str, Any],
+                             block_content: str, metadata: Dict[str, Any], format_type: str) -> str:
+    """
+    Process a HEAVY_CPU block in a worker process
+    
+    Args:
+        processor_class: Class of the processor that owns the block
+        config: Configuration of the processor in the main process
+        block_content: Text of the block
+        metadata: Metadata of the block
+        format_type: 'preview' or export format type
+    
+    Returns:
+        Processed block
+    """
+    processor = _worker_processors.get(processor_class)
+    if processor is None:
+        processor = processor_class(config)
+        _worker_processors[processor_class] = processor
+    elif processor.config != config:
+        processor.configure(config)
+    
+    if format_type == 'preview':
+        return processor.process_for_preview(block_content, metadata)
+    return processor.process_for_export(block_content, metadata, format_type)
+
+
 class ProcessorRegistry:
-    """Registry for all content processors"""
+    """
+    Registry for all content processors
+    
+    The registry owns one long-lived instance per processor class. Instances
+    are created on first use, reconfigured in place when the configuration
+    changes and cleaned up on shutdown (at the latest when the interpreter
+    exits).
+    """
     
     _instance = None
     
+    # Limits of the executors HEAVY_CPU and SUBPROCESS blocks are dispatched to.
+    # Without a spare core, worker processes only add overhead, so 0 processes
+    # HEAVY_CPU blocks inline.
+    MAX_PROCESS_WORKERS = (os.cpu_count() or 1) - 1
+    MAX_SUBPROCESS_WORKERS = 4
+    
     def __new__(cls):
         """Singleton pattern"""
         if cls._instance is None:
             cls._instance = super(ProcessorRegistry, cls).__new__(cls)
             cls._instance._processors = {}
             cls._instance._processor_instances = {}
+            cls._instance._lazy_processors = {}
+            cls._instance._lock = threading.RLock()
+            cls._instance._block_cache = BlockCache()
+            cls._instance._process_pool = None
+            cls._instance._thread_pool = None
+            atexit.register(cls._instance.shutdown)
         return cls._instance
     
     def register_processor(self, processor_class: Type[ContentProcessor], priority: int = 100):
@@ -34,10 +94,62 @@ class ProcessorRegistry:
         """
         processor_name = processor_class.__name__
         logger.debug(f"Registering processor: {processor_name} with priority {priority}")
-        self._processors[processor_name] = {
-            'class': processor_class,
-            'priority': priority
-        }
+        with self._lock:
+            self._processors[processor_name] = {
+                'class': processor_class,
+                'priority': priority
+            }
+            
+            # A re-registered class may differ from the pooled instance
+            instance = self._processor_instances.get(processor_name)
+            if instance is not None and type(instance) is not processor_class:
+                self._release(processor_name)
+    
+    def register_lazy_processor(self, name: str, triggers: List[str], loader: Callable[[], None]):
+        """
+        Register processors that are only loaded once content needs them
+        
+        The loader runs the first time content processed by the registry
+        matches one of the triggers, and registers the actual processors.
+        
+        Args:
+            name: Name of the lazy entry, e.g. the plugin name
+            triggers: Regular expressions matching content the processors handle
+            loader: Function that loads and registers the processors
+        """
+        logger.debug(f"Registering lazy processor: {name}")
+        with self._lock:
+            self._lazy_processors[name] = {
+                'triggers': [re.compile(trigger) for trigger in triggers],
+                'loader': loader
+            }
+    
+    def activate_lazy_processors(self, content: str) -> List[str]:
+        """
+        Load the lazy processors whose triggers match some content
+        
+        Args:
+            content: The content about to be processed
+        
+        Returns:
+            Names of the lazy entries that were loaded
+        """
+        if not self._lazy_processors:
+            return []
+        
+        with self._lock:
+            activated = [
+                name for name, lazy in self._lazy_processors.items()
+                if any(trigger.search(content) for trigger in lazy['triggers'])
+            ]
+            for name in activated:
+                loader = self._lazy_processors.pop(name)['loader']
+                logger.debug(f"Activating lazy processor: {name}")
+                try:
+                    loader()
+                except Exception as e:
+                    logger.error(f"Error activating lazy processor {name}: {str(e)}")
+        return activated
     
     def get_processor(self, processor_name: str, config: Optional[Dict[str, Any]] = None) -> Optional[ContentProcessor]:
         """
@@ -45,7 +157,8 @@ class ProcessorRegistry:
         
         Args:
             processor_name: Name of the processor
-            config: Optional configuration for the processor
+            config: Optional configuration for the processor. The pooled
+                instance is reconfigured if it differs from the current one.
             
         Returns:
             Processor instance or None if not found
@@ -54,12 +167,16 @@ class ProcessorRegistry:
             logger.warning(f"Processor not found: {processor_name}")
             return None
         
-        # Create a new instance if it doesn't exist or if config is provided
-        if processor_name not in self._processor_instances or config is not None:
-            processor_class = self._processors[processor_name]['class']
-            self._processor_instances[processor_name] = processor_class(config)
+        with self._lock:
+            processor = self._processor_instances.get(processor_name)
+            if processor is None:
+                processor_class = self._processors[processor_name]['class']
+                processor = processor_class(config)
+                self._processor_instances[processor_name] = processor
+            elif config is not None and processor.config != config:
+                processor.configure(config)
         
-        return self._processor_instances[processor_name]
+        return processor
     
     def get_all_processors(self, config: Optional[Dict[str, Any]] = None) -> List[ContentProcessor]:
         """
@@ -77,13 +194,66 @@ class ProcessorRegistry:
             key=lambda x: x[1]['priority']
         )
         
-        # Create instances
-        processor_instances = []
-        for processor_name, processor_info in sorted_processors:
-            processor_class = processor_info['class']
-            processor_instances.append(processor_class(config))
+        return [self.get_processor(processor_name, config) for processor_name, _ in sorted_processors]
+    
+    def configure(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Apply a configuration to all processors without re-creating them
         
-        return processor_instances
+        Args:
+            config: Configuration dictionary, or None for the defaults
+        """
+        config = dict(config or {})
+        for processor in self.get_all_processors():
+            if processor.config != config:
+                processor.configure(config)
+    
+    def invalidate_cache(self, processor_name: Optional[str] = None, path: Optional[str] = None) -> int:
+        """
+        Drop cached block output
+        
+        Blocks that depend on local files are checked against the files'
+        modification times on every lookup. This is for changes that cannot
+        be detected that way, e.g. a file watcher noticing an asset changed
+        on a file system with coarse timestamps.
+        
+        Args:
+            processor_name: Only drop blocks of this processor
+            path: Only drop blocks that depend on this file
+        
+        Returns:
+            Number of dropped blocks
+        """
+        return self._block_cache.invalidate(processor_name, path)
+    
+    def get_cache_stats(self) -> Dict[str, int]:
+        """
+        Get block cache statistics
+        
+        Returns:
+            Dictionary with entries, size, hits and misses
+        """
+        return self._block_cache.get_stats()
+    
+    def shutdown(self):
+        """Stop the executors and clean up all pooled processor instances"""
+        with self._lock:
+            for pool in (self._process_pool, self._thread_pool):
+                if pool is not None:
+                    pool.shutdown(wait=True, cancel_futures=True)
+            self._process_pool = None
+            self._thread_pool = None
+            
+            for processor_name in list(self._processor_instances):
+                self._release(processor_name)
+    
+    def _release(self, processor_name: str):
+        """Clean up and drop a pooled processor instance"""
+        processor = self._processor_instances.pop(processor_name)
+        try:
+            processor.cleanup()
+        except Exception as e:
+            logger.error(f"Error cleaning up {processor_name}: {str(e)}")
     
     def process_content(self, content: str, format_type: str = 'preview') -> str:
         """
@@ -96,44 +266,262 @@ class ProcessorRegistry:
         Returns:
             Processed content
         """
+        self.activate_lazy_processors(content)
+        return self._process_segment(content, format_type, self.get_all_processors())
+    
+    def process_stream(self, chunks: Iterable[str], format_type: str = 'preview',
+                       segment_size: int = SEGMENT_SIZE) -> Iterator[str]:
+        """
+        Process a document that arrives in chunks, yielding the output as it is produced
+        
+        The input is regrouped into segments that end on block boundaries and
+        each segment is processed on its own, so memory use is bounded by the
+        segment size or the largest block rather than by the document. Output
+        is not added to the block cache, which would otherwise hold on to
+        most of the document.
+        
+        Args:
+            chunks: The content in chunks of any size, e.g. an open file
+            format_type: 'preview' or export format type (pdf, html, docx, etc.)
+            segment_size: Minimum length of a segment before it is processed
+        
+        Yields:
+            Processed segments, in document order
+        """
         processors = self.get_all_processors()
-        processed_content = content
+        delimiters = [delimiter for processor in processors for delimiter in processor.get_stream_delimiters()]
         
-        # First, detect all content blocks
-        content_blocks = []
+        for segment in split_stream(chunks, delimiters, segment_size):
+            # Processors loaded on the way handle the following segments as well
+            if self.activate_lazy_processors(segment):
+                processors = self.get_all_processors()
+            yield self._process_segment(segment, format_type, processors, store=False)
+    
+    def _process_segment(self, content: str, format_type: str, processors: List[ContentProcessor],
+                         store: bool = True) -> str:
+        """
+        Process a complete document or one segment of a stream
+        
+        Args:
+            content: The content to process
+            format_type: 'preview' or export format type
+            processors: Processors in priority order
+            store: Add newly processed blocks to the block cache
+        
+        Returns:
+            Processed content
+        """
+        # First, detect all content blocks in a single pass
+        content_blocks = self.scan_content(content, processors)
+        
+        # Reuse the output of blocks that did not change since the last run
+        fingerprints = {processor: processor.get_cache_fingerprint() for processor in processors}
+        for block in content_blocks:
+            processor = block['processor']
+            block['cache_key'] = (
+                processor.name,
+                hash_block(content[block['start']:block['end']]),
+                format_type,
+                fingerprints[processor]
+            )
+            block['output'] = self._block_cache.get(block['cache_key'])
+            if not store:
+                block['cache_key'] = None
+        
+        # Let processors batch their work for the blocks that must be processed
         for processor in processors:
-            detected_blocks = processor.detect(processed_content)
-            for start, end, metadata in detected_blocks:
-                content_blocks.append({
-                    'start': start,
-                    'end': end,
-                    'processor': processor,
-                    'metadata': metadata
-                })
+            processor_blocks = [
+                block['metadata'] for block in content_blocks
+                if block['processor'] is processor and block['output'] is None
+            ]
+            if processor_blocks:
+                processor.prepare_blocks(processor_blocks, format_type)
         
-        # Sort blocks by start position (in reverse order to avoid index changes)
-        content_blocks.sort(key=lambda x: x['start'], reverse=True)
+        # Process the remaining blocks, each on the executor matching its cost
+        self._process_blocks(content, [block for block in content_blocks if block['output'] is None], format_type)
         
-        # Process each block
+        # Assemble the output in document order with a single join
+        pieces = []
+        position = 0
         for block in content_blocks:
+            pieces.append(content[position:block['start']])
+            pieces.append(block['output'])
+            position = block['end']
+        
+        pieces.append(content[position:])
+        return ''.join(pieces)
+    
+    def _process_blocks(self, content: str, blocks: List[Dict[str, Any]], format_type: str) -> None:
+        """
+        Process blocks and store their output in block['output']
+        
+        HEAVY_CPU blocks go to a process pool and SUBPROCESS blocks to a
+        bounded thread pool. CHEAP blocks are processed inline while the
+        others run. A block that fails keeps its original text, and its
+        output is not cached.
+        
+        Args:
+            content: The content the blocks were found in
+            blocks: Blocks from scan_content()
+            format_type: 'preview' or export format type
+        """
+        futures = []
+        inline_blocks = []
+        for block in blocks:
             processor = block['processor']
-            start = block['start']
-            end = block['end']
-            metadata = block['metadata']
+            block_content = content[block['start']:block['end']]
+            try:
+                cost_class = processor.get_cost_class(block['metadata'], format_type)
+            except Exception as e:
+                logger.error(f"Error getting cost class from {processor.name}: {str(e)}")
+                cost_class = CostClass.CHEAP
             
-            # Extract the block content
-            block_content = processed_content[start:end]
+            executor = None
+            if cost_class == CostClass.HEAVY_CPU:
+                executor = self._get_process_pool()
+            elif cost_class == CostClass.SUBPROCESS:
+                executor = self._get_thread_pool()
             
-            # Process the block
-            if format_type == 'preview':
-                processed_block = processor.process_for_preview(block_content, metadata)
-            else:
-                processed_block = processor.process_for_export(block_content, metadata, format_type)
+            if executor is None:
+                inline_blocks.append((block, block_content))
+                continue
             
-            # Replace the block in the content
-            processed_content = processed_content[:start] + processed_block + processed_content[end:]
+            try:
+                if executor is self._process_pool:
+                    future = executor.submit(
+                        _process_block_in_worker, type(processor), processor.config,
+                        block_content, block['metadata'], format_type
+                    )
+                else:
+                    future = executor.submit(self._run_processor, processor, block_content, block['metadata'], format_type)
+                futures.append((block, block_content, future))
+            except Exception as e:
+                logger.warning(f"Could not dispatch block of {processor.name}, processing inline: {str(e)}")
+                inline_blocks.append((block, block_content))
+        
+        for block, block_content in inline_blocks:
+            self._store_output(block, block_content, format_type)
+        
+        for block, block_content, future in futures:
+            try:
+                block['output'] = future.result()
+            except Exception as e:
+                # A crashed worker or an unpicklable block, try again in this process
+                logger.warning(f"Worker failed on block of {block['processor'].name}, processing inline: {str(e)}")
+                self._reset_process_pool()
+                self._store_output(block, block_content, format_type)
+                continue
+            self._cache_output(block)
+    
+    def _store_output(self, block: Dict[str, Any], block_content: str, format_type: str) -> None:
+        """Process a block in this thread, keeping its text if processing fails"""
+        processor = block['processor']
+        try:
+            block['output'] = self._run_processor(processor, block_content, block['metadata'], format_type)
+        except Exception as e:
+            logger.error(f"Error processing block with {processor.name}: {str(e)}")
+            block['output'] = block_content
+            return
+        self._cache_output(block)
+    
+    def _cache_output(self, block: Dict[str, Any]) -> None:
+        """Add the output of a processed block to the block cache"""
+        if block['cache_key'] is not None:
+            files = block['processor'].get_file_dependencies(block['metadata'])
+            self._block_cache.put(block['cache_key'], block['output'], files)
+    
+    @staticmethod
+    def _run_processor(processor: ContentProcessor, block_content: str, metadata: Dict[str, Any], format_type: str) -> str:
+        """Process a block for preview or export"""
+        if format_type == 'preview':
+            return processor.process_for_preview(block_content, metadata)
+        return processor.process_for_export(block_content, metadata, format_type)
+    
+    def _get_process_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Get the pool for HEAVY_CPU blocks, or None to process them inline"""
+        with self._lock:
+            if self._process_pool is None and self.MAX_PROCESS_WORKERS > 0:
+                try:
+                    # Forking a process with a running Qt application or worker threads is unsafe
+                    self._process_pool = ProcessPoolExecutor(
+                        max_workers=self.MAX_PROCESS_WORKERS,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                except Exception as e:
+                    logger.warning(f"Could not start worker processes: {str(e)}")
+                    self.MAX_PROCESS_WORKERS = 0
+            return self._process_pool
+    
+    def _get_thread_pool(self) -> Optional[ThreadPoolExecutor]:
+        """Get the bounded pool for SUBPROCESS blocks"""
+        with self._lock:
+            if self._thread_pool is None and self.MAX_SUBPROCESS_WORKERS > 0:
+                self._thread_pool = ThreadPoolExecutor(
+                    max_workers=self.MAX_SUBPROCESS_WORKERS,
+                    thread_name_prefix="content-processor"
+                )
+            return self._thread_pool
+    
+    def _reset_process_pool(self) -> None:
+        """Drop a process pool whose workers died, a new one is started when needed"""
+        with self._lock:
+            pool = self._process_pool
+            if pool is not None and getattr(pool, '_broken', False):
+                self._process_pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+    
+    def scan_content(self, content: str, processors: Optional[List[ContentProcessor]] = None) -> List[Dict[str, Any]]:
+        """
+        Find the blocks of all processors in one pass over the content
+        
+        The lexer rules of all processors are scanned together in linear
+        time. At every position the leftmost block wins, and when several
+        processors match at the same position the one with the highest
+        priority wins. A processor can decline a match from
+        build_metadata(), in which case the lower priority processors get a
+        chance at the same position. Processors without rules are scanned
+        with detect(), and their blocks are kept only where they do not
+        overlap a block that was already found.
+        
+        Args:
+            content: The content to scan
+            processors: Processors in priority order (defaults to all registered processors)
+        
+        Returns:
+            Non-overlapping blocks sorted by start position, each a dictionary
+            with 'start', 'end', 'processor' and 'metadata'
+        """
+        if processors is None:
+            self.activate_lazy_processors(content)
+            processors = self.get_all_processors()
+        
+        entries = []
+        detect_processors = []
+        for processor in processors:
+            rules = processor.get_rules()
+            if not rules:
+                detect_processors.append(processor)
+            entries.extend((processor, rule) for rule in rules)
         
-        return processed_content
+        blocks = scan_blocks(content, entries) if entries else []
+        
+        # Processors without rules scan on their own and fill the gaps. The blocks
+        # stay sorted and never overlap, so only the neighbours of a span can overlap it.
+        starts = [block['start'] for block in blocks]
+        for processor in detect_processors:
+            for start, end, metadata in processor.detect(content):
+                index = bisect.bisect_right(starts, start)
+                if any(start < block['end'] and block['start'] < end for block in blocks[max(0, index - 1):index + 1]):
+                    continue
+                starts.insert(index, start)
+                blocks.insert(index, {
+                    'start': start,
+                    'end': end,
+                    'processor': processor,
+                    'metadata': metadata
+                })
+        
+        return blocks
     
     def get_required_scripts(self) -> List[str]:
         """
@@ -159,6 +547,18 @@ class ProcessorRegistry:
             styles.extend(processor.get_required_styles())
         return styles
     
+    def get_pandoc_args(self) -> List[str]:
+        """
+        Get all pandoc arguments needed for export
+        
+        Returns:
+            List of command-line arguments
+        """
+        args = []
+        for processor in self.get_all_processors():
+            args.extend(processor.get_pandoc_args())
+        return args
+    
     def check_dependencies(self) -> Dict[str, bool]:
         """
         Check if all required dependencies are available
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Stream Splitter
+---------------
+Splits a stream of Markdown text into segments that can be processed
+independently.
+
+Segments end on a blank line outside fenced code blocks and outside the
+multi-line constructs the processors declare through
+get_stream_delimiters() (display math, inline SVG, media elements), so no
+block is ever split between two segments. A segment is only as long as
+needed to reach the target size or to close the largest block.
+
+Delimiters pair up as the lexer pairs them: a block ends at the first
+closing string after its opening one, tag openings such as <svg need
+whitespace after them, and no block crosses a code fence. A block that is
+still open after MAX_BLOCK_SIZE characters is taken to be a stray opening
+string, so one unmatched $$ cannot make the rest of the document a single
+segment.
+"""
+
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from logging_config import get_logger
+
+logger = get_logger()
+
+# Segments are cut at the first safe blank line after this many characters
+SEGMENT_SIZE = 256 * 1024
+
+# Blocks still open after this many characters do not hold back the segment end
+MAX_BLOCK_SIZE = 4 * SEGMENT_SIZE
+
+# Characters that open and close fenced code blocks
+_FENCE_CHARS = ('`', '~')
+
+
+class _BlockTracker:
+    """Tracks whether the text seen so far ends inside a block"""
+    
+    def __init__(self, delimiters: List[Tuple[str, str]], max_block_size: int = MAX_BLOCK_SIZE):
+        """
+        Initialize the tracker
+        
+        Args:
+            delimiters: (opening, closing) strings of multi-line blocks
+            max_block_size: Characters after which an open block is given up
+        """
+        self.delimiters = delimiters
+        self.max_block_size = max_block_size
+        self.fence = None
+        # Index of the delimiters of the open block, and its size so far
+        self.block = None
+        self.block_size = 0
+    
+    def is_clean(self) -> bool:
+        """Check if the text seen so far does not end inside a block"""
+        return self.fence is None and self.block is None
+    
+    def feed(self, line: str) -> None:
+        """
+        Update the state with the next line
+        
+        Args:
+            line: Line without the line break
+        """
+        stripped = line.lstrip(' ')
+        if len(line) - len(stripped) <= 3 and stripped[:1] in _FENCE_CHARS:
+            char = stripped[0]
+            run = len(stripped) - len(stripped.lstrip(char))
+            if self.fence is None and run >= 3:
+                # A backtick line with more backticks after it is inline code
+                if char == '`' and '`' in stripped[run:]:
+                    return
+                self.fence = char * run
+                # Blocks never cross a fence
+                self.block = None
+                return
+            closes_fence = self.fence is not None and char == self.fence[0] and run >= len(self.fence)
+            if closes_fence and not stripped[run:].strip():
+                self.fence = None
+                return
+        
+        if self.fence is not None:
+            return
+        
+        if self.block is not None:
+            self.block_size += len(line) + 1
+            if self.block_size > self.max_block_size:
+                logger.debug(f"No {self.delimiters[self.block][1]} within {self.max_block_size} characters, "
+                             f"ignoring the opening {self.delimiters[self.block][0]}")
+                self.block = None
+        
+        position = 0
+        while True:
+            if self.block is None:
+                found = self._find_opening(line, position)
+                if found is None:
+                    return
+                self.block, position = found
+                self.block_size = len(line) + 1
+            closing = self.delimiters[self.block][1]
+            end = line.find(closing, position)
+            if end < 0:
+                return
+            self.block = None
+            position = end + len(closing)
+    
+    def _find_opening(self, line: str, position: int) -> Optional[Tuple[int, int]]:
+        """Find the first opening string at or after a position, as (delimiter index, end of the opening)"""
+        best = None
+        for index, (opening, _) in enumerate(self.delimiters):
+            found = line.find(opening, position)
+            # Tag openings need whitespace after them, so <videos opens nothing
+            while found >= 0 and opening.startswith('<'):
+                after = found + len(opening)
+                if after == len(line) or line[after].isspace():
+                    break
+                found = line.find(opening, found + 1)
+            if found >= 0 and (best is None or found < best[0]):
+                best = (found, index, found + len(opening))
+        return best[1:] if best is not None else None
+
+
+def split_stream(chunks: Iterable[str], delimiters: List[Tuple[str, str]] = (),
+                 segment_size: int = SEGMENT_SIZE, max_block_size: int = MAX_BLOCK_SIZE) -> Iterator[str]:
+    """
+    Regroup a stream of text into segments that end on block boundaries
+    
+    Args:
+        chunks: Text in chunks of any size, e.g. the lines of a file
+        delimiters: (opening, closing) strings of multi-line blocks that may
+            contain blank lines
+        segment_size: Minimum segment length before a boundary is used
+        max_block_size: Characters after which a block without its closing
+            string no longer holds back the end of a segment
+    
+    Yields:
+        Segments that concatenate to the input
+    """
+    tracker = _BlockTracker(list(delimiters), max_block_size)
+    segment = []
+    size = 0
+    partial = ''
+    
+    for chunk in chunks:
+        # Slices of the chunks are kept instead of lines to keep the per-line overhead low
+        taken = 0
+        position = 0
+        while True:
+            newline = chunk.find('\n', position)
+            if newline < 0:
+                break
+            
+            line = partial + chunk[position:newline]
+            partial = ''
+            position = newline + 1
+            size += len(line) + 1
+            tracker.feed(line)
+            
+            if size >= segment_size and not line.strip() and tracker.is_clean():
+                segment.append(chunk[taken:position])
+                yield ''.join(segment)
+                segment = []
+                size = 0
+                taken = position
+        
+        partial += chunk[position:]
+        if taken < len(chunk):
+            segment.append(chunk[taken:] if taken else chunk)
+    
+    if segment:
+        yield ''.join(segment)
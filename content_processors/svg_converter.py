@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+SVG Converter
+-------------
+Converts SVG (inline images and rendered diagrams) to PDF for LaTeX engines
+and to PNG or EMF for DOCX, so pandoc does not have to shell out per image
+on every export.
+
+Converted files are cached on disk by SVG content hash, target format and
+DPI. Batches are converted in parallel on a thread pool, since every
+backend except cairosvg runs as an external process.
+"""
+
+import os
+import hashlib
+import threading
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from shutil import which
+from typing import Dict, List, Optional
+from logging_config import get_logger
+
+logger = get_logger()
+
+try:
+    import cairosvg
+    CAIROSVG_AVAILABLE = True
+except (ImportError, OSError):
+    CAIROSVG_AVAILABLE = False
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".mdz", "cache", "svg")
+
+
+class SVGConverter:
+    """Cached, parallel SVG to PDF/PNG/EMF converter"""
+    
+    def __init__(self, cache_dir: Optional[str] = None, max_workers: Optional[int] = None, timeout: int = 30):
+        """
+        Initialize the converter
+        
+        Args:
+            cache_dir: Directory for converted files (defaults to ~/.mdz/cache/svg)
+            max_workers: Maximum number of parallel conversions
+            timeout: Seconds allowed for a single conversion
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.timeout = timeout
+        self._backends = None
+        self._lock = threading.Lock()
+    
+    def get_backends(self) -> Dict[str, str]:
+        """
+        Find the available conversion backends (probed once)
+        
+        Returns:
+            Dictionary mapping backend name to executable path (or module name)
+        """
+        with self._lock:
+            if self._backends is None:
+                backends = {}
+                for name in ['rsvg-convert', 'inkscape']:
+                    path = which(name)
+                    if path:
+                        backends[name] = path
+                if CAIROSVG_AVAILABLE:
+                    backends['cairosvg'] = 'cairosvg'
+                logger.debug(f"SVG conversion backends: {', '.join(backends) or 'none'}")
+                self._backends = backends
+            return self._backends
+    
+    def supports(self, image_format: str) -> bool:
+        """
+        Check if SVG can be converted to a format
+        
+        Args:
+            image_format: 'pdf', 'png' or 'emf'
+        
+        Returns:
+            True if a backend for the format is installed, False otherwise
+        """
+        return bool(self._backends_for(image_format))
+    
+    def get_target_format(self, format_type: str, docx_format: str = 'png') -> Optional[str]:
+        """
+        Get the conversion format for an export format
+        
+        Args:
+            format_type: Export format type (pdf, latex, docx, etc.)
+            docx_format: Preferred image format for DOCX ('png' or 'emf')
+        
+        Returns:
+            'pdf' for LaTeX engines, the DOCX image format, or None if SVG
+            should be kept as is
+        """
+        if format_type in ['pdf', 'latex']:
+            return 'pdf'
+        if format_type == 'docx':
+            return docx_format if self.supports(docx_format) else 'png'
+        return None
+    
+    def get_cache_path(self, svg_content: str, image_format: str, dpi: int) -> str:
+        """
+        Get the cache file path for a conversion
+        
+        Args:
+            svg_content: SVG markup
+            image_format: 'pdf', 'png' or 'emf'
+            dpi: Target resolution
+        
+        Returns:
+            Absolute path of the converted file
+        """
+        digest = hashlib.sha256(svg_content.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}-{dpi}.{image_format}")
+    
+    def convert(self, svg_content: str, image_format: str = 'pdf', dpi: int = 300) -> Optional[str]:
+        """
+        Convert a single SVG
+        
+        Args:
+            svg_content: SVG markup
+            image_format: 'pdf', 'png' or 'emf'
+            dpi: Target resolution
+        
+        Returns:
+            Path of the converted file, or None if conversion failed
+        """
+        return self.convert_batch([svg_content], image_format, dpi).get(svg_content)
+    
+    def convert_batch(self, svgs: List[str], image_format: str = 'pdf', dpi: int = 300) -> Dict[str, Optional[str]]:
+        """
+        Convert many SVGs in parallel
+        
+        Args:
+            svgs: List of SVG markup strings
+            image_format: 'pdf', 'png' or 'emf'
+            dpi: Target resolution
+        
+        Returns:
+            Dictionary mapping SVG markup to the converted file path,
+            or None for SVGs that could not be converted
+        """
+        results = {}
+        missing = []
+        
+        for svg_content in svgs:
+            if svg_content in results:
+                continue
+            path = self.get_cache_path(svg_content, image_format, dpi)
+            if os.path.isfile(path):
+                results[svg_content] = path
+            else:
+                results[svg_content] = None
+                missing.append((svg_content, path))
+        
+        if not missing or not self.supports(image_format):
+            return results
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        workers = min(self.max_workers, len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            converted = executor.map(
+                lambda item: self._convert_to_cache(item[0], item[1], image_format, dpi),
+                missing
+            )
+            for (svg_content, _), path in zip(missing, converted):
+                results[svg_content] = path
+        
+        logger.debug(f"Converted {len(missing)} SVGs to {image_format}, {len(svgs) - len(missing)} served from cache")
+        return results
+    
+    def _backends_for(self, image_format: str) -> List[str]:
+        """Get the backends able to produce a format, in order of preference"""
+        backends = self.get_backends()
+        if image_format == 'emf':
+            candidates = ['inkscape']
+        else:
+            candidates = ['rsvg-convert', 'cairosvg', 'inkscape']
+        return [name for name in candidates if name in backends]
+    
+    def _convert_to_cache(self, svg_content: str, path: str, image_format: str, dpi: int) -> Optional[str]:
+        """Convert one SVG into the cache, trying each backend in turn"""
+        # Write to a temporary name first so a partial file never looks like a cache hit
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.{image_format}"
+        
+        for backend in self._backends_for(image_format):
+            try:
+                self._run_backend(backend, svg_content, temp_path, image_format, dpi)
+                if os.path.isfile(temp_path) and os.path.getsize(temp_path) > 0:
+                    os.replace(temp_path, path)
+                    return path
+            except Exception as e:
+                logger.warning(f"{backend} could not convert SVG to {image_format}: {str(e)}")
+            finally:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+        
+        return None
+    
+    def _run_backend(self, backend: str, svg_content: str, output_path: str, image_format: str, dpi: int) -> None:
+        """Run a single conversion with the given backend"""
+        if backend == 'cairosvg':
+            converters = {'pdf': cairosvg.svg2pdf, 'png': cairosvg.svg2png}
+            converters[image_format](bytestring=svg_content.encode('utf-8'), write_to=output_path, dpi=dpi)
+            return
+        
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.svg', delete=False) as svg_file:
+            svg_file.write(svg_content)
+            svg_path = svg_file.name
+        
+        try:
+            if backend == 'rsvg-convert':
+                cmd = [self._backends[backend], '-f', image_format, '-d', str(dpi), '-p', str(dpi),
+                       '-o', output_path, svg_path]
+            else:
+                cmd = [self._backends[backend], f'--export-type={image_format}', f'--export-dpi={dpi}',
+                       f'--export-filename={output_path}', svg_path]
+            
+            subprocess.run(cmd, check=True, capture_output=True, timeout=self.timeout)
+        finally:
+            os.unlink(svg_path)
+
+
+_converter = None
+_converter_lock = threading.Lock()
+
+
+def get_svg_converter() -> SVGConverter:
+    """
+    Get the shared SVG converter
+    
+    Returns:
+        SVGConverter instance
+    """
+    global _converter
+    with _converter_lock:
+        if _converter is None:
+            _converter = SVGConverter()
+        return _converter
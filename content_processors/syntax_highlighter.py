@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Syntax Highlighter
+------------------
+In-process syntax highlighting for code blocks, backed by Pygments.
+
+Highlighted output is cached by language, code hash, theme and output
+format. Very long listings are tokenized in a single pass, so strings and
+comments spanning many lines keep their state, and the token stream is
+flushed into chunks of whole lines that are formatted and cached
+independently, so editing one part of a huge listing only re-formats the
+chunk that changed.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional, List, Tuple
+from logging_config import get_logger
+
+logger = get_logger()
+
+try:
+    from pygments import highlight, format as format_tokens
+    from pygments.lexers import get_lexer_by_name
+    from pygments.formatters import HtmlFormatter
+    from pygments.styles import get_all_styles
+    from pygments.util import ClassNotFound
+    PYGMENTS_AVAILABLE = True
+except ImportError:
+    PYGMENTS_AVAILABLE = False
+
+# Pandoc's built-in highlight styles, used for PDF/DOCX export
+PANDOC_HIGHLIGHT_STYLES = ['pygments', 'tango', 'espresso', 'zenburn', 'kate', 'monochrome', 'breezedark', 'haddock']
+
+
+class SyntaxHighlighter:
+    """Pygments highlighter with a bounded per-block cache"""
+    
+    def __init__(self, theme: str = 'default', cache_size: int = 2048, chunk_lines: int = 400):
+        """
+        Initialize the highlighter
+        
+        Args:
+            theme: Pygments style name
+            cache_size: Maximum number of highlighted blocks (or chunks) kept in memory
+            chunk_lines: Listings longer than this are formatted chunk by chunk
+        """
+        if PYGMENTS_AVAILABLE and theme not in get_all_styles():
+            logger.warning(f"Unknown highlight theme: {theme}, defaulting to default")
+            theme = 'default'
+        
+        self.theme = theme
+        self.cache_size = cache_size
+        self.chunk_lines = chunk_lines
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._lexers = {}
+        self._formatter = HtmlFormatter(nowrap=True) if PYGMENTS_AVAILABLE else None
+    
+    def is_available(self) -> bool:
+        """
+        Check if Pygments is installed
+        
+        Returns:
+            True if code can be highlighted, False otherwise
+        """
+        return PYGMENTS_AVAILABLE
+    
+    def highlight_html(self, code: str, language: str) -> Optional[str]:
+        """
+        Highlight a code block as HTML spans
+        
+        Args:
+            code: Source code
+            language: Fence language name
+        
+        Returns:
+            HTML with Pygments token classes (without the surrounding <pre>),
+            or None if the language is unknown or Pygments is missing
+        """
+        if not PYGMENTS_AVAILABLE or not language:
+            return None
+        
+        lexer = self._get_lexer(language)
+        if lexer is None:
+            return None
+        
+        if code.count('\n') < self.chunk_lines:
+            html = self._cached(self._cache_key(language, code), lambda: highlight(code, lexer, self._formatter))
+        else:
+            html = self._cached(self._cache_key(language, code), lambda: ''.join(
+                self._format_chunk(language, tokens) for tokens in self._split_tokens(lexer.get_tokens(code))))
+        
+        # Pygments always terminates its output with a newline
+        if not code.endswith('\n') and html.endswith('\n'):
+            html = html[:-1]
+        return html
+    
+    def get_stylesheet(self) -> str:
+        """
+        Get the CSS rules for the current theme
+        
+        Returns:
+            CSS for elements inside .highlight containers
+        """
+        if not PYGMENTS_AVAILABLE:
+            return ""
+        return HtmlFormatter(style=self.theme).get_style_defs('.highlight')
+    
+    def get_pandoc_style(self) -> str:
+        """
+        Get the closest pandoc highlight style for the current theme
+        
+        Returns:
+            Name of a pandoc built-in highlight style
+        """
+        if self.theme in PANDOC_HIGHLIGHT_STYLES:
+            return self.theme
+        if self.theme in ['monokai', 'native', 'fruity', 'vim', 'dracula', 'github-dark']:
+            return 'breezedark'
+        return 'pygments'
+    
+    def clear_cache(self) -> None:
+        """Drop all cached highlighting results"""
+        with self._lock:
+            self._cache.clear()
+    
+    def _get_lexer(self, language: str):
+        """Get a (cached) lexer for a fence language"""
+        language = language.lower()
+        if language not in self._lexers:
+            try:
+                self._lexers[language] = get_lexer_by_name(language, stripnl=False, ensurenl=True)
+            except ClassNotFound:
+                logger.debug(f"No Pygments lexer for language: {language}")
+                self._lexers[language] = None
+        return self._lexers[language]
+    
+    def _split_tokens(self, tokens) -> Iterator[List[Tuple]]:
+        """Split a token stream into chunks of whole lines"""
+        chunk = []
+        lines = 0
+        for token_type, value in tokens:
+            for piece in value.splitlines(keepends=True):
+                chunk.append((token_type, piece))
+                if piece.endswith('\n'):
+                    lines += 1
+                    if lines >= self.chunk_lines:
+                        yield chunk
+                        chunk = []
+                        lines = 0
+        if chunk:
+            yield chunk
+    
+    def _format_chunk(self, language: str, tokens: List[Tuple]) -> str:
+        """Format the tokens of one chunk, using the cache when possible"""
+        # Token types are part of the key: the same lines can lex differently in another context
+        text = ''.join(f'{token_type}\0{value}\0' for token_type, value in tokens)
+        return self._cached(self._cache_key(language, text), lambda: format_tokens(tokens, self._formatter))
+    
+    def _cache_key(self, language: str, text: str) -> tuple:
+        """Build the cache key of a listing or chunk"""
+        return (language.lower(), hashlib.sha256(text.encode('utf-8')).hexdigest(), self.theme, 'html')
+    
+    def _cached(self, key: tuple, render: Callable[[], str]) -> str:
+        """Get a cached result, rendering and storing it when missing"""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        
+        html = render()
+        
+        with self._lock:
+            self._cache[key] = html
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        
+        return html
+
+
+_highlighters = {}
+_highlighters_lock = threading.Lock()
+
+
+def get_syntax_highlighter(theme: str = 'default', chunk_lines: int = 400) -> SyntaxHighlighter:
+    """
+    Get the shared highlighter for a theme, so the cache survives across previews
+    
+    Args:
+        theme: Pygments style name
+        chunk_lines: Listings longer than this are formatted chunk by chunk
+        
+    Returns:
+        SyntaxHighlighter instance
+    """
+    with _highlighters_lock:
+        key = (theme, chunk_lines)
+        if key not in _highlighters:
+            _highlighters[key] = SyntaxHighlighter(theme=theme, chunk_lines=chunk_lines)
+        return _highlighters[key]
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Table Renderer
+--------------
+Renders rows of cells as HTML, Office Open XML or Markdown pipe tables.
+
+Rows are consumed from an iterator and written out one at a time, so
+tables read from large CSV files are never held in memory as a list of
+rows. External CSV files are memory-mapped and parsed line by line.
+
+Markdown pipe tables are parsed once into a ColumnarTable. Large ones are
+rendered as virtualized tables in the preview and as page-sized tables
+that repeat the header in HTML-based exports.
+"""
+
+import io
+import csv
+import codecs
+import re
+import json
+import mmap
+from html import escape
+from itertools import chain, repeat, islice
+from typing import Iterable, Iterator, List, Optional
+
+# Tags of the raw blocks pandoc passes through to each output format
+RAW_FORMATS = {
+    'html': 'html',
+    'epub': 'html',
+    'docx': 'openxml'
+}
+
+
+def iter_csv_rows(text: Optional[str] = None, path: Optional[str] = None,
+                  delimiter: str = ',') -> Iterator[List[str]]:
+    """
+    Iterate over the rows of inline CSV text or of a CSV file
+    
+    Blank lines are skipped. Files are decoded as UTF-8, with or without a
+    byte order mark.
+    
+    Args:
+        text: Inline CSV text
+        path: Path of a CSV file, used when text is None
+        delimiter: Field delimiter
+    
+    Yields:
+        Lists of cells
+    """
+    if path is None:
+        lines = io.StringIO(text or '')
+        for row in csv.reader(lines, delimiter=delimiter):
+            if row:
+                yield row
+        return
+    
+    with open(path, 'rb') as f:
+        # Empty files cannot be mapped
+        if not f.seek(0, io.SEEK_END):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped[:3] == codecs.BOM_UTF8:
+                mapped.seek(3)
+            lines = (line.decode('utf-8') for line in iter(mapped.readline, b''))
+            for row in csv.reader(lines, delimiter=delimiter):
+                if row:
+                    yield row
+
+
+class _Rows:
+    """Splits off the header row and stops after the row limit"""
+    
+    def __init__(self, rows: Iterable[List[str]], max_rows: Optional[int], header: bool):
+        self._rows = iter(rows)
+        self.header = next(self._rows, None) if header else None
+        self.max_rows = max_rows
+        self.truncated = False
+    
+    def __iter__(self) -> Iterator[List[str]]:
+        for count, row in enumerate(self._rows):
+            if self.max_rows is not None and count >= self.max_rows:
+                self.truncated = True
+                return
+            yield row
+
+
+def _truncation_note(max_rows: int) -> str:
+    return f"Only the first {max_rows} rows are shown."
+
+
+def _html_row(tag: str, cells: Iterable[str], alignments: Optional[List[str]], escape_cells: bool) -> str:
+    if not alignments:
+        if escape_cells:
+            cells = [escape(cell, quote=False) for cell in cells]
+        return f'<tr><{tag}>' + f'</{tag}><{tag}>'.join(cells) + f'</{tag}></tr>\n'
+    aligned = zip(cells, chain(alignments, repeat('left')))
+    return '<tr>' + ''.join(_html_cell(tag, cell, alignment, escape_cells) for cell, alignment in aligned) + '</tr>\n'
+
+
+def _html_cell(tag: str, cell: str, alignment: str, escape_cells: bool) -> str:
+    style = f' style="text-align: {alignment}"' if alignment != 'left' else ''
+    return f'<{tag}{style}>{escape(cell, quote=False) if escape_cells else cell}</{tag}>'
+
+
+def render_html_table(rows: Iterable[List[str]], css_class: str = 'csv-table',
+                      max_rows: Optional[int] = None, header: bool = True,
+                      alignments: Optional[List[str]] = None, escape_cells: bool = True) -> str:
+    """
+    Render rows as an HTML table
+    
+    The table only carries class names; the styles are shared by all tables
+    of a document (see EnhancedElementProcessor.get_required_styles()).
+    
+    Args:
+        rows: Rows of cells, the first one is the header row if header is True
+        css_class: Class of the table, the container is named after it
+        max_rows: Maximum number of body rows, None for all
+        header: Whether the first row is a header row
+        alignments: Text alignment of each column ('left', 'center' or 'right')
+        escape_cells: Whether cells are text to escape rather than HTML
+    
+    Returns:
+        HTML markup
+    """
+    rows = _Rows(rows, max_rows, header)
+    parts = [f'<div class="{css_class}-container">\n<table class="{css_class}">\n']
+    
+    if rows.header is not None:
+        parts.append('<thead>\n')
+        parts.append(_html_row('th', rows.header, alignments, escape_cells))
+        parts.append('</thead>\n')
+    
+    parts.append('<tbody>\n')
+    parts.extend(_html_row('td', row, alignments, escape_cells) for row in rows)
+    parts.append('</tbody>\n</table>\n')
+    
+    if rows.truncated:
+        parts.append(f'<p class="{css_class}-note">{_truncation_note(max_rows)}</p>\n')
+    parts.append('</div>')
+    return ''.join(parts)
+
+
+def _openxml_row(cells: List[str], columns: int, header: bool = False) -> str:
+    cells = (list(cells) + [''] * columns)[:columns]
+    # The header row is repeated at the top of every page
+    parts = ['<w:tr><w:trPr><w:tblHeader/></w:trPr>' if header else '<w:tr>']
+    run_properties = '<w:rPr><w:b/></w:rPr>' if header else ''
+    for cell in cells:
+        parts.append(f'<w:tc><w:p><w:r>{run_properties}<w:t xml:space="preserve">'
+                     f'{escape(cell, quote=False)}</w:t></w:r></w:p></w:tc>')
+    parts.append('</w:tr>')
+    return ''.join(parts)
+
+
+def render_openxml_table(rows: Iterable[List[str]], max_rows: Optional[int] = None,
+                         header: bool = True) -> str:
+    """
+    Render rows as an Office Open XML (Word) table
+    
+    Args:
+        rows: Rows of cells, the first one is the header row if header is True
+        max_rows: Maximum number of body rows, None for all
+        header: Whether the first row is a header row
+    
+    Returns:
+        WordprocessingML markup of the table
+    """
+    rows = _Rows(rows, max_rows, header)
+    body = iter(rows)
+    first = rows.header if rows.header is not None else next(body, None)
+    if first is None:
+        return ''
+    columns = len(first)
+    
+    parts = [
+        '<w:tbl><w:tblPr><w:tblStyle w:val="Table"/><w:tblW w:w="5000" w:type="pct"/></w:tblPr><w:tblGrid>',
+        '<w:gridCol/>' * columns,
+        '</w:tblGrid>',
+        _openxml_row(first, columns, header=rows.header is not None)
+    ]
+    parts.extend(_openxml_row(row, columns) for row in body)
+    parts.append('</w:tbl>')
+    
+    if rows.truncated:
+        parts.append(f'<w:p><w:r><w:rPr><w:i/></w:rPr><w:t>{_truncation_note(max_rows)}</w:t></w:r></w:p>')
+    return ''.join(parts)
+
+
+def _pipe_row(cells: List[str], columns: int) -> str:
+    cells = (list(cells) + [''] * columns)[:columns]
+    cells = [cell.replace('\\', '\\\\').replace('|', '\\|').replace('\r', ' ').replace('\n', ' ') for cell in cells]
+    return '| ' + ' | '.join(cells) + ' |\n'
+
+
+def render_pipe_table(rows: Iterable[List[str]], max_rows: Optional[int] = None,
+                      header: bool = True) -> str:
+    """
+    Render rows as a Markdown pipe table
+    
+    Args:
+        rows: Rows of cells, the first one is the header row if header is True
+        max_rows: Maximum number of body rows, None for all
+        header: Whether the first row is a header row
+    
+    Returns:
+        Markdown text
+    """
+    rows = _Rows(rows, max_rows, header)
+    body = iter(rows)
+    first = rows.header if rows.header is not None else next(body, None)
+    if first is None:
+        return ''
+    columns = len(first)
+    
+    # Pipe tables always have a header row, an empty one stands in for a missing header
+    parts = [_pipe_row(first if rows.header is not None else [], columns), '|' + '---|' * columns + '\n']
+    if rows.header is None:
+        parts.append(_pipe_row(first, columns))
+    parts.extend(_pipe_row(row, columns) for row in body)
+    
+    if rows.truncated:
+        parts.append(f'\n*{_truncation_note(max_rows)}*\n')
+    return ''.join(parts).rstrip('\n')
+
+
+def raw_block(text: str, raw_format: str) -> str:
+    """
+    Wrap output in a pandoc raw block, which is passed through unparsed
+    
+    Args:
+        text: Output in the target format
+        raw_format: Raw format name, e.g. 'html' or 'openxml'
+    
+    Returns:
+        Fenced raw block
+    """
+    longest = max((len(run) for run in re.findall(r'`{3,}', text)), default=2)
+    fence = '`' * (longest + 1)
+    return f"{fence}{{={raw_format}}}\n{text}\n{fence}"
+
+
+def render_table(rows: Iterable[List[str]], format_type: str, max_rows: Optional[int] = None,
+                 header: bool = True) -> str:
+    """
+    Render rows as Markdown for an export format
+    
+    HTML, EPUB and DOCX get raw blocks that pandoc copies to the output
+    without parsing a pipe table. Other formats get a pipe table; for PDF,
+    pandoc writes it as a longtable, which splits across pages and repeats
+    the header row on each page.
+    
+    Args:
+        rows: Rows of cells, the first one is the header row if header is True
+        format_type: Export format type (pdf, html, docx, etc.)
+        max_rows: Maximum number of body rows, None for all
+        header: Whether the first row is a header row
+    
+    Returns:
+        Markdown text
+    """
+    raw_format = RAW_FORMATS.get(format_type)
+    if raw_format == 'html':
+        return raw_block(render_html_table(rows, max_rows=max_rows, header=header), raw_format)
+    if raw_format == 'openxml':
+        return raw_block(render_openxml_table(rows, max_rows=max_rows, header=header), raw_format)
+    return render_pipe_table(rows, max_rows=max_rows, header=header)
+
+
+def _split_pipe_row(line: str) -> List[str]:
+    """Split a pipe table row into its stripped cells, keeping escaped pipes"""
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|') and not line.endswith('\\|'):
+        line = line[:-1]
+    if '\\|' in line:
+        return [cell.replace('\\|', '|').strip() for cell in re.split(r'(?<!\\)\|', line)]
+    return [cell.strip() for cell in line.split('|')]
+
+
+class ColumnarTable:
+    """
+    Table data stored column by column
+    
+    Each column is a single list of cell strings, so a table with tens of
+    thousands of rows is parsed once into a handful of lists instead of a
+    list or an HTML string per row. Rows are produced on demand.
+    """
+    
+    def __init__(self, header: List[str], alignments: List[str], columns: List[List[str]]):
+        """
+        Initialize the table
+        
+        Args:
+            header: Header cells
+            alignments: Text alignment of each column ('left', 'center' or 'right')
+            columns: Body cells of each column, all of the same length
+        """
+        self.header = header
+        self.alignments = alignments
+        self.columns = columns
+    
+    @classmethod
+    def from_pipe_table(cls, text: str) -> Optional['ColumnarTable']:
+        """
+        Parse a Markdown pipe table
+        
+        Args:
+            text: Header row, delimiter row and body rows
+        
+        Returns:
+            ColumnarTable, or None if the text has no delimiter row
+        """
+        lines = text.strip('\n').split('\n')
+        if len(lines) < 2:
+            return None
+        
+        header = _split_pipe_row(lines[0])
+        alignments = []
+        for cell in _split_pipe_row(lines[1]):
+            if cell.startswith(':') and cell.endswith(':'):
+                alignments.append('center')
+            elif cell.endswith(':'):
+                alignments.append('right')
+            else:
+                alignments.append('left')
+        alignments = (alignments + ['left'] * len(header))[:len(header)]
+        
+        # Short rows are padded and long rows cut to the header, as pandoc does
+        width = len(header)
+        padding = [''] * width
+        rows = []
+        for line in lines[2:]:
+            cells = _split_pipe_row(line)
+            rows.append(cells if len(cells) == width else (cells + padding)[:width])
+        columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in header]
+        return cls(header, alignments, columns)
+    
+    @property
+    def row_count(self) -> int:
+        """Number of body rows"""
+        return len(self.columns[0]) if self.columns else 0
+    
+    def iter_rows(self, start: int = 0, stop: Optional[int] = None, header: bool = True) -> Iterator[List[str]]:
+        """
+        Iterate over rows
+        
+        Args:
+            start: First body row
+            stop: End of the body rows, None for all
+            header: Whether to yield the header row first
+        
+        Yields:
+            Rows of cells
+        """
+        body = zip(*(islice(column, start, stop) for column in self.columns))
+        return chain([self.header], body) if header else body
+    
+    def to_json(self) -> str:
+        """
+        Serialize the body and alignments for the virtualized preview
+        
+        Returns:
+            JSON text that is safe inside a <script> element
+        """
+        data = {'alignments': self.alignments, 'columns': self.columns}
+        return json.dumps(data, separators=(',', ':')).replace('</', '<\\/')
+
+
+def render_virtual_table(table: ColumnarTable, css_class: str = 'enhanced-table',
+                         initial_rows: int = 50, escape_cells: bool = True) -> str:
+    """
+    Render a table for the preview that only lays out the rows in view
+    
+    The first rows are rendered as HTML so the table shows without
+    JavaScript; resources/virtual_table.js then replaces the body with the
+    rows visible in the scrolling container, read from the embedded column
+    data.
+    
+    Args:
+        table: Table data
+        css_class: Class of the table, the container is named after it
+        initial_rows: Number of rows rendered as HTML
+        escape_cells: Whether cells are text to escape rather than HTML
+    
+    Returns:
+        HTML markup
+    """
+    html = render_html_table(table.iter_rows(stop=initial_rows), css_class,
+                             alignments=table.alignments, escape_cells=escape_cells)
+    html_cells = 'false' if escape_cells else 'true'
+    return (
+        f'<div class="virtual-table" data-rows="{table.row_count}" data-html="{html_cells}">\n'
+        f'{html}\n'
+        f'<script type="application/json" class="virtual-table-data">{table.to_json()}</script>\n'
+        '</div>'
+    )
+
+
+def _markdown_row(cells: Iterable[str]) -> str:
+    # Cells of pipe tables are Markdown already, only their pipes need escaping again
+    return '| ' + ' | '.join(cell.replace('|', '\\|') for cell in cells) + ' |\n'
+
+
+def render_paged_pipe_tables(table: ColumnarTable, page_rows: int) -> str:
+    """
+    Render a table as consecutive pipe tables that each repeat the header
+    
+    HTML-based output (and PDF engines that lay out HTML) then handles many
+    small tables instead of one very long one, and every part carries the
+    header.
+    
+    Args:
+        table: Table data
+        page_rows: Body rows per table
+    
+    Returns:
+        Markdown text with the tables separated by blank lines
+    """
+    delimiter = {'left': '---', 'center': ':---:', 'right': '---:'}
+    header = _markdown_row(table.header) + '|' + '|'.join(delimiter[a] for a in table.alignments) + '|\n'
+    
+    pages = []
+    for start in range(0, max(table.row_count, 1), page_rows):
+        body = ''.join(_markdown_row(row) for row in table.iter_rows(start, start + page_rows, header=False))
+        pages.append(header + body)
+    return '\n'.join(pages).rstrip('\n')
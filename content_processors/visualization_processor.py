@@ -5,11 +5,12 @@ Visualization Content Processor
 Processor for interactive visualizations (Plotly, Chart.js) in Markdown.
 """
 
-import re
 import json
 from typing import Dict, Any, List, Tuple, Optional
 from logging_config import get_logger
-from content_processors.base_processor import ContentProcessor
+from content_processors.base_processor import ContentProcessor, CostClass
+from content_processors.block_lexer import FencedBlockRule, LexMatch, Rule
+from content_processors.chart_renderer import get_chart_service
 
 logger = get_logger()
 
@@ -24,8 +25,24 @@ class VisualizationProcessor(ContentProcessor):
             config: Optional configuration dictionary
         """
         super().__init__(config)
-        self.plotly_pattern = r'```plotly\s+(.*?)\s+```'
-        self.chartjs_pattern = r'```chartjs\s+(.*?)\s+```'
+    
+    def configure(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Apply a new configuration to the Visualization processor
+        
+        Args:
+            config: Configuration dictionary, or None for the defaults
+        """
+        super().configure(config)
+        
+        # Static rendering for formats that cannot run JavaScript
+        self.rasterize_charts = self.config.get('rasterize_charts', True)
+        self.chart_format = self.config.get('chart_format', 'png')
+        self.chart_dpi = self.config.get('chart_dpi', 300)
+        self.chart_width = self.config.get('chart_width', 800)
+        self.chart_height = self.config.get('chart_height', 400)
+        self.chart_service = get_chart_service() if self.rasterize_charts else None
+        self._rendered_charts = {}
     
     def detect(self, content: str) -> List[Tuple[int, int, Dict[str, Any]]]:
         """
@@ -37,33 +54,75 @@ class VisualizationProcessor(ContentProcessor):
         Returns:
             List of tuples containing (start_index, end_index, metadata)
         """
-        result = []
-        
-        # Detect Plotly blocks
-        for match in re.finditer(self.plotly_pattern, content, re.DOTALL):
-            start, end = match.span()
-            plotly_code = match.group(1).strip()
-            result.append((
-                start, end, 
-                {
-                    'type': 'plotly',
-                    'code': plotly_code
-                }
-            ))
-        
-        # Detect Chart.js blocks
-        for match in re.finditer(self.chartjs_pattern, content, re.DOTALL):
-            start, end = match.span()
-            chartjs_code = match.group(1).strip()
-            result.append((
-                start, end, 
-                {
-                    'type': 'chartjs',
-                    'code': chartjs_code
-                }
-            ))
-        
-        return result
+        return self.detect_with_patterns(content)
+    
+    def get_rules(self) -> List[Rule]:
+        """
+        Get the rules for Plotly and Chart.js blocks
+        
+        Returns:
+            List of lexer rules
+        """
+        return [
+            FencedBlockRule('plotly', ['plotly']),
+            FencedBlockRule('chartjs', ['chartjs'])
+        ]
+    
+    def build_metadata(self, block_type: str, match: LexMatch) -> Optional[Dict[str, Any]]:
+        """
+        Build the metadata for a visualization
+        
+        Args:
+            block_type: 'plotly' or 'chartjs'
+            match: Match object of the rule
+        
+        Returns:
+            Metadata dictionary
+        """
+        return {
+            'type': block_type,
+            'code': match.group(2).strip()
+        }
+    
+    def get_cache_fingerprint(self) -> str:
+        """
+        Get the configuration fingerprint, including whether charts can be rendered
+        
+        Returns:
+            Fingerprint string
+        """
+        return f"{super().get_cache_fingerprint()}|render={self._can_render()}"
+    
+    def prepare_blocks(self, blocks: List[Dict[str, Any]], format_type: str) -> None:
+        """
+        Render all charts of a document in one batch for static export formats
+        
+        Args:
+            blocks: Metadata of all visualization blocks in the document
+            format_type: 'preview' or export format type
+        """
+        # Instances are reused for every document, only keep this document's results
+        self._rendered_charts = {}
+        if format_type not in ['pdf', 'latex', 'docx'] or not self._can_render():
+            return
+        
+        charts = [(block.get('type', ''), block.get('code', '')) for block in blocks]
+        self._rendered_charts.update(self._render_charts(charts))
+    
+    def get_cost_class(self, metadata: Dict[str, Any], format_type: str) -> str:
+        """
+        Get the cost class of a visualization
+        
+        Args:
+            metadata: Metadata of the block
+            format_type: 'preview' or export format type
+        
+        Returns:
+            SUBPROCESS when the chart is rendered to an image, CHEAP otherwise
+        """
+        if format_type in ['pdf', 'latex', 'docx'] and self._can_render():
+            return CostClass.SUBPROCESS
+        return CostClass.CHEAP
     
     def process_for_preview(self, content: str, metadata: Dict[str, Any]) -> str:
         """
@@ -147,16 +206,48 @@ class VisualizationProcessor(ContentProcessor):
             return self.process_for_preview(content, metadata)
         
         elif format_type in ['pdf', 'latex', 'docx']:
-            # For PDF/LaTeX/DOCX export, generate a static image if possible
-            # This is a simplified implementation
+            # For PDF/LaTeX/DOCX export, embed a static image if one could be rendered
+            image_path = self._get_rendered_chart(vis_type, code)
             if vis_type == 'plotly':
+                if image_path:
+                    return f"\n\n![Plotly Visualization]({image_path})\n\n"
                 return "\n\n[Plotly Visualization]\n\n"
             elif vis_type == 'chartjs':
+                if image_path:
+                    return f"\n\n![Chart.js Visualization]({image_path})\n\n"
                 return "\n\n[Chart.js Visualization]\n\n"
         
         # Default fallback
         return f'```\n{code}\n```'
     
+    def _can_render(self) -> bool:
+        """Check if charts can be rendered to static images"""
+        return self.chart_service is not None and self.chart_service.is_available()
+    
+    def _render_charts(self, charts: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[str]]:
+        """Render charts to images with the shared render service"""
+        charts = [chart for chart in charts if chart[0] in ['plotly', 'chartjs']]
+        if not charts:
+            return {}
+        
+        rendered = self.chart_service.render_batch(
+            charts,
+            image_format=self.chart_format,
+            dpi=self.chart_dpi,
+            width=self.chart_width,
+            height=self.chart_height
+        )
+        
+        # Pandoc accepts forward slashes on every platform
+        return {key: path.replace('\\', '/') if path else None for key, path in rendered.items()}
+    
+    def _get_rendered_chart(self, vis_type: str, code: str) -> Optional[str]:
+        """Get the image for a chart, rendering it now if it was not batched"""
+        key = (vis_type, code)
+        if key not in self._rendered_charts and self._can_render():
+            self._rendered_charts.update(self._render_charts([key]))
+        return self._rendered_charts.get(key)
+    
     def get_required_scripts(self) -> List[str]:
         """
         Get required JavaScript scripts for visualizations
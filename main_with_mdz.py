@@ -259,6 +259,10 @@ def main():
     except ImportError as e:
         logger.warning(f"Failed to import QtWebEngineWidgets: {str(e)}")
 
+    # Register the vendor script scheme for the shared preview profile (must precede QApplication)
+    from web_profile import register_resource_scheme
+    register_resource_scheme()
+
     # Create QApplication
     app = QApplication(sys.argv)
     app.setApplicationName("Advanced Markdown to PDF Converter")
@@ -4487,6 +4487,10 @@ def main():
         os.environ["MARKDOWN_PDF_TEST_MODE"] = "1"
         logger.info("Running in test mode - dialogs will be suppressed")
 
+    # Register the vendor script scheme for the shared preview profile (must precede QApplication)
+    from web_profile import register_resource_scheme
+    register_resource_scheme()
+
     # Initialize QApplication with remaining arguments
     app = QApplication(remaining)
     app.setApplicationName("Advanced Markdown to PDF Converter")
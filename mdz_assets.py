@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+MDZ Asset Store
+---------------
+Assets of exported bundles are stored by the SHA-256 of their content,
+under assets/<sha256><extension>, and the manifest maps every path the
+document refers to onto the hash. Identical content is stored once, and
+different files that share a name no longer overwrite each other.
+
+AssetStore is an optional local directory of assets shared by many
+bundles, such as logos and templates. Bundles created in a batch can
+reference assets in the store by hash instead of embedding a copy.
+
+File: mdz_assets.py
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+from typing import BinaryIO, Union
+
+from mdz_stream import CHUNK_SIZE
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Directory of asset blobs within a bundle
+ASSET_DIR = "assets"
+
+
+def hash_bytes(data: Union[str, bytes]) -> str:
+    """
+    Compute the SHA-256 of an asset held in memory
+
+    Args:
+        data: Asset content, text is encoded as UTF-8
+
+    Returns:
+        Hex digest
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """
+    Compute the SHA-256 of a file, reading it in chunks
+
+    Args:
+        path: Path of the file
+
+    Returns:
+        Hex digest
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def blob_path(sha256: str, name: str) -> str:
+    """
+    Get the path of an asset blob within a bundle
+
+    The extension of the asset name is kept, so the media type of the blob
+    can still be told from its path.
+
+    Args:
+        sha256: Hex digest of the content
+        name: Name of the asset
+
+    Returns:
+        Path within the bundle
+    """
+    return f"{ASSET_DIR}/{sha256}{os.path.splitext(name)[1].lower()}"
+
+
+def normalize_asset_name(name: str) -> str:
+    """
+    Normalize the path a document refers to an asset by
+
+    Args:
+        name: Asset path as referenced
+
+    Returns:
+        The path with forward slashes and without a leading "./"
+    """
+    name = name.replace('\\', '/')
+    while name.startswith('./'):
+        name = name[2:]
+    return name
+
+
+class AssetStore:
+    """
+    Shared local store of assets, addressed by their SHA-256
+
+    Blobs are kept under <root>/<first two hex digits>/<sha256> and never
+    change once written, so any number of bundles can reference them.
+    """
+
+    def __init__(self, root: str):
+        """
+        Open a store, creating its directory if needed
+
+        Args:
+            root: Directory of the store
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, sha256: str) -> str:
+        """
+        Get the path of a blob
+
+        Args:
+            sha256: Hex digest of the content
+
+        Returns:
+            Path of the blob file, which may not exist
+        """
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def __contains__(self, sha256: str) -> bool:
+        return os.path.exists(self.path_for(sha256))
+
+    def add_bytes(self, data: Union[str, bytes]) -> str:
+        """
+        Add an asset from memory
+
+        Args:
+            data: Asset content, text is encoded as UTF-8
+
+        Returns:
+            SHA-256 of the asset
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        sha256 = hash_bytes(data)
+        if sha256 not in self:
+            self._write(sha256, lambda f: f.write(data))
+        return sha256
+
+    def add_file(self, path: str) -> str:
+        """
+        Add an asset from a file
+
+        Args:
+            path: Path of the file
+
+        Returns:
+            SHA-256 of the asset
+        """
+        sha256 = hash_file(path)
+        if sha256 not in self:
+            def copy(f):
+                with open(path, 'rb') as source:
+                    shutil.copyfileobj(source, f, CHUNK_SIZE)
+            self._write(sha256, copy)
+        return sha256
+
+    def _write(self, sha256: str, write) -> None:
+        """Write a blob next to its final path and move it into place when complete"""
+        target = self.path_for(sha256)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = f"{target}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                write(f)
+            os.replace(temp_path, target)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        logger.debug(f"Added asset {sha256} to the store {self.root}")
+
+    def open(self, sha256: str) -> BinaryIO:
+        """
+        Open a blob for reading
+
+        Args:
+            sha256: Hex digest of the content
+
+        Returns:
+            Binary file object
+
+        Raises:
+            KeyError: If the store has no such asset
+        """
+        try:
+            return open(self.path_for(sha256), 'rb')
+        except FileNotFoundError:
+            raise KeyError(sha256)
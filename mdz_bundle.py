@@ -25,6 +25,10 @@ try:
 except ImportError:
     raise ImportError("Zstandard library not found. Please install it with 'pip install zstandard'")
 
+from mdz_stream import MDZStreamWriter, AUTO_LEVEL, compression_level_arg, DIGEST_MANIFEST
+from mdz_dictionary import default_dictionary
+from mdz_container import FORMAT_VERSION, IndexedMDZReader, LazyContent, save_indexed, sniff_format
+
 # Configure logger
 logger = logging.getLogger(__name__)
 
@@ -42,14 +46,20 @@ class MDZBundle:
         "additional_assets/": {}  # Directory for any additional files
     }
     
-    def __init__(self, compression_level: int = 3):
+    def __init__(self, compression_level: Union[int, str] = 3, format_version: int = FORMAT_VERSION, use_dictionary: bool = True):
         """
         Initialize a new MDZ bundle
         
         Args:
-            compression_level: Zstandard compression level (1-22, default: 3)
+            compression_level: Zstandard compression level (1-22, default: 3), or "auto"
+                to choose one from the bundle size
+            format_version: Format to save in, 2 (indexed, default) or 1 (single tar frame, readable by older versions)
+            use_dictionary: Compress the text entries of version 2 bundles with the shipped dictionary
         """
-        self.compression_level = min(max(1, compression_level), 22)  # Ensure valid compression level
+        # Ensure valid compression level
+        self.compression_level = compression_level if compression_level == AUTO_LEVEL else min(max(1, compression_level), 22)
+        self.format_version = format_version
+        self.use_dictionary = use_dictionary
         self.content = {}
         self.temp_dir = None
         self.main_content = ""
@@ -170,43 +180,27 @@ class MDZBundle:
         Args:
             output_path: Path to save the .mdz file
         """
-        # Create a temporary directory for building the tar file
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Create the bundle structure in the temporary directory
-            for path, content in self.content.items():
-                full_path = os.path.join(temp_dir, path)
-                
-                if isinstance(content, dict):  # Directory
-                    os.makedirs(full_path, exist_ok=True)
-                else:  # File
-                    # Create parent directories if they don't exist
-                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                    
-                    # Write the file content
-                    mode = 'wb' if isinstance(content, bytes) else 'w'
-                    with open(full_path, mode) as f:
-                        f.write(content)
-            
-            # Create a tar file in memory
-            tar_data = io.BytesIO()
-            with tarfile.open(fileobj=tar_data, mode='w') as tar:
-                # Add all files from the temporary directory
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, temp_dir)
-                        tar.add(file_path, arcname=arcname)
+        # Stream the content into the compressed output file, as indexed frames
+        # (version 2) or as one tar frame (version 1)
+        if self.format_version >= 2:
+            # Only changed files are compressed, and the content is then read from the saved file
+            dictionary = default_dictionary() if self.use_dictionary else None
+            self.content = LazyContent(save_indexed(self.content, output_path, self.compression_level, dictionary))
+        else:
+            # Version 1 files stay headerless, so older versions can read them
+            writer = MDZStreamWriter(self.compression_level, header=False)
+            writer.add_content(self.content)
             
-            # Compress the tar data with Zstandard
-            tar_data.seek(0)
-            compressor = zstd.ZstdCompressor(level=self.compression_level)
-            compressed_data = compressor.compress(tar_data.getvalue())
+            # The source file is unmapped while it may be replaced
+            if isinstance(self.content, LazyContent):
+                self.content.reader.close()
+            writer.write(output_path)
             
-            # Write the compressed data to the output file
-            with open(output_path, 'wb') as f:
-                f.write(compressed_data)
-            
-            logger.info(f"Saved MDZ bundle to {output_path} (compression level: {self.compression_level})")
+            # Lazy content loaded from the file that was just replaced is read from the new file
+            if isinstance(self.content, LazyContent) and os.path.abspath(self.content.reader.path) == os.path.abspath(output_path):
+                self._load_content(output_path)
+        
+        logger.info(f"Saved MDZ bundle to {output_path} (compression level: {self.compression_level})")
     
     def load(self, input_path: str) -> None:
         """
@@ -215,8 +209,50 @@ class MDZBundle:
         Args:
             input_path: Path to the .mdz file
         """
+        self._load_content(input_path)
+        
+        # Extract main content and metadata
+        if "index.md" in self.content:
+            self.main_content = self.content["index.md"]
+            
+            # Check for front matter in the main content
+            if isinstance(self.main_content, str):
+                markdown_content, front_matter = self.extract_front_matter(self.main_content)
+                if front_matter:
+                    self.metadata.update(front_matter)
+                    self.main_content = markdown_content
+        
+        # Load metadata from metadata.yaml if it exists
+        if "metadata.yaml" in self.content and isinstance(self.content["metadata.yaml"], str):
+            try:
+                yaml_metadata = yaml.safe_load(self.content["metadata.yaml"])
+                if isinstance(yaml_metadata, dict):
+                    self.metadata.update(yaml_metadata)
+            except Exception as e:
+                logger.warning(f"Error parsing metadata.yaml: {str(e)}")
+        
+        logger.info(f"Loaded MDZ bundle from {input_path}")
+    
+    def _load_content(self, input_path: str) -> None:
+        """
+        Load the content of a .mdz file
+        
+        Version 2 bundles are opened lazily, files are only decompressed when
+        they are accessed. Version 1 bundles are decompressed completely.
+        
+        Args:
+            input_path: Path to the .mdz file
+        """
+        bundle_format = sniff_format(input_path)
+        if bundle_format.indexed:
+            self.content = LazyContent(IndexedMDZReader(input_path))
+            return
+        if bundle_format.secure:
+            raise ValueError(f"{input_path} is a secure bundle, open it with UnifiedMDZ")
+        
         # Read the compressed data
         with open(input_path, 'rb') as f:
+            f.seek(bundle_format.header_size)
             compressed_data = f.read()
         
         # Decompress the data
@@ -229,6 +265,9 @@ class MDZBundle:
         # Extract the tar file
         with tarfile.open(fileobj=tar_data, mode='r') as tar:
             for member in tar.getmembers():
+                if member.name == DIGEST_MANIFEST:
+                    # Only used to verify the bundle
+                    continue
                 if member.isdir():
                     # Add directory to content
                     dir_path = member.name
@@ -250,28 +289,6 @@ class MDZBundle:
                                 pass
                         
                         self.content[member.name] = content
-        
-        # Extract main content and metadata
-        if "index.md" in self.content:
-            self.main_content = self.content["index.md"]
-            
-            # Check for front matter in the main content
-            if isinstance(self.main_content, str):
-                markdown_content, front_matter = self.extract_front_matter(self.main_content)
-                if front_matter:
-                    self.metadata.update(front_matter)
-                    self.main_content = markdown_content
-        
-        # Load metadata from metadata.yaml if it exists
-        if "metadata.yaml" in self.content and isinstance(self.content["metadata.yaml"], str):
-            try:
-                yaml_metadata = yaml.safe_load(self.content["metadata.yaml"])
-                if isinstance(yaml_metadata, dict):
-                    self.metadata.update(yaml_metadata)
-            except Exception as e:
-                logger.warning(f"Error parsing metadata.yaml: {str(e)}")
-        
-        logger.info(f"Loaded MDZ bundle from {input_path}")
     
     def extract_to_directory(self, output_dir: str) -> Dict[str, str]:
         """
@@ -360,13 +377,33 @@ class MDZBundle:
         """
         Get the path to an extracted asset
         
+        Assets that have not been extracted yet are extracted on their own
+        to the temporary directory.
+        
         Args:
             internal_path: Internal path within the bundle
             
         Returns:
             The path to the extracted asset, or None if not found
         """
-        return self.extracted_paths.get(internal_path)
+        if internal_path in self.extracted_paths:
+            return self.extracted_paths[internal_path]
+        if internal_path.endswith('/') or internal_path not in self.content:
+            return None
+        
+        if not self.temp_dir:
+            self.temp_dir = tempfile.mkdtemp(prefix="mdz_bundle_")
+        
+        # Write only this file
+        content = self.content[internal_path]
+        file_path = os.path.join(self.temp_dir, internal_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        mode = 'wb' if isinstance(content, bytes) else 'w'
+        with open(file_path, mode) as f:
+            f.write(content)
+        
+        self.extracted_paths[internal_path] = file_path
+        return file_path
     
     def __enter__(self):
         """
@@ -382,7 +419,7 @@ class MDZBundle:
 
 
 def create_mdz_from_markdown_file(markdown_file: str, output_file: str, 
-                                 compression_level: int = 3,
+                                 compression_level: Union[int, str] = 3,
                                  include_images: bool = True,
                                  base_dir: Optional[str] = None) -> None:
     """
@@ -391,7 +428,7 @@ def create_mdz_from_markdown_file(markdown_file: str, output_file: str,
     Args:
         markdown_file: Path to the markdown file
         output_file: Path to save the MDZ bundle
-        compression_level: Zstandard compression level (1-22, default: 3)
+        compression_level: Zstandard compression level (1-22 or "auto", default: 3)
         include_images: Whether to include referenced images
         base_dir: Base directory for resolving relative paths (defaults to markdown file's directory)
     """
@@ -495,8 +532,8 @@ if __name__ == "__main__":
     create_parser = subparsers.add_parser('create', help='Create an MDZ bundle from a markdown file')
     create_parser.add_argument('markdown_file', help='Path to the markdown file')
     create_parser.add_argument('output_file', help='Path to save the MDZ bundle')
-    create_parser.add_argument('--compression', type=int, default=3, 
-                              help='Zstandard compression level (1-22, default: 3)')
+    create_parser.add_argument('--compression', type=compression_level_arg, default=3, 
+                              help='Zstandard compression level (1-22 or auto, default: 3)')
     create_parser.add_argument('--no-images', action='store_true', 
                               help='Do not include referenced images')
     
@@ -787,6 +787,41 @@ This document tests all the features of the MDZ format.
 
         return True
 
+    def verify_mdz_bundles(self):
+        """Verify the files of the MDZ bundles against their recorded digests, without extracting them"""
+        logger.info("Verifying MDZ bundles...")
+
+        try:
+            from mdz_verify import verify_bundles
+        except ImportError:
+            logger.error("MDZ verification module not found")
+            return False
+
+        bundle_paths = [os.path.join(self.test_files_dir, file_name)
+                        for file_name in sorted(os.listdir(self.test_files_dir)) if file_name.endswith(".mdz")]
+        result = verify_bundles(bundle_paths)
+
+        for report in result["bundles"]:
+            if not report["ok"]:
+                logger.error(f"Integrity check failed for {report['path']}: "
+                             f"failed {report['failed']}, missing {report['missing']}")
+            elif report["unverified"]:
+                logger.warning(f"No digests recorded for {len(report['unverified'])} files of {report['path']}")
+
+        logger.info(f"Verified {result['checked']} files of {len(result['bundles'])} bundles, "
+                    f"{result['bytes'] / (1024 * 1024):.1f} MB in {result['seconds']:.2f}s "
+                    f"({result['throughput'] / (1024 * 1024):.1f} MB/s)")
+
+        self.test_results["integrity"] = {
+            "bundles": len(result["bundles"]),
+            "files": result["checked"],
+            "bytes": result["bytes"],
+            "seconds": result["seconds"],
+            "throughput": result["throughput"],
+            "ok": result["ok"]
+        }
+        return result["ok"]
+
     def test_mdz_extraction(self):
         """Test MDZ bundle extraction"""
         logger.info("Testing MDZ bundle extraction...")
@@ -1053,6 +1088,11 @@ This document tests all the features of the MDZ format.
             logger.error("Failed to create MDZ bundles")
             return False
 
+        # Verify the bundles
+        if not self.verify_mdz_bundles():
+            logger.error("Failed to verify MDZ bundles")
+            return False
+
         # Test MDZ extraction
         if not self.test_mdz_extraction():
             logger.error("Failed to extract MDZ bundles")
@@ -1112,6 +1152,11 @@ def main():
             logger.error("Failed to create MDZ bundles")
             success = False
 
+        # Verify the bundles
+        if success and not validator.verify_mdz_bundles():
+            logger.error("Failed to verify MDZ bundles")
+            success = False
+
         # Test MDZ extraction
         if success and not validator.test_mdz_extraction():
             logger.error("Failed to extract MDZ bundles")
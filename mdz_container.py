@@ -0,0 +1,1077 @@
+#!/usr/bin/env python3
+"""
+MDZ Indexed Container (format version 2)
+----------------------------------------
+Version 1 bundles are a single Zstandard frame holding a tar archive, so
+reading any file means decompressing the whole bundle. Version 2 bundles
+compress every entry (or group of small entries) as an independent frame
+and end with an index, so readers can decompress just the files they need.
+
+Layout:
+
+    [header][frame 0][frame 1]...[frame N-1][index frame][footer]
+
+The index is a Zstandard-compressed JSON document listing the frames
+(offset, compressed length, decompressed size) and the entries (path,
+frame, offset within the frame, size, SHA-256, media type). The footer is
+24 bytes: the index offset and length as little-endian 64-bit integers,
+followed by the magic bytes b"MDZIDX02". The 16-byte header is the one
+every bundle starts with (see mdz_stream.py); sniff_format() tells all
+bundle kinds apart from it, or for headerless files from their first bytes.
+
+Text entries can be compressed with a shipped dictionary (see
+mdz_dictionary.py). They then share frames only with other text entries,
+and the index records the dictionary ID for the bundle and each frame.
+
+File: mdz_container.py
+"""
+
+import io
+import os
+import mmap
+import contextlib
+import collections
+import json
+import struct
+import hashlib
+import logging
+import mimetypes
+from collections.abc import MutableMapping
+from typing import BinaryIO, Dict, Iterator, List, Optional, Union
+
+# Import Zstandard library
+try:
+    import zstandard as zstd
+except ImportError:
+    raise ImportError("Zstandard library not found. Please install it with 'pip install zstandard'")
+
+from mdz_stream import (MDZStreamWriter, CHUNK_SIZE, AUTO_TIME_BUDGET, HEADER, HEADER_MAGIC, METHOD_STANDARD,
+                        METHOD_SECURE, pack_header, _HashingWriter)
+from mdz_dictionary import get_dictionary
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+INDEX_MAGIC = b"MDZIDX02"
+FOOTER = struct.Struct("<QQ8s")
+
+# Entries below this size share frames of up to GROUP_FRAME_SIZE bytes
+SMALL_ENTRY_SIZE = 64 * 1024
+GROUP_FRAME_SIZE = 1024 * 1024
+
+# Bundles are rewritten instead of appended to when more than this part of them would be unused
+COMPACTION_RATIO = 0.5
+
+# Entries read on every open always get a frame of their own
+SEPARATE_ENTRIES = ("index.md", "metadata.yaml")
+
+# Files decoded to text when loaded, as in version 1 bundles
+TEXT_EXTENSIONS = ('.md', '.txt', '.yaml', '.yml', '.json', '.mmd', '.mermaid')
+
+# Files that are already compressed, stored without recompressing them
+STORED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.heic', '.mp4', '.m4v', '.mov', '.webm',
+                     '.mp3', '.m4a', '.ogg', '.pdf', '.zip', '.gz', '.bz2', '.xz', '.zst', '.7z', '.mdz', '.docx',
+                     '.xlsx', '.pptx', '.epub', '.woff', '.woff2')
+
+# Kinds of frames: compressed, compressed with the text dictionary, or stored as is
+FRAME_ZSTD = "zstd"
+FRAME_TEXT = "text"
+FRAME_STORE = "store"
+
+DIRECTORY_MEDIA_TYPE = "inode/directory"
+
+# Headerless files are told apart by decompressing the start of their first frame
+SNIFF_INPUT_SIZE = 132 * 1024
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ZIP_MAGIC = b"PK\x03\x04"
+TAR_MAGIC_OFFSET = 257
+
+
+def is_indexed_bundle(path: str) -> bool:
+    """
+    Check if a file is a version 2 (indexed) bundle
+
+    Args:
+        path: Path to the .mdz file
+
+    Returns:
+        True if the file ends with the index footer
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < FOOTER.size:
+                return False
+            f.seek(-len(INDEX_MAGIC), os.SEEK_END)
+            return f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+    except OSError:
+        return False
+
+
+class BundleFormat:
+    """Format of a bundle file, as found by sniff_format()"""
+
+    __slots__ = ('version', 'method', 'flags', 'dictionary_id', 'header_size')
+
+    def __init__(self, version: int, method: int, flags: int = 0, dictionary_id: int = 0, header_size: int = 0):
+        self.version = version
+        self.method = method
+        self.flags = flags
+        self.dictionary_id = dictionary_id
+        self.header_size = header_size
+
+    @property
+    def indexed(self) -> bool:
+        return self.version >= 2
+
+    @property
+    def secure(self) -> bool:
+        return self.method == METHOD_SECURE
+
+    def __repr__(self) -> str:
+        return (f"BundleFormat(version={self.version}, method={self.method}, flags={self.flags}, "
+                f"dictionary_id={self.dictionary_id}, header_size={self.header_size})")
+
+
+def sniff_format(path: str) -> BundleFormat:
+    """
+    Detect the format of a bundle without decompressing it
+
+    Files with a header are identified by it. Headerless files are version 2
+    if they end with the index footer; otherwise the start of their single
+    frame is decompressed: a tar archive is a standard bundle and anything
+    else a secure one (a zip that may need its checksum dictionary).
+
+    Args:
+        path: Path to the .mdz file
+
+    Returns:
+        BundleFormat of the file
+
+    Raises:
+        ValueError: If the file is not an MDZ bundle
+    """
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_INPUT_SIZE)
+
+    if head.startswith(HEADER_MAGIC):
+        if len(head) < HEADER.size:
+            raise ValueError(f"Truncated MDZ header: {path}")
+        _, version, method, flags, dictionary_id, _ = HEADER.unpack_from(head)
+        return BundleFormat(version, method, flags, dictionary_id, HEADER.size)
+
+    if is_indexed_bundle(path):
+        return BundleFormat(FORMAT_VERSION, METHOD_STANDARD)
+
+    if not head.startswith(ZSTD_MAGIC):
+        raise ValueError(f"Not an MDZ file: {path}")
+
+    try:
+        start = zstd.ZstdDecompressor().stream_reader(io.BytesIO(head)).read(TAR_MAGIC_OFFSET + 5)
+    except zstd.ZstdError:
+        # Only secure bundles are compressed with a dictionary
+        start = b""
+    if start[TAR_MAGIC_OFFSET:TAR_MAGIC_OFFSET + 5] == b"ustar" or (start and not start.strip(b"\0")):
+        return BundleFormat(1, METHOD_STANDARD)
+    if not start.startswith(ZIP_MAGIC):
+        logger.debug(f"No archive signature in {path}, assuming a secure bundle")
+    return BundleFormat(1, METHOD_SECURE)
+
+
+def decode_entry(path: str, data: bytes) -> Union[str, bytes]:
+    """
+    Decode the content of text files
+
+    Args:
+        path: Path within the bundle
+        data: Raw file content
+
+    Returns:
+        The content as text for text files that are valid UTF-8, else the bytes
+    """
+    if path.endswith(TEXT_EXTENSIONS):
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            # Keep as binary if decoding fails
+            pass
+    return data
+
+
+def guess_media_type(path: str) -> str:
+    """
+    Guess the media type of an entry
+
+    Args:
+        path: Path within the bundle
+
+    Returns:
+        Media type, application/octet-stream when unknown
+    """
+    if path.endswith('/'):
+        return DIRECTORY_MEDIA_TYPE
+    if path.endswith(('.md', '.markdown')):
+        return "text/markdown"
+    if path.endswith(('.yaml', '.yml')):
+        return "application/yaml"
+    if path.endswith(('.mmd', '.mermaid')):
+        return "text/vnd.mermaid"
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+class IndexedMDZWriter(MDZStreamWriter):
+    """
+    Writer for version 2 bundles
+
+    Entries are added as with MDZStreamWriter and streamed frame by frame
+    into the output file when it is written.
+    """
+
+    def __init__(self, compression_level: Union[int, str] = 3, chunk_size: int = CHUNK_SIZE, header: bool = True,
+                 dictionary: Optional[zstd.ZstdCompressionDict] = None, threads: int = -1,
+                 time_budget: float = AUTO_TIME_BUDGET):
+        """
+        Initialize the writer
+
+        Args:
+            compression_level: Zstandard compression level (1-22, default: 3),
+                or "auto" to choose one from the size and the time budget
+            chunk_size: Bytes copied to the compressor at a time
+            header: Start the file with the format header
+            dictionary: Dictionary to compress text entries with
+                (see mdz_dictionary.default_dictionary())
+            threads: Compression threads for large frames, -1 for one per
+                core and 0 to compress in the calling thread only
+            time_budget: Seconds the "auto" level aims to compress within
+        """
+        super().__init__(compression_level, chunk_size=chunk_size, header=header, threads=threads,
+                         time_budget=time_budget)
+        self.dictionary = dictionary
+        self.reused = {}
+
+    def _frame_kind(self, entry) -> str:
+        """Get the kind of frame an entry is written to"""
+        if entry.name.lower().endswith(STORED_EXTENSIONS):
+            return FRAME_STORE
+        if self.dictionary is not None and entry.name.endswith(TEXT_EXTENSIONS):
+            return FRAME_TEXT
+        return FRAME_ZSTD
+
+    def _plan_frames(self, entries: List) -> List[List]:
+        """Group entries into frames"""
+        frames = []
+        # Small entries only share frames with entries of the same kind
+        groups = {}
+        group_sizes = {}
+        for entry in entries:
+            if entry.is_dir:
+                continue
+            if entry.size >= SMALL_ENTRY_SIZE or entry.name in SEPARATE_ENTRIES:
+                frames.append([entry])
+                continue
+            kind = self._frame_kind(entry)
+            if kind in groups and group_sizes[kind] + entry.size > GROUP_FRAME_SIZE:
+                frames.append(groups.pop(kind))
+            if kind not in groups:
+                groups[kind], group_sizes[kind] = [], 0
+            groups[kind].append(entry)
+            group_sizes[kind] += entry.size
+        frames.extend(groups.values())
+        return frames
+
+    def add_reused(self, name: str, reader: "IndexedMDZReader") -> None:
+        """
+        Add a file that is unchanged in an existing bundle
+
+        Frames whose files are all reused are copied as they are, without
+        decompressing them; files from other frames are read from the bundle
+        and compressed again.
+
+        Args:
+            name: Path within both bundles
+            reader: Reader of the existing bundle
+        """
+        entry = reader.get_entry(name)
+        self.add_stream(name, lambda: reader.open(name), entry["size"])
+        self.reused[name] = reader
+
+    def _close_sources(self) -> None:
+        """Unmap the bundles files were reused from"""
+        for reader in set(self.reused.values()):
+            reader.close()
+
+    def _copied_frames(self) -> Dict:
+        """Find the frames of existing bundles whose files are all reused"""
+        groups = {}
+        for entry in self.entries:
+            reader = self.reused.get(entry.name)
+            if reader is not None:
+                groups.setdefault((reader, reader.get_entry(entry.name)["frame"]), []).append(entry)
+        return {key: group for key, group in groups.items() if len(group) == key[0].frame_entry_count(key[1])}
+
+    def needs_compaction(self, reader: "IndexedMDZReader") -> bool:
+        """
+        Check if appending to a bundle would leave it mostly unused bytes
+
+        Args:
+            reader: Reader of the bundle the files are reused from
+
+        Returns:
+            True if the bundle should be rewritten rather than appended to
+        """
+        live = {reader.get_entry(name)["frame"] for name, source in self.reused.items() if source is reader}
+        dead = reader.index_length + sum(frame["length"] for number, frame in enumerate(reader.frames)
+                                         if number not in live)
+        return dead > reader.end * COMPACTION_RATIO
+
+    def write_to(self, fileobj: BinaryIO) -> Dict[str, str]:
+        """
+        Write the bundle to a binary file object
+
+        Args:
+            fileobj: Writable binary file object
+
+        Returns:
+            Dictionary mapping file paths in the bundle to their SHA-256
+        """
+        dictionary_id = self.dictionary.dict_id() if self.dictionary is not None else 0
+        sink = _HashingWriter(fileobj)
+        if self.header:
+            sink.write(pack_header(FORMAT_VERSION, METHOD_STANDARD, dictionary_id=dictionary_id))
+
+        frames = []
+        records = {}
+        self.digests = {}
+
+        # Frames of reused files are copied byte for byte
+        copied = self._copied_frames()
+        for (reader, number), group in copied.items():
+            start = sink.size
+            view = reader._frame_view(number)
+            for position in range(0, len(view), self.chunk_size):
+                sink.write(view[position:position + self.chunk_size])
+            for entry in group:
+                records[entry.name] = dict(reader.get_entry(entry.name), frame=len(frames))
+                self.digests[entry.name] = records[entry.name]["sha256"]
+            frames.append(dict(reader.frames[number], offset=start))
+
+        copied_names = {entry.name for group in copied.values() for entry in group}
+        copied_size = sum(self._compressed_size(reader, [number]) for reader, number in copied)
+        self._write_frames(sink, [entry for entry in self.entries if entry.name not in copied_names], frames, records,
+                           0, copied_size)
+        self._write_index(sink, frames, records)
+        return self.digests
+
+    def append(self, path: str, reader: "IndexedMDZReader") -> Dict[str, str]:
+        """
+        Save over an existing bundle by appending to it
+
+        Reused files keep their frames where they are. Only the other files
+        and a new index are written, after the end of the file; the frames
+        and index they replace stay behind as unused bytes until the bundle
+        is compacted by writing it anew (see needs_compaction()).
+
+        Args:
+            path: Path of the bundle
+            reader: Reader of the bundle, the source of the reused files
+
+        Returns:
+            Dictionary mapping file paths in the bundle to their SHA-256
+        """
+        reader.close()
+        with open(path, 'r+b') as f:
+            # Bytes of an interrupted save after the last footer are overwritten
+            base = reader.end
+            f.truncate(base)
+            f.seek(base)
+            try:
+                sink = _HashingWriter(f)
+                frames = list(reader.frames)
+                records = {}
+                self.digests = {}
+                for entry in self.entries:
+                    if self.reused.get(entry.name) is reader:
+                        records[entry.name] = reader.get_entry(entry.name)
+                        self.digests[entry.name] = records[entry.name]["sha256"]
+                live = {record["frame"] for record in records.values()}
+                self._write_frames(sink, [entry for entry in self.entries if entry.name not in records], frames,
+                                   records, base, self._compressed_size(reader, live))
+                self._write_index(sink, frames, records, base)
+                f.flush()
+                os.fsync(f.fileno())
+            except Exception:
+                # Leave the bundle as it was
+                f.truncate(base)
+                raise
+
+        logger.debug(f"Appended {len(self.entries) - len(records)} entries to {path}")
+        return self.digests
+
+    @staticmethod
+    def _compressed_size(reader: "IndexedMDZReader", numbers) -> int:
+        """Get the decompressed size of the frames of a bundle that are not stored as is"""
+        return sum(reader.frames[number]["size"] for number in numbers if not reader.is_stored(number))
+
+    def _write_frames(self, sink: _HashingWriter, entries: List, frames: List[Dict], records: Dict[str, Dict],
+                      base: int = 0, reused_size: int = 0) -> None:
+        """
+        Compress entries into new frames
+
+        Args:
+            sink: Output, positioned at the end of the frames written so far
+            entries: Entries to write
+            frames: Frame records, the new ones are appended
+            records: Index records of entries, the new ones are added
+            base: Offset in the file at which the sink started
+            reused_size: Compressed bytes of the bundle kept in existing frames,
+                so the settings are chosen for the whole bundle and not only the
+                bytes written now
+        """
+        dictionary_id = self.dictionary.dict_id() if self.dictionary is not None else 0
+        planned = self._plan_frames(entries)
+        kinds = [self._frame_kind(group[0]) for group in planned]
+        self._choose_settings(reused_size + sum(entry.size for group, kind in zip(planned, kinds)
+                                                if kind != FRAME_STORE for entry in group))
+        compressors = {}
+
+        for group, kind in zip(planned, kinds):
+            number = len(frames)
+            start = base + sink.size
+            frame_size = sum(entry.size for entry in group)
+            threads = self._thread_count(frame_size) if kind != FRAME_STORE else 0
+            if kind == FRAME_STORE:
+                # Already compressed files are copied as they are
+                target = contextlib.nullcontext(sink)
+            else:
+                key = (kind, threads)
+                if key not in compressors:
+                    compressors[key] = self._compressor(frame_size, self.dictionary if kind == FRAME_TEXT else None)
+                # Every frame records its size, so it can be decompressed in one call
+                target = compressors[key].stream_writer(sink, size=frame_size, write_size=self.chunk_size, closefd=False)
+            offset = 0
+            with target as writer:
+                for entry in group:
+                    sha256 = hashlib.sha256()
+                    with entry.open() as source:
+                        for chunk in iter(lambda: source.read(self.chunk_size), b''):
+                            sha256.update(chunk)
+                            writer.write(chunk)
+                    self.digests[entry.name] = sha256.hexdigest()
+                    records[entry.name] = {
+                        "path": entry.name,
+                        "frame": number,
+                        "offset": offset,
+                        "size": entry.size,
+                        "sha256": self.digests[entry.name],
+                        "media_type": guess_media_type(entry.name)
+                    }
+                    offset += entry.size
+            frame = {"offset": start, "length": base + sink.size - start, "size": frame_size}
+            if kind == FRAME_STORE:
+                frame["method"] = FRAME_STORE
+            if kind == FRAME_TEXT:
+                frame["dictionary"] = dictionary_id
+            if threads:
+                frame["threads"] = threads
+            frames.append(frame)
+
+    def _write_index(self, sink: _HashingWriter, frames: List[Dict], records: Dict[str, Dict], base: int = 0) -> None:
+        """
+        Write the index and the footer
+
+        Args:
+            sink: Output, positioned after the last frame
+            frames: Frame records
+            records: Index records of the files
+            base: Offset in the file at which the sink started
+        """
+        dictionary_id = self.dictionary.dict_id() if self.dictionary is not None else 0
+
+        # The index lists entries in the order they were added, directories included
+        entries = []
+        for entry in self.entries:
+            if entry.is_dir:
+                entries.append({"path": entry.name, "frame": None, "offset": 0, "size": 0,
+                                "sha256": None, "media_type": DIRECTORY_MEDIA_TYPE})
+            else:
+                entries.append(records[entry.name])
+
+        # The index itself never uses the dictionary, so any reader can list the bundle
+        index = json.dumps({"version": FORMAT_VERSION, "dictionary": dictionary_id or None,
+                            "compression": self.settings, "frames": frames, "entries": entries},
+                           separators=(',', ':')).encode('utf-8')
+        index_offset = base + sink.size
+        sink.write(zstd.ZstdCompressor(level=self.compression_level).compress(index))
+        sink.write(FOOTER.pack(index_offset, base + sink.size - index_offset, INDEX_MAGIC))
+
+
+class IndexedMDZReader:
+    """
+    Random access reader for version 2 bundles
+
+    The file is memory-mapped. Only the footer and the index are read when
+    the reader is created; entries are decompressed frame by frame when
+    they are read, straight from the mapped pages.
+
+    A save that appends to the bundle and is interrupted leaves bytes after
+    the last complete footer. The reader then falls back to the last footer
+    whose index is intact, which describes the bundle as it was before.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open a bundle
+
+        Args:
+            path: Path to the .mdz file
+
+        Raises:
+            ValueError: If the file is not a version 2 bundle
+        """
+        self.path = path
+        self._map = None
+
+        mapped = self._mapping()
+        file_size = len(mapped)
+        found = self._find_index(mapped, file_size)
+        if found is None:
+            self.close()
+            raise ValueError(f"Not an indexed MDZ bundle: {path}")
+        index, index_length, self.end = found
+        if self.end < file_size:
+            logger.warning(f"Ignoring {file_size - self.end} bytes of an interrupted save at the end of {path}")
+
+        if index.get("version") != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported MDZ format version: {index.get('version')}")
+
+        self.index_length = index_length
+        self.frames = index["frames"]
+        self.entries = {entry["path"]: entry for entry in index["entries"]}
+        self._frame_entry_counts = None
+        self.dictionary_id = index.get("dictionary")
+        self.compression = index.get("compression", {})
+        self._decompressors = {}
+
+        # The last small frame read is kept, for entries that share it and repeated reads
+        self._cached_frame = (None, None)
+
+        logger.debug(f"Opened indexed MDZ bundle {path} ({len(self.entries)} entries, {len(self.frames)} frames)")
+
+    @staticmethod
+    def _find_index(mapped: mmap.mmap, file_size: int) -> Optional[tuple]:
+        """
+        Find the last footer whose index is intact
+
+        Args:
+            mapped: Mapped file
+            file_size: Size of the file
+
+        Returns:
+            Tuple of (index, index length, end of the footer), or None
+        """
+        end = file_size
+        while True:
+            position = mapped.rfind(INDEX_MAGIC, 0, end)
+            if position < 0:
+                return None
+            footer_end = position + len(INDEX_MAGIC)
+            footer_start = footer_end - FOOTER.size
+            end = footer_end - 1
+            if footer_start < 0:
+                continue
+            index_offset, index_length, _ = FOOTER.unpack_from(mapped, footer_start)
+            # The index frame always ends where its footer starts
+            if index_offset + index_length != footer_start:
+                continue
+            try:
+                index = json.loads(zstd.ZstdDecompressor().decompress(mapped[index_offset:footer_start]))
+            except (zstd.ZstdError, ValueError):
+                continue
+            if isinstance(index, dict) and "frames" in index and "entries" in index:
+                return index, index_length, footer_end
+
+    def _mapping(self) -> mmap.mmap:
+        """Get the memory map of the file, mapping it again after close()"""
+        if self._map is None:
+            with open(self.path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    raise ValueError(f"Not an indexed MDZ bundle: {self.path}")
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _frame_view(self, number: int) -> memoryview:
+        """Get the compressed bytes of a frame without copying them"""
+        frame = self.frames[number]
+        return memoryview(self._mapping())[frame["offset"]:frame["offset"] + frame["length"]]
+
+    def close(self) -> None:
+        """
+        Unmap the file
+
+        The reader maps the file again when it is used after closing, so the
+        file can be replaced while nothing is being read from it.
+        """
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Entry files that are still open keep the mapping alive
+                pass
+            self._map = None
+        self._cached_frame = (None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def names(self) -> List[str]:
+        """
+        Get the paths of all entries
+
+        Returns:
+            List of paths in bundle order
+        """
+        return list(self.entries)
+
+    def frame_entry_count(self, number: int) -> int:
+        """
+        Count the files in a frame
+
+        Args:
+            number: Frame number
+
+        Returns:
+            Number of files the index places in the frame
+        """
+        if self._frame_entry_counts is None:
+            self._frame_entry_counts = collections.Counter(entry["frame"] for entry in self.entries.values())
+        return self._frame_entry_counts[number]
+
+    def get_entry(self, path: str) -> Optional[Dict]:
+        """
+        Get the index record of an entry
+
+        Args:
+            path: Path within the bundle
+
+        Returns:
+            Dictionary with frame, offset, size, sha256 and media_type, or None
+        """
+        return self.entries.get(path)
+
+    def read_frame(self, number: int) -> bytes:
+        """
+        Decompress a frame
+
+        Args:
+            number: Frame number
+
+        Returns:
+            Decompressed frame content
+        """
+        cached_number, cached_data = self._cached_frame
+        if cached_number == number:
+            return cached_data
+
+        data = self._decompress_frame(number)
+        if len(data) <= GROUP_FRAME_SIZE:
+            self._cached_frame = (number, data)
+        return data
+
+    def _decompress_frame(self, number: int) -> bytes:
+        """Decompress a frame from the mapped file"""
+        if self.is_stored(number):
+            return bytes(self._frame_view(number))
+        return self.decompressor(number).decompress(self._frame_view(number))
+
+    def is_stored(self, number: int) -> bool:
+        """
+        Check if a frame holds its entries as they are, without compression
+
+        Args:
+            number: Frame number
+
+        Returns:
+            True for frames of already compressed files
+        """
+        return self.frames[number].get("method") == FRAME_STORE
+
+    def decompressor(self, number: int) -> zstd.ZstdDecompressor:
+        """
+        Get a decompressor for a frame, with the dictionary it was compressed with
+
+        Args:
+            number: Frame number
+
+        Returns:
+            Zstandard decompressor
+
+        Raises:
+            ValueError: If the frame uses a dictionary this version does not ship
+        """
+        dictionary_id = self.frames[number].get("dictionary")
+        if dictionary_id not in self._decompressors:
+            dict_data = get_dictionary(dictionary_id) if dictionary_id else None
+            self._decompressors[dictionary_id] = zstd.ZstdDecompressor(dict_data=dict_data)
+        return self._decompressors[dictionary_id]
+
+    def frame_digests(self, number: int, paths: Optional[List[str]] = None) -> Dict[str, str]:
+        """
+        Hash the files of a frame as it is decompressed
+
+        The frame is streamed in chunks with a decompressor of its own, so
+        several threads can hash frames of the same reader at once and large
+        files are never held in memory. Decompression stops after the last
+        file to hash.
+
+        Args:
+            number: Frame number
+            paths: Files of the frame to hash (default: all of them)
+
+        Returns:
+            Dictionary mapping the paths of the hashed files to their SHA-256
+
+        Raises:
+            zstd.ZstdError: If the frame is corrupted
+        """
+        if paths is None:
+            paths = [path for path, entry in self.entries.items() if entry["frame"] == number]
+        ranges = [(self.entries[path]["offset"], self.entries[path]["offset"] + self.entries[path]["size"],
+                   path, hashlib.sha256()) for path in paths]
+        last = max((stop for _, stop, _, _ in ranges), default=0)
+        view = self._frame_view(number)
+        if self.is_stored(number):
+            chunks = (view[start:start + CHUNK_SIZE] for start in range(0, len(view), CHUNK_SIZE))
+        else:
+            dictionary_id = self.frames[number].get("dictionary")
+            decompressor = zstd.ZstdDecompressor(dict_data=get_dictionary(dictionary_id) if dictionary_id else None)
+            stream = decompressor.stream_reader(view, read_size=CHUNK_SIZE)
+            chunks = iter(lambda: stream.read(CHUNK_SIZE), b'')
+
+        position = 0
+        for chunk in chunks:
+            if position >= last:
+                break
+            end = position + len(chunk)
+            for start, stop, _, sha256 in ranges:
+                if start < end and stop > position:
+                    sha256.update(chunk[max(start - position, 0):min(stop, end) - position])
+            position = end
+        return {path: sha256.hexdigest() for _, _, path, sha256 in ranges}
+
+    def read(self, path: str) -> bytes:
+        """
+        Read an entry
+
+        Args:
+            path: Path within the bundle
+
+        Returns:
+            The entry content
+
+        Raises:
+            KeyError: If the bundle has no such file
+        """
+        entry = self.entries.get(path)
+        if entry is None or entry["frame"] is None:
+            raise KeyError(path)
+
+        data = self.read_frame(entry["frame"])
+        if len(data) == entry["size"]:
+            return data
+        return data[entry["offset"]:entry["offset"] + entry["size"]]
+
+    def open(self, path: str) -> "MDZEntryFile":
+        """
+        Open an entry as a read-only binary file
+
+        Args:
+            path: Path within the bundle
+
+        Returns:
+            File object that decompresses the entry as it is read
+
+        Raises:
+            KeyError: If the bundle has no such file
+        """
+        entry = self.entries.get(path)
+        if entry is None or entry["frame"] is None:
+            raise KeyError(path)
+        return MDZEntryFile(self, entry)
+
+
+class MDZEntryFile(io.RawIOBase):
+    """
+    Read-only, seekable file object over one entry of an indexed bundle
+
+    Entries in small frames are copied out of the decompressed frame, which
+    the reader keeps. Entries with a frame of their own are decompressed as
+    a stream from the mapped file, so reading a large asset never holds
+    more than a chunk of it in memory. Stored entries are copied straight
+    from the mapped file.
+    """
+
+    def __init__(self, reader: IndexedMDZReader, entry: Dict):
+        """
+        Initialize the file
+
+        Args:
+            reader: Reader of the bundle
+            entry: Index record of the entry
+        """
+        super().__init__()
+        self.name = entry["path"]
+        self.size = entry["size"]
+        self._reader = reader
+        self._entry = entry
+        self._position = 0
+        self._stream = None
+        self._stream_position = 0
+        self._stored = reader.is_stored(entry["frame"])
+        self._streamed = not self._stored and reader.frames[entry["frame"]]["size"] > GROUP_FRAME_SIZE
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        count = min(len(buffer), self.size - self._position)
+        if count <= 0:
+            return 0
+
+        if self._stored:
+            start = self._entry["offset"] + self._position
+            buffer[:count] = self._reader._frame_view(self._entry["frame"])[start:start + count]
+        elif not self._streamed:
+            start = self._entry["offset"] + self._position
+            buffer[:count] = memoryview(self._reader.read_frame(self._entry["frame"]))[start:start + count]
+        else:
+            # Streams only go forward, seeking back starts over
+            if self._stream is None or self._stream_position > self._position:
+                self._close_stream()
+                frame = self._entry["frame"]
+                self._stream = self._reader.decompressor(frame).stream_reader(self._reader._frame_view(frame),
+                                                                              read_size=CHUNK_SIZE)
+                self._stream_position = 0
+            while self._stream_position < self._position:
+                skipped = self._stream.read(min(CHUNK_SIZE, self._position - self._stream_position))
+                self._stream_position += len(skipped)
+            count = self._stream.readinto(memoryview(buffer)[:count])
+            self._stream_position += count
+
+        self._position += count
+        return count
+
+    def _close_stream(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def close(self) -> None:
+        self._close_stream()
+        super().close()
+
+
+class LazyContent(MutableMapping):
+    """
+    Bundle content mapping backed by an indexed bundle
+
+    Behaves like the content dictionary of a loaded bundle: directories map
+    to empty dicts, text files to str and other files to bytes. Files are
+    only decompressed when they are accessed, and assigned values are kept
+    in memory until the bundle is saved.
+    """
+
+    def __init__(self, reader: IndexedMDZReader):
+        """
+        Initialize the mapping
+
+        Args:
+            reader: Reader of the bundle
+        """
+        self.reader = reader
+        self._changes = {}
+        self._deleted = set()
+
+    def __getitem__(self, path: str) -> Union[str, bytes, dict]:
+        if path in self._changes:
+            return self._changes[path]
+        if path in self._deleted:
+            raise KeyError(path)
+        entry = self.reader.get_entry(path)
+        if entry is None:
+            raise KeyError(path)
+        if entry["frame"] is None:
+            return {}
+        return decode_entry(path, self.reader.read(path))
+
+    def __setitem__(self, path: str, value: Union[str, bytes, dict]) -> None:
+        self._changes[path] = value
+        self._deleted.discard(path)
+
+    def __delitem__(self, path: str) -> None:
+        if path in self._changes:
+            del self._changes[path]
+        elif path not in self.reader.entries or path in self._deleted:
+            raise KeyError(path)
+        if path in self.reader.entries:
+            self._deleted.add(path)
+
+    def __iter__(self) -> Iterator[str]:
+        for path in self.reader.entries:
+            if path not in self._deleted and path not in self._changes:
+                yield path
+        yield from self._changes
+
+    def __len__(self) -> int:
+        stored = sum(1 for path in self.reader.entries if path not in self._deleted and path not in self._changes)
+        return stored + len(self._changes)
+
+    def __contains__(self, path) -> bool:
+        if path in self._changes:
+            return True
+        return path in self.reader.entries and path not in self._deleted
+
+    def open(self, path: str) -> BinaryIO:
+        """
+        Open a file as a read-only binary file object
+
+        Files that have not been changed are decompressed as they are read.
+
+        Args:
+            path: Path within the bundle
+
+        Returns:
+            Binary file object
+
+        Raises:
+            KeyError: If the bundle has no such file
+        """
+        if path in self._changes:
+            content = self._changes[path]
+            if isinstance(content, dict):
+                raise KeyError(path)
+            return io.BytesIO(content.encode('utf-8') if isinstance(content, str) else content)
+        if path in self._deleted:
+            raise KeyError(path)
+        return self.reader.open(path)
+
+    def is_unchanged(self, path: str) -> bool:
+        """
+        Check if an entry still has the content it has in the bundle
+
+        Assigned files count as unchanged when their content hashes to the
+        digest recorded in the index.
+
+        Args:
+            path: Path within the bundle
+
+        Returns:
+            True if the bundle holds the entry with the same content
+        """
+        entry = self.reader.get_entry(path)
+        if entry is None or path in self._deleted:
+            return False
+        if path not in self._changes:
+            return True
+        content = self._changes[path]
+        if isinstance(content, dict) or entry["frame"] is None:
+            return isinstance(content, dict) and entry["frame"] is None
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return len(content) == entry["size"] and hashlib.sha256(content).hexdigest() == entry["sha256"]
+
+    def is_loaded(self, path: str) -> bool:
+        """
+        Check if an entry is held in memory
+
+        Args:
+            path: Path within the bundle
+
+        Returns:
+            True for entries that were assigned since the bundle was loaded
+        """
+        return path in self._changes
+
+    def get_size(self, path: str) -> int:
+        """
+        Get the size of a file without decompressing it
+
+        Args:
+            path: Path within the bundle
+
+        Returns:
+            Size in bytes
+        """
+        if path not in self._changes and path not in self._deleted and path in self.reader.entries:
+            return self.reader.entries[path]["size"]
+        content = self[path]
+        if isinstance(content, str):
+            return len(content.encode('utf-8'))
+        return len(content)
+
+
+def save_indexed(content: Union[Dict, LazyContent], output_path: str, compression_level: Union[int, str] = 3,
+                 dictionary: Optional[zstd.ZstdCompressionDict] = None) -> IndexedMDZReader:
+    """
+    Save bundle content as a version 2 bundle, rewriting only what changed
+
+    Files that are unchanged in the bundle lazy content was loaded from
+    keep their compressed frames. Saving over that bundle appends only the
+    changed files and a new index, unless most of the file would then be
+    unused, in which case it is compacted by writing it anew.
+
+    Args:
+        content: Bundle content, a dictionary or lazy content
+        output_path: Path of the .mdz file
+        compression_level: Zstandard compression level (1-22), or "auto"
+        dictionary: Dictionary to compress text entries with
+
+    Returns:
+        Reader of the saved bundle, to load its content lazily from
+    """
+    source = content.reader if isinstance(content, LazyContent) else None
+    in_place = source is not None and os.path.abspath(source.path) == os.path.abspath(output_path)
+    if in_place:
+        # Appended frames use the dictionary the bundle was written with
+        dictionary = get_dictionary(source.dictionary_id) if source.dictionary_id else None
+
+    writer = IndexedMDZWriter(compression_level, dictionary=dictionary)
+    for path in content:
+        if source is not None and content.is_unchanged(path):
+            if source.get_entry(path)["frame"] is None:
+                writer.add_directory(path)
+            else:
+                writer.add_reused(path, source)
+            continue
+        value = content[path]
+        if isinstance(value, dict):
+            writer.add_directory(path)
+        else:
+            writer.add_bytes(path, value)
+
+    # The source file is unmapped while it may be replaced
+    if source is not None:
+        source.close()
+    if in_place and not writer.needs_compaction(source):
+        writer.append(output_path, source)
+    else:
+        writer.write(output_path)
+    return IndexedMDZReader(output_path)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+MDZ Text Dictionaries
+---------------------
+Bundles hold many small text entries (index.md, metadata.yaml,
+manifest.json, Mermaid sources) that compress poorly on their own at the
+usual levels. This module trains Zstandard dictionaries on a corpus of
+bundles and text files, and loads the versioned dictionaries shipped in
+resources/ so indexed bundles can compress their text entries with one.
+
+Bundles record the ID of the dictionary they were written with; readers
+look it up among the shipped dictionaries, so a dictionary file must
+never change once released. Train a new version instead:
+
+    python mdz_dictionary.py -o resources/mdz_text_v2.dict --dict-id 1296128514 bundles/ docs/
+
+File: mdz_dictionary.py
+"""
+
+import os
+import glob
+import argparse
+import logging
+from typing import Dict, Iterable, List, Optional
+
+# Import Zstandard library
+try:
+    import zstandard as zstd
+except ImportError:
+    raise ImportError("Zstandard library not found. Please install it with 'pip install zstandard'")
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+DICTIONARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+
+# Dictionary used for new bundles
+DEFAULT_DICTIONARY = 'mdz_text_v1.dict'
+
+# Shipped dictionaries, every version that was ever released
+DICTIONARY_PATTERN = 'mdz_text_v*.dict'
+
+# Training settings: dictionary size, and the size large text files are split into
+DICTIONARY_SIZE = 16 * 1024
+SAMPLE_SIZE = 4 * 1024
+
+_dictionaries = None
+
+
+def _load_shipped() -> Dict[int, zstd.ZstdCompressionDict]:
+    """Load the shipped dictionaries once, keyed by dictionary ID"""
+    global _dictionaries
+    if _dictionaries is None:
+        _dictionaries = {}
+        for path in sorted(glob.glob(os.path.join(DICTIONARY_DIR, DICTIONARY_PATTERN))):
+            dictionary = load_dictionary(path)
+            _dictionaries[dictionary.dict_id()] = dictionary
+    return _dictionaries
+
+
+def load_dictionary(path: str) -> zstd.ZstdCompressionDict:
+    """
+    Load a dictionary file
+
+    Args:
+        path: Path of the dictionary
+
+    Returns:
+        The dictionary
+    """
+    with open(path, 'rb') as f:
+        return zstd.ZstdCompressionDict(f.read())
+
+
+def default_dictionary() -> Optional[zstd.ZstdCompressionDict]:
+    """
+    Get the dictionary new bundles compress their text entries with
+
+    Returns:
+        The default dictionary, or None if it is not installed
+    """
+    path = os.path.join(DICTIONARY_DIR, DEFAULT_DICTIONARY)
+    if not os.path.exists(path):
+        logger.warning(f"Default MDZ dictionary not found: {path}")
+        return None
+    dictionary = load_dictionary(path)
+    return _load_shipped().setdefault(dictionary.dict_id(), dictionary)
+
+
+def get_dictionary(dict_id: int) -> zstd.ZstdCompressionDict:
+    """
+    Get a shipped dictionary by its ID
+
+    Args:
+        dict_id: Dictionary ID recorded in a bundle
+
+    Returns:
+        The dictionary
+
+    Raises:
+        ValueError: If no shipped dictionary has this ID
+    """
+    dictionary = _load_shipped().get(dict_id)
+    if dictionary is None:
+        raise ValueError(f"Unknown MDZ dictionary {dict_id}, the bundle was written by a newer version")
+    return dictionary
+
+
+def _split_sample(data: bytes) -> List[bytes]:
+    """Split a large text file at line ends into samples of about SAMPLE_SIZE bytes"""
+    samples = []
+    while len(data) > SAMPLE_SIZE:
+        end = data.rfind(b'\n', 0, SAMPLE_SIZE) + 1 or SAMPLE_SIZE
+        samples.append(data[:end])
+        data = data[end:]
+    if data:
+        samples.append(data)
+    return samples
+
+
+def collect_samples(paths: Iterable[str]) -> List[bytes]:
+    """
+    Collect training samples
+
+    Bundles contribute their text entries, text files their content, and
+    directories everything of either kind below them.
+
+    Args:
+        paths: Bundles, text files and directories
+
+    Returns:
+        List of samples
+    """
+    from mdz_container import TEXT_EXTENSIONS
+    from unified_mdz import UnifiedMDZ
+
+    samples = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = []
+            for root, dirs, names in os.walk(path):
+                dirs[:] = [name for name in dirs if not name.startswith('.') and name != 'node_modules']
+                files.extend(os.path.join(root, name) for name in sorted(names))
+            samples.extend(collect_samples(name for name in files if name.endswith(TEXT_EXTENSIONS + ('.mdz',))))
+        elif path.endswith('.mdz'):
+            bundle = UnifiedMDZ()
+            try:
+                bundle.load(path)
+            except ValueError as e:
+                logger.warning(f"Skipping {path}: {str(e)}")
+                continue
+            for name in bundle.get_file_list():
+                content = bundle.content[name]
+                if name.endswith(TEXT_EXTENSIONS) and content:
+                    samples.extend(_split_sample(content.encode('utf-8') if isinstance(content, str) else content))
+            bundle.cleanup()
+        elif path.endswith(TEXT_EXTENSIONS):
+            with open(path, 'rb') as f:
+                samples.extend(_split_sample(f.read()))
+    return samples
+
+
+def train_dictionary(samples: List[bytes], dict_id: int, size: int = DICTIONARY_SIZE,
+                     level: int = 3) -> zstd.ZstdCompressionDict:
+    """
+    Train a dictionary
+
+    Args:
+        samples: Training samples
+        dict_id: ID recorded in the dictionary and in bundles that use it
+        size: Dictionary size in bytes
+        level: Compression level the dictionary is tuned for
+
+    Returns:
+        The trained dictionary
+    """
+    return zstd.train_dictionary(size, samples, dict_id=dict_id, level=level)
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Train a Zstandard dictionary for MDZ text entries')
+    parser.add_argument('paths', nargs='+', help='Bundles, text files or directories to train on')
+    parser.add_argument('-o', '--output', required=True, help='Dictionary file to write')
+    parser.add_argument('--dict-id', type=int, required=True, help='Dictionary ID, unique per released dictionary')
+    parser.add_argument('--size', type=int, default=DICTIONARY_SIZE, help=f'Dictionary size in bytes (default: {DICTIONARY_SIZE})')
+    parser.add_argument('--level', type=int, default=3, help='Compression level to tune for (default: 3)')
+    args = parser.parse_args()
+
+    samples = collect_samples(args.paths)
+    if not samples:
+        parser.error("No training samples found")
+
+    dictionary = train_dictionary(samples, args.dict_id, args.size, args.level)
+    with open(args.output, 'wb') as f:
+        f.write(dictionary.as_bytes())
+    print(f"Trained dictionary {dictionary.dict_id()} ({len(dictionary)} bytes) "
+          f"on {len(samples)} samples ({sum(len(sample) for sample in samples) / 1024:.0f} KB): {args.output}")
+
+
+if __name__ == '__main__':
+    main()
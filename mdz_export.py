@@ -11,7 +11,10 @@ import shutil
 import logging
 import zstandard as zstd
 import yaml
-from typing import Dict, Any, List, Optional, Tuple
+from mdz_stream import MDZStreamWriter, MDZContainer, DIGEST_MANIFEST
+from mdz_container import sniff_format
+from mdz_assets import AssetStore, hash_bytes, hash_file, blob_path, normalize_asset_name
+from typing import Dict, Any, List, Optional, Tuple, Union
 from PyQt6.QtWidgets import QMessageBox, QApplication
 
 # Get the logger
@@ -20,11 +23,20 @@ logger = logging.getLogger(__name__)
 class MDZExporter:
     """Class for handling MDZ export operations"""
 
-    def __init__(self):
-        """Initialize the MDZ exporter"""
-        self.temp_dir = None
+    def __init__(self, asset_store: Optional[AssetStore] = None):
+        """
+        Initialize the MDZ exporter
+
+        Args:
+            asset_store: Shared store for assets marked as shared, which are
+                then referenced by hash instead of embedded
+        """
+        self.writer = None
         self.files = []
         self.metadata = {}
+        self.asset_store = asset_store
+        self.assets = {}
+        self.blobs = {}
 
     def export_to_mdz(self, markdown_text: str, output_file: str,
                       document_settings: Dict[str, Any],
@@ -42,17 +54,16 @@ class MDZExporter:
             bool: True if export was successful, False otherwise
         """
         try:
-            # Create a temporary directory for the bundle contents
-            self.temp_dir = tempfile.mkdtemp(prefix="mdz_export_")
-            logger.debug(f"Created temporary directory: {self.temp_dir}")
+            # Collect the bundle contents in a streaming writer
+            self.writer = MDZStreamWriter(3, MDZContainer.ZIP, checksum_dictionary=True, digest_manifest=True)
 
-            # Reset the file list
+            # Reset the file list and the assets
             self.files = []
+            self.assets = {}
+            self.blobs = {}
 
             # Create the main markdown file
-            main_file_path = os.path.join(self.temp_dir, "main.md")
-            with open(main_file_path, "w", encoding="utf-8") as f:
-                f.write(markdown_text)
+            self.writer.add_bytes("main.md", markdown_text)
             self.files.append({"path": "main.md", "type": "markdown"})
 
             # Create the metadata file
@@ -67,9 +78,7 @@ class MDZExporter:
             self.metadata["created"] = datetime.datetime.now().isoformat()
 
             # Write metadata to YAML file
-            metadata_path = os.path.join(self.temp_dir, "metadata.yaml")
-            with open(metadata_path, "w", encoding="utf-8") as f:
-                yaml.dump(self.metadata, f, default_flow_style=False)
+            self.writer.add_bytes("metadata.yaml", yaml.dump(self.metadata, default_flow_style=False))
             self.files.append({"path": "metadata.yaml", "type": "metadata"})
 
             # Process and include assets if provided
@@ -77,14 +86,13 @@ class MDZExporter:
                 for asset in assets:
                     self._add_asset(asset)
 
-            # Create the manifest file
+            # Create the manifest file, with the hash of every asset the document refers to
             manifest = {
                 "files": self.files,
-                "main": "main.md"
+                "main": "main.md",
+                "assets": self.assets
             }
-            manifest_path = os.path.join(self.temp_dir, "manifest.json")
-            with open(manifest_path, "w", encoding="utf-8") as f:
-                json.dump(manifest, f, indent=2)
+            self.writer.add_bytes("manifest.json", json.dumps(manifest, indent=2))
 
             # Create the MDZ bundle
             self._create_mdz_bundle(output_file)
@@ -103,43 +111,72 @@ class MDZExporter:
         """
         Add an asset to the bundle
 
+        Assets are stored once per content, under their SHA-256, and the
+        manifest maps the name the document refers to onto the hash.
+
         Args:
-            asset: Asset information dictionary with 'path', 'data', and 'type'
+            asset: Asset information dictionary with 'path', 'data', and 'type'.
+                Without 'data' the file at 'path' is streamed into the bundle.
+                'name' is the path the document refers to the asset by
+                (default: 'path'), and shared assets ('shared': True) are
+                put in the asset store instead of the bundle, if there is one.
         """
         try:
             # Get asset information
             asset_path = asset.get("path", "")
-            asset_data = asset.get("data", b"")
+            asset_data = asset.get("data")
             asset_type = asset.get("type", "binary")
 
             if not asset_path:
                 logger.warning("Asset path is empty, skipping")
                 return
 
-            # Create the assets directory if it doesn't exist
-            assets_dir = os.path.join(self.temp_dir, "assets")
-            os.makedirs(assets_dir, exist_ok=True)
-
-            # Determine the target path
-            target_path = os.path.join(assets_dir, os.path.basename(asset_path))
-
-            # Write the asset
-            if asset_type == "text":
-                with open(target_path, "w", encoding="utf-8") as f:
-                    f.write(asset_data)
-            else:
-                with open(target_path, "wb") as f:
-                    f.write(asset_data)
+            name = normalize_asset_name(asset.get("name", asset_path))
+            if asset.get("shared") and self.asset_store is not None:
+                # Shared assets are referenced by hash, the bundle holds no copy
+                if asset_data is None:
+                    sha256 = self.asset_store.add_file(asset_path)
+                else:
+                    sha256 = self.asset_store.add_bytes(asset_data)
+                self._map_asset(name, {"sha256": sha256, "store": True})
+                return
 
-            # Add to the file list
-            self.files.append({
-                "path": f"assets/{os.path.basename(asset_path)}",
-                "type": asset_type
-            })
+            sha256 = hash_file(asset_path) if asset_data is None else hash_bytes(asset_data)
+            if sha256 not in self.blobs:
+                # Add the asset, text is encoded as UTF-8
+                target_path = blob_path(sha256, asset_path)
+                if asset_data is None:
+                    self.writer.add_path(target_path, asset_path)
+                else:
+                    self.writer.add_bytes(target_path, asset_data)
+                self.blobs[sha256] = target_path
+
+                # Add to the file list
+                self.files.append({
+                    "path": target_path,
+                    "type": asset_type,
+                    "sha256": sha256
+                })
+
+            self._map_asset(name, {"sha256": sha256, "path": self.blobs[sha256]})
 
         except Exception as e:
             logger.error(f"Error adding asset {asset.get('path', 'unknown')}: {str(e)}")
 
+    def _map_asset(self, name: str, record: Dict[str, Any]) -> None:
+        """
+        Record the asset a name refers to in the manifest
+
+        Args:
+            name: Path the document refers to the asset by
+            record: Hash of the asset, with its path in the bundle or a
+                reference to the asset store
+        """
+        previous = self.assets.get(name)
+        if previous is not None and previous["sha256"] != record["sha256"]:
+            logger.warning(f"Asset {name} was added twice with different content, keeping the last one")
+        self.assets[name] = record
+
     def _create_mdz_bundle(self, output_file: str) -> None:
         """
         Create the MDZ bundle file using Zstandard compression
@@ -148,34 +185,9 @@ class MDZExporter:
             output_file: Path to save the MDZ file
         """
         try:
-            # Create a temporary file for the bundle
-            temp_bundle = tempfile.NamedTemporaryFile(delete=False, suffix=".mdz.tmp")
-            temp_bundle.close()
-
-            # Create a zip archive of the temp directory
-            import zipfile
-            with zipfile.ZipFile(temp_bundle.name, "w") as zipf:
-                for root, _, files in os.walk(self.temp_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, self.temp_dir)
-                        zipf.write(file_path, arcname)
-
-            # Calculate the checksum of the zip file to use as the password
-            with open(temp_bundle.name, "rb") as f:
-                file_data = f.read()
-                checksum = hashlib.sha256(file_data).hexdigest()
-
-            # Compress the zip file with Zstandard using the checksum as the password
-            compressor = zstd.ZstdCompressor(level=3, dict_data=zstd.ZstdCompressionDict(checksum.encode()))
-            compressed_data = compressor.compress(file_data)
-
-            # Write the compressed data to the output file
-            with open(output_file, "wb") as f:
-                f.write(compressed_data)
-
-            # Clean up the temporary bundle file
-            os.unlink(temp_bundle.name)
+            # Stream the entries through zip into the output file, the checksum of
+            # the zip archive is used as the password
+            self.writer.write(output_file)
 
             logger.info(f"Created MDZ bundle: {output_file}")
 
@@ -184,18 +196,12 @@ class MDZExporter:
             raise
 
     def _cleanup(self) -> None:
-        """Clean up temporary files"""
-        if self.temp_dir and os.path.exists(self.temp_dir):
-            try:
-                shutil.rmtree(self.temp_dir)
-                logger.debug(f"Cleaned up temporary directory: {self.temp_dir}")
-            except Exception as e:
-                logger.error(f"Error cleaning up temporary directory: {str(e)}")
-            finally:
-                self.temp_dir = None
-
-
-def create_mdz_file(markdown_path: str, output_file: str, assets: List[str] = None) -> bool:
+        """Release the collected bundle contents"""
+        self.writer = None
+
+
+def create_mdz_file(markdown_path: str, output_file: str, assets: List[str] = None,
+                    shared_assets: List[str] = None, asset_store: Union[str, AssetStore, None] = None) -> bool:
     """
     Create an MDZ file from a markdown file
 
@@ -203,6 +209,9 @@ def create_mdz_file(markdown_path: str, output_file: str, assets: List[str] = No
         markdown_path: Path to the markdown file
         output_file: Path to save the MDZ file
         assets: List of asset file paths to include
+        shared_assets: List of asset file paths kept in the asset store and
+            only referenced by the bundle, such as logos used by many documents
+        asset_store: Shared asset store, or the path of its directory
 
     Returns:
         bool: True if creation was successful, False otherwise
@@ -243,30 +252,35 @@ def create_mdz_file(markdown_path: str, output_file: str, assets: List[str] = No
             }
         }
 
-        # Process assets
+        # Process assets, named by their path relative to the document
         asset_list = []
-        if assets:
-            for asset_path in assets:
-                if os.path.exists(asset_path):
-                    # Determine asset type
-                    asset_type = "binary"
-                    if asset_path.lower().endswith((".txt", ".md", ".json", ".yaml", ".yml", ".css", ".js", ".html", ".xml", ".svg")):
-                        asset_type = "text"
-                        with open(asset_path, "r", encoding="utf-8") as f:
-                            asset_data = f.read()
-                    else:
-                        with open(asset_path, "rb") as f:
-                            asset_data = f.read()
-
-                    # Add to asset list
-                    asset_list.append({
-                        "path": asset_path,
-                        "data": asset_data,
-                        "type": asset_type
-                    })
+        markdown_dir = os.path.dirname(os.path.abspath(markdown_path))
+        shared = set(shared_assets or [])
+        for asset_path in list(assets or []) + [path for path in shared if path not in (assets or [])]:
+            if os.path.exists(asset_path):
+                # Determine asset type
+                asset_type = "binary"
+                if asset_path.lower().endswith((".txt", ".md", ".json", ".yaml", ".yml", ".css", ".js", ".html", ".xml", ".svg")):
+                    asset_type = "text"
+
+                try:
+                    name = os.path.relpath(os.path.abspath(asset_path), markdown_dir)
+                except ValueError:
+                    # On another drive than the document
+                    name = os.path.basename(asset_path)
+
+                # Add to asset list, the file is read while the bundle is written
+                asset_list.append({
+                    "path": asset_path,
+                    "name": name,
+                    "type": asset_type,
+                    "shared": asset_path in shared
+                })
 
         # Create the MDZ exporter
-        exporter = MDZExporter()
+        if isinstance(asset_store, str):
+            asset_store = AssetStore(asset_store)
+        exporter = MDZExporter(asset_store)
 
         # Export to MDZ
         return exporter.export_to_mdz(markdown_text, output_file, document_settings, asset_list)
@@ -275,13 +289,38 @@ def create_mdz_file(markdown_path: str, output_file: str, assets: List[str] = No
         logger.error(f"Error creating MDZ file: {str(e)}")
         return False
 
-def extract_mdz_file(mdz_file: str, output_dir: str = None) -> Tuple[str, Dict[str, Any]]:
+def _materialize_asset(source_path: str, target_path: str, link: bool) -> None:
+    """
+    Place an asset blob under the name the document refers to it by
+
+    Args:
+        source_path: Path of the blob
+        target_path: Path the document expects the asset at
+        link: Hard-link the blob instead of copying it, where possible
+    """
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    if os.path.exists(target_path):
+        os.unlink(target_path)
+    if link:
+        try:
+            os.link(source_path, target_path)
+            return
+        except OSError:
+            # Not supported by the file system, or across devices
+            pass
+    shutil.copyfile(source_path, target_path)
+
+
+def extract_mdz_file(mdz_file: str, output_dir: str = None,
+                     asset_store: Union[str, AssetStore, None] = None) -> Tuple[str, Dict[str, Any]]:
     """
     Extract an MDZ file
 
     Args:
         mdz_file: Path to the MDZ file
         output_dir: Directory to extract to (if None, a temporary directory is created)
+        asset_store: Asset store to copy the shared assets the bundle refers to
+            from, or the path of its directory
 
     Returns:
         Tuple of (markdown_content, metadata)
@@ -290,8 +329,10 @@ def extract_mdz_file(mdz_file: str, output_dir: str = None) -> Tuple[str, Dict[s
         # Create a temporary directory if output_dir is not provided
         temp_dir = output_dir or tempfile.mkdtemp(prefix="mdz_extract_")
 
-        # Read the MDZ file
+        # Read the MDZ file, after the header if it has one
+        header_size = sniff_format(mdz_file).header_size
         with open(mdz_file, "rb") as f:
+            f.seek(header_size)
             compressed_data = f.read()
 
         # Calculate the checksum to use as the password
@@ -309,7 +350,7 @@ def extract_mdz_file(mdz_file: str, output_dir: str = None) -> Tuple[str, Dict[s
         # Extract the zip file
         import zipfile
         with zipfile.ZipFile(temp_zip.name, "r") as zipf:
-            zipf.extractall(temp_dir)
+            zipf.extractall(temp_dir, [name for name in zipf.namelist() if name != DIGEST_MANIFEST])
 
         # Clean up the temporary zip file
         os.unlink(temp_zip.name)
@@ -319,6 +360,25 @@ def extract_mdz_file(mdz_file: str, output_dir: str = None) -> Tuple[str, Dict[s
         with open(manifest_path, "r", encoding="utf-8") as f:
             manifest = json.load(f)
 
+        # Put every asset where the document refers to it, from its blob in the
+        # bundle or in the asset store
+        if isinstance(asset_store, str):
+            asset_store = AssetStore(asset_store)
+        root = os.path.realpath(temp_dir)
+        for name, record in manifest.get("assets", {}).items():
+            target_path = os.path.realpath(os.path.join(root, *name.split("/")))
+            if os.path.commonpath([root, target_path]) != root:
+                logger.warning(f"Asset {name} is outside the extraction directory, skipping")
+                continue
+            if record.get("store"):
+                if asset_store is None or record["sha256"] not in asset_store:
+                    logger.warning(f"Shared asset {name} ({record['sha256']}) is not in the asset store")
+                    continue
+                # Copied, so editing the extracted file cannot change the store
+                _materialize_asset(asset_store.path_for(record["sha256"]), target_path, link=False)
+            else:
+                _materialize_asset(os.path.join(root, *record["path"].split("/")), target_path, link=True)
+
         # Get the main markdown file
         main_file = manifest.get("main", "main.md")
         main_file_path = os.path.join(temp_dir, main_file)
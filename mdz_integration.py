@@ -21,6 +21,7 @@ from PyQt6.QtCore import Qt, QSettings
 # Import unified MDZ module and renderer
 from unified_mdz import UnifiedMDZ, CompressionMethod, get_mdz_info
 from mdz_renderer import MDZRenderer
+from mdz_render_cache import CACHE_DIR
 
 # Import page preview improvements
 try:
@@ -33,6 +34,9 @@ except ImportError:
 # Configure logger
 logger = logging.getLogger(__name__)
 
+# Files taken to be images the document refers to, and pruned once it no longer does
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.bmp')
+
 class MDZIntegration:
     """
     Class for integrating MDZ bundle format into the main application
@@ -161,7 +165,8 @@ class MDZIntegration:
             if file_path.lower().endswith('.mdz'):
                 self.open_mdz_file(file_path)
             else:
-                # Use the original method for non-MDZ files
+                # Use the original method for non-MDZ files, the bundle is no longer the document
+                self.cleanup_mdz()
                 try:
                     with open(file_path, 'r', encoding='utf-8') as file:
                         self.main_window.markdown_editor.setPlainText(file.read())
@@ -191,12 +196,9 @@ class MDZIntegration:
             # Create a new MDZ bundle
             self.current_mdz_bundle = UnifiedMDZ()
 
-            # Load the MDZ bundle
+            # Load the MDZ bundle, assets are only extracted when the preview references them
             self.current_mdz_bundle.load(file_path)
-
-            # Extract to a temporary directory
-            self.extracted_assets = self.current_mdz_bundle.extract_to_temp()
-            self.temp_dir = self.current_mdz_bundle.temp_dir
+            self.extracted_assets = {}
 
             # Get the main content
             main_content = self.current_mdz_bundle.get_main_content()
@@ -275,6 +277,9 @@ class MDZIntegration:
         # Find all image references
         image_pattern = r'!\[(.*?)\]\((.*?)\)'
 
+        # Files in the bundle, only the referenced ones are extracted
+        bundle_assets = self.current_mdz_bundle.get_file_list() if self.current_mdz_bundle else []
+
         def replace_image_path(match):
             alt_text = match.group(1)
             image_path = match.group(2)
@@ -284,23 +289,23 @@ class MDZIntegration:
                 return match.group(0)
 
             # Check if we have a mapping for this image path
-            for internal_path, extracted_path in self.extracted_assets.items():
+            for internal_path in bundle_assets:
                 # Try different matching strategies
                 if (internal_path.endswith(image_path) or
                     image_path.endswith(internal_path) or
                     os.path.basename(internal_path) == os.path.basename(image_path)):
                     # Replace with the extracted path and add MDZ asset class for styling
-                    return f'![{alt_text}]({extracted_path}){{.mdz-asset}}'
+                    return f'![{alt_text}]({self.get_extracted_asset(internal_path)}){{.mdz-asset}}'
 
                 # Try to match by directory structure
                 if 'images/' in internal_path and os.path.basename(internal_path) == os.path.basename(image_path):
-                    return f'![{alt_text}]({extracted_path}){{.mdz-asset}}'
+                    return f'![{alt_text}]({self.get_extracted_asset(internal_path)}){{.mdz-asset}}'
 
             # If no exact match found, try to find a match by filename only
             image_filename = os.path.basename(image_path)
-            for internal_path, extracted_path in self.extracted_assets.items():
+            for internal_path in bundle_assets:
                 if os.path.basename(internal_path) == image_filename:
-                    return f'![{alt_text}]({extracted_path}){{.mdz-asset}}'
+                    return f'![{alt_text}]({self.get_extracted_asset(internal_path)}){{.mdz-asset}}'
 
             # Keep the original path if no mapping is found
             logger.warning(f"No asset mapping found for image: {image_path}")
@@ -310,13 +315,28 @@ class MDZIntegration:
         processed_content = re.sub(image_pattern, replace_image_path, markdown_content)
 
         # Add a note about MDZ assets at the beginning of the document
-        if self.extracted_assets:
-            asset_count = len(self.extracted_assets)
+        if bundle_assets:
+            asset_count = len(bundle_assets)
             mdz_note = f"\n\n> **Note**: This document contains {asset_count} embedded MDZ assets that will be properly displayed in the preview and PDF export.\n\n"
             processed_content = mdz_note + processed_content
 
         return processed_content
 
+    def get_extracted_asset(self, internal_path):
+        """
+        Get the path of an asset of the open MDZ bundle, extracting it on first use
+
+        Args:
+            internal_path: Path within the bundle
+
+        Returns:
+            Path to the extracted file
+        """
+        if internal_path not in self.extracted_assets:
+            self.extracted_assets[internal_path] = self.current_mdz_bundle.get_asset_path(internal_path)
+            self.temp_dir = self.current_mdz_bundle.temp_dir
+        return self.extracted_assets[internal_path]
+
     def save_file(self):
         """
         Override of the save_file method to handle MDZ files
@@ -391,8 +411,9 @@ class MDZIntegration:
             True if successful, False otherwise
         """
         try:
-            # Create a new MDZ bundle
-            bundle = UnifiedMDZ()
+            # Update the open bundle in place, so only the changed files are
+            # written (appended to the file when saving over it)
+            bundle = self.current_mdz_bundle or UnifiedMDZ()
 
             # Get the current markdown content
             markdown_content = self.main_window.markdown_editor.toPlainText()
@@ -400,7 +421,7 @@ class MDZIntegration:
             # Extract front matter
             markdown_without_front_matter, front_matter = bundle.extract_front_matter(markdown_content)
 
-            # Create the bundle from the markdown content
+            # Update the main document and the metadata
             bundle.create_from_markdown(markdown_content, front_matter)
 
             # Include referenced images
@@ -432,7 +453,8 @@ class MDZIntegration:
 
     def include_referenced_images(self, bundle, markdown_content):
         """
-        Include referenced images in the MDZ bundle
+        Include referenced images in the MDZ bundle, and drop the images it
+        holds that the document no longer refers to
 
         Args:
             bundle: MDZ bundle
@@ -441,11 +463,13 @@ class MDZIntegration:
         # Find all image references
         image_pattern = r'!\[(.*?)\]\((.*?)\)'
         image_references = re.findall(image_pattern, markdown_content)
+        referenced = set()
 
         for _, image_path in image_references:
             # Skip URLs
             if image_path.startswith(('http://', 'https://')):
                 continue
+            referenced.add(image_path)
 
             # Check if the image exists
             if os.path.exists(image_path):
@@ -457,18 +481,26 @@ class MDZIntegration:
                     bundle.add_file(image_path, image_content)
                 except Exception as e:
                     logger.warning(f"Error adding image {image_path}: {str(e)}")
-            elif self.temp_dir:
-                # Check if the image exists in the extracted assets
-                for internal_path, extracted_path in self.extracted_assets.items():
+            elif self.current_mdz_bundle and self.current_mdz_bundle is not bundle:
+                # Check if the image exists in the open MDZ bundle; saving the open
+                # bundle itself keeps its images without reading them
+                for internal_path in self.current_mdz_bundle.get_file_list():
                     if internal_path.endswith(image_path) or os.path.basename(internal_path) == os.path.basename(image_path):
                         try:
-                            with open(extracted_path, 'rb') as f:
+                            with self.current_mdz_bundle.open_asset(internal_path) as f:
                                 image_content = f.read()
 
-                            bundle.add_file(internal_path, image_content, internal_path)
+                            bundle.add_file(internal_path, image_content)
                         except Exception as e:
                             logger.warning(f"Error adding extracted image {internal_path}: {str(e)}")
 
+        # Drop the images the document no longer refers to, matched as they are looked up above
+        for path in [path for path in bundle.content
+                     if path.lower().endswith(IMAGE_EXTENSIONS) and not path.startswith(('mermaid/', CACHE_DIR + '/'))]:
+            if not any(path.endswith(image_path) or os.path.basename(path) == os.path.basename(image_path)
+                       for image_path in referenced):
+                del bundle.content[path]
+
     def include_mermaid_diagrams(self, bundle, markdown_content):
         """
         Include Mermaid diagrams in the MDZ bundle
@@ -482,24 +514,38 @@ class MDZIntegration:
         mermaid_blocks = re.findall(mermaid_pattern, markdown_content, re.DOTALL)
 
         # Add each Mermaid diagram to the bundle
+        diagram_paths = set()
         for i, mermaid_code in enumerate(mermaid_blocks):
             mermaid_code = mermaid_code.strip()
 
             # Create a file name for the diagram
-            file_name = f"diagram_{i+1}.mmd"
+            diagram_path = f"mermaid/diagram_{i+1}.mmd"
+            svg_path = f"{diagram_path}.svg"
+            diagram_paths.update((diagram_path, svg_path))
+
+            # Diagrams the bundle already holds are neither rewritten nor rendered again
+            if bundle.content.get(diagram_path) == mermaid_code and svg_path in bundle.content:
+                continue
 
             # Add the diagram to the bundle
-            bundle.add_file(file_name, mermaid_code, f"mermaid/{file_name}")
+            bundle.add_file(diagram_path, mermaid_code)
 
             # Try to render the diagram to SVG
             try:
                 svg_content = self.mdz_renderer.render_mermaid_to_svg(mermaid_code)
                 if svg_content:
                     # Add the SVG to the bundle
-                    bundle.add_file(f"{file_name}.svg", svg_content, f"mermaid/{file_name}.svg")
+                    bundle.add_file(svg_path, svg_content)
+                elif svg_path in bundle.content:
+                    del bundle.content[svg_path]
             except Exception as e:
                 logger.warning(f"Error rendering Mermaid diagram: {str(e)}")
 
+        # Drop the files of diagrams removed from the document
+        for path in [path for path in bundle.content if re.fullmatch(r'mermaid/diagram_\d+\.mmd(\.svg)?', path)]:
+            if path not in diagram_paths:
+                del bundle.content[path]
+
     def export_to_mdz(self):
         """
         Export the current document to an MDZ bundle
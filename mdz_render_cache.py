@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+MDZ Render Cache
+----------------
+Bundles can carry the artifacts rendered from them under cache/: the SVGs
+of Mermaid diagrams, math pre-rendered with KaTeX and the final HTML.
+Opening a bundle then takes them from the cache instead of rendering again,
+so diagrams show instantly even on machines without mermaid-cli.
+
+Every artifact is stored under the SHA-256 of its source, the options it
+was rendered with and the renderer version:
+
+    cache/mermaid/<key>.svg
+    cache/math/<key>.html
+    cache/html/<key>.html
+
+A changed source, option or renderer simply misses the cache and is
+rendered as before. Artifacts that depend on the machine, such as HTML
+pointing at extracted temporary files, never match on another one.
+
+File: mdz_render_cache.py
+"""
+
+import json
+import logging
+from typing import Any, Dict, MutableMapping, Optional, Set
+
+from mdz_assets import hash_bytes
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Version of the output of MDZRenderer, part of the key of every artifact.
+# Bump it whenever a change to the renderer changes what it produces.
+RENDERER_VERSION = "1"
+
+# Directory of cached artifacts within a bundle
+CACHE_DIR = "cache"
+
+# Kinds of artifacts and the extension they are stored with
+KIND_MERMAID = "mermaid"
+KIND_MATH = "math"
+KIND_HTML = "html"
+EXTENSIONS = {
+    KIND_MERMAID: ".svg",
+    KIND_MATH: ".html",
+    KIND_HTML: ".html",
+}
+
+
+def cache_key(kind: str, source: str, version: str = RENDERER_VERSION, **options: Any) -> str:
+    """
+    Compute the key of an artifact
+
+    Args:
+        kind: Kind of artifact (mermaid, math or html)
+        source: Source the artifact is rendered from
+        version: Renderer version
+        **options: Rendering options that change the output
+
+    Returns:
+        Hex digest identifying the artifact
+    """
+    material = json.dumps([version, kind, options, source], sort_keys=True, default=str)
+    return hash_bytes(material)
+
+
+class RenderCache:
+    """
+    Rendered artifacts kept in the content of a bundle
+
+    Works on the content mapping of any bundle class, so artifacts are saved
+    and loaded along with the rest of the bundle. The keys looked up or
+    stored are remembered, which lets prune() drop artifacts of sources the
+    document no longer has.
+    """
+
+    def __init__(self, content: MutableMapping, version: str = RENDERER_VERSION):
+        """
+        Initialize the cache
+
+        Args:
+            content: Content mapping of the bundle
+            version: Renderer version the artifacts must match
+        """
+        self.content = content
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._used: Set[str] = set()
+
+    def path_for(self, kind: str, source: str, **options: Any) -> str:
+        """
+        Get the path of an artifact within the bundle
+
+        Args:
+            kind: Kind of artifact
+            source: Source the artifact is rendered from
+            **options: Rendering options that change the output
+
+        Returns:
+            Path within the bundle
+        """
+        key = cache_key(kind, source, self.version, **options)
+        return f"{CACHE_DIR}/{kind}/{key}{EXTENSIONS[kind]}"
+
+    def get(self, kind: str, source: str, **options: Any) -> Optional[str]:
+        """
+        Look up an artifact
+
+        Args:
+            kind: Kind of artifact
+            source: Source the artifact is rendered from
+            **options: Rendering options that change the output
+
+        Returns:
+            The artifact, or None if the bundle does not hold it
+        """
+        path = self.path_for(kind, source, **options)
+        self._used.add(path)
+        if path not in self.content:
+            self.misses += 1
+            return None
+        self.hits += 1
+        artifact = self.content[path]
+        return artifact.decode('utf-8') if isinstance(artifact, bytes) else artifact
+
+    def put(self, kind: str, source: str, artifact: str, **options: Any) -> None:
+        """
+        Store an artifact
+
+        Args:
+            kind: Kind of artifact
+            source: Source the artifact was rendered from
+            artifact: Rendered artifact
+            **options: Rendering options that change the output
+        """
+        path = self.path_for(kind, source, **options)
+        self._used.add(path)
+        for directory in (f"{CACHE_DIR}/", f"{CACHE_DIR}/{kind}/"):
+            if directory not in self.content:
+                self.content[directory] = {}
+        self.content[path] = artifact
+
+    def artifacts(self) -> Dict[str, int]:
+        """
+        Count the cached artifacts of each kind
+
+        Returns:
+            Dictionary mapping kinds to artifact counts
+        """
+        counts = {}
+        for path in self.content:
+            parts = path.split('/')
+            if len(parts) == 3 and parts[0] == CACHE_DIR and parts[2]:
+                counts[parts[1]] = counts.get(parts[1], 0) + 1
+        return counts
+
+    def prune(self) -> int:
+        """
+        Remove the artifacts that were neither looked up nor stored
+
+        Call it after rendering the whole document, so artifacts of edited
+        diagrams, math or text do not accumulate in the bundle.
+
+        Returns:
+            Number of artifacts removed
+        """
+        stale = [path for path in self.content
+                 if path.startswith(f"{CACHE_DIR}/") and not path.endswith('/') and path not in self._used]
+        for path in stale:
+            del self.content[path]
+
+        # Drop the directories left empty
+        directories = [path for path in self.content if path.startswith(f"{CACHE_DIR}/") and path.endswith('/')]
+        for directory in sorted(directories, key=len, reverse=True):
+            if not any(path != directory and path.startswith(directory) for path in self.content):
+                del self.content[directory]
+
+        if stale:
+            logger.debug(f"Removed {len(stale)} stale rendered artifacts")
+        return len(stale)
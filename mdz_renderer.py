@@ -18,6 +18,8 @@ import yaml
 from typing import Dict, List, Optional, Union, Tuple, Any
 from pathlib import Path
 
+from mdz_render_cache import RenderCache, KIND_MERMAID, KIND_MATH, KIND_HTML
+
 # Configure logger
 logger = logging.getLogger(__name__)
 
@@ -26,18 +28,32 @@ class MDZRenderer:
     Enhanced Markdown renderer for .mdz files
     """
 
-    def __init__(self, math_engine: str = "mathjax"):
+    def __init__(self, math_engine: str = "mathjax", prerender_math: bool = False,
+                 cache: Optional[RenderCache] = None):
         """
         Initialize the renderer
 
         Args:
             math_engine: Math rendering engine ('mathjax' or 'katex')
+            prerender_math: Render math to static HTML+MathML with the bundled KaTeX
+                instead of loading a math library in the browser
+            cache: Optional render cache of a bundle, rendered artifacts are taken
+                from it when present and stored in it otherwise
         """
+        self.cache = cache
         self.math_engine = math_engine.lower()
         if self.math_engine not in ["mathjax", "katex"]:
             logger.warning(f"Unknown math engine: {math_engine}, defaulting to mathjax")
             self.math_engine = "mathjax"
 
+        self.katex_service = None
+        if prerender_math:
+            from content_processors.katex_renderer import get_katex_service
+            self.katex_service = get_katex_service()
+            if not self.katex_service.is_available():
+                logger.warning("KaTeX worker not available, falling back to client-side math rendering")
+                self.katex_service = None
+
         # Import required modules
         try:
             import markdown
@@ -168,6 +184,57 @@ class MDZRenderer:
 
         return markdown_content
 
+    def prerender_math_expressions(self, markdown_content: str) -> Tuple[str, Dict[str, str]]:
+        """
+        Replace math expressions with placeholders and pre-render them with KaTeX
+
+        All expressions of the document are rendered in a single batch. Expressions
+        KaTeX cannot render keep the delimiters used by preprocess_math.
+
+        Args:
+            markdown_content: Markdown content
+
+        Returns:
+            Tuple of (content_with_placeholders, placeholder_to_html)
+        """
+        pattern = re.compile(r'\$\$(.*?)\$\$|(?<!\$)\$(?!\$)(.*?)(?<!\$)\$(?!\$)', re.DOTALL)
+        matches = list(pattern.finditer(markdown_content))
+        expressions = [(m.group(1), True) if m.group(1) is not None else (m.group(2), False) for m in matches]
+
+        # Only render the expressions the cache does not hold
+        rendered = {}
+        if self.cache is not None:
+            for tex, display in set(expressions):
+                html = self.cache.get(KIND_MATH, tex, display=display)
+                if html is not None:
+                    rendered[(tex, display)] = html
+        missing = [expression for expression in expressions if expression not in rendered]
+        if missing:
+            fresh = self.katex_service.render_batch(missing)
+            rendered.update(fresh)
+            if self.cache is not None:
+                for (tex, display), html in fresh.items():
+                    if html is not None:
+                        self.cache.put(KIND_MATH, tex, html, display=display)
+
+        parts = []
+        placeholders = {}
+        last_end = 0
+        for index, (match, expression) in enumerate(zip(matches, expressions)):
+            parts.append(markdown_content[last_end:match.start()])
+            html = rendered.get(expression)
+            if html is None:
+                tex, display = expression
+                parts.append(f'\\\\[{tex}\\\\]' if display else f'\\\\({tex}\\\\)')
+            else:
+                placeholder = f"MDZMATHPLACEHOLDER{index}X"
+                placeholders[placeholder] = html
+                parts.append(placeholder)
+            last_end = match.end()
+        parts.append(markdown_content[last_end:])
+
+        return ''.join(parts), placeholders
+
     def preprocess_image_paths(self, markdown_content: str, asset_paths: Optional[Dict] = None) -> str:
         """
         Preprocess Markdown content to handle image paths with enhanced asset resolution
@@ -246,9 +313,29 @@ class MDZRenderer:
         """
         import markdown
 
+        # Everything that changes the output is part of the cache key
+        if self.cache is not None:
+            cache_options = {
+                'front_matter': front_matter,
+                'mermaid_diagrams': mermaid_diagrams,
+                'asset_paths': asset_paths,
+                'toc': toc,
+                'numbering': numbering,
+                'theme': theme,
+                'math_engine': self.math_engine,
+                'katex_stylesheet': self.katex_service.get_stylesheet_url() if self.katex_service is not None else None,
+            }
+            cached_html = self.cache.get(KIND_HTML, markdown_content, **cache_options)
+            if cached_html is not None:
+                return cached_html
+
         # Preprocess the content
         processed_content = self.preprocess_mermaid(markdown_content, mermaid_diagrams)
-        processed_content = self.preprocess_math(processed_content)
+        if self.katex_service is not None:
+            processed_content, math_html = self.prerender_math_expressions(processed_content)
+        else:
+            processed_content = self.preprocess_math(processed_content)
+            math_html = {}
         processed_content = self.preprocess_image_paths(processed_content, asset_paths)
 
         # Add TOC marker if requested
@@ -265,8 +352,16 @@ class MDZRenderer:
         # Convert Markdown to HTML
         html_content = markdown.markdown(processed_content, extensions=extensions)
 
+        # Put the pre-rendered math back in place
+        for placeholder, rendered_math in math_html.items():
+            html_content = html_content.replace(placeholder, rendered_math)
+
         # Add math rendering support
-        if self.math_engine == "mathjax":
+        if self.katex_service is not None and "\\\\(" not in processed_content and "\\\\[" not in processed_content:
+            # Everything was pre-rendered, only the local stylesheet is needed
+            stylesheet_url = self.katex_service.get_stylesheet_url()
+            math_script = f'<link rel="stylesheet" href="{stylesheet_url}">' if stylesheet_url else ""
+        elif self.math_engine == "mathjax":
             math_script = """
 <script type="text/javascript" id="MathJax-script" async
   src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js">
@@ -525,6 +620,9 @@ class MDZRenderer:
 </html>
 """
 
+        if self.cache is not None:
+            self.cache.put(KIND_HTML, markdown_content, html_document, **cache_options)
+
         return html_document
 
     def render_mermaid_to_svg(self, mermaid_code: str) -> Optional[str]:
@@ -599,11 +697,15 @@ class MDZRenderer:
         mermaid_pattern = r'```mermaid\s+(.*?)\s+```'
         mermaid_blocks = re.findall(mermaid_pattern, markdown_content, re.DOTALL)
 
-        # Render each Mermaid diagram
+        # Render each Mermaid diagram, unless the cache holds it
         mermaid_diagrams = {}
         for mermaid_code in mermaid_blocks:
             mermaid_code = mermaid_code.strip()
-            svg_content = self.render_mermaid_to_svg(mermaid_code)
+            svg_content = self.cache.get(KIND_MERMAID, mermaid_code) if self.cache is not None else None
+            if svg_content is None:
+                svg_content = self.render_mermaid_to_svg(mermaid_code)
+                if svg_content and self.cache is not None:
+                    self.cache.put(KIND_MERMAID, mermaid_code, svg_content)
             if svg_content:
                 mermaid_diagrams[mermaid_code] = svg_content
 
@@ -626,6 +728,8 @@ if __name__ == "__main__":
                        help='Output format (default: html)')
     parser.add_argument('--math', choices=['mathjax', 'katex'], default='mathjax',
                        help='Math rendering engine (default: mathjax)')
+    parser.add_argument('--prerender-math', action='store_true',
+                       help='Pre-render math with the bundled KaTeX (no math JavaScript in the output)')
     parser.add_argument('--toc', action='store_true', help='Include table of contents')
     parser.add_argument('--numbering', action='store_true', help='Enable section numbering')
     parser.add_argument('--theme', choices=['default', 'light', 'dark'], default='default',
@@ -639,7 +743,7 @@ if __name__ == "__main__":
         markdown_content = f.read()
 
     # Create a renderer
-    renderer = MDZRenderer(math_engine=args.math)
+    renderer = MDZRenderer(math_engine=args.math, prerender_math=args.prerender_math)
 
     # Extract front matter
     markdown_without_front_matter, front_matter = renderer.extract_front_matter(markdown_content)
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+MDZ Stream Writer
+-----------------
+This module writes .mdz bundles straight to the output file. Entries are
+added from memory or from source paths and streamed through tar (or zip)
+into a Zstandard stream writer, so neither a temporary directory nor an
+in-memory copy of the archive is needed. Peak memory is bounded by the
+chunk size, and the SHA-256 of every entry is computed while it is written.
+
+Large frames are compressed by one thread per core. With the "auto"
+compression level, the writer picks the highest level expected to
+compress the bundle within a time budget.
+
+File: mdz_stream.py
+"""
+
+import os
+import io
+import json
+import time
+import struct
+import hashlib
+import tarfile
+import zipfile
+import logging
+from typing import BinaryIO, Callable, Dict, Optional, Union
+
+# Import Zstandard library
+try:
+    import zstandard as zstd
+except ImportError:
+    raise ImportError("Zstandard library not found. Please install it with 'pip install zstandard'")
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+# Bytes copied from a source to the compressor at a time
+CHUNK_SIZE = 1024 * 1024
+
+# Frames of at least this size are compressed by several threads
+MULTITHREAD_SIZE = 8 * 1024 * 1024
+
+# Compression level that is chosen from the bundle size and a time budget
+AUTO_LEVEL = "auto"
+AUTO_TIME_BUDGET = 1.0
+
+# Conservative single-core compression speed of Markdown at each level, in MB/s,
+# from the highest level "auto" may pick to the lowest
+LEVEL_SPEEDS = ((19, 2), (15, 20), (12, 40), (9, 70), (6, 100), (3, 300), (1, 500))
+
+# Fixed 16-byte header at the start of a bundle: magic, format version,
+# compression method, flags, text dictionary ID and 4 reserved bytes
+HEADER_MAGIC = b"MDZ\x1a"
+HEADER = struct.Struct("<4sBBHII")
+
+# Compression methods recorded in the header
+METHOD_STANDARD = 0  # Tar archive (version 1) or indexed frames (version 2)
+METHOD_SECURE = 1    # Zip archive compressed with its checksum as dictionary
+
+# Last entry of tar and zip bundles written with a digest manifest, holding
+# the SHA-256 of every file so entries can be verified one by one
+DIGEST_MANIFEST = ".mdz/digests.json"
+
+
+def pack_header(version: int, method: int, flags: int = 0, dictionary_id: int = 0) -> bytes:
+    """
+    Build the header of a bundle
+
+    Args:
+        version: Format version
+        method: Compression method (METHOD_STANDARD or METHOD_SECURE)
+        flags: Format flags
+        dictionary_id: ID of the dictionary text entries are compressed with, 0 for none
+
+    Returns:
+        The 16 header bytes
+    """
+    return HEADER.pack(HEADER_MAGIC, version, method, flags, dictionary_id, 0)
+
+
+def pack_digests(digests: Dict[str, str]) -> bytes:
+    """
+    Serialize the digest manifest
+
+    The size only depends on the entry names, as every digest has the same
+    length, so tar bundles can declare their size before hashing anything.
+
+    Args:
+        digests: Dictionary mapping file paths to their SHA-256
+
+    Returns:
+        JSON content of the manifest
+    """
+    return json.dumps({"algorithm": "sha256", "entries": digests}, indent=1, sort_keys=True).encode('utf-8')
+
+
+def choose_level(size: int, time_budget: float = AUTO_TIME_BUDGET, threads: int = 1) -> int:
+    """
+    Pick the highest compression level expected to compress data within a time budget
+
+    Args:
+        size: Bytes to compress
+        time_budget: Time budget in seconds
+        threads: Number of compression threads
+
+    Returns:
+        Zstandard compression level
+    """
+    size_mb = size / (1024 * 1024)
+    for level, speed in LEVEL_SPEEDS:
+        if size_mb <= speed * max(1, threads) * time_budget:
+            return level
+    return LEVEL_SPEEDS[-1][0]
+
+
+def compression_level_arg(value: str) -> Union[int, str]:
+    """
+    Parse a compression level command line argument
+
+    Args:
+        value: A level from 1 to 22, or "auto"
+
+    Returns:
+        The level, or AUTO_LEVEL
+    """
+    if value == AUTO_LEVEL:
+        return AUTO_LEVEL
+    return int(value)
+
+
+class MDZContainer:
+    """Enum for the archive inside the Zstandard frame"""
+    TAR = "tar"  # Standard bundles
+    ZIP = "zip"  # Secure bundles and exports
+
+
+class _Entry:
+    """
+    A file or directory to write, with its content still in memory, on disk
+    (source is a path) or behind a function that opens it (source is callable)
+    """
+
+    __slots__ = ('name', 'data', 'source', 'size', 'mtime')
+
+    def __init__(self, name: str, data: Optional[bytes] = None, source: Union[str, Callable[[], BinaryIO], None] = None,
+                 size: int = 0, mtime: Optional[float] = None):
+        self.name = name
+        self.data = data
+        self.source = source
+        self.size = size
+        self.mtime = int(mtime if mtime is not None else time.time())
+
+    @property
+    def is_dir(self) -> bool:
+        return self.name.endswith('/')
+
+    def open(self) -> BinaryIO:
+        """Open the content for reading"""
+        if callable(self.source):
+            return self.source()
+        if self.source is not None:
+            return open(self.source, 'rb')
+        return io.BytesIO(self.data)
+
+
+class _HashingReader:
+    """File-like reader that hashes what is read through it"""
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.sha256.update(data)
+        return data
+
+
+class _HashingWriter:
+    """File-like sink that hashes and counts what is written, then passes it on"""
+
+    def __init__(self, target: Optional[BinaryIO] = None):
+        self.target = target
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        if self.target is not None:
+            self.target.write(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+class MDZStreamWriter:
+    """
+    Streaming writer for .mdz bundles
+
+    Entries only reference their content until write() streams them into
+    the output file.
+    """
+
+    # Format version recorded in the header
+    FORMAT_VERSION = 1
+
+    def __init__(self, compression_level: Union[int, str] = 3, container: str = MDZContainer.TAR,
+                 checksum_dictionary: bool = False, chunk_size: int = CHUNK_SIZE, header: bool = True,
+                 threads: int = -1, time_budget: float = AUTO_TIME_BUDGET, digest_manifest: bool = False):
+        """
+        Initialize the writer
+
+        Args:
+            compression_level: Zstandard compression level (1-22, default: 3),
+                or "auto" to choose one from the size and the time budget
+            container: Archive format inside the Zstandard frame (tar or zip)
+            checksum_dictionary: Compress with the SHA-256 of the archive as
+                dictionary, as secure bundles do
+            chunk_size: Bytes copied to the compressor at a time
+            header: Start the file with the format header; without it the
+                file can be read by versions that predate the header
+            threads: Compression threads for large frames, -1 for one per
+                core and 0 to compress in the calling thread only
+            time_budget: Seconds the "auto" level aims to compress within
+            digest_manifest: End the archive with DIGEST_MANIFEST, the SHA-256
+                of every file
+        """
+        self.auto_level = compression_level == AUTO_LEVEL
+        self.compression_level = 3 if self.auto_level else min(max(1, compression_level), 22)
+        self.container = container
+        self.checksum_dictionary = checksum_dictionary
+        self.chunk_size = chunk_size
+        self.header = header
+        self.threads = threads
+        self.time_budget = time_budget
+        self.digest_manifest = digest_manifest
+        self.entries = []
+        self.digests = {}
+        self.settings = {}
+
+    def add_bytes(self, name: str, data: Union[str, bytes], mtime: Optional[float] = None) -> None:
+        """
+        Add a file from memory
+
+        Args:
+            name: Path within the bundle
+            data: File content, text is encoded as UTF-8
+            mtime: Modification time (defaults to now)
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.entries.append(_Entry(name, data=data, size=len(data), mtime=mtime))
+
+    def add_path(self, name: str, source_path: str) -> None:
+        """
+        Add a file that is read from disk while the bundle is written
+
+        Args:
+            name: Path within the bundle
+            source_path: Path of the source file
+        """
+        stat = os.stat(source_path)
+        self.entries.append(_Entry(name, source=source_path, size=stat.st_size, mtime=stat.st_mtime))
+
+    def add_stream(self, name: str, opener: Callable[[], BinaryIO], size: int, mtime: Optional[float] = None) -> None:
+        """
+        Add a file that is read through a file object while the bundle is written
+
+        Args:
+            name: Path within the bundle
+            opener: Function that opens the content as a binary file object
+            size: Size of the content in bytes
+            mtime: Modification time (defaults to now)
+        """
+        self.entries.append(_Entry(name, source=opener, size=size, mtime=mtime))
+
+    def add_directory(self, name: str) -> None:
+        """
+        Add a directory
+
+        Args:
+            name: Directory path within the bundle
+        """
+        if not name.endswith('/'):
+            name += '/'
+        self.entries.append(_Entry(name))
+
+    def add_content(self, content: Dict[str, Union[str, bytes, dict]]) -> None:
+        """
+        Add the entries of a bundle content dictionary
+
+        Args:
+            content: Dictionary mapping paths to file content, or to a dict
+                for directories
+        """
+        for path, value in content.items():
+            if isinstance(value, dict):
+                self.add_directory(path)
+            else:
+                self.add_bytes(path, value)
+
+    def write(self, output_path: str) -> Dict[str, str]:
+        """
+        Write the bundle to a file
+
+        The bundle is written next to the output file and moved into place
+        when complete, so a failed save never leaves a truncated bundle.
+
+        Args:
+            output_path: Path of the .mdz file
+
+        Returns:
+            Dictionary mapping file paths in the bundle to their SHA-256
+        """
+        temp_path = f"{output_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                digests = self.write_to(f)
+            # A source may be the file that is replaced
+            self._close_sources()
+            os.replace(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+        logger.debug(f"Streamed {len(self.entries)} entries to {output_path} (container: {self.container})")
+        return digests
+
+    def _close_sources(self) -> None:
+        """Release the files entries were read from, before the output file replaces one"""
+        pass
+
+    def write_to(self, fileobj: BinaryIO) -> Dict[str, str]:
+        """
+        Write the bundle to a binary file object
+
+        Args:
+            fileobj: Writable binary file object
+
+        Returns:
+            Dictionary mapping file paths in the bundle to their SHA-256
+        """
+        write_archive = self._write_zip if self.container == MDZContainer.ZIP else self._write_tar
+
+        dict_data = None
+        if self.checksum_dictionary:
+            # The dictionary is the checksum of the archive, so it is produced once just to be hashed
+            counter = _HashingWriter()
+            write_archive(counter)
+            size = counter.size
+            dict_data = zstd.ZstdCompressionDict(counter.sha256.hexdigest().encode())
+        elif self.container == MDZContainer.ZIP:
+            counter = _HashingWriter()
+            write_archive(counter)
+            size = counter.size
+        else:
+            size = self._tar_size()
+
+        if self.header:
+            fileobj.write(pack_header(self.FORMAT_VERSION, METHOD_SECURE if self.checksum_dictionary else METHOD_STANDARD))
+
+        # The frame records the archive size, so readers can decompress it in one call
+        self._choose_settings(size)
+        compressor = self._compressor(size, dict_data)
+        with compressor.stream_writer(fileobj, size=size, write_size=self.chunk_size, closefd=False) as writer:
+            self.digests = write_archive(writer)
+        return self.digests
+
+    def _thread_count(self, size: int) -> int:
+        """Get the number of compression threads for a frame of the given size, 0 for none"""
+        if self.threads == 0 or size < MULTITHREAD_SIZE:
+            return 0
+        threads = self.threads if self.threads > 0 else (os.cpu_count() or 1)
+        # A single worker thread is slower than compressing in the calling thread
+        return threads if threads > 1 else 0
+
+    def _choose_settings(self, size: int) -> None:
+        """
+        Choose the compression level for the bytes to compress and record the settings
+
+        Args:
+            size: Bytes that will be compressed
+        """
+        threads = self._thread_count(size)
+        if self.auto_level:
+            self.compression_level = choose_level(size, self.time_budget, threads)
+        self.settings = {"level": self.compression_level, "auto": self.auto_level, "threads": threads}
+        if self.auto_level:
+            self.settings["time_budget"] = self.time_budget
+        logger.debug(f"Compression settings for {size} bytes: {self.settings}")
+
+    def _compressor(self, size: int, dict_data: Optional[zstd.ZstdCompressionDict] = None) -> zstd.ZstdCompressor:
+        """Create a compressor for a frame of the given size"""
+        return zstd.ZstdCompressor(level=self.compression_level, dict_data=dict_data, threads=self._thread_count(size))
+
+    def _tar_info(self, entry: _Entry) -> tarfile.TarInfo:
+        """Build the tar header of an entry"""
+        info = tarfile.TarInfo(entry.name.rstrip('/') if entry.is_dir else entry.name)
+        info.mtime = entry.mtime
+        if entry.is_dir:
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+        else:
+            info.size = entry.size
+            info.mode = 0o644
+        return info
+
+    def _manifest_entry(self, digests: Dict[str, str]) -> _Entry:
+        """Build the digest manifest entry"""
+        data = pack_digests(digests)
+        return _Entry(DIGEST_MANIFEST, data=data, size=len(data))
+
+    def _tar_size(self) -> int:
+        """Compute the size of the tar archive without writing it"""
+        entries = list(self.entries)
+        if self.digest_manifest:
+            entries.append(self._manifest_entry({entry.name: '0' * 64 for entry in self.entries if not entry.is_dir}))
+
+        size = 0
+        for entry in entries:
+            header = self._tar_info(entry).tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+            blocks = -(-entry.size // tarfile.BLOCKSIZE) if not entry.is_dir else 0
+            size += len(header) + blocks * tarfile.BLOCKSIZE
+
+        # Two zero blocks end the archive, which is padded to a whole record
+        size += 2 * tarfile.BLOCKSIZE
+        return -(-size // tarfile.RECORDSIZE) * tarfile.RECORDSIZE
+
+    def _write_tar(self, sink) -> Dict[str, str]:
+        """Stream all entries as a tar archive into the sink"""
+        digests = {}
+        with tarfile.open(fileobj=sink, mode='w|', format=tarfile.PAX_FORMAT, encoding='utf-8',
+                          copybufsize=self.chunk_size) as tar:
+            for entry in self.entries:
+                info = self._tar_info(entry)
+                if entry.is_dir:
+                    tar.addfile(info)
+                    continue
+                with entry.open() as source:
+                    reader = _HashingReader(source)
+                    tar.addfile(info, reader)
+                digests[entry.name] = reader.sha256.hexdigest()
+            if self.digest_manifest:
+                manifest = self._manifest_entry(digests)
+                tar.addfile(self._tar_info(manifest), io.BytesIO(manifest.data))
+        return digests
+
+    def _write_zip(self, sink) -> Dict[str, str]:
+        """Stream all entries as a zip archive into the sink"""
+        digests = {}
+        # Hide tell() of the compressor, which counts compressed bytes, so zipfile tracks offsets itself
+        with zipfile.ZipFile(_HashingWriter(sink), 'w') as archive:
+            for entry in self.entries:
+                info = zipfile.ZipInfo(entry.name, date_time=time.localtime(entry.mtime)[:6])
+                if entry.is_dir:
+                    info.external_attr = (0o40755 << 16) | 0x10
+                    archive.writestr(info, b'')
+                    continue
+                info.external_attr = 0o644 << 16
+                info.file_size = entry.size
+                sha256 = hashlib.sha256()
+                with entry.open() as source, archive.open(info, 'w') as destination:
+                    for chunk in iter(lambda: source.read(self.chunk_size), b''):
+                        sha256.update(chunk)
+                        destination.write(chunk)
+                digests[entry.name] = sha256.hexdigest()
+            if self.digest_manifest:
+                manifest = self._manifest_entry(digests)
+                info = zipfile.ZipInfo(DIGEST_MANIFEST, date_time=time.localtime(manifest.mtime)[:6])
+                info.external_attr = 0o644 << 16
+                archive.writestr(info, manifest.data)
+        return digests
+
+
+def save_content(content: Dict[str, Union[str, bytes, dict]], output_path: str, compression_level: Union[int, str] = 3,
+                 container: str = MDZContainer.TAR, checksum_dictionary: bool = False) -> Dict[str, str]:
+    """
+    Write a bundle content dictionary to a .mdz file
+
+    Args:
+        content: Dictionary mapping paths to file content, or to a dict for directories
+        output_path: Path of the .mdz file
+        compression_level: Zstandard compression level (1-22, default: 3), or "auto"
+        container: Archive format inside the Zstandard frame (tar or zip)
+        checksum_dictionary: Compress with the SHA-256 of the archive as dictionary
+
+    Returns:
+        Dictionary mapping file paths in the bundle to their SHA-256
+    """
+    writer = MDZStreamWriter(compression_level, container, checksum_dictionary)
+    writer.add_content(content)
+    return writer.write(output_path)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+MDZ Integrity Verification
+--------------------------
+Checks the files of bundles against the SHA-256 recorded for each of them,
+so a damaged bundle reports which files are affected instead of failing
+as a whole, and files can be checked just before they are used.
+
+Version 2 bundles record the digests in their index; secure and exported
+bundles end with a digest manifest (mdz_stream.DIGEST_MANIFEST). Entries
+are hashed in parallel by a thread pool: Zstandard and hashlib release the
+GIL, and every frame of an indexed bundle is decompressed on its own.
+Version 1 standard bundles record no digests; their files are reported as
+unverified.
+
+    python mdz_verify.py bundles/*.mdz
+    python mdz_verify.py report.mdz --entry index.md --entry images/chart.png
+
+File: mdz_verify.py
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import zipfile
+import tarfile
+import argparse
+import logging
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+# Import Zstandard library
+try:
+    import zstandard as zstd
+except ImportError:
+    raise ImportError("Zstandard library not found. Please install it with 'pip install zstandard'")
+
+from mdz_stream import CHUNK_SIZE, DIGEST_MANIFEST
+from mdz_container import IndexedMDZReader, sniff_format
+
+# Configure logger
+logger = logging.getLogger(__name__)
+
+
+def default_workers() -> int:
+    """
+    Get the number of verification threads
+
+    Returns:
+        One thread per core, at least two so hashing overlaps reading
+    """
+    return max(2, os.cpu_count() or 1)
+
+
+def _new_report(path: str, format_version: int) -> Dict:
+    """Create an empty verification report"""
+    return {
+        'path': path,
+        'format_version': format_version,
+        'checked': 0,
+        'bytes': 0,
+        'failed': [],
+        'missing': [],
+        'unverified': [],
+        'seconds': 0.0,
+        'ok': True,
+    }
+
+
+def _finish_report(report: Dict, started: float) -> Dict:
+    """Sort the name lists and record the outcome and the duration"""
+    for key in ('failed', 'missing', 'unverified'):
+        report[key].sort()
+    report['ok'] = not report['failed'] and not report['missing']
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def _verify_indexed(path: str, names: Optional[List[str]], executor: Executor, report: Dict) -> None:
+    """Hash the requested files of an indexed bundle, one frame per task"""
+    with IndexedMDZReader(path) as reader:
+        if names is None:
+            names = [name for name, entry in reader.entries.items() if entry["frame"] is not None]
+
+        by_frame = {}
+        for name in names:
+            entry = reader.get_entry(name)
+            if entry is None or entry["frame"] is None:
+                report['missing'].append(name)
+            else:
+                by_frame.setdefault(entry["frame"], []).append(name)
+
+        def check_frame(number: int, frame_names: List[str]) -> Dict[str, Optional[str]]:
+            try:
+                return reader.frame_digests(number, frame_names)
+            except zstd.ZstdError as e:
+                logger.warning(f"Frame {number} of {path} is corrupted: {str(e)}")
+                return dict.fromkeys(frame_names)
+
+        tasks = [executor.submit(check_frame, number, frame_names) for number, frame_names in by_frame.items()]
+        for task in tasks:
+            for name, digest in task.result().items():
+                entry = reader.get_entry(name)
+                report['checked'] += 1
+                report['bytes'] += entry["size"]
+                if digest != entry["sha256"]:
+                    report['failed'].append(name)
+
+
+def _read_archive(path: str, header_size: int, secure: bool) -> bytes:
+    """Decompress the single frame of a version 1 or secure bundle, as the loaders do"""
+    with open(path, 'rb') as f:
+        f.seek(header_size)
+        compressed_data = f.read()
+    dict_data = None
+    if secure:
+        # The checksum is used as the password
+        dict_data = zstd.ZstdCompressionDict(hashlib.sha256(compressed_data).hexdigest().encode())
+    return zstd.ZstdDecompressor(dict_data=dict_data).decompress(compressed_data)
+
+
+def _hash_stream(stream) -> str:
+    """Hash a file object in chunks"""
+    sha256 = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _verify_archive(path: str, names: Optional[List[str]], executor: Executor, report: Dict,
+                    header_size: int, secure: bool) -> None:
+    """Hash the requested files of a zip or tar bundle, one file per task"""
+    data = _read_archive(path, header_size, secure)
+
+    if data.startswith(b"PK"):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            sizes = {info.filename: info.file_size for info in archive.infolist() if not info.is_dir()}
+            manifest = archive.read(DIGEST_MANIFEST) if DIGEST_MANIFEST in sizes else None
+
+        def hash_member(name: str) -> Optional[str]:
+            # Every task reads through an archive of its own, over the same bytes
+            try:
+                with zipfile.ZipFile(io.BytesIO(data)) as archive, archive.open(name) as member:
+                    return _hash_stream(member)
+            except (zipfile.BadZipFile, OSError):
+                return None
+    else:
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r') as archive:
+            members = {member.name: member for member in archive.getmembers() if member.isfile()}
+            manifest = archive.extractfile(members[DIGEST_MANIFEST]).read() if DIGEST_MANIFEST in members else None
+        sizes = {name: member.size for name, member in members.items()}
+        view = memoryview(data)
+
+        def hash_member(name: str) -> Optional[str]:
+            member = members[name]
+            return hashlib.sha256(view[member.offset_data:member.offset_data + member.size]).hexdigest()
+
+    digests = json.loads(manifest).get("entries", {}) if manifest is not None else {}
+    sizes.pop(DIGEST_MANIFEST, None)
+
+    if names is None:
+        names = list(sizes)
+    to_check = []
+    for name in names:
+        if name not in sizes:
+            report['missing'].append(name)
+        elif name not in digests:
+            report['unverified'].append(name)
+        else:
+            to_check.append(name)
+
+    tasks = [(name, executor.submit(hash_member, name)) for name in to_check]
+    for name, task in tasks:
+        report['checked'] += 1
+        report['bytes'] += sizes[name]
+        if task.result() != digests[name]:
+            report['failed'].append(name)
+
+
+def verify_bundle(path: str, names: Optional[Iterable[str]] = None, workers: Optional[int] = None,
+                  executor: Optional[Executor] = None) -> Dict:
+    """
+    Verify the files of a bundle against their recorded digests
+
+    Args:
+        path: Path to the .mdz file
+        names: Files to check, such as those about to be used (default: all)
+        workers: Verification threads (default: one per core)
+        executor: Thread pool to run the checks on, instead of a new one
+
+    Returns:
+        Report with the files and bytes checked, the files that failed, were
+        missing or have no recorded digest, the duration and whether all
+        requested files are intact
+    """
+    started = time.perf_counter()
+    names = list(names) if names is not None else None
+    bundle_format = sniff_format(path)
+    report = _new_report(path, bundle_format.version)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=workers or default_workers())
+    try:
+        if bundle_format.indexed:
+            _verify_indexed(path, names, executor, report)
+        else:
+            try:
+                _verify_archive(path, names, executor, report, bundle_format.header_size, bundle_format.secure)
+            except (zstd.ZstdError, zipfile.BadZipFile, tarfile.TarError) as e:
+                # Without a readable archive no file can be told apart
+                logger.warning(f"Could not read {path}: {str(e)}")
+                report['failed'] = names if names is not None else ['*']
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    return _finish_report(report, started)
+
+
+def verify_bundles(paths: Iterable[str], names: Optional[Iterable[str]] = None,
+                   workers: Optional[int] = None) -> Dict:
+    """
+    Verify a batch of bundles on one thread pool
+
+    Args:
+        paths: Paths to the .mdz files
+        names: Files to check in every bundle (default: all)
+        workers: Verification threads (default: one per core)
+
+    Returns:
+        Report with one report per bundle ('bundles'), the totals of files
+        and bytes checked, the duration, the throughput in bytes per second
+        and whether every bundle is intact
+    """
+    started = time.perf_counter()
+    names = list(names) if names is not None else None
+    reports = []
+    with ThreadPoolExecutor(max_workers=workers or default_workers()) as executor:
+        for path in paths:
+            try:
+                reports.append(verify_bundle(path, names, executor=executor))
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not verify {path}: {str(e)}")
+                report = _new_report(path, 0)
+                report['failed'] = ['*']
+                reports.append(_finish_report(report, time.perf_counter()))
+
+    seconds = time.perf_counter() - started
+    total_bytes = sum(report['bytes'] for report in reports)
+    return {
+        'bundles': reports,
+        'checked': sum(report['checked'] for report in reports),
+        'bytes': total_bytes,
+        'seconds': seconds,
+        'throughput': total_bytes / seconds if seconds > 0 else 0.0,
+        'ok': all(report['ok'] for report in reports),
+    }
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Verify the files of MDZ bundles against their recorded digests')
+    parser.add_argument('bundles', nargs='+', help='Bundles to verify')
+    parser.add_argument('--entry', action='append', dest='entries',
+                        help='Only verify this file, can be given several times')
+    parser.add_argument('--workers', type=int, help='Verification threads (default: one per core)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    result = verify_bundles(args.bundles, args.entries, args.workers)
+    for report in result['bundles']:
+        status = "OK" if report['ok'] else "FAILED"
+        print(f"{report['path']}: {status}, {report['checked']} files, {report['bytes'] / (1024 * 1024):.1f} MB "
+              f"in {report['seconds']:.2f}s")
+        for key in ('failed', 'missing', 'unverified'):
+            if report[key]:
+                print(f"  {key.capitalize()}: {', '.join(report[key])}")
+    print(f"Verified {result['checked']} files, {result['bytes'] / (1024 * 1024):.1f} MB in {result['seconds']:.2f}s "
+          f"({result['throughput'] / (1024 * 1024):.1f} MB/s)")
+    return 0 if result['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
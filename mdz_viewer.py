@@ -9,9 +9,7 @@ File: mdz_viewer.py
 
 import os
 import sys
-import tempfile
 import logging
-import shutil
 from pathlib import Path
 from typing import Dict, List, Optional, Union, Tuple, Any
 
@@ -27,6 +25,7 @@ from PyQt6.QtCore import Qt, QSize, QMimeData, QUrl, QThread, pyqtSignal
 
 # Import the unified MDZ module
 from unified_mdz import UnifiedMDZ, CompressionMethod, get_mdz_info
+from mdz_container import TEXT_EXTENSIONS
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -93,7 +92,6 @@ class MDZViewerWindow(QMainWindow):
         # Initialize variables
         self.current_mdz_file = None
         self.current_mdz_bundle = None
-        self.temp_dir = None
         
         # Set up the UI
         self.setup_ui()
@@ -224,13 +222,9 @@ class MDZViewerWindow(QMainWindow):
             # Create a new MDZ bundle
             self.current_mdz_bundle = UnifiedMDZ()
             
-            # Load the MDZ bundle
+            # Load the MDZ bundle, files are only read when they are opened or extracted
             self.current_mdz_bundle.load(file_path)
             
-            # Extract to a temporary directory
-            self.temp_dir = tempfile.mkdtemp(prefix="mdz_viewer_")
-            self.current_mdz_bundle.extract_to_directory(self.temp_dir)
-            
             # Update the file tree
             self.update_file_tree()
             
@@ -317,7 +311,7 @@ class MDZViewerWindow(QMainWindow):
         
         try:
             # Get file information
-            info = get_mdz_info(self.current_mdz_file)
+            info = get_mdz_info(self.current_mdz_file, self.current_mdz_bundle)
             
             # Format the information
             info_text = f"MDZ File: {self.current_mdz_file}\n"
@@ -356,31 +350,29 @@ class MDZViewerWindow(QMainWindow):
         if not path:
             return
         
-        # Get the file content
-        content = self.current_mdz_bundle.content.get(path)
-        if content is None:
-            return
-        
         # Check if it's a text file
-        if isinstance(content, str):
-            # Show the content in the text view
-            self.text_view.setPlainText(content)
-            self.content_tabs.setCurrentWidget(self.text_view)
-        else:
-            # Try to open the file with the default application
-            try:
-                file_path = os.path.join(self.temp_dir, path)
-                if os.path.exists(file_path):
-                    import subprocess
-                    if sys.platform == 'win32':
-                        os.startfile(file_path)
-                    elif sys.platform == 'darwin':
-                        subprocess.call(['open', file_path])
-                    else:
-                        subprocess.call(['xdg-open', file_path])
-            except Exception as e:
-                QMessageBox.warning(self, "Error", f"Error opening file: {str(e)}")
-                logger.error(f"Error opening file: {str(e)}")
+        if path.endswith(TEXT_EXTENSIONS):
+            content = self.current_mdz_bundle.content.get(path)
+            if isinstance(content, str):
+                # Show the content in the text view
+                self.text_view.setPlainText(content)
+                self.content_tabs.setCurrentWidget(self.text_view)
+                return
+        
+        # Try to open the file with the default application, extracting only this file
+        try:
+            file_path = self.current_mdz_bundle.get_asset_path(path)
+            if file_path and os.path.exists(file_path):
+                import subprocess
+                if sys.platform == 'win32':
+                    os.startfile(file_path)
+                elif sys.platform == 'darwin':
+                    subprocess.call(['open', file_path])
+                else:
+                    subprocess.call(['xdg-open', file_path])
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Error opening file: {str(e)}")
+            logger.error(f"Error opening file: {str(e)}")
     
     def show_context_menu(self, position):
         """Show context menu for file tree items"""
@@ -421,9 +413,7 @@ class MDZViewerWindow(QMainWindow):
         if not self.current_mdz_bundle:
             return
         
-        # Get the file content
-        content = self.current_mdz_bundle.content.get(path)
-        if content is None:
+        if path not in self.current_mdz_bundle.content:
             return
         
         # Get the save location
@@ -434,10 +424,8 @@ class MDZViewerWindow(QMainWindow):
         
         if save_path:
             try:
-                # Write the file
-                mode = 'wb' if isinstance(content, bytes) else 'w'
-                with open(save_path, mode) as f:
-                    f.write(content)
+                # Write the file, streamed from the bundle
+                self.current_mdz_bundle.extract_file(path, save_path)
                 
                 self.statusBar.showMessage(f"Extracted {path} to {save_path}")
             except Exception as e:
@@ -487,18 +475,9 @@ class MDZViewerWindow(QMainWindow):
                 for item in selected_items:
                     path = item.data(0, Qt.ItemDataRole.UserRole)
                     if path:
-                        # Get the file content
-                        content = self.current_mdz_bundle.content.get(path)
-                        if content is not None:
-                            # Create the output file path
-                            output_path = os.path.join(save_dir, path)
-                            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                            
-                            # Write the file
-                            mode = 'wb' if isinstance(content, bytes) else 'w'
-                            with open(output_path, mode) as f:
-                                f.write(content)
-                            
+                        if path in self.current_mdz_bundle.content:
+                            # Write the file, streamed from the bundle
+                            self.current_mdz_bundle.extract_file(path, os.path.join(save_dir, path))
                             extracted_count += 1
                 
                 self.statusBar.showMessage(f"Extracted {extracted_count} files to {save_dir}")
@@ -534,18 +513,9 @@ class MDZViewerWindow(QMainWindow):
                 for path in self.current_mdz_bundle.get_file_list():
                     # Check if the file matches the selected types
                     if not selected_types or any(path.lower().endswith(ext) for ext in selected_types):
-                        # Get the file content
-                        content = self.current_mdz_bundle.content.get(path)
-                        if content is not None:
-                            # Create the output file path
-                            output_path = os.path.join(save_dir, path)
-                            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                            
-                            # Write the file
-                            mode = 'wb' if isinstance(content, bytes) else 'w'
-                            with open(output_path, mode) as f:
-                                f.write(content)
-                            
+                        if path in self.current_mdz_bundle.content:
+                            # Write the file, streamed from the bundle
+                            self.current_mdz_bundle.extract_file(path, os.path.join(save_dir, path))
                             extracted_count += 1
                 
                 self.statusBar.showMessage(f"Extracted {extracted_count} files to {save_dir}")
@@ -559,10 +529,6 @@ class MDZViewerWindow(QMainWindow):
             self.current_mdz_bundle.cleanup()
             self.current_mdz_bundle = None
         
-        if self.temp_dir and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
-            self.temp_dir = None
-        
         self.current_mdz_file = None
         self.setWindowTitle("MDZ Viewer")
         self.file_tree.clear()
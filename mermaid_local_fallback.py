@@ -10,14 +10,18 @@ import os
 import tempfile
 import platform
 import subprocess
+from functools import lru_cache
 from logging_config import get_logger, EnhancedLogger
 
 logger = get_logger()
 
+@lru_cache(maxsize=None)
 def find_mermaid_js():
     """
     Find the local Mermaid JS file in standard installation locations.
     Resources directory is prioritized over other locations.
+    The result is cached for the session; call find_mermaid_js.cache_clear()
+    after installing or copying a new Mermaid.js.
     
     Returns:
         str: Path to the local Mermaid JS file if found, None otherwise
@@ -136,6 +140,14 @@ def find_mermaid_js():
     logger.warning("No valid local Mermaid.js installation found in standard locations")
     return None
 
+def clear_mermaid_cache():
+    """
+    Forget the Mermaid.js location resolved for this session.
+    Called after a new Mermaid.js has been copied or downloaded.
+    """
+    find_mermaid_js.cache_clear()
+    get_mermaid_script_tag.cache_clear()
+
 def create_resources_directory():
     """Create resources directory if it doesn't exist"""
     # Determine application directory
@@ -241,6 +253,7 @@ def copy_mermaid_to_resources():
                 urllib.request.urlretrieve(cdn_url, target_path)
                 if os.path.exists(target_path) and os.path.getsize(target_path) > 100000:
                     logger.info(f"Successfully downloaded Mermaid.js to: {target_path}")
+                    clear_mermaid_cache()
                     return target_path
             except Exception as e:
                 logger.error(f"Error downloading Mermaid.js: {str(e)}")
@@ -292,15 +305,19 @@ def copy_mermaid_to_resources():
             logger.error(f"Error validating copied Mermaid.js: {str(e)}")
             return None
             
+        clear_mermaid_cache()
         return target_path
     except Exception as e:
         logger.error(f"Error copying Mermaid.js: {str(e)}")
         return None
 
+@lru_cache(maxsize=None)
 def get_mermaid_script_tag():
     """
     Get the appropriate script tag for including Mermaid.js,
     explicitly prioritizing the resources directory version.
+    Resolved once per session, and served through the shared web profile's
+    mdzres:// scheme when it is registered.
     
     Returns:
         str: HTML script tag for including Mermaid.js
@@ -331,6 +348,13 @@ def get_mermaid_script_tag():
     
     # Use the resources directory file
     try:
+        # Prefer the cached resource scheme so the compiled script is reused across reloads
+        from web_profile import get_resource_url
+        resource_url = get_resource_url(resources_mermaid_path)
+        if resource_url:
+            logger.info(f"Using Mermaid.js from resources: {resource_url}")
+            return f'<script src="{resource_url}" defer></script>'
+        
         # Convert to file URL with proper format for all platforms
         if platform.system() == "Windows":
             file_url = f"file:///{resources_mermaid_path.replace(os.sep, '/').replace(' ', '%20')}"
@@ -12,6 +12,7 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtCore import Qt, QUrl, QTimer, pyqtSignal
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 from PyQt6.QtWebEngineCore import QWebEnginePage
+from web_profile import create_page, BASE_URL
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -55,8 +56,9 @@ class PagePreview(QWidget):
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
 
-        # Create web view
+        # Create web view on the shared profile so vendor scripts stay cached across reloads
         self.web_view = QWebEngineView()
+        self.web_view.setPage(create_page(self.web_view))
         self.web_page = self.web_view.page()
         layout.addWidget(self.web_view)
 
@@ -455,8 +457,8 @@ class PagePreview(QWidget):
             </html>
             """
 
-        # Load the HTML
-        self.web_view.setHtml(full_html)
+        # Load the HTML with a mdzres:// origin so vendor scripts resolve through the shared profile
+        self.web_view.setHtml(full_html, QUrl(BASE_URL))
 
     def clean_html_content(self, html_content):
         """Clean HTML content to remove unwanted title elements and blank lines"""
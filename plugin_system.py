@@ -3,10 +3,22 @@
 Plugin System
 -----------
 Plugin system for the Markdown to PDF converter.
+
+A plugin can declare the blocks it handles in a PLUGIN_MANIFEST dictionary
+literal, e.g. {'languages': ['plantuml']} for fenced code blocks or
+{'patterns': [r'<chart>']} for regular expressions. Discovery reads the
+manifests without importing the plugins, and a plugin is imported the first
+time a document contains one of its blocks. Manifests are cached in
+~/.mdz/plugin_cache.json by file modification time, so unchanged plugins
+are not even parsed. Plugins without a manifest are imported on discovery.
 """
 
 import os
+import re
+import ast
 import sys
+import json
+import time
 import importlib.util
 from typing import Dict, List, Any, Optional, Type
 from logging_config import get_logger
@@ -15,6 +27,72 @@ from content_processors.processor_registry import ProcessorRegistry
 
 logger = get_logger()
 
+# Manifests of the plugin files by modification time and size
+PLUGIN_CACHE_PATH = os.path.expanduser('~/.mdz/plugin_cache.json')
+
+# Name of the manifest variable in a plugin file
+MANIFEST_NAME = 'PLUGIN_MANIFEST'
+
+
+def parse_manifest(plugin_path: str) -> Optional[Dict[str, List[str]]]:
+    """
+    Read the manifest of a plugin file without importing it
+    
+    Args:
+        plugin_path: Plugin file path
+    
+    Returns:
+        Dictionary with the 'languages' and 'patterns' lists, or None if the
+        plugin has no valid manifest
+    """
+    try:
+        with open(plugin_path, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read(), plugin_path)
+    except (OSError, SyntaxError, ValueError) as e:
+        logger.warning(f"Cannot read plugin {plugin_path}: {str(e)}")
+        return None
+    
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        if not any(isinstance(target, ast.Name) and target.id == MANIFEST_NAME for target in node.targets):
+            continue
+        
+        try:
+            manifest = ast.literal_eval(node.value)
+            languages = [str(language).lower() for language in manifest.get('languages', [])]
+            patterns = [str(pattern) for pattern in manifest.get('patterns', [])]
+            for pattern in patterns:
+                re.compile(pattern)
+        except (ValueError, TypeError, AttributeError, re.error) as e:
+            logger.warning(f"Invalid {MANIFEST_NAME} in {plugin_path}: {str(e)}")
+            return None
+        
+        if not languages and not patterns:
+            logger.warning(f"{MANIFEST_NAME} in {plugin_path} declares no languages or patterns")
+            return None
+        return {'languages': languages, 'patterns': patterns}
+    
+    return None
+
+
+def manifest_triggers(manifest: Dict[str, List[str]]) -> List[str]:
+    """
+    Get the regular expressions matching content a plugin handles
+    
+    Args:
+        manifest: Plugin manifest
+    
+    Returns:
+        List of regular expressions
+    """
+    triggers = list(manifest['patterns'])
+    if manifest['languages']:
+        # Opening line of a fence in one of the languages
+        languages = '|'.join(re.escape(language) for language in manifest['languages'])
+        triggers.append(rf'(?im)^ {{0,3}}(?:`{{3,}}|~{{3,}})[ \t]*(?:{languages})(?!\S)')
+    return triggers
+
 class PluginSystem:
     """Plugin system for the Markdown to PDF converter"""
     
@@ -27,6 +105,8 @@ class PluginSystem:
             cls._instance._plugins = {}
             cls._instance._plugin_dirs = []
             cls._instance._registry = ProcessorRegistry()
+            cls._instance._manifest_cache = None
+            cls._instance._manifest_cache_changed = False
         return cls._instance
     
     def register_plugin_directory(self, directory: str):
@@ -47,19 +127,107 @@ class PluginSystem:
         for directory in self._plugin_dirs:
             logger.debug(f"Discovering plugins in {directory}")
             self._discover_plugins_in_directory(directory)
+        self._save_manifest_cache()
     
     def _discover_plugins_in_directory(self, directory: str):
         """
         Discover plugins in a directory
         
+        Plugins with a manifest are registered for lazy loading, the others
+        are loaded right away.
+        
         Args:
             directory: Directory path
         """
-        for filename in os.listdir(directory):
+        for filename in sorted(os.listdir(directory)):
             if filename.endswith('.py') and not filename.startswith('_'):
                 plugin_path = os.path.join(directory, filename)
                 plugin_name = os.path.splitext(filename)[0]
-                self._load_plugin(plugin_name, plugin_path)
+                if plugin_name in self._plugins:
+                    continue
+                
+                manifest = self._get_manifest(plugin_path)
+                if manifest is None:
+                    self._load_plugin(plugin_name, plugin_path)
+                else:
+                    self._register_lazy_plugin(plugin_name, plugin_path, manifest)
+    
+    def _register_lazy_plugin(self, plugin_name: str, plugin_path: str, manifest: Dict[str, List[str]]):
+        """
+        Register a plugin to be loaded when a document needs it
+        
+        Args:
+            plugin_name: Plugin name
+            plugin_path: Plugin file path
+            manifest: Plugin manifest
+        """
+        logger.debug(f"Registering lazy plugin: {plugin_name} for {manifest}")
+        self._plugins[plugin_name] = {
+            'path': plugin_path,
+            'module': None,
+            'manifest': manifest,
+            'load_time': None
+        }
+        self._registry.register_lazy_processor(
+            plugin_name, manifest_triggers(manifest), lambda: self._load_plugin(plugin_name, plugin_path)
+        )
+    
+    def _get_manifest(self, plugin_path: str) -> Optional[Dict[str, List[str]]]:
+        """
+        Get the manifest of a plugin file, from the cache if the file did not change
+        
+        Args:
+            plugin_path: Plugin file path
+        
+        Returns:
+            Plugin manifest, or None if the plugin has none
+        """
+        try:
+            stat = os.stat(plugin_path)
+        except OSError:
+            return None
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        
+        cache = self._load_manifest_cache()
+        key = os.path.abspath(plugin_path)
+        entry = cache.get(key)
+        if entry is not None and entry.get('stamp') == stamp:
+            return entry.get('manifest')
+        
+        manifest = parse_manifest(plugin_path)
+        cache[key] = {'stamp': stamp, 'manifest': manifest}
+        self._manifest_cache_changed = True
+        return manifest
+    
+    def _load_manifest_cache(self) -> Dict[str, Any]:
+        """Load the manifest cache file on first use"""
+        if self._manifest_cache is None:
+            self._manifest_cache = {}
+            try:
+                with open(PLUGIN_CACHE_PATH, 'r', encoding='utf-8') as f:
+                    cache = json.load(f)
+                if isinstance(cache, dict):
+                    self._manifest_cache = cache
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring plugin cache {PLUGIN_CACHE_PATH}: {str(e)}")
+        return self._manifest_cache
+    
+    def _save_manifest_cache(self):
+        """Write the manifest cache file if it changed"""
+        if not self._manifest_cache_changed:
+            return
+        
+        try:
+            os.makedirs(os.path.dirname(PLUGIN_CACHE_PATH), exist_ok=True)
+            temp_path = f"{PLUGIN_CACHE_PATH}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._manifest_cache, f, indent=1, sort_keys=True)
+            os.replace(temp_path, PLUGIN_CACHE_PATH)
+            self._manifest_cache_changed = False
+        except OSError as e:
+            logger.warning(f"Could not write plugin cache {PLUGIN_CACHE_PATH}: {str(e)}")
     
     def _load_plugin(self, plugin_name: str, plugin_path: str):
         """
@@ -71,6 +239,7 @@ class PluginSystem:
         """
         try:
             logger.debug(f"Loading plugin: {plugin_name} from {plugin_path}")
+            started = time.perf_counter()
             
             # Load the module
             spec = importlib.util.spec_from_file_location(plugin_name, plugin_path)
@@ -85,11 +254,14 @@ class PluginSystem:
             # Check if the module has a register_plugin function
             if hasattr(module, 'register_plugin'):
                 module.register_plugin(self)
-                logger.info(f"Successfully registered plugin: {plugin_name}")
-                self._plugins[plugin_name] = {
+                load_time = time.perf_counter() - started
+                logger.info(f"Successfully registered plugin: {plugin_name} in {load_time * 1000:.1f} ms")
+                plugin = self._plugins.setdefault(plugin_name, {'manifest': None})
+                plugin.update({
                     'path': plugin_path,
-                    'module': module
-                }
+                    'module': module,
+                    'load_time': load_time
+                })
             else:
                 logger.warning(f"Plugin {plugin_name} does not have a register_plugin function")
         
@@ -120,7 +292,8 @@ class PluginSystem:
         Get all registered plugins
         
         Returns:
-            Dictionary of plugins
+            Dictionary of plugins with their path, module (None until a lazy
+            plugin is loaded), manifest and load time in seconds
         """
         return self._plugins
     
@@ -143,6 +316,9 @@ class PluginSystem:
 
 from content_processors.base_processor import ContentProcessor
 
+# Optional: import the plugin only for documents with these blocks
+PLUGIN_MANIFEST = {'languages': ['example']}
+
 class ExampleProcessor(ContentProcessor):
     # Implementation...
     pass
@@ -16,6 +16,9 @@ from content_processors.base_processor import ContentProcessor
 
 logger = get_logger()
 
+# The plugin is only imported for documents with PlantUML fences
+PLUGIN_MANIFEST = {'languages': ['plantuml']}
+
 class PlantUMLProcessor(ContentProcessor):
     """Processor for PlantUML diagrams"""
     
@@ -10,6 +10,7 @@ import os
 import tempfile
 import subprocess
 import time
+import threading
 import traceback
 from logging_config import get_logger, EnhancedLogger
 
@@ -746,13 +747,17 @@ $body$
 
                 # Run pandoc to convert markdown to HTML
                 try:
+                    # Serve MathJax from the shared profile when a local copy is bundled
+                    from web_profile import get_vendor_url
+                    mathjax_url = get_vendor_url('resources/mathjax/es5/tex-mml-chtml.js', 'resources/mathjax/tex-mml-chtml.js')
+
                     pandoc_cmd = [
                         r'C:\Users\joshd\AppData\Local\Pandoc\pandoc.exe',
                         md_path,
                         '-o', html_file_name,
                         '--standalone',
                         '--css=' + css_file_name,
-                        '--mathjax',
+                        f'--mathjax={mathjax_url}' if mathjax_url else '--mathjax',
                         '-f', 'markdown+fenced_divs+pipe_tables+backtick_code_blocks',
                         '-t', 'html5'
                     ]
@@ -990,4 +995,91 @@ $body$
             EnhancedLogger.log_exception(logger, e)
             EnhancedLogger.log_function_exit(logger, "run_process_with_timeout",
                                            f"Error: {str(e)}")
-            return None, None, str(e), -3
\ No newline at end of file
+            return None, None, str(e), -3
+
+    @staticmethod
+    def run_process_with_input_stream(command, chunks, timeout=600, encoding='utf-8'):
+        """
+        Run a command, writing text chunks to its stdin as they are produced
+
+        The chunks can come from a generator such as
+        ProcessorRegistry.process_stream, so the whole input never has to be
+        held in memory. stdout and stderr are drained in background threads
+        so a full pipe cannot block the writer.
+
+        Args:
+            command: Command line as a list
+            chunks: Iterable of text chunks
+            timeout: Seconds the whole run may take
+            encoding: Encoding of the text written to stdin
+
+        Returns:
+            Tuple of (stdout, stderr, error_message, returncode) like
+            run_process_with_timeout
+        """
+        logger.debug("Running process with streamed input")
+        EnhancedLogger.log_command(logger, command)
+
+        try:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+        except Exception as e:
+            logger.error(f"Error starting process: {str(e)}")
+            return None, None, str(e), -3
+
+        output = {'stdout': [], 'stderr': []}
+
+        def drain(stream, name):
+            for data in iter(lambda: stream.read(65536), b''):
+                output[name].append(data)
+
+        readers = [
+            threading.Thread(target=drain, args=(process.stdout, 'stdout'), daemon=True),
+            threading.Thread(target=drain, args=(process.stderr, 'stderr'), daemon=True)
+        ]
+        for reader in readers:
+            reader.start()
+
+        start_time = time.time()
+        error = None
+        try:
+            for chunk in chunks:
+                if time.time() - start_time > timeout:
+                    error = f"Process timed out after {timeout} seconds"
+                    break
+                process.stdin.write(chunk.encode(encoding))
+        except BrokenPipeError:
+            # The process exited early, its stderr says why
+            pass
+        except Exception as e:
+            error = f"Error producing process input: {str(e)}"
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        if error is None:
+            try:
+                process.wait(timeout=max(0, timeout - (time.time() - start_time)))
+            except subprocess.TimeoutExpired:
+                error = f"Process timed out after {timeout} seconds"
+
+        if error is not None:
+            logger.warning(error)
+            process.kill()
+            process.wait()
+
+        for reader in readers:
+            reader.join()
+
+        stdout = b''.join(output['stdout']).decode(encoding, errors='replace')
+        stderr = b''.join(output['stderr']).decode(encoding, errors='replace')
+        if stderr:
+            logger.warning(f"Process stderr: {stderr}")
+        logger.debug(f"Process completed with return code {process.returncode}")
+        return stdout, stderr, error, process.returncode if error is None else -1
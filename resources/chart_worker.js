@@ -0,0 +1,155 @@
+#!/usr/bin/env node
+/*
+ * Chart render worker
+ * -------------------
+ * Long-lived helper used by content_processors/chart_renderer.py.
+ * Starts one headless browser with a small pool of pages. Every page loads
+ * Plotly and Chart.js once and is then reused for all later batches.
+ *
+ * Usage: node chart_worker.js '<json list of script paths or URLs>' [pool size]
+ *
+ * Writes {"id": 0, "ready": true} (or "ready": false with an "error") once
+ * the pages are loaded, then reads one JSON request per line on stdin:
+ *   {"id": 1, "items": [{"type": "plotly", "code": "{...}", "format": "svg",
+ *                        "width": 800, "height": 400, "scale": 3.125}, ...]}
+ * and writes one JSON response per line on stdout:
+ *   {"id": 1, "results": [{"data": "data:image/png;base64,..."}, {"data": null, "error": "..."}]}
+ *
+ * Specs are parsed as JSON. Only Chart.js configs that are not JSON (because
+ * they contain callbacks) are evaluated, inside the page.
+ */
+
+const readline = require('readline');
+
+const scripts = JSON.parse(process.argv[2] || '[]');
+const poolSize = Math.max(1, parseInt(process.argv[3] || '2', 10));
+
+function send(message) {
+  process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+// Parses a spec in the worker, so JSON specs reach the page as plain data
+function parseSpec(item) {
+  try {
+    return JSON.parse(item.code);
+  } catch (e) {
+    if (item.type === 'plotly') {
+      throw new Error('Plotly specs must be JSON: ' + e.message);
+    }
+    // Chart.js configs with callbacks are evaluated in the page
+    return null;
+  }
+}
+
+// Runs inside the page
+async function renderInPage(item) {
+  const spec = item.spec || (new Function('return (' + item.code + ');'))();
+  const holder = document.createElement('div');
+  holder.style.width = item.width + 'px';
+  holder.style.height = item.height + 'px';
+  document.body.appendChild(holder);
+
+  try {
+    if (item.type === 'plotly') {
+      const layout = Object.assign({}, spec.layout || {}, { width: item.width, height: item.height });
+      const config = Object.assign({}, spec.config || {}, { staticPlot: true });
+      await Plotly.newPlot(holder, spec.data || [], layout, config);
+      return await Plotly.toImage(holder, {
+        format: item.format,
+        width: item.width,
+        height: item.height,
+        scale: item.format === 'svg' ? 1 : item.scale
+      });
+    }
+
+    const canvas = document.createElement('canvas');
+    canvas.style.width = item.width + 'px';
+    canvas.style.height = item.height + 'px';
+    holder.appendChild(canvas);
+    const options = Object.assign({}, spec.options || {}, {
+      animation: false,
+      responsive: false,
+      devicePixelRatio: item.scale
+    });
+    const chart = new Chart(canvas, Object.assign({}, spec, { options: options }));
+    const data = canvas.toDataURL('image/png');
+    chart.destroy();
+    return data;
+  } finally {
+    if (item.type === 'plotly' && window.Plotly) {
+      Plotly.purge(holder);
+    }
+    holder.remove();
+  }
+}
+
+async function openPage(browser) {
+  const page = await browser.newPage();
+  await page.setContent('<!DOCTYPE html><html><head><meta charset="utf-8"></head><body style="margin:0;background:#fff"></body></html>');
+  for (const script of scripts) {
+    if (/^https?:/.test(script)) {
+      await page.addScriptTag({ url: script });
+    } else {
+      await page.addScriptTag({ path: script });
+    }
+  }
+  return page;
+}
+
+async function renderOnPage(page, items) {
+  const results = [];
+  for (const item of items) {
+    try {
+      const spec = parseSpec(item);
+      const pageItem = Object.assign({}, item, { spec: spec, code: spec ? null : item.code });
+      results.push({ data: await page.evaluate(renderInPage, pageItem) });
+    } catch (e) {
+      results.push({ data: null, error: String((e && e.message) || e) });
+    }
+  }
+  return results;
+}
+
+async function main() {
+  let pages;
+  try {
+    const puppeteer = require('puppeteer');
+    const browser = await puppeteer.launch({ headless: true, args: ['--disable-gpu'] });
+    pages = [];
+    for (let i = 0; i < poolSize; i++) {
+      pages.push(await openPage(browser));
+    }
+    process.on('exit', () => browser.process() && browser.process().kill());
+  } catch (e) {
+    send({ id: 0, ready: false, error: String((e && e.message) || e) });
+    process.exit(1);
+  }
+  send({ id: 0, ready: true });
+
+  const rl = readline.createInterface({ input: process.stdin, terminal: false });
+  let queue = Promise.resolve();
+
+  rl.on('line', (line) => {
+    queue = queue.then(async () => {
+      let request;
+      try {
+        request = JSON.parse(line);
+      } catch (e) {
+        send({ id: null, error: String(e) });
+        return;
+      }
+
+      // Spread the batch over the page pool and keep the original order
+      const items = request.items || [];
+      const slices = pages.map((_, index) => items.filter((__, i) => i % pages.length === index));
+      const rendered = await Promise.all(slices.map((slice, index) => renderOnPage(pages[index], slice)));
+      const results = items.map((_, i) => rendered[i % pages.length][Math.floor(i / pages.length)]);
+
+      send({ id: request.id, results: results });
+    });
+  });
+
+  rl.on('close', () => queue.then(() => process.exit(0)));
+}
+
+main();
@@ -0,0 +1,44 @@
+#!/usr/bin/env node
+/*
+ * KaTeX render worker
+ * -------------------
+ * Long-lived helper used by content_processors/katex_renderer.py.
+ * Reads one JSON request per line on stdin:
+ *   {"id": 1, "items": [{"tex": "E=mc^2", "display": false}, ...]}
+ * and writes one JSON response per line on stdout:
+ *   {"id": 1, "results": [{"html": "<span class=\"katex\">...</span>"}, {"html": null, "error": "..."}]}
+ */
+
+const readline = require('readline');
+const katex = require(process.argv[2] || 'katex');
+
+const rl = readline.createInterface({ input: process.stdin, terminal: false });
+
+rl.on('line', (line) => {
+  let request;
+  try {
+    request = JSON.parse(line);
+  } catch (e) {
+    process.stdout.write(JSON.stringify({ id: null, error: String(e) }) + '\n');
+    return;
+  }
+
+  const results = (request.items || []).map((item) => {
+    try {
+      return {
+        html: katex.renderToString(item.tex, {
+          displayMode: !!item.display,
+          output: 'htmlAndMathml',
+          throwOnError: true,
+          strict: 'ignore'
+        })
+      };
+    } catch (e) {
+      return { html: null, error: String((e && e.message) || e) };
+    }
+  });
+
+  process.stdout.write(JSON.stringify({ id: request.id, results: results }) + '\n');
+});
+
+rl.on('close', () => process.exit(0));
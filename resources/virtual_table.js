@@ -0,0 +1,108 @@
+/*
+ * Virtualized tables for the preview
+ *
+ * Large tables are emitted as a .virtual-table container holding the first
+ * rows as HTML and the whole body as column data in a JSON script element.
+ * Only the rows in view (plus some overscan) are kept in the DOM; spacer
+ * rows stand in for the rest so the scrollbar covers the whole table.
+ */
+(function () {
+    'use strict';
+
+    var OVERSCAN = 30;
+    var DEFAULT_ROW_HEIGHT = 33;
+
+    function spacer(columnCount, height) {
+        var row = document.createElement('tr');
+        row.className = 'virtual-table-spacer';
+        var cell = document.createElement('td');
+        cell.colSpan = columnCount;
+        cell.style.height = height + 'px';
+        row.appendChild(cell);
+        return row;
+    }
+
+    function initTable(container) {
+        if (container.getAttribute('data-virtual-ready')) {
+            return;
+        }
+        container.setAttribute('data-virtual-ready', 'true');
+
+        var data = JSON.parse(container.querySelector('script.virtual-table-data').textContent);
+        var columns = data.columns;
+        var alignments = data.alignments || [];
+        var rowCount = columns.length ? columns[0].length : 0;
+        var htmlCells = container.getAttribute('data-html') === 'true';
+        var body = container.querySelector('tbody');
+        var head = container.querySelector('thead');
+
+        var firstRow = body.rows[0];
+        var rowHeight = (firstRow && firstRow.getBoundingClientRect().height) || DEFAULT_ROW_HEIGHT;
+        var rendered = [-1, -1];
+
+        function render() {
+            var headHeight = head ? head.getBoundingClientRect().height : 0;
+            var offset = Math.max(0, container.scrollTop - headHeight);
+            var visible = Math.ceil(container.clientHeight / rowHeight);
+            var start = Math.max(0, Math.floor(offset / rowHeight) - OVERSCAN);
+            var end = Math.min(rowCount, start + visible + 2 * OVERSCAN);
+            if (start === rendered[0] && end === rendered[1]) {
+                return;
+            }
+            rendered = [start, end];
+
+            var fragment = document.createDocumentFragment();
+            if (start > 0) {
+                fragment.appendChild(spacer(columns.length, start * rowHeight));
+            }
+            for (var row = start; row < end; row++) {
+                var tr = document.createElement('tr');
+                for (var column = 0; column < columns.length; column++) {
+                    var td = document.createElement('td');
+                    var alignment = alignments[column];
+                    if (alignment && alignment !== 'left') {
+                        td.style.textAlign = alignment;
+                    }
+                    if (htmlCells) {
+                        td.innerHTML = columns[column][row];
+                    } else {
+                        td.textContent = columns[column][row];
+                    }
+                    tr.appendChild(td);
+                }
+                fragment.appendChild(tr);
+            }
+            if (end < rowCount) {
+                fragment.appendChild(spacer(columns.length, (rowCount - end) * rowHeight));
+            }
+
+            body.textContent = '';
+            body.appendChild(fragment);
+        }
+
+        var pending = false;
+        container.addEventListener('scroll', function () {
+            if (!pending) {
+                pending = true;
+                window.requestAnimationFrame(function () {
+                    pending = false;
+                    render();
+                });
+            }
+        });
+        render();
+    }
+
+    function initAll() {
+        var containers = document.querySelectorAll('.virtual-table');
+        for (var i = 0; i < containers.length; i++) {
+            initTable(containers[i]);
+        }
+    }
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', initAll);
+    } else {
+        initAll();
+    }
+})();
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for the linear-time block lexer
+"""
+
+import re
+import time
+import random
+
+from content_processors.block_lexer import (
+    scan_blocks, ScanState, DelimitedRule, FencedBlockRule, InlineMathRule, MarkdownImageRule, HtmlImageRule, PipeTableRule
+)
+from content_processors.processor_registry import ProcessorRegistry
+from content_processors.math_processor import MathContentProcessor
+from content_processors.code_processor import CodeBlockProcessor
+from content_processors.image_processor import ImageContentProcessor
+from content_processors.media_processor import MediaContentProcessor
+from content_processors.enhanced_element_processor import EnhancedElementProcessor
+from benchmark_content_processing import ADVERSARIAL_CASES
+
+registry = ProcessorRegistry()
+
+# Generous bound, the linear scan needs well under a second per MB
+SECONDS_PER_MB = 5.0
+
+
+class Collector:
+    """Accepts every match and records its groups"""
+
+    def __init__(self, groups):
+        self.groups = groups
+
+    def build_metadata(self, block_type, match):
+        return {'groups': [match.group(index) for index in range(1, self.groups + 1)]}
+
+
+def lexed(text, rule, groups):
+    return [(block['start'], block['end'], block['metadata']['groups'])
+            for block in scan_blocks(text, [(Collector(groups), rule)])]
+
+
+def backtracked(text, pattern, flags, groups):
+    return [(match.start(), match.end(), [match.group(index) for index in range(1, groups + 1)])
+            for match in re.finditer(pattern, text, flags)]
+
+
+def random_texts(alphabet, count, seed):
+    """Random short texts over tokens that almost form blocks"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+
+
+def test_rules_match_the_old_patterns_outside_fences():
+    """Without fences, the rules find the blocks the backtracking patterns found"""
+    cases = [
+        (DelimitedRule('display', '$$', '$$'), r'\$\$(.*?)\$\$', re.DOTALL, 1, ['$$', '$', 'a', ' ', '\n']),
+        (InlineMathRule('inline'), r'(?<!\$)\$(?!\$)(.*?)(?<!\$)\$(?!\$)', 0, 1, ['$$', '$', 'a', ' ', '\n']),
+        (DelimitedRule('video', '<video', '</video>', space_after_opening=True), r'<video\s+.*?</video>', re.DOTALL, 0,
+         ['<video', '</video>', ' ', '\n', 'a', '>', '<']),
+        (MarkdownImageRule('markdown_image'), r'!\[(.*?)\]\((.*?)(?:\s+"(.*?)")?\)', 0, 3,
+         ['![', '](', ']', '(', ')', '"', ' ', 'a']),
+        (HtmlImageRule('html_image'), r'<img\s+[^>]*src="([^"]*)"[^>]*>', 0, 1,
+         ['<img ', 'src="', '"', '>', 'a', ' ', '\n']),
+        (PipeTableRule('table'), r'(?m)(^\|[^\n]+\|\n\|[-:| ]+\|\n(?:\|[^\n]+\|\n)+)', 0, 1,
+         ['|', '|-|', '| a |', '-', ':', ' ', 'a', '\n', '\n|']),
+    ]
+    for rule, pattern, flags, groups, alphabet in cases:
+        for text in random_texts(alphabet, 3000, seed=rule.block_type):
+            assert lexed(text, rule, groups) == backtracked(text, pattern, flags, groups), (rule.block_type, text)
+
+
+def test_unclosed_fence_runs_to_end():
+    """A fence without a closing line ends with the document, as in CommonMark"""
+    text = "Intro $a$\n\n```python\nx = '$b$'\n\n$$c$$\n"
+    blocks = registry.scan_content(text, [MathContentProcessor(), CodeBlockProcessor()])
+    assert [(block['processor'].name, block['start'], block['end']) for block in blocks] == [
+        ('MathContentProcessor', 6, 9),
+        ('CodeBlockProcessor', 11, len(text)),
+    ]
+    assert blocks[1]['metadata']['code'] == "x = '$b$'\n\n$$c$$\n"
+
+
+def test_nothing_is_detected_inside_fences():
+    """Fences hide their content, and delimited blocks do not close inside them"""
+    text = "<video src=a>\n```\n</video> $x$ ![a](b)\n```\n</video>\n"
+    processors = [MathContentProcessor(), ImageContentProcessor(), MediaContentProcessor()]
+    blocks = registry.scan_content(text, processors)
+    assert blocks == []
+
+    # A fence no processor claims is skipped as a whole
+    fenced = "~~~~\n$x$\n~~~\n~~~~\n$y$"
+    blocks = registry.scan_content(fenced, processors)
+    assert [fenced[block['start']:block['end']] for block in blocks] == ['$y$']
+
+
+def test_fences_are_line_based():
+    """Fences open at the start of a line, indented at most three spaces"""
+    rule = FencedBlockRule('code')
+    text = "see ```js``` here\n    ```\nindented\n   ```js\nbody\n   ````\n``` x\n"
+    assert lexed(text, rule, 3) == [
+        (text.index('```js\n'), text.index('````') + 4, ['js', 'body', 'js']),
+        (text.index('``` x'), len(text), ['x', '', 'x']),
+    ]
+
+    # Backtick fences may not have backticks in their info string, and the closer is at least as long
+    text = "```a`b\n````\nx\n```\n````\n"
+    assert lexed(text, rule, 2) == [(text.index('````'), len(text) - 1, ['', 'x\n```'])]
+
+
+def test_table_rows_start_lines():
+    """Tables start at the beginning of a line"""
+    processor = EnhancedElementProcessor()
+    assert processor.detect("x | A | B |\n|---|---|\n| 1 | 2 |\n") == []
+    assert len(processor.detect("| A | B |\n|---|---|\n| 1 | 2 |\n")) == 1
+
+
+def test_adversarial_inputs_take_linear_time():
+    """Pathological inputs are scanned within a bound per MB"""
+    processors = registry.get_all_processors()
+    size = 512 * 1024
+    for name, build in ADVERSARIAL_CASES.items():
+        content = build(size)
+        start = time.perf_counter()
+        registry.scan_content(content, processors)
+        elapsed = time.perf_counter() - start
+        assert elapsed / (len(content) / (1024 * 1024)) < SECONDS_PER_MB, name
+
+
+def test_fences_do_not_repeat_candidate_searches(monkeypatch):
+    """Code-dense documents find every block, searching for the next candidate once, not at every fence"""
+    content = ADVERSARIAL_CASES['code_dense'](256 * 1024)
+    searches = []
+    original = ScanState.search
+    def counted(self, key, position, find):
+        if key[0] == 'candidates':
+            find = lambda text, start, find=find: searches.append(start) or find(text, start)
+        return original(self, key, position, find)
+    monkeypatch.setattr(ScanState, 'search', counted)
+
+    blocks = registry.scan_content(content, registry.get_all_processors())
+    assert len(blocks) == content.count('```python') + 1
+    assert blocks[-1]['metadata'] == {'code': 'a', 'type': 'inline'}
+    # One search finds the math at the end, one more finds nothing after it
+    assert len(searches) == 2
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for static Plotly/Chart.js rendering in exports
+"""
+
+import os
+
+from content_processors.chart_renderer import ChartRenderService
+from content_processors.visualization_processor import VisualizationProcessor
+
+PLOTLY_CODE = '{"data": [{"x": [1, 2, 3], "y": [2, 1, 3], "type": "scatter"}]}'
+CHARTJS_CODE = '{"type": "bar", "data": {"labels": ["a", "b"], "datasets": [{"data": [1, 2]}]}}'
+
+
+def test_cache_path_depends_on_spec_format_and_dpi(tmp_path):
+    """Every spec/format/size/DPI combination gets its own cache entry"""
+    service = ChartRenderService(cache_dir=str(tmp_path))
+    base = service.get_cache_path('plotly', PLOTLY_CODE, 'svg', 300, 800, 400)
+
+    assert base.endswith('.svg')
+    assert base == service.get_cache_path('plotly', PLOTLY_CODE, 'svg', 300, 800, 400)
+    assert base != service.get_cache_path('plotly', PLOTLY_CODE, 'svg', 150, 800, 400)
+    assert base != service.get_cache_path('plotly', PLOTLY_CODE + ' ', 'svg', 300, 800, 400)
+
+    # Chart.js renders on a canvas and is always stored as PNG
+    assert service.get_cache_path('chartjs', CHARTJS_CODE, 'svg', 300, 800, 400).endswith('.png')
+
+
+def test_cached_charts_are_used_without_a_browser(tmp_path):
+    """Cached images are returned without starting the worker"""
+    service = ChartRenderService(cache_dir=str(tmp_path))
+    path = service.get_cache_path('plotly', PLOTLY_CODE, 'png', 300, 800, 400)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+
+    processor = VisualizationProcessor()
+    processor.chart_service = service
+    blocks = [metadata for _, _, metadata in processor.detect(f"```plotly\n{PLOTLY_CODE}\n```\n")]
+    processor.prepare_blocks(blocks, 'pdf')
+
+    exported = processor.process_for_export("", blocks[0], 'pdf')
+    assert exported.strip() == f"![Plotly Visualization]({path.replace(os.sep, '/')})"
+    assert service._process is None
+
+
+def test_export_falls_back_to_placeholder():
+    """Without a renderer the export keeps the previous placeholder"""
+    processor = VisualizationProcessor({'rasterize_charts': False})
+    exported = processor.process_for_export("", {'type': 'chartjs', 'code': CHARTJS_CODE}, 'docx')
+    assert exported == "\n\n[Chart.js Visualization]\n\n"
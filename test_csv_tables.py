@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for CSV tables from inline blocks and external files
+"""
+
+import os
+
+from content_processors.processor_registry import ProcessorRegistry
+from content_processors.enhanced_element_processor import EnhancedElementProcessor
+from content_processors.table_renderer import iter_csv_rows, render_pipe_table, render_table
+
+
+def make_registry(monkeypatch, config=None):
+    """Create a registry separate from the shared singleton"""
+    monkeypatch.setattr(ProcessorRegistry, '_instance', None)
+    registry = ProcessorRegistry()
+    registry.register_processor(EnhancedElementProcessor, priority=5)
+    if config:
+        registry.configure(config)
+    return registry
+
+
+def test_rows_are_read_from_files(tmp_path):
+    """External files are mapped and parsed like inline data"""
+    path = tmp_path / "data.csv"
+    path.write_bytes(b'\xef\xbb\xbfName;Note\r\n\r\nAda;"two\nlines"\r\n')
+    assert list(iter_csv_rows(path=str(path), delimiter=';')) == [['Name', 'Note'], ['Ada', 'two\nlines']]
+    assert list(iter_csv_rows("Name;Note\n\nAda;x", delimiter=';')) == [['Name', 'Note'], ['Ada', 'x']]
+
+    path.write_bytes(b'')
+    assert list(iter_csv_rows(path=str(path))) == []
+
+
+def test_preview_uses_shared_styles(monkeypatch):
+    """Tables carry class names only, the styles come once per document"""
+    registry = make_registry(monkeypatch)
+    content = "```csv\nName,Value\n<b>,1\n```\n\n| A |\n|---|\n| x |\n\n```csv\nA\n1\n```\n"
+    output = registry.process_content(content)
+
+    assert '<style>' not in output
+    assert output.count('<table class="csv-table">') == 2
+    assert '<td>&lt;b&gt;</td>' in output
+    assert 'enhanced-table' in output
+    styles = ''.join(registry.get_required_styles())
+    assert '.csv-table-container' in styles and 'table-header-group' in styles
+
+
+def test_row_limits(monkeypatch):
+    """Rows past the limit are left out with a note"""
+    registry = make_registry(monkeypatch, {'csv_preview_max_rows': 2})
+    rows = ''.join(f"{index},x\n" for index in range(10))
+    output = registry.process_content(f"```csv\n{rows}```\n")
+    assert output.count('<tr>') == 3
+    assert 'Only the first 2 rows are shown.' in output
+
+    output = registry.process_content(f"```csv max-rows=1 header=no\n{rows}```\n")
+    assert '<thead>' not in output
+    assert output.count('<tr>') == 1
+
+    table = render_pipe_table([['a', 'b|c'], ['1'], ['2', '3']], max_rows=1)
+    assert table == "| a | b\\|c |\n|---|---|\n| 1 |  |\n\n*Only the first 1 rows are shown.*"
+
+
+def test_export_formats(monkeypatch):
+    """HTML and Word get raw tables, other formats a pipe table"""
+    rows = [['Name', 'Code'], ['x', '````']]
+    html = render_table(rows, 'html')
+    assert html.startswith('`````{=html}\n<div class="csv-table-container">')
+    assert html.endswith('</div>\n`````')
+
+    docx = render_table(rows, 'docx')
+    assert docx.startswith('`````{=openxml}\n<w:tbl>')
+    assert docx.count('<w:tblHeader/>') == 1
+
+    registry = make_registry(monkeypatch)
+    assert registry.process_content("```csv\nA,B\n1,2\n```\n", 'pdf') == "| A | B |\n|---|---|\n| 1 | 2 |\n"
+
+
+def test_external_files_invalidate_cache(monkeypatch, tmp_path):
+    """Blocks that reference a CSV file are reprocessed when it changes"""
+    path = tmp_path / "sales.csv"
+    path.write_text("Region,Total\nNorth,10\n")
+    registry = make_registry(monkeypatch, {'asset_paths': {'sales.csv': str(path)}})
+    content = '```csv src="sales.csv"\n```\n'
+
+    assert '<td>North</td>' in registry.process_content(content)
+    path.write_text("Region,Total\nSouth,20\n")
+    os.utime(path, ns=(1, 1))
+    assert '<td>South</td>' in registry.process_content(content)
+
+    missing = registry.process_content('```csv src=missing.csv\n```\n')
+    assert 'csv-error' in missing
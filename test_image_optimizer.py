@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for the image derivatives used by the preview and exports
+"""
+
+import os
+
+from PIL import Image
+
+from content_processors.image_optimizer import ImageOptimizer
+from content_processors.image_processor import ImageContentProcessor
+
+
+def make_image(path, size, image_format='PNG'):
+    Image.new('RGB', size, (200, 40, 40)).save(path, image_format)
+    return str(path)
+
+
+def make_processor(tmp_path, config=None):
+    processor = ImageContentProcessor(config)
+    processor.image_optimizer = ImageOptimizer(cache_dir=str(tmp_path / 'cache'), max_workers=4)
+    return processor
+
+
+def test_derivatives_are_cached_by_content_and_width(tmp_path):
+    """Large images are downscaled once per width, small ones are used as they are"""
+    optimizer = ImageOptimizer(cache_dir=str(tmp_path / 'cache'), max_workers=4)
+    photo = make_image(tmp_path / 'photo.jpg', (1200, 800), 'JPEG')
+    icon = make_image(tmp_path / 'icon.png', (32, 32))
+
+    results = optimizer.optimize_batch([photo, icon, photo], 300)
+    assert results[icon] is None
+    with Image.open(results[photo]) as image:
+        assert (image.format, image.size) == ('JPEG', (300, 200))
+
+    # Copies of the same image share the derivative
+    copy = tmp_path / 'copy.jpg'
+    copy.write_bytes(open(photo, 'rb').read())
+    assert optimizer.optimize(str(copy), 300) == results[photo]
+    assert optimizer.optimize(photo, 600) != results[photo]
+    assert len(os.listdir(tmp_path / 'cache')) == 2
+
+    assert optimizer.optimize(str(tmp_path / 'missing.png'), 300) is None
+    assert optimizer.optimize(str(tmp_path / 'figure.svg'), 300) is None
+
+
+def test_exif_orientation_is_applied(tmp_path):
+    """Photos stored sideways are turned upright before they are scaled"""
+    optimizer = ImageOptimizer(cache_dir=str(tmp_path / 'cache'))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    path = tmp_path / 'portrait.jpg'
+    Image.new('RGB', (800, 400)).save(path, 'JPEG', exif=exif)
+
+    with Image.open(optimizer.optimize(str(path), 200)) as image:
+        assert image.size == (200, 400)
+
+
+def test_preview_and_export_use_derivatives(tmp_path):
+    """The preview gets thumbnails, exports that embed images get the export DPI"""
+    processor = make_processor(tmp_path, {'image_preview_width': 100, 'image_export_dpi': 50, 'image_export_width': 4})
+    photo = make_image(tmp_path / 'photo.png', (1000, 500))
+    blocks = [metadata for _, _, metadata in processor.detect(f"![Photo]({photo})")]
+
+    processor.prepare_blocks(blocks, 'preview')
+    preview = processor.process_for_preview('', blocks[0])
+    assert preview.startswith('<img src="file://') and 'alt="Photo"' in preview
+
+    processor.prepare_blocks(blocks, 'pdf')
+    exported = processor.process_for_export('', blocks[0], 'pdf')
+    with Image.open(exported[len('![Photo]('):-1]) as image:
+        assert image.size == (200, 100)
+
+    # HTML exports link the original, and optimization can be turned off
+    assert f'src="{photo}"' in processor.process_for_export('', blocks[0], 'html')
+    processor.configure({'optimize_images': False})
+    assert processor.process_for_export('', blocks[0], 'docx') == f'![Photo]({photo})'
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for offline KaTeX math pre-rendering
+"""
+
+import pytest
+
+from content_processors.katex_renderer import get_katex_service
+from content_processors.math_processor import MathContentProcessor
+from mdz_renderer import MDZRenderer
+
+service = get_katex_service()
+requires_katex = pytest.mark.skipif(not service.is_available(), reason="Node.js or bundled KaTeX not available")
+
+
+@requires_katex
+def test_render_batch_caches_expressions():
+    """Expressions are rendered once and then served from the cache"""
+    results = service.render_batch([("E = mc^2", False), ("\\frac{a}{b}", True)])
+    assert 'class="katex"' in results[("E = mc^2", False)]
+    assert "katex-display" in results[("\\frac{a}{b}", True)]
+    assert "<math" in results[("E = mc^2", False)]
+
+    request_id = service._request_id
+    service.render_batch([("E = mc^2", False)])
+    assert service._request_id == request_id
+
+
+@requires_katex
+def test_invalid_expression_returns_none():
+    """Expressions KaTeX cannot parse fall back to client-side delimiters"""
+    assert service.render("\\frac{", False) is None
+
+    processor = MathContentProcessor({'prerender_math': True})
+    processed = processor.process_for_preview("$\\frac{$", {'code': "\\frac{", 'type': 'inline'})
+    assert processed == "\\\\(\\frac{\\\\)"
+
+
+@requires_katex
+def test_math_processor_prerenders_without_scripts():
+    """Pre-rendered math needs only the local stylesheet"""
+    processor = MathContentProcessor({'prerender_math': True})
+    content = "Inline $a^2 + b^2$ and display $$\\sum_{i=1}^n i$$"
+    blocks = [metadata for _, _, metadata in processor.detect(content)]
+    processor.prepare_blocks(blocks, 'preview')
+
+    processed = processor.process_for_preview("$a^2 + b^2$", {'code': "a^2 + b^2", 'type': 'inline'})
+    assert 'class="katex"' in processed
+
+    exported = processor.process_for_export("$a^2 + b^2$", {'code': "a^2 + b^2", 'type': 'inline'}, 'epub')
+    assert exported == processed
+
+    scripts = processor.get_required_scripts()
+    assert not any('<script' in script for script in scripts)
+    assert any('katex.min.css' in script for script in scripts)
+
+
+def test_math_processor_default_is_unchanged():
+    """Without prerender_math the processor keeps client-side delimiters"""
+    processor = MathContentProcessor()
+    processed = processor.process_for_preview("$x$", {'code': "x", 'type': 'inline'})
+    assert processed == "\\\\(x\\\\)"
+
+
+@requires_katex
+def test_mdz_renderer_prerender_math():
+    """MDZRenderer output contains static math and no math JavaScript"""
+    renderer = MDZRenderer(prerender_math=True)
+    html = renderer.render_to_html("# Title\n\nInline $E = mc^2$.\n\n$$\n\\int_0^1 x\\,dx\n$$\n")
+    assert 'class="katex"' in html
+    assert "katex-display" in html
+    assert "MDZMATHPLACEHOLDER" not in html
+    assert "MathJax" not in html
+    assert "katex.min.js" not in html
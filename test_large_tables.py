@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for columnar pipe tables, virtualized previews and paged exports
+"""
+
+import json
+import re
+
+from content_processors import enhanced_element_processor
+from content_processors.processor_registry import ProcessorRegistry
+from content_processors.enhanced_element_processor import EnhancedElementProcessor
+from content_processors.table_renderer import ColumnarTable, render_paged_pipe_tables
+
+TABLE = "| Name | Total |\n|:---|---:|\n| a \\| b | 1 |\n| c |\n| d | 3 | extra |\n"
+
+
+def make_registry(monkeypatch, config=None):
+    """Create a registry separate from the shared singleton"""
+    monkeypatch.setattr(ProcessorRegistry, '_instance', None)
+    registry = ProcessorRegistry()
+    registry.register_processor(EnhancedElementProcessor, priority=5)
+    if config:
+        registry.configure(config)
+    return registry
+
+
+def generated_table(rows):
+    return "| Id | Value |\n|---|---:|\n" + ''.join(f"| {index} | ${index}$ |\n" for index in range(rows))
+
+
+def test_pipe_tables_are_parsed_into_columns():
+    """Rows are padded or cut to the header and escaped pipes stay in their cell"""
+    table = ColumnarTable.from_pipe_table(TABLE)
+    assert table.header == ['Name', 'Total']
+    assert table.alignments == ['left', 'right']
+    assert table.columns == [['a | b', 'c', 'd'], ['1', '', '3']]
+    assert list(table.iter_rows(1, 2)) == [['Name', 'Total'], ('c', '')]
+    assert ColumnarTable.from_pipe_table("| A |\n") is None
+
+
+def test_small_tables_render_in_place(monkeypatch):
+    """Tables below the threshold are laid out in full with their alignments"""
+    registry = make_registry(monkeypatch)
+    output = registry.process_content(TABLE)
+    assert output.count('<tr>') == 4
+    assert '<td style="text-align: right">1</td>' in output
+    assert 'virtual-table' not in output
+
+
+def test_large_tables_are_virtualized(monkeypatch):
+    """The preview gets the first rows as HTML and the columns as JSON"""
+    registry = make_registry(monkeypatch, {'large_table_rows': 100})
+    output = registry.process_content(generated_table(500))
+
+    assert output.startswith('<div class="virtual-table" data-rows="500" data-html="true">')
+    assert output.count('<tr>') == 51
+    data = json.loads(re.search(r'<script type="application/json" class="virtual-table-data">(.*?)</script>', output).group(1))
+    assert data['alignments'] == ['left', 'right']
+    assert data['columns'][0][499] == '499'
+    assert data['columns'][1][7] == '\\(7\\)'
+
+    processor = registry.get_processor('EnhancedElementProcessor')
+    monkeypatch.setattr(enhanced_element_processor, 'find_mermaid_cli', lambda: ('mmdc', None))
+    assert any('virtual-table-data' in script for script in processor.get_required_scripts())
+
+
+def test_large_tables_are_paged_for_html_export(monkeypatch):
+    """HTML exports split large tables into tables that each repeat the header"""
+    registry = make_registry(monkeypatch, {'large_table_rows': 100, 'table_page_rows': 40})
+    content = generated_table(100)
+
+    output = registry.process_content(content, 'html')
+    assert output.count('| Id | Value |\n|---|---:|\n') == 3
+    assert '| 99 | $99$ |' in output
+    assert registry.process_content(content, 'pdf') == content
+
+    table = ColumnarTable.from_pipe_table(TABLE)
+    assert render_paged_pipe_tables(table, 2) == (
+        "| Name | Total |\n|---|---:|\n| a \\| b | 1 |\n| c |  |\n\n"
+        "| Name | Total |\n|---|---:|\n| d | 3 |"
+    )
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for content-addressed MDZ assets
+"""
+
+import os
+import json
+import hashlib
+
+import pytest
+
+from mdz_assets import AssetStore, blob_path, hash_file, normalize_asset_name
+
+
+def test_store_keeps_one_copy_per_content(tmp_path):
+    """Blobs are addressed by their hash and written once"""
+    store = AssetStore(str(tmp_path / "store"))
+    (tmp_path / "logo.png").write_bytes(b"logo")
+
+    sha256 = store.add_file(str(tmp_path / "logo.png"))
+    assert sha256 == hashlib.sha256(b"logo").hexdigest() == hash_file(str(tmp_path / "logo.png"))
+    assert store.add_bytes(b"logo") == sha256
+    assert sha256 in store
+    with store.open(sha256) as f:
+        assert f.read() == b"logo"
+    assert os.listdir(tmp_path / "store" / sha256[:2]) == [sha256]
+
+    with pytest.raises(KeyError):
+        store.open(hashlib.sha256(b"missing").hexdigest())
+
+    assert blob_path(sha256, "images/Logo.PNG") == f"assets/{sha256}.png"
+    assert normalize_asset_name(".\\images\\logo.png") == "images/logo.png"
+
+
+def test_exported_assets_are_stored_by_hash(tmp_path):
+    """Same-named assets no longer collide, identical ones are stored once, shared ones stay in the store"""
+    pytest.importorskip("PyQt6")
+    from mdz_export import create_mdz_file, extract_mdz_file
+
+    for directory, content in (("a", b"first"), ("b", b"second")):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / "logo.png").write_bytes(content)
+    (tmp_path / "copy.png").write_bytes(b"first")
+    (tmp_path / "brand.svg").write_text("<svg/>")
+    (tmp_path / "doc.md").write_text("# Report\n")
+
+    assets = [str(tmp_path / "a" / "logo.png"), str(tmp_path / "b" / "logo.png"), str(tmp_path / "copy.png")]
+    assert create_mdz_file(str(tmp_path / "doc.md"), str(tmp_path / "doc.mdz"), assets,
+                           shared_assets=[str(tmp_path / "brand.svg")], asset_store=str(tmp_path / "store"))
+
+    extract_mdz_file(str(tmp_path / "doc.mdz"), str(tmp_path / "out"), asset_store=str(tmp_path / "store"))
+    manifest = json.loads((tmp_path / "out" / "manifest.json").read_text())
+    mapping = manifest["assets"]
+    assert mapping["a/logo.png"]["sha256"] != mapping["b/logo.png"]["sha256"]
+    assert mapping["copy.png"] == mapping["a/logo.png"]
+    assert mapping["brand.svg"]["store"]
+    assert len([entry for entry in manifest["files"] if entry["path"].startswith("assets/")]) == 2
+    assert (tmp_path / "out" / mapping["b/logo.png"]["path"]).read_bytes() == b"second"
+    # Every asset is also where the document refers to it
+    assert (tmp_path / "out" / "a" / "logo.png").read_bytes() == b"first"
+    assert (tmp_path / "out" / "b" / "logo.png").read_bytes() == b"second"
+    assert (tmp_path / "out" / "copy.png").read_bytes() == b"first"
+    assert (tmp_path / "out" / "brand.svg").read_text() == "<svg/>"
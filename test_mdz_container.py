@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Tests for indexed (version 2) MDZ bundles
+"""
+
+import os
+import hashlib
+
+import pytest
+
+import mdz_dictionary
+from mdz_bundle import MDZBundle
+from mdz_container import IndexedMDZReader, IndexedMDZWriter, LazyContent, is_indexed_bundle, sniff_format
+from mdz_stream import MDZStreamWriter, MDZContainer, METHOD_STANDARD, METHOD_SECURE, AUTO_LEVEL, choose_level
+from unified_mdz import UnifiedMDZ, CompressionMethod, get_mdz_info
+
+
+def make_bundle(path, format_version=2):
+    bundle = MDZBundle(format_version=format_version)
+    bundle.create_from_markdown("---\ntitle: Report\n---\n# Report\n", {"author": "Ada"})
+    bundle.content["images/photo.jpg"] = os.urandom(300 * 1024)
+    for index in range(20):
+        bundle.content[f"images/icon_{index}.png"] = os.urandom(1000)
+    bundle.save(str(path))
+    return bundle
+
+
+def count_frame_reads(monkeypatch):
+    reads = []
+    original = IndexedMDZReader._decompress_frame
+    monkeypatch.setattr(IndexedMDZReader, '_decompress_frame',
+                        lambda self, number: reads.append(number) or original(self, number))
+    return reads
+
+
+def test_index_records_entries(tmp_path):
+    """Large files get their own frame, small ones share one"""
+    bundle = make_bundle(tmp_path / "report.mdz")
+    reader = IndexedMDZReader(str(tmp_path / "report.mdz"))
+
+    photo = reader.get_entry("images/photo.jpg")
+    assert photo["media_type"] == "image/jpeg"
+    assert photo["sha256"] == hashlib.sha256(bundle.content["images/photo.jpg"]).hexdigest()
+    assert reader.get_entry("images/")["frame"] is None
+    assert reader.get_entry("images/icon_0.png")["frame"] == reader.get_entry("images/icon_19.png")["frame"]
+    assert reader.read("images/icon_7.png") == bundle.content["images/icon_7.png"]
+    assert len(reader.frames) == 4
+
+
+def test_opening_reads_only_what_is_needed(tmp_path, monkeypatch):
+    """Loading decompresses the document and metadata, assets wait until they are used"""
+    photo = make_bundle(tmp_path / "report.mdz").content["images/photo.jpg"]
+    reads = count_frame_reads(monkeypatch)
+
+    loaded = MDZBundle()
+    loaded.load(str(tmp_path / "report.mdz"))
+    assert isinstance(loaded.content, LazyContent)
+    assert loaded.get_main_content() == "# Report\n"
+    assert loaded.get_metadata() == {"title": "Report", "author": "Ada"}
+    assert len(reads) == 2
+
+    path = loaded.get_asset_path("images/photo.jpg")
+    assert open(path, "rb").read() == photo
+    assert len(reads) == 3
+    assert loaded.get_asset_path("images/missing.png") is None
+    loaded.cleanup_temp()
+
+    info = get_mdz_info(str(tmp_path / "report.mdz"))
+    assert (info["format_version"], info["file_count"]) == (2, 23)
+    assert len(reads) == 5
+
+
+def test_changes_and_version_1_bundles(tmp_path):
+    """Edited bundles can be saved over themselves, version 1 bundles still load"""
+    make_bundle(tmp_path / "report.mdz")
+    bundle = UnifiedMDZ()
+    bundle.load(str(tmp_path / "report.mdz"))
+    bundle.add_file("notes.txt", "new")
+    del bundle.content["images/icon_3.png"]
+    bundle.save(str(tmp_path / "report.mdz"))
+
+    reloaded = UnifiedMDZ()
+    reloaded.load(str(tmp_path / "report.mdz"))
+    assert reloaded.content["notes.txt"] == "new"
+    assert "images/icon_3.png" not in reloaded.content
+    assert len(reloaded.content["images/photo.jpg"]) == 300 * 1024
+
+    make_bundle(tmp_path / "old.mdz", format_version=1)
+    assert not is_indexed_bundle(str(tmp_path / "old.mdz"))
+    old = UnifiedMDZ()
+    old.load(str(tmp_path / "old.mdz"))
+    assert old.get_main_content() == "# Report"
+    assert isinstance(old.content, dict)
+
+
+def test_assets_open_as_lazy_files(tmp_path, monkeypatch):
+    """Assets are read as files straight from the mapped bundle"""
+    video = os.urandom(3 * 1024 * 1024)
+    bundle = UnifiedMDZ()
+    bundle.create_from_markdown("# Clip\n")
+    bundle.add_file("media/clip.wav", video)
+    bundle.add_file("media/poster.png", b"poster")
+    bundle.save(str(tmp_path / "clip.mdz"))
+
+    loaded = UnifiedMDZ()
+    loaded.load(str(tmp_path / "clip.mdz"))
+    reads = count_frame_reads(monkeypatch)
+    with loaded.open_asset("media/clip.wav") as f:
+        f.seek(2 * 1024 * 1024)
+        assert f.read(16) == video[2 * 1024 * 1024:2 * 1024 * 1024 + 16]
+        f.seek(-4, os.SEEK_END)
+        assert f.read() == video[-4:]
+        f.seek(10)
+        assert f.read(5) == video[10:15]
+    # The large asset is streamed, never decompressed as a whole
+    assert reads == []
+
+    with loaded.open_asset("media/poster.png") as f:
+        assert f.read() == b"poster"
+
+    loaded.extract_to_directory(str(tmp_path / "out"))
+    assert (tmp_path / "out" / "media" / "clip.wav").read_bytes() == video
+    assert (tmp_path / "out" / "index.md").read_text() == "# Clip\n"
+
+    # The file can be replaced while the bundle is open
+    loaded.cleanup()
+    loaded.add_file("notes.txt", "saved over itself")
+    loaded.save(str(tmp_path / "clip.mdz"))
+    assert loaded.open_asset("media/clip.wav").read() == video
+
+
+def test_format_is_sniffed_without_decompressing(tmp_path, monkeypatch):
+    """Headers name the format, headerless files are told apart by their first bytes"""
+    cases = {
+        "indexed.mdz": (IndexedMDZWriter(), (2, METHOD_STANDARD, 16)),
+        "secure.mdz": (MDZStreamWriter(container=MDZContainer.ZIP, checksum_dictionary=True), (1, METHOD_SECURE, 16)),
+        "legacy.mdz": (MDZStreamWriter(header=False), (1, METHOD_STANDARD, 0)),
+        "legacy_secure.mdz": (MDZStreamWriter(container=MDZContainer.ZIP, checksum_dictionary=True, header=False),
+                              (1, METHOD_SECURE, 0)),
+        "legacy_indexed.mdz": (IndexedMDZWriter(header=False), (2, METHOD_STANDARD, 0)),
+    }
+    for name, (writer, expected) in cases.items():
+        writer.add_bytes("index.md", "# Sniffed\n" * 100)
+        writer.add_bytes("images/photo.png", os.urandom(200 * 1024))
+        writer.write(str(tmp_path / name))
+        bundle_format = sniff_format(str(tmp_path / name))
+        assert (bundle_format.version, bundle_format.method, bundle_format.header_size) == expected
+
+    # Loading dispatches on the format, there is no second attempt
+    monkeypatch.setattr(UnifiedMDZ, '_load_standard', lambda self, data: pytest.fail("standard loader used"))
+    for name in ("secure.mdz", "legacy_secure.mdz"):
+        bundle = UnifiedMDZ()
+        bundle.load(str(tmp_path / name))
+        assert bundle.compression_method == CompressionMethod.SECURE
+        assert bundle.get_main_content() == "# Sniffed\n" * 100
+
+    (tmp_path / "notes.txt").write_text("not a bundle")
+    with pytest.raises(ValueError):
+        UnifiedMDZ().load(str(tmp_path / "notes.txt"))
+
+
+def test_text_entries_use_the_shipped_dictionary(tmp_path, monkeypatch):
+    """Text entries are compressed with the default dictionary, recorded in the header and index"""
+    dictionary = mdz_dictionary.default_dictionary()
+    sizes = {}
+    for use_dictionary in (True, False):
+        bundle = UnifiedMDZ(use_dictionary=use_dictionary)
+        bundle.create_from_markdown("# Diagrams\n\n```mermaid\ngraph TD\n```\n", {"title": "Diagrams"})
+        bundle.add_file("manifest.json", '{"version": "1.0", "main": "index.md"}')
+        for index in range(10):
+            bundle.add_file(f"mermaid/diagram_{index}.mmd", f"graph TD\n    A{index} --> B{index}\n")
+            bundle.add_file(f"images/icon_{index}.png", os.urandom(500))
+        path = str(tmp_path / f"{use_dictionary}.mdz")
+        bundle.save(path)
+        sizes[use_dictionary] = os.path.getsize(path)
+
+    assert sizes[True] < sizes[False]
+    assert sniff_format(str(tmp_path / "True.mdz")).dictionary_id == dictionary.dict_id()
+    assert sniff_format(str(tmp_path / "False.mdz")).dictionary_id == 0
+
+    # Text entries never share a frame with binary ones
+    reader = IndexedMDZReader(str(tmp_path / "True.mdz"))
+    assert reader.dictionary_id == dictionary.dict_id()
+    for path in reader.names():
+        entry = reader.get_entry(path)
+        if entry["frame"] is not None:
+            assert ("dictionary" in reader.frames[entry["frame"]]) == path.endswith((".md", ".yaml", ".json", ".mmd"))
+    reader.close()
+
+    loaded = UnifiedMDZ()
+    loaded.load(str(tmp_path / "True.mdz"))
+    assert loaded.content["mermaid/diagram_7.mmd"] == "graph TD\n    A7 --> B7\n"
+    assert get_mdz_info(str(tmp_path / "True.mdz"), loaded)["dictionary_id"] == dictionary.dict_id()
+
+    # Bundles written with a dictionary this version does not ship cannot be read
+    monkeypatch.setattr(mdz_dictionary, '_dictionaries', {})
+    with pytest.raises(ValueError):
+        UnifiedMDZ().load(str(tmp_path / "True.mdz"))
+
+
+def test_compression_choices_are_recorded(tmp_path):
+    """Compressed files are stored as they are, the chosen level and threads are kept in the index"""
+    photo = os.urandom(100 * 1024)
+    writer = IndexedMDZWriter(AUTO_LEVEL, threads=2)
+    writer.add_bytes("index.md", "# Media\n" * 1000)
+    writer.add_bytes("images/photo.jpg", photo)
+    writer.add_bytes("images/icon.png", b"icon")
+    writer.add_bytes("data/samples.bin", bytes(9 * 1024 * 1024))
+    writer.write(str(tmp_path / "media.mdz"))
+
+    reader = IndexedMDZReader(str(tmp_path / "media.mdz"))
+    assert reader.compression == {"level": choose_level(8000 + 9 * 1024 * 1024, 1.0, 2), "auto": True,
+                                  "threads": 2, "time_budget": 1.0}
+    stored = reader.get_entry("images/photo.jpg")
+    assert reader.is_stored(stored["frame"]) and reader.frames[stored["frame"]]["length"] == len(photo)
+    assert reader.frames[reader.get_entry("data/samples.bin")["frame"]]["threads"] == 2
+    assert not reader.is_stored(reader.get_entry("index.md")["frame"])
+    with reader.open("images/photo.jpg") as f:
+        f.seek(1000)
+        assert f.read(10) == photo[1000:1010]
+    assert reader.read("images/icon.png") == b"icon"
+    reader.close()
+
+    bundle = UnifiedMDZ(compression_level="auto")
+    bundle.load(str(tmp_path / "media.mdz"))
+    info = get_mdz_info(str(tmp_path / "media.mdz"), bundle)
+    assert info["stored_file_count"] == 2
+    assert info["compression_settings"]["auto"]
+
+    bundle.save(str(tmp_path / "copy.mdz"))
+    assert IndexedMDZReader(str(tmp_path / "copy.mdz")).compression["auto"]
+
+
+def test_saving_rewrites_only_changed_files(tmp_path, monkeypatch):
+    """Saves append the changed files, unchanged ones keep their frames until the bundle is compacted"""
+    talk = os.urandom(4 * 1024 * 1024)
+    bundle = UnifiedMDZ()
+    bundle.create_from_markdown("# Talk\n")
+    bundle.add_file("media/talk.wav", talk)
+    bundle.add_file("images/logo.png", b"logo")
+    bundle.save(str(tmp_path / "talk.mdz"))
+    size = os.path.getsize(tmp_path / "talk.mdz")
+    reader = IndexedMDZReader(str(tmp_path / "talk.mdz"))
+    offset = reader.frames[reader.get_entry("media/talk.wav")["frame"]]["offset"]
+    reader.close()
+
+    written = []
+    original = IndexedMDZWriter._write_frames
+    monkeypatch.setattr(IndexedMDZWriter, '_write_frames', lambda self, sink, entries, *args: written.append(
+        [entry.name for entry in entries if not entry.is_dir]) or original(self, sink, entries, *args))
+
+    # A text edit appends one frame and an index, assigning the same content changes nothing
+    bundle.add_file("index.md", "# Talk\n\nWith notes\n")
+    bundle.add_file("images/logo.png", b"logo")
+    bundle.save(str(tmp_path / "talk.mdz"))
+    assert written == [["index.md"]]
+    assert size < os.path.getsize(tmp_path / "talk.mdz") < size + 4096
+    reader = IndexedMDZReader(str(tmp_path / "talk.mdz"))
+    assert reader.frames[reader.get_entry("media/talk.wav")["frame"]]["offset"] == offset
+    reader.close()
+
+    reloaded = UnifiedMDZ()
+    reloaded.load(str(tmp_path / "talk.mdz"))
+    assert reloaded.content["index.md"] == "# Talk\n\nWith notes\n"
+    assert reloaded.content["media/talk.wav"] == talk
+
+    # Saving elsewhere copies the frames without compressing anything
+    reloaded.save(str(tmp_path / "copy.mdz"))
+    assert written[-1] == []
+    assert os.path.getsize(tmp_path / "copy.mdz") < os.path.getsize(tmp_path / "talk.mdz")
+
+    # Once most of the file is unused it is written anew
+    reloaded.save(str(tmp_path / "talk.mdz"))
+    del reloaded.content["media/talk.wav"]
+    reloaded.save(str(tmp_path / "talk.mdz"))
+    assert os.path.getsize(tmp_path / "talk.mdz") < 64 * 1024
+    final = UnifiedMDZ()
+    final.load(str(tmp_path / "talk.mdz"))
+    assert sorted(final.get_file_list()) == ["images/logo.png", "index.md", "metadata.yaml"]
+
+
+@pytest.mark.parametrize("damage", ["padded", "truncated"])
+def test_interrupted_save_is_recovered(tmp_path, damage):
+    """Bytes left by an interrupted append are ignored, and overwritten by the next save"""
+    bundle = UnifiedMDZ()
+    bundle.create_from_markdown("# Draft\n")
+    bundle.add_file("images/photo.jpg", os.urandom(200 * 1024))
+    path = str(tmp_path / "draft.mdz")
+    bundle.save(path)
+    size = os.path.getsize(path)
+
+    if damage == "padded":
+        # The save stopped after writing part of a frame
+        with open(path, "ab") as f:
+            f.write(os.urandom(504))
+    else:
+        # The save wrote its index but stopped within the footer
+        bundle.add_file("index.md", "# Draft\n\nSecond version\n")
+        bundle.save(path)
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 10)
+
+    with IndexedMDZReader(path) as reader:
+        assert reader.end == size
+    reloaded = UnifiedMDZ()
+    reloaded.load(path)
+    assert reloaded.content["index.md"] == "# Draft\n"
+
+    reloaded.add_file("index.md", "# Draft\n\nThird version\n")
+    reloaded.save(path)
+    with IndexedMDZReader(path) as reader:
+        assert reader.end == os.path.getsize(path)
+        assert reader.read("index.md") == b"# Draft\n\nThird version\n"
+
+    # Garbage is still not an index
+    with open(tmp_path / "junk.mdz", "wb") as f:
+        f.write(os.urandom(1000) + b"MDZIDX02")
+    with pytest.raises(ValueError):
+        IndexedMDZReader(str(tmp_path / "junk.mdz"))
+
+
+def test_appends_keep_the_bundle_compression_settings(tmp_path):
+    """The level chosen for the whole bundle is kept when a save appends a few bytes"""
+    bundle = UnifiedMDZ(compression_level="auto")
+    bundle.create_from_markdown("# Data\n")
+    bundle.add_file("data/samples.bin", bytes(9 * 1024 * 1024))
+    path = str(tmp_path / "data.mdz")
+    bundle.save(path)
+    with IndexedMDZReader(path) as reader:
+        settings = reader.compression
+    assert settings["level"] == choose_level(9 * 1024 * 1024, 1.0, settings["threads"])
+
+    bundle.add_file("index.md", "# Data\n\nEdited\n")
+    bundle.save(path)
+    with IndexedMDZReader(path) as reader:
+        assert reader.compression == settings
+        assert reader.read("index.md") == b"# Data\n\nEdited\n"
+
+    # A bundle saved with another level chooses its settings again
+    fixed = UnifiedMDZ(compression_level=5)
+    fixed.load(path)
+    fixed.add_file("index.md", "# Data\n\nFixed\n")
+    fixed.save(path)
+    with IndexedMDZReader(path) as reader:
+        assert reader.compression["level"] == 5 and not reader.compression["auto"]
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for saving MDZ bundles from the editor
+"""
+
+import os
+
+import pytest
+
+from unified_mdz import UnifiedMDZ
+
+
+class FakeEditor:
+    def __init__(self, text):
+        self.text = text
+
+    def toPlainText(self):
+        return self.text
+
+
+class FakeWindow:
+    def __init__(self, text):
+        self.markdown_editor = FakeEditor(text)
+        self.current_file = None
+        self.dialog_paths = {}
+
+    def setWindowTitle(self, title):
+        pass
+
+
+def make_integration(text):
+    pytest.importorskip("PyQt6")
+    from mdz_integration import MDZIntegration
+
+    # The menus and dialogs of the application are not needed to save
+    integration = MDZIntegration.__new__(MDZIntegration)
+    integration.main_window = FakeWindow(text)
+    integration.current_mdz_bundle = None
+    integration.mdz_renderer = None
+    return integration
+
+
+def test_saving_in_place_drops_unreferenced_images(tmp_path, monkeypatch):
+    """Images removed from the document are removed from the bundle, the others are kept"""
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("images")
+    for name in ("logo.png", "chart.png"):
+        with open(os.path.join("images", name), "wb") as f:
+            f.write(os.urandom(2000))
+
+    integration = make_integration("# Report\n\n![Logo](images/logo.png)\n\n![Chart](images/chart.png)\n")
+    assert integration.save_mdz_file("report.mdz")
+
+    integration.main_window.markdown_editor.text = "# Report\n\n![Logo](images/logo.png)\n"
+    assert integration.save_mdz_file("report.mdz")
+
+    saved = UnifiedMDZ()
+    saved.load("report.mdz")
+    assert "images/logo.png" in saved.content
+    assert "images/chart.png" not in saved.content
+    assert saved.content["index.md"] == "# Report\n\n![Logo](images/logo.png)\n"
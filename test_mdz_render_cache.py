@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the render cache of MDZ bundles
+"""
+
+import pytest
+
+from mdz_renderer import MDZRenderer
+from mdz_render_cache import RenderCache, KIND_MERMAID, KIND_HTML
+from unified_mdz import UnifiedMDZ, get_mdz_info
+
+DOCUMENT = "---\ntitle: Flow\n---\n# Flow\n\n```mermaid\ngraph TD\n  A-->B\n```\n\nText\n"
+
+
+def fake_mermaid(calls):
+    def render_mermaid_to_svg(self, mermaid_code):
+        calls.append(mermaid_code)
+        return f"<svg><!-- {mermaid_code} --></svg>"
+    return render_mermaid_to_svg
+
+
+def test_cached_artifacts_are_used_without_rendering(tmp_path, monkeypatch):
+    """A saved bundle shows its diagrams without mermaid-cli and without converting again"""
+    calls = []
+    monkeypatch.setattr(MDZRenderer, "render_mermaid_to_svg", fake_mermaid(calls))
+    bundle = UnifiedMDZ()
+    bundle.create_from_markdown(DOCUMENT)
+    html = bundle.render()
+    assert calls == ["graph TD\n  A-->B"]
+    assert "<svg><!--" in html
+    bundle.save(str(tmp_path / "flow.mdz"))
+
+    # No mermaid-cli on this machine
+    monkeypatch.setattr(MDZRenderer, "render_mermaid_to_svg", lambda self, code: None)
+    monkeypatch.setattr(MDZRenderer, "preprocess_mermaid", lambda *args: pytest.fail("converted again"))
+    loaded = UnifiedMDZ()
+    loaded.load(str(tmp_path / "flow.mdz"))
+    assert loaded.render() == html
+    assert get_mdz_info(str(tmp_path / "flow.mdz"), loaded)["cached_artifacts"] == {KIND_MERMAID: 1, KIND_HTML: 1}
+
+
+def test_changes_miss_the_cache(monkeypatch):
+    """Other sources, options or renderer versions are rendered, and prune drops what is unused"""
+    calls = []
+    monkeypatch.setattr(MDZRenderer, "render_mermaid_to_svg", fake_mermaid(calls))
+    bundle = UnifiedMDZ()
+    bundle.create_from_markdown(DOCUMENT)
+    bundle.render()
+
+    cache = RenderCache(bundle.content)
+    assert cache.get(KIND_MERMAID, "graph TD\n  A-->B") is not None
+    assert cache.get(KIND_HTML, "# Flow") is None
+    assert RenderCache(bundle.content, version="0").get(KIND_MERMAID, "graph TD\n  A-->B") is None
+
+    bundle.create_from_markdown(DOCUMENT.replace("A-->B", "A-->C"))
+    bundle.render(prune=True)
+    assert calls == ["graph TD\n  A-->B", "graph TD\n  A-->C"]
+    assert RenderCache(bundle.content).artifacts() == {KIND_MERMAID: 1, KIND_HTML: 1}
+
+
+def test_math_is_taken_from_the_cache(monkeypatch):
+    """Cached math is not sent to KaTeX again, even when the HTML has to be rendered"""
+    from content_processors.katex_renderer import get_katex_service
+    if not get_katex_service().is_available():
+        pytest.skip("Node.js or bundled KaTeX not available")
+
+    content = {}
+    html = MDZRenderer(prerender_math=True, cache=RenderCache(content)).render_to_html("Inline $x^2$ and $y$.")
+
+    renderer = MDZRenderer(prerender_math=True, cache=RenderCache(content))
+    monkeypatch.setattr(renderer.katex_service, "render_batch", lambda expressions: pytest.fail("rendered again"))
+    assert renderer.render_to_html("Inline $x^2$ and $y$.", theme="dark") != html
+    assert 'class="katex"' in renderer.render_to_html("Inline $x^2$ and $y$.")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming MDZ writer
+"""
+
+import io
+import hashlib
+import tarfile
+import zipfile
+
+import zstandard as zstd
+
+from mdz_bundle import MDZBundle
+from mdz_stream import MDZStreamWriter, MDZContainer, HEADER, METHOD_SECURE
+from unified_mdz import UnifiedMDZ, CompressionMethod
+
+
+def make_writer(tmp_path, container, checksum_dictionary=False):
+    source = tmp_path / "image.bin"
+    source.write_bytes(bytes(range(256)) * 1000)
+
+    # A small chunk size makes every entry span several chunks
+    writer = MDZStreamWriter(3, container, checksum_dictionary, chunk_size=4096)
+    writer.add_directory("images")
+    writer.add_path("images/image.bin", str(source))
+    writer.add_bytes("index.md", "# Überschrift\n" * 500)
+    writer.add_bytes("notes/" + "n" * 120 + ".md", b"")
+    return writer, source.read_bytes()
+
+
+def test_tar_round_trip(tmp_path):
+    """Tar bundles declare their size and hold every entry with its digest"""
+    writer, image = make_writer(tmp_path, MDZContainer.TAR)
+    output = tmp_path / "bundle.mdz"
+    digests = writer.write(str(output))
+
+    data = output.read_bytes()[HEADER.size:]
+    assert zstd.frame_content_size(data) > 0
+    with tarfile.open(fileobj=io.BytesIO(zstd.ZstdDecompressor().decompress(data))) as tar:
+        assert tar.getmember("images").isdir()
+        assert tar.extractfile("images/image.bin").read() == image
+        assert tar.extractfile("notes/" + "n" * 120 + ".md").read() == b""
+    assert digests["images/image.bin"] == hashlib.sha256(image).hexdigest()
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_zip_round_trip_with_checksum_dictionary(tmp_path):
+    """Zip bundles are written through the stream, compressed with their checksum"""
+    writer, image = make_writer(tmp_path, MDZContainer.ZIP, checksum_dictionary=True)
+    sink = io.BytesIO()
+    digests = writer.write_to(sink)
+    assert HEADER.unpack_from(sink.getvalue())[2] == METHOD_SECURE
+    data = sink.getvalue()[HEADER.size:]
+
+    raw = zstd.ZstdDecompressor().decompress(data)
+    with zipfile.ZipFile(io.BytesIO(raw)) as archive:
+        assert archive.testzip() is None
+        assert archive.read("images/image.bin") == image
+        assert archive.read("index.md").decode("utf-8") == "# Überschrift\n" * 500
+
+    # The same dictionary decompresses it
+    dictionary = zstd.ZstdCompressionDict(hashlib.sha256(raw).hexdigest().encode())
+    assert zstd.ZstdDecompressor(dict_data=dictionary).decompress(data) == raw
+    assert digests["index.md"] == hashlib.sha256(("# Überschrift\n" * 500).encode("utf-8")).hexdigest()
+
+
+def test_bundles_load_what_they_saved(tmp_path):
+    """Both bundle classes read back the bundles they stream out"""
+    bundle = MDZBundle()
+    bundle.create_from_markdown("# Title\n\nText")
+    bundle.content["images/"] = {}
+    bundle.content["images/logo.png"] = b"\x89PNG\r\n"
+    bundle.save(str(tmp_path / "bundle.mdz"))
+
+    loaded = MDZBundle()
+    loaded.load(str(tmp_path / "bundle.mdz"))
+    assert loaded.content["images/logo.png"] == b"\x89PNG\r\n"
+    assert "images/" in loaded.content
+
+    for method in (CompressionMethod.STANDARD, CompressionMethod.SECURE):
+        unified = UnifiedMDZ(compression_method=method)
+        unified.content = {"index.md": "# Title\n", "data/notes.txt": "a,b\n1,2\n"}
+        path = str(tmp_path / f"{method}.mdz")
+        unified.save(path)
+
+        loaded = UnifiedMDZ(compression_method=method)
+        loaded.load(path)
+        assert loaded.content["data/notes.txt"] == "a,b\n1,2\n"
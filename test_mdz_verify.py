@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for per-entry MDZ integrity verification
+"""
+
+import os
+
+import pytest
+
+from mdz_container import IndexedMDZReader
+from mdz_stream import MDZStreamWriter, MDZContainer, DIGEST_MANIFEST
+from mdz_verify import verify_bundle, verify_bundles
+from unified_mdz import UnifiedMDZ, CompressionMethod
+
+
+def save_bundle(tmp_path, name, method=CompressionMethod.STANDARD, format_version=2):
+    bundle = UnifiedMDZ(compression_method=method, format_version=format_version)
+    bundle.content["index.md"] = "# Report\n" * 200
+    bundle.content["images/photo.bin"] = os.urandom(200 * 1024)
+    bundle.content["data/table.csv"] = "a,b\n1,2\n" * 1000
+    path = str(tmp_path / name)
+    bundle.save(path)
+    return path
+
+
+def corrupt(path, position):
+    data = bytearray(open(path, "rb").read())
+    data[position] ^= 0xFF
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+@pytest.mark.parametrize("method", [CompressionMethod.STANDARD, CompressionMethod.SECURE])
+def test_every_entry_is_verified(tmp_path, method):
+    """Indexed and secure bundles record a digest for every file"""
+    path = save_bundle(tmp_path, "bundle.mdz", method, 2 if method == CompressionMethod.STANDARD else 1)
+    report = verify_bundle(path, workers=4)
+    assert report["ok"]
+    assert report["checked"] == 4
+    assert report["bytes"] > 200 * 1024
+    assert not report["unverified"]
+
+    # Partial checks only hash the files asked for
+    report = verify_bundle(path, ["index.md", "missing.md"])
+    assert report["checked"] == 1
+    assert report["missing"] == ["missing.md"]
+    assert not report["ok"]
+
+    # The digest manifest is not part of the content
+    loaded = UnifiedMDZ(compression_method=method)
+    loaded.load(path)
+    assert DIGEST_MANIFEST not in loaded.content
+
+
+def test_damage_is_reported_per_entry(tmp_path):
+    """A damaged frame fails the files in it and leaves the others intact"""
+    path = save_bundle(tmp_path, "bundle.mdz")
+    with IndexedMDZReader(path) as reader:
+        frame = reader.frames[reader.get_entry("images/photo.bin")["frame"]]
+    corrupt(path, frame["offset"] + frame["length"] // 2)
+
+    report = verify_bundle(path)
+    assert report["failed"] == ["images/photo.bin"]
+    assert verify_bundle(path, ["index.md"])["ok"]
+
+
+def test_batch_reports_throughput(tmp_path):
+    """Batches verify tar bundles with a manifest and report their totals"""
+    writer = MDZStreamWriter(3, MDZContainer.TAR, digest_manifest=True)
+    writer.add_directory("notes")
+    writer.add_bytes("notes/" + "ü" * 60 + ".md", "x" * 5000)
+    writer.add_bytes("index.md", "# Notes\n")
+    writer.write(str(tmp_path / "tar.mdz"))
+    legacy = save_bundle(tmp_path, "legacy.mdz", format_version=1)
+
+    result = verify_bundles([str(tmp_path / "tar.mdz"), save_bundle(tmp_path, "indexed.mdz"), legacy])
+    assert result["ok"]
+    assert result["checked"] == 6
+    assert result["throughput"] > 0
+    assert len(result["bundles"][2]["unverified"]) == 4
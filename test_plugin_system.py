@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for manifest-based lazy plugin loading
+"""
+
+import os
+import sys
+import json
+
+import plugin_system
+from plugin_system import PluginSystem, parse_manifest
+from content_processors.processor_registry import ProcessorRegistry
+
+PLUGIN_SOURCE = '''
+from content_processors.base_processor import ContentProcessor
+from content_processors.block_lexer import FencedBlockRule
+
+PLUGIN_MANIFEST = {'languages': ['shout']}
+
+
+class ShoutFenceProcessor(ContentProcessor):
+    def detect(self, content):
+        return self.detect_with_patterns(content)
+
+    def get_rules(self):
+        return [FencedBlockRule('shout', ['shout'])]
+
+    def build_metadata(self, block_type, match):
+        return {'code': match.group(2)}
+
+    def process_for_preview(self, content, metadata):
+        return metadata['code'].upper()
+
+    def process_for_export(self, content, metadata, format_type):
+        return metadata['code'].upper()
+
+
+def register_plugin(plugin_system):
+    plugin_system.register_processor(ShoutFenceProcessor, priority=1)
+'''
+
+EAGER_SOURCE = '''
+def register_plugin(plugin_system):
+    pass
+'''
+
+
+def make_plugin_system(monkeypatch, tmp_path):
+    """Create a plugin system and registry separate from the shared singletons"""
+    monkeypatch.setattr(ProcessorRegistry, '_instance', None)
+    monkeypatch.setattr(PluginSystem, '_instance', None)
+    monkeypatch.setattr(plugin_system, 'PLUGIN_CACHE_PATH', str(tmp_path / 'cache' / 'plugin_cache.json'))
+    monkeypatch.delitem(sys.modules, 'shout_plugin', raising=False)
+    monkeypatch.delitem(sys.modules, 'eager_plugin', raising=False)
+
+    directory = tmp_path / 'plugins'
+    if not directory.exists():
+        directory.mkdir()
+        (directory / 'shout_plugin.py').write_text(PLUGIN_SOURCE)
+        (directory / 'eager_plugin.py').write_text(EAGER_SOURCE)
+
+    plugins = PluginSystem()
+    plugins.register_plugin_directory(str(directory))
+    return plugins
+
+
+def test_manifest_is_read_without_import(tmp_path):
+    """The manifest is parsed from the source, module code does not run"""
+    path = tmp_path / 'plugin.py'
+    path.write_text("raise SystemExit('imported')\nPLUGIN_MANIFEST = {'languages': ['Dot'], 'patterns': [r'<dot>']}\n")
+    assert parse_manifest(str(path)) == {'languages': ['dot'], 'patterns': ['<dot>']}
+
+    path.write_text("PLUGIN_MANIFEST = {'patterns': ['(']}\n")
+    assert parse_manifest(str(path)) is None
+    path.write_text("PLUGIN_MANIFEST = make_manifest()\n")
+    assert parse_manifest(str(path)) is None
+
+
+def test_plugin_is_imported_on_first_use(monkeypatch, tmp_path):
+    """Plugins with a manifest load with the first document that needs them"""
+    plugins = make_plugin_system(monkeypatch, tmp_path)
+    plugins.discover_plugins()
+    registry = plugins.get_registry()
+
+    assert 'shout_plugin' not in sys.modules
+    assert plugins.get_plugin('eager_plugin')['module'] is not None
+    assert plugins.get_plugin('shout_plugin')['module'] is None
+
+    assert registry.process_content("```python\nshout\n```\n") == "```python\nshout\n```\n"
+    assert 'shout_plugin' not in sys.modules
+
+    assert registry.process_content("Intro\n\n```shout\nhello\n```\n") == "Intro\n\nHELLO\n"
+    plugin = plugins.get_plugin('shout_plugin')
+    assert plugin['module'] is sys.modules['shout_plugin']
+    assert plugin['load_time'] > 0
+
+    # Streams load plugins for the segments that follow
+    monkeypatch.delitem(sys.modules, 'shout_plugin')
+    plugins = make_plugin_system(monkeypatch, tmp_path)
+    plugins.discover_plugins()
+    chunks = ["text\n\n", "```shout\nhi\n```\n"]
+    assert ''.join(plugins.get_registry().process_stream(chunks, segment_size=1)) == "text\n\nHI\n"
+
+
+def test_manifests_are_cached_by_mtime(monkeypatch, tmp_path):
+    """Unchanged plugin files are not parsed again"""
+    plugins = make_plugin_system(monkeypatch, tmp_path)
+    plugins.discover_plugins()
+    with open(plugin_system.PLUGIN_CACHE_PATH, encoding='utf-8') as f:
+        cache = json.load(f)
+    assert {entry['manifest'] and entry['manifest']['languages'][0] for entry in cache.values()} == {'shout', None}
+
+    parsed = []
+    monkeypatch.setattr(plugin_system, 'parse_manifest', lambda path: parsed.append(path))
+    plugins = make_plugin_system(monkeypatch, tmp_path)
+    plugins.discover_plugins()
+    assert parsed == []
+    assert plugins.get_plugin('shout_plugin')['manifest'] == {'languages': ['shout'], 'patterns': []}
+
+    path = tmp_path / 'plugins' / 'shout_plugin.py'
+    os.utime(path, ns=(1, 1))
+    plugins = make_plugin_system(monkeypatch, tmp_path)
+    plugins.discover_plugins()
+    assert parsed == [str(path)]
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Tests for the single-pass scanner of the processor registry
+"""
+
+import os
+import re
+import threading
+
+from content_processors.processor_registry import ProcessorRegistry
+from content_processors.base_processor import ContentProcessor, CostClass
+from content_processors.enhanced_element_processor import EnhancedElementProcessor
+from content_processors.math_processor import MathContentProcessor
+from content_processors.code_processor import CodeBlockProcessor
+from content_processors.visualization_processor import VisualizationProcessor
+from content_processors.image_processor import ImageContentProcessor
+from content_processors.block_cache import BlockCache
+from content_processors import dependency_probe
+
+registry = ProcessorRegistry()
+
+
+class ShoutProcessor(ContentProcessor):
+    """Processor without patterns, scanned with detect()"""
+
+    def detect(self, content):
+        start = content.find('SHOUT')
+        return [(start, start + 5, {})] if start >= 0 else []
+
+    def process_for_preview(self, content, metadata):
+        return content.lower()
+
+    def process_for_export(self, content, metadata, format_type):
+        return content.lower()
+
+
+class CostProcessor(ContentProcessor):
+    """Processor for [[cost:text]] markers that reports where each block ran"""
+
+    def detect(self, content):
+        return self.detect_with_patterns(content)
+
+    def get_patterns(self):
+        return [('marker', r'\[\[(\w+):(\w+)\]\]', 0)]
+
+    def build_metadata(self, block_type, match):
+        return {'cost': match.group(1), 'text': match.group(2)}
+
+    def get_cost_class(self, metadata, format_type):
+        return {'heavy': CostClass.HEAVY_CPU, 'slow': CostClass.SUBPROCESS}.get(metadata['cost'], CostClass.CHEAP)
+
+    def process_for_preview(self, content, metadata):
+        if metadata['text'] == 'fail':
+            raise ValueError("broken block")
+        where = 'main' if threading.current_thread() is threading.main_thread() else 'thread'
+        return f"{metadata['text']}@{os.getpid()}/{where}"
+
+    def process_for_export(self, content, metadata, format_type):
+        return self.process_for_preview(content, metadata)
+
+
+def make_processors():
+    """Processors in registry priority order"""
+    return [
+        EnhancedElementProcessor(),
+        MathContentProcessor(),
+        CodeBlockProcessor(),
+        VisualizationProcessor({'rasterize_charts': False}),
+        ShoutProcessor()
+    ]
+
+
+def owners(blocks):
+    return [(block['processor'].name, block['metadata'].get('type') or block['metadata'].get('language')) for block in blocks]
+
+
+def test_blocks_do_not_overlap():
+    """Math inside code and chart fences inside the code pattern are claimed once"""
+    content = (
+        "Price $a$ here.\n\n"
+        "```python\ncost = '$5 and $6'\n```\n\n"
+        "```plotly\n{\"data\": []}\n```\n\n"
+        "| A | B |\n|---|---|\n| $x$ | 2 |\n"
+    )
+    blocks = registry.scan_content(content, make_processors())
+
+    assert owners(blocks) == [
+        ('MathContentProcessor', 'inline'),
+        ('CodeBlockProcessor', 'python'),
+        ('VisualizationProcessor', 'plotly'),
+        ('EnhancedElementProcessor', 'table'),
+    ]
+    for previous, block in zip(blocks, blocks[1:]):
+        assert previous['end'] <= block['start']
+
+
+def test_declined_match_falls_through_to_lower_priority():
+    """A chart fence declined by the code processor goes to the visualization processor"""
+    content = "```chartjs\n{\"type\": \"bar\"}\n```\n"
+    processors = [CodeBlockProcessor(), VisualizationProcessor({'rasterize_charts': False})]
+    blocks = registry.scan_content(content, processors)
+    assert owners(blocks) == [('VisualizationProcessor', 'chartjs')]
+
+
+def test_detect_only_processors_fill_gaps():
+    """Processors without patterns keep blocks that do not overlap others"""
+    content = "SHOUT then\n```text\nSHOUT\n```"
+    processors = [CodeBlockProcessor(), ShoutProcessor()]
+    blocks = registry.scan_content(content, processors)
+    assert owners(blocks) == [('ShoutProcessor', None), ('CodeBlockProcessor', 'text')]
+
+    # ShoutProcessor.detect() only reports the first occurrence
+    blocks = registry.scan_content("```text\nSHOUT\n```", processors)
+    assert owners(blocks) == [('CodeBlockProcessor', 'text')]
+
+
+class EveryShoutProcessor(ShoutProcessor):
+    """Reports every occurrence of SHOUT"""
+
+    def detect(self, content):
+        return [(match.start(), match.end(), {}) for match in re.finditer('SHOUT', content)]
+
+
+def test_detected_spans_fill_gaps_in_order():
+    """Spans are checked against their neighbouring blocks and inserted in position"""
+    content = "SHOUT\n```text\nSHOUT\n```\n" * 200 + "SHOUT"
+    blocks = registry.scan_content(content, [CodeBlockProcessor(), EveryShoutProcessor()])
+    assert owners(blocks) == [('EveryShoutProcessor', None), ('CodeBlockProcessor', 'text')] * 200 + [
+        ('EveryShoutProcessor', None)]
+    assert [block['start'] for block in blocks] == sorted(block['start'] for block in blocks)
+
+
+def test_detect_matches_patterns():
+    """detect() reports the same metadata the scanner builds"""
+    processor = MathContentProcessor()
+    assert processor.detect("$a$ and $$b$$") == [
+        (0, 3, {'code': 'a', 'type': 'inline'}),
+        (8, 13, {'code': 'b', 'type': 'display'}),
+    ]
+
+
+def test_enhanced_elements_are_processed_by_type(monkeypatch):
+    """Each block is handled by its type, math and diagrams outside it are left alone"""
+    monkeypatch.setattr(EnhancedElementProcessor, 'plantuml_path', None)
+    processor = EnhancedElementProcessor()
+    content = "```plantuml\nA -> B\n```"
+    block = processor.detect(content)[0][2]
+    assert 'PlantUML not available' in processor.process_for_preview(content, block)
+    assert processor.process_for_export(content, block, 'pdf') == content
+
+    # A table block converts the math of its cells, and nothing else
+    table = "| A | B |\n|---|---|\n| $x$ | ```mermaid |\n"
+    output = processor.process_for_preview(table, processor.detect(table)[0][2])
+    assert '\\(x\\)' in output and '```mermaid' in output
+    assert processor.process_for_preview("$y$", {}) == "$y$"
+
+
+def make_registry(monkeypatch):
+    """Create a registry separate from the shared singleton"""
+    monkeypatch.setattr(ProcessorRegistry, '_instance', None)
+    fresh = ProcessorRegistry()
+    fresh.register_processor(CodeBlockProcessor, priority=10)
+    fresh.register_processor(EnhancedElementProcessor, priority=5)
+    return fresh
+
+
+def test_processors_are_pooled_and_reconfigured(monkeypatch):
+    """The registry hands out the same instances and reconfigures them in place"""
+    pooled = make_registry(monkeypatch)
+    processors = pooled.get_all_processors()
+    assert [processor.name for processor in processors] == ['EnhancedElementProcessor', 'CodeBlockProcessor']
+    assert pooled.get_all_processors() == processors
+
+    pooled.configure({'skip_languages': ['text']})
+    code_processor = pooled.get_processor('CodeBlockProcessor')
+    assert code_processor is processors[1]
+    assert code_processor.skip_languages == ['text']
+    assert registry.scan_content("```text\nx\n```", [code_processor]) == []
+
+    assert pooled.get_all_processors({'highlighter': 'highlight.js'})[1] is code_processor
+    assert code_processor.highlighter == 'highlight.js'
+    assert code_processor.skip_languages == ['mermaid', 'plotly', 'chartjs', 'csv', 'plantuml']
+
+
+def test_dependencies_are_probed_lazily_once(monkeypatch):
+    """Constructing processors runs no subprocess, and each tool is probed once"""
+    calls = []
+    monkeypatch.setattr(dependency_probe, '_run_version', lambda cmd, pattern=None: calls.append(cmd))
+    monkeypatch.setattr(dependency_probe, 'which', lambda name: '/usr/bin/' + name)
+    monkeypatch.setattr(dependency_probe.os.path, 'isfile', lambda path: True)
+    dependency_probe.clear_probe_cache()
+
+    try:
+        processor = EnhancedElementProcessor()
+        assert calls == []
+        assert processor._temp_dir is None
+
+        assert processor.mmdc_path is None
+        probed = len(calls)
+        assert probed > 0
+        assert EnhancedElementProcessor().mmdc_path is None
+        assert len(calls) == probed
+    finally:
+        dependency_probe.clear_probe_cache()
+
+
+def test_shutdown_cleans_up_instances(monkeypatch):
+    """Temporary directories are created on use and removed on shutdown"""
+    pooled = make_registry(monkeypatch)
+    processor = pooled.get_processor('EnhancedElementProcessor')
+    temp_dir = processor.temp_dir
+    assert os.path.isdir(temp_dir)
+
+    pooled.shutdown()
+    assert not os.path.exists(temp_dir)
+    assert pooled.get_processor('EnhancedElementProcessor') is not processor
+
+
+def test_block_output_is_memoized(monkeypatch):
+    """Unchanged blocks are served from the cache until their configuration or files change"""
+    pooled = make_registry(monkeypatch)
+    pooled.register_processor(ImageContentProcessor, priority=20)
+    content = "```python\nx = 1\n```\n\n![Logo](logo.png)\n"
+
+    first = pooled.process_content(content, 'html')
+    assert pooled.get_cache_stats()['misses'] == 2
+
+    calls = []
+    code_processor = pooled.get_processor('CodeBlockProcessor')
+    monkeypatch.setattr(code_processor, 'process_for_export', lambda *args: calls.append(args) or 'code')
+    assert pooled.process_content(content, 'html') == first
+    assert calls == []
+    assert pooled.get_cache_stats()['hits'] == 2
+
+    # A different format or configuration is processed again
+    pooled.process_content(content, 'docx')
+    assert len(calls) == 1
+    pooled.configure({'highlight_theme': 'monokai'})
+    pooled.process_content(content, 'html')
+    assert len(calls) == 2
+
+
+def test_file_dependencies_invalidate_cache(monkeypatch, tmp_path):
+    """Blocks that reference local files are reprocessed when the files change"""
+    image = tmp_path / "figure.svg"
+    image.write_text('<svg xmlns="http://www.w3.org/2000/svg"></svg>')
+    pooled = make_registry(monkeypatch)
+    pooled.register_processor(ImageContentProcessor, priority=20)
+    processor = pooled.get_processor('ImageContentProcessor')
+    assert processor.get_file_dependencies({'src': 'https://example.com/a.png'}) == []
+
+    content = f"![Figure]({image})"
+    pooled.process_content(content, 'preview')
+    pooled.process_content(content, 'preview')
+    assert pooled.get_cache_stats()['hits'] == 1
+
+    os.utime(image, ns=(1, 1))
+    pooled.process_content(content, 'preview')
+    assert pooled.get_cache_stats()['hits'] == 1
+
+    assert pooled.invalidate_cache(path=str(image)) == 1
+    assert pooled.get_cache_stats()['entries'] == 0
+
+
+def test_block_cache_is_bounded():
+    """The least recently used blocks are evicted first"""
+    cache = BlockCache(max_entries=2, max_chars=10)
+    cache.put(('a', '1', 'html', ''), 'aaaa')
+    cache.put(('b', '2', 'html', ''), 'bbbb')
+    assert cache.get(('a', '1', 'html', '')) == 'aaaa'
+
+    cache.put(('c', '3', 'html', ''), 'cccc')
+    assert cache.get(('b', '2', 'html', '')) is None
+    assert cache.get_stats()['entries'] == 2
+
+    cache.put(('d', '4', 'html', ''), 'dddddddd')
+    assert cache.get_stats() == {'entries': 1, 'size': 8, 'hits': 1, 'misses': 1}
+
+
+def test_blocks_are_dispatched_by_cost(monkeypatch):
+    """Heavy blocks run in worker processes and subprocess blocks in threads, in document order"""
+    pooled = make_registry(monkeypatch)
+    pooled.register_processor(CostProcessor, priority=1)
+    monkeypatch.setattr(pooled, 'MAX_PROCESS_WORKERS', 2)
+
+    try:
+        output = pooled.process_content("[[cheap:a]] [[heavy:b]] [[slow:c]] [[heavy:d]] [[slow:fail]] [[cheap:e]]")
+    finally:
+        pooled.shutdown()
+
+    pid = os.getpid()
+    parts = output.split(' ')
+    assert parts[0] == f"a@{pid}/main"
+    assert parts[1].startswith("b@") and not parts[1].startswith(f"b@{pid}/")
+    assert parts[2] == f"c@{pid}/thread"
+    assert parts[3].startswith("d@") and not parts[3].startswith(f"d@{pid}/")
+    assert parts[4] == "[[slow:fail]]"
+    assert parts[5] == f"e@{pid}/main"
+
+    # Failed blocks are not cached
+    assert pooled.get_cache_stats()['entries'] == 5
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming document processing
+"""
+
+import sys
+import random
+import logging
+import tracemalloc
+
+from content_processors.processor_registry import ProcessorRegistry
+from content_processors.stream_splitter import split_stream
+from content_processors.math_processor import MathContentProcessor
+from content_processors.code_processor import CodeBlockProcessor
+from content_processors.image_processor import ImageContentProcessor
+from content_processors.enhanced_element_processor import EnhancedElementProcessor
+from render_utils import RenderUtils
+from logging_config import get_logger
+
+DOCUMENT = """# Report
+
+Intro with $x^2$ inline.
+
+```python
+def f():
+
+    return 1
+```
+
+$$
+a
+
+b
+$$
+
+<svg width="10">
+
+<rect/>
+</svg>
+
+| A | B |
+|---|---|
+| 1 | 2 |
+
+~~~
+``` not a closing fence
+
+~~~
+
+Closing paragraph.
+"""
+
+
+def random_chunks(text, seed):
+    """Cut text at random positions"""
+    rng = random.Random(seed)
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 40)
+        yield text[position:position + size]
+        position += size
+
+
+def make_registry(monkeypatch):
+    """Create a registry separate from the shared singleton"""
+    monkeypatch.setattr(ProcessorRegistry, '_instance', None)
+    registry = ProcessorRegistry()
+    registry.register_processor(EnhancedElementProcessor, priority=5)
+    registry.register_processor(MathContentProcessor, priority=20)
+    registry.register_processor(ImageContentProcessor, priority=30)
+    registry.register_processor(CodeBlockProcessor, priority=40)
+    return registry
+
+
+def test_segments_end_on_block_boundaries():
+    """Blank lines inside fences, display math and SVG never end a segment"""
+    delimiters = [('$$', '$$'), ('<svg', '</svg>')]
+    for seed in range(20):
+        segments = list(split_stream(random_chunks(DOCUMENT, seed), delimiters, segment_size=1))
+        assert ''.join(segments) == DOCUMENT
+        assert segments[0] == "# Report\n\n"
+        assert "```python\ndef f():\n\n    return 1\n```\n\n" in segments
+        assert "$$\na\n\nb\n$$\n\n" in segments
+        assert '<svg width="10">\n\n<rect/>\n</svg>\n\n' in segments
+        assert "~~~\n``` not a closing fence\n\n~~~\n\n" in segments
+
+
+def test_stray_openings_do_not_hold_back_segments():
+    """An unmatched $$, a tag name in prose or an opening inside a fence only delays the next boundary"""
+    delimiters = [('$$', '$$'), ('<svg', '</svg>'), ('<video', '</video>')]
+    paragraph = "Some text about nothing in particular.\n\n"
+    for stray in ("It costs $$ a lot.\n\n", "Use <svgs or <videos here.\n\n", "$$\n```\n$$ in code\n```\n\n"):
+        document = paragraph * 5 + stray + paragraph * 100
+        segments = list(split_stream(document, delimiters, segment_size=200, max_block_size=1000))
+        assert ''.join(segments) == document
+        assert max(len(segment) for segment in segments) < 1400, stray
+
+    # Blocks open and close on the same line as the lexer pairs them
+    segments = list(split_stream("$$a$$ and $$\nb\n\n$$\n\nc\n", delimiters, segment_size=1))
+    assert segments == ["$$a$$ and $$\nb\n\n$$\n\n", "c\n"]
+
+
+def test_stream_matches_whole_document(monkeypatch):
+    """Processing a stream gives the same output as processing the whole document"""
+    registry = make_registry(monkeypatch)
+    expected = registry.process_content(DOCUMENT, 'html')
+    for seed in range(5):
+        streamed = ''.join(registry.process_stream(random_chunks(DOCUMENT, seed), 'html', segment_size=1))
+        assert streamed == expected
+
+
+def test_stream_memory_is_bounded(monkeypatch, caplog):
+    """Peak memory depends on the segment size, not on the document size"""
+    # Captured debug records would be counted as well
+    caplog.set_level(logging.INFO, logger=get_logger().name)
+    registry = make_registry(monkeypatch)
+    section = "Some $a_{i}$ text.\n\n```python\nprint('x')\n```\n\n| A | B |\n|---|---|\n| 1 | 2 |\n\n"
+
+    # Load lexers and compile patterns before measuring
+    ''.join(registry.process_stream(section, 'html'))
+
+    def measure(sections):
+        chunks = (section.replace('{i}', str(index)) for index in range(sections))
+        total = 0
+        tracemalloc.start()
+        try:
+            for piece in registry.process_stream(chunks, 'html', segment_size=16 * 1024):
+                total += len(piece)
+            return total, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    small_total, small_peak = measure(2000)
+    large_total, large_peak = measure(16000)
+
+    assert large_total > 8 * small_total
+    assert large_peak < 1.5 * small_peak
+    assert large_peak < large_total / 4
+    assert registry.get_cache_stats()['entries'] == 0
+
+
+def test_process_input_is_streamed():
+    """Chunks are piped to the process as they are produced"""
+    script = "import sys; data = sys.stdin.buffer.read(); print(len(data), data.count(b'x'))"
+    chunks = ('x' * 1000 + '\n' for _ in range(5000))
+    stdout, stderr, error, returncode = RenderUtils.run_process_with_input_stream([sys.executable, '-c', script], chunks)
+    assert error is None
+    assert returncode == 0
+    assert stdout.split() == ['5005000', '5000000']
+
+
+def test_process_failure_is_reported():
+    """A process that exits early does not hang the writer"""
+    chunks = ('x' * 65536 for _ in range(100))
+    stdout, stderr, error, returncode = RenderUtils.run_process_with_input_stream(
+        [sys.executable, '-c', "import sys; sys.exit('bad input')"], chunks
+    )
+    assert returncode == 1
+    assert 'bad input' in stderr
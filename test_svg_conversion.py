@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for the SVG conversion cache used by LaTeX and DOCX exports
+"""
+
+import os
+import threading
+
+from content_processors.svg_converter import SVGConverter
+from content_processors.image_processor import ImageContentProcessor
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"><rect width="10" height="10"/></svg>'
+
+
+def make_converter(tmp_path, calls):
+    """Converter with a fake backend that records which threads converted what"""
+    converter = SVGConverter(cache_dir=str(tmp_path), max_workers=4)
+    converter._backends = {'rsvg-convert': 'rsvg-convert'}
+
+    def run_backend(backend, svg_content, output_path, image_format, dpi):
+        calls.append((svg_content, image_format, dpi, threading.get_ident()))
+        with open(output_path, 'wb') as f:
+            f.write(image_format.encode('ascii'))
+
+    converter._run_backend = run_backend
+    return converter
+
+
+def test_conversions_are_cached_by_content_and_dpi(tmp_path):
+    """Each SVG is converted once per format and DPI"""
+    calls = []
+    converter = make_converter(tmp_path, calls)
+    svgs = [SVG.replace('10', str(size)) for size in range(20, 28)]
+
+    converted = converter.convert_batch(svgs + svgs, 'pdf', 300)
+    assert len(calls) == len(svgs)
+    assert all(path and path.endswith('-300.pdf') and os.path.isfile(path) for path in converted.values())
+
+    converter.convert_batch(svgs, 'pdf', 300)
+    assert len(calls) == len(svgs)
+
+    converter.convert(svgs[0], 'png', 150)
+    assert len(calls) == len(svgs) + 1
+
+
+def test_target_formats(tmp_path):
+    """LaTeX gets PDF, DOCX gets PNG unless EMF can be produced"""
+    converter = make_converter(tmp_path, [])
+    assert converter.get_target_format('latex') == 'pdf'
+    assert converter.get_target_format('docx', 'emf') == 'png'
+    assert converter.get_target_format('html') is None
+
+    converter._backends = {'inkscape': 'inkscape'}
+    assert converter.get_target_format('docx', 'emf') == 'emf'
+
+
+def test_image_processor_embeds_converted_svg(tmp_path):
+    """Inline SVG is replaced by the converted file in LaTeX and DOCX exports"""
+    calls = []
+    processor = ImageContentProcessor()
+    processor.svg_converter = make_converter(tmp_path, calls)
+
+    blocks = [metadata for _, _, metadata in processor.detect(f"Before\n{SVG}\nAfter")]
+    processor.prepare_blocks(blocks, 'pdf')
+    exported = processor.process_for_export(SVG, blocks[0], 'pdf')
+    assert exported.strip().startswith('![](') and exported.strip().endswith('.pdf)')
+
+    exported = processor.process_for_export(SVG, blocks[0], 'docx')
+    assert exported.strip().endswith('.png)')
+    assert len(calls) == 2
+
+
+def test_image_processor_without_converter(tmp_path):
+    """Without a backend the export keeps the previous behavior"""
+    processor = ImageContentProcessor()
+    processor.svg_converter = SVGConverter(cache_dir=str(tmp_path))
+    processor.svg_converter._backends = {}
+
+    metadata = {'type': 'svg', 'content': SVG}
+    assert processor.process_for_export(SVG, metadata, 'latex') == f"\n\n{SVG}\n\n"
+    assert processor.process_for_export(SVG, metadata, 'docx') == "\n\n[SVG Image]\n\n"
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for server-side syntax highlighting
+"""
+
+import pytest
+
+from content_processors.code_processor import CodeBlockProcessor
+from content_processors.syntax_highlighter import SyntaxHighlighter, PYGMENTS_AVAILABLE
+
+requires_pygments = pytest.mark.skipif(not PYGMENTS_AVAILABLE, reason="Pygments not installed")
+
+
+@requires_pygments
+def test_preview_is_highlighted_without_scripts():
+    """Code blocks are tokenized in-process and need no client-side scripts"""
+    processor = CodeBlockProcessor()
+    processed = processor.process_for_preview("", {'language': 'python', 'code': 'def f(x):\n    return x < 1'})
+
+    assert processed.startswith('<div class="highlight"><pre><code class="language-python">')
+    assert '<span class="k">def</span>' in processed
+    assert '&lt;' in processed
+    assert processor.get_required_scripts() == []
+    assert '.highlight' in processor.get_required_styles()[0]
+
+
+@requires_pygments
+def test_unknown_language_falls_back_to_plain_block():
+    """Unknown languages are escaped and emitted unhighlighted"""
+    processor = CodeBlockProcessor()
+    processed = processor.process_for_preview("", {'language': 'no-such-lang', 'code': 'a < b'})
+    assert processed == '<pre><code class="language-no-such-lang">a &lt; b</code></pre>'
+
+
+@requires_pygments
+def test_cache_and_incremental_chunks():
+    """Long listings are formatted chunk by chunk and chunks are cached"""
+    highlighter = SyntaxHighlighter(chunk_lines=10)
+    code = '\n'.join(f'value_{i} = {i}' for i in range(35))
+
+    first = highlighter.highlight_html(code, 'python')
+    assert len(highlighter._cache) == 5
+    assert not first.endswith('\n')
+
+    # Changing one line only adds one new chunk (and the new listing) to the cache
+    edited = code.replace('value_3 = 3', 'value_3 = 33')
+    second = highlighter.highlight_html(edited, 'python')
+    assert len(highlighter._cache) == 7
+    assert '33' in second
+    assert second.count('\n') == first.count('\n')
+
+
+@requires_pygments
+def test_strings_spanning_chunks_keep_their_state():
+    """Chunks are cut from one token stream, not lexed from scratch"""
+    code = 'x = """\n' + 'not = code\n' * 12 + '"""\ny = 1\n'
+    chunked = SyntaxHighlighter(chunk_lines=5).highlight_html(code, 'python')
+    assert chunked == SyntaxHighlighter().highlight_html(code, 'python')
+    assert '<span class="n">not</span>' not in chunked
+
+
+def test_export_keeps_fenced_block_for_pandoc():
+    """PDF export keeps a fenced block and pandoc gets a highlight style"""
+    processor = CodeBlockProcessor({'highlight_theme': 'monokai'})
+    exported = processor.process_for_export("", {'language': 'python', 'code': 'x = 1'}, 'pdf')
+    assert exported == '```python\nx = 1\n```'
+
+    args = processor.get_pandoc_args()
+    assert args[0] == '--highlight-style'
+    if PYGMENTS_AVAILABLE:
+        assert args[1] == 'breezedark'
+
+
+def test_export_command_gets_highlight_style(monkeypatch):
+    """Streamed exports pass the code processor's highlight style to pandoc"""
+    from content_processing_integration import ContentProcessingIntegration
+    from render_utils import RenderUtils
+
+    commands = []
+    monkeypatch.setattr(RenderUtils, 'run_process_with_input_stream',
+                        lambda command, chunks, timeout=600: commands.append(command) or ('', '', None, 0))
+    integration = ContentProcessingIntegration()
+    assert integration.export_stream(['```python\nx = 1\n```\n'], 'pdf', 'out.pdf', ['--highlight-style', 'kate'])
+
+    command = commands[0]
+    assert command.count('--highlight-style') == 2
+    # Arguments given by the caller come last, so they win
+    assert command[-2:] == ['--highlight-style', 'kate']
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared web profile's resource scheme
+"""
+
+import os
+
+import web_profile
+import mermaid_local_fallback
+
+
+def test_resolve_resource_stays_inside_roots():
+    """Only files inside the resource roots are served"""
+    path = web_profile.resolve_resource('/resources/katex_worker.js')
+    assert path == os.path.realpath(os.path.join(web_profile.APP_DIR, 'resources', 'katex_worker.js'))
+
+    assert web_profile.resolve_resource('/resources/../main.py') is None
+    assert web_profile.resolve_resource('/unknown/katex_worker.js') is None
+    assert web_profile.resolve_resource('/resources/missing.js') is None
+
+
+def test_resource_urls_round_trip(monkeypatch):
+    """Vendor files map to stable mdzres:// URLs once the scheme is registered"""
+    path = os.path.join(web_profile.APP_DIR, 'resources', 'katex_worker.js')
+
+    monkeypatch.setattr(web_profile, '_scheme_registered', False)
+    assert web_profile.get_resource_url(path) is None
+
+    monkeypatch.setattr(web_profile, '_scheme_registered', True)
+    url = web_profile.get_resource_url(path)
+    assert url == 'mdzres://app/resources/katex_worker.js'
+    assert web_profile.resolve_resource(url[len('mdzres://app'):]) == os.path.realpath(path)
+    assert web_profile.get_vendor_url('resources/missing.js', 'resources/katex_worker.js') == url
+
+
+def test_mermaid_lookup_is_resolved_once(monkeypatch):
+    """find_mermaid_js scans the filesystem only on the first call"""
+    mermaid_local_fallback.clear_mermaid_cache()
+    first = mermaid_local_fallback.find_mermaid_js()
+
+    def fail(*args):
+        raise AssertionError("filesystem scanned again")
+
+    monkeypatch.setattr(mermaid_local_fallback.os.path, 'exists', fail)
+    assert mermaid_local_fallback.find_mermaid_js() == first
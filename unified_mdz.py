@@ -27,6 +27,11 @@ try:
 except ImportError:
     raise ImportError("Zstandard library not found. Please install it with 'pip install zstandard'")
 
+from mdz_stream import MDZStreamWriter, AUTO_LEVEL, compression_level_arg, MDZContainer, CHUNK_SIZE, DIGEST_MANIFEST
+from mdz_dictionary import default_dictionary
+from mdz_container import FORMAT_VERSION, IndexedMDZReader, LazyContent, save_indexed, sniff_format
+from mdz_render_cache import RenderCache
+
 # Configure logger
 logger = logging.getLogger(__name__)
 
@@ -49,16 +54,23 @@ class UnifiedMDZ:
         "additional_assets/": {}  # Directory for any additional files
     }
 
-    def __init__(self, compression_level: int = 3, compression_method: str = CompressionMethod.STANDARD):
+    def __init__(self, compression_level: Union[int, str] = 3, compression_method: str = CompressionMethod.STANDARD,
+                 format_version: int = FORMAT_VERSION, use_dictionary: bool = True):
         """
         Initialize a new MDZ bundle
 
         Args:
-            compression_level: Zstandard compression level (1-22, default: 3)
+            compression_level: Zstandard compression level (1-22, default: 3), or "auto"
+                to choose one from the bundle size
             compression_method: Compression method to use (standard or secure)
+            format_version: Format of standard bundles, 2 (indexed, default) or 1 (single tar frame, readable by older versions)
+            use_dictionary: Compress the text entries of version 2 bundles with the shipped dictionary
         """
-        self.compression_level = min(max(1, compression_level), 22)  # Ensure valid compression level
+        # Ensure valid compression level
+        self.compression_level = compression_level if compression_level == AUTO_LEVEL else min(max(1, compression_level), 22)
         self.compression_method = compression_method
+        self.format_version = format_version
+        self.use_dictionary = use_dictionary
         self.content = {}
         self.temp_dir = None
         self.main_content = ""
@@ -156,6 +168,48 @@ class UnifiedMDZ:
 
         return content_without_front_matter, front_matter
 
+    def render(self, math_engine: str = "mathjax", prerender_math: bool = False, prune: bool = False) -> str:
+        """
+        Render the main document to HTML through the render cache of the bundle
+
+        Diagrams, math and the HTML itself are taken from the cache/ section
+        when it holds them for this renderer version, and rendered and added
+        to it otherwise, so saving the bundle afterwards ships them along.
+
+        Args:
+            math_engine: Math rendering engine ('mathjax' or 'katex')
+            prerender_math: Pre-render math with the bundled KaTeX
+            prune: Remove cached artifacts this rendering did not use, such as
+                those of edited diagrams
+
+        Returns:
+            HTML document
+        """
+        from mdz_renderer import MDZRenderer
+
+        cache = RenderCache(self.content)
+        renderer = MDZRenderer(math_engine=math_engine, prerender_math=prerender_math, cache=cache)
+
+        markdown_content = self.content.get("index.md") or ""
+        if isinstance(markdown_content, bytes):
+            markdown_content = markdown_content.decode('utf-8')
+        markdown_without_front_matter, front_matter = renderer.extract_front_matter(markdown_content)
+        mermaid_diagrams = renderer.extract_and_render_mermaid(markdown_without_front_matter)
+
+        html_content = renderer.render_to_html(
+            markdown_without_front_matter,
+            front_matter=front_matter,
+            mermaid_diagrams=mermaid_diagrams,
+            toc=front_matter.get("toc", False),
+            numbering=front_matter.get("numbering", False),
+            theme=front_matter.get("theme", "default")
+        )
+
+        if prune:
+            cache.prune()
+        logger.debug(f"Rendered bundle with {cache.hits} cached and {cache.misses} new artifacts")
+        return html_content
+
     def save(self, output_path: str) -> None:
         """
         Save the MDZ bundle to a file
@@ -170,52 +224,24 @@ class UnifiedMDZ:
 
     def _save_standard(self, output_path: str) -> None:
         """
-        Save using the standard (tar-based) method
+        Save using the standard method, as indexed frames (version 2) or as
+        a single tar frame (version 1)
 
         Args:
             output_path: Path to save the MDZ bundle
         """
         try:
-            # Create a temporary directory
-            temp_dir = tempfile.mkdtemp(prefix="mdz_save_")
-
-            # Write all files to the temporary directory
-            for path, content in self.content.items():
-                if isinstance(content, dict):  # Directory
-                    # Create the directory
-                    dir_path = os.path.join(temp_dir, path)
-                    os.makedirs(dir_path, exist_ok=True)
-                else:  # File
-                    # Create parent directories if they don't exist
-                    file_path = os.path.join(temp_dir, path)
-                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-                    # Write the file content
-                    mode = 'wb' if isinstance(content, bytes) else 'w'
-                    with open(file_path, mode) as f:
-                        f.write(content)
-
-            # Create a tar file in memory
-            tar_data = io.BytesIO()
-            with tarfile.open(fileobj=tar_data, mode='w') as tar:
-                # Add all files from the temporary directory
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, temp_dir)
-                        tar.add(file_path, arcname=arcname)
-
-            # Compress the tar data with Zstandard
-            tar_data.seek(0)
-            compressor = zstd.ZstdCompressor(level=self.compression_level)
-            compressed_data = compressor.compress(tar_data.getvalue())
-
-            # Write the compressed data to the output file
-            with open(output_path, 'wb') as f:
-                f.write(compressed_data)
-
-            # Clean up the temporary directory
-            shutil.rmtree(temp_dir)
+            # Stream the content into the compressed output file
+            if self.format_version >= 2:
+                # Only changed files are compressed, and the content is then read from the saved file
+                dictionary = default_dictionary() if self.use_dictionary else None
+                self.content = LazyContent(save_indexed(self.content, output_path, self.compression_level, dictionary))
+            else:
+                self._materialize_content()
+                # Version 1 files stay headerless, so older versions can read them
+                writer = MDZStreamWriter(self.compression_level, header=False)
+                writer.add_content(self.content)
+                writer.write(output_path)
 
             logger.info(f"Saved MDZ bundle to {output_path} (compression level: {self.compression_level}, method: standard)")
         except Exception as e:
@@ -230,86 +256,58 @@ class UnifiedMDZ:
             output_path: Path to save the MDZ bundle
         """
         try:
-            # Create a temporary directory
-            temp_dir = tempfile.mkdtemp(prefix="mdz_save_")
-
-            # Write all files to the temporary directory
-            for path, content in self.content.items():
-                if isinstance(content, dict):  # Directory
-                    # Create the directory
-                    dir_path = os.path.join(temp_dir, path)
-                    os.makedirs(dir_path, exist_ok=True)
-                else:  # File
-                    # Create parent directories if they don't exist
-                    file_path = os.path.join(temp_dir, path)
-                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-                    # Write the file content
-                    mode = 'wb' if isinstance(content, bytes) else 'w'
-                    with open(file_path, mode) as f:
-                        f.write(content)
-
-            # Create a temporary zip file
-            temp_bundle = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-
-            # Create a zip file with all the content
-            with zipfile.ZipFile(temp_bundle.name, "w") as zipf:
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, temp_dir)
-                        zipf.write(file_path, arcname=arcname)
-
-            # Read the zip file
-            with open(temp_bundle.name, "rb") as f:
-                file_data = f.read()
-
-            # Calculate the checksum to use as the password
-            checksum = hashlib.sha256(file_data).hexdigest()
-
-            # Compress the zip file with Zstandard using the checksum as the password
-            compressor = zstd.ZstdCompressor(level=self.compression_level, dict_data=zstd.ZstdCompressionDict(checksum.encode()))
-            compressed_data = compressor.compress(file_data)
-
-            # Write the compressed data to the output file
-            with open(output_path, "wb") as f:
-                f.write(compressed_data)
-
-            # Clean up temporary files
-            os.unlink(temp_bundle.name)
-            shutil.rmtree(temp_dir)
+            # Stream the content through zip into the compressed output file, the
+            # checksum of the zip archive is used as the password
+            self._materialize_content()
+            writer = MDZStreamWriter(self.compression_level, MDZContainer.ZIP, checksum_dictionary=True, digest_manifest=True)
+            writer.add_content(self.content)
+            writer.write(output_path)
 
             logger.info(f"Saved MDZ bundle to {output_path} (compression level: {self.compression_level}, method: secure)")
         except Exception as e:
             logger.error(f"Error saving MDZ bundle: {str(e)}")
             raise
 
+    def _materialize_content(self) -> None:
+        """Read all lazily loaded files into memory, before saving in a format without an index"""
+        if isinstance(self.content, LazyContent):
+            self.content = dict(self.content)
+
     def load(self, input_path: str) -> None:
         """
         Load a .mdz file
 
+        Version 2 bundles are opened lazily: only the index, the main document
+        and the metadata are read, other files are decompressed when accessed.
+
         Args:
             input_path: Path to the .mdz file
         """
+        # The header (or, for older files, the first bytes) tells the format
+        bundle_format = sniff_format(input_path)
+
+        if bundle_format.indexed:
+            self.content = LazyContent(IndexedMDZReader(input_path))
+            self.compression_method = CompressionMethod.STANDARD
+            self._process_content()
+            logger.debug(f"Opened indexed MDZ bundle {input_path}")
+            return
+
         # Read the compressed data
         with open(input_path, 'rb') as f:
+            f.seek(bundle_format.header_size)
             compressed_data = f.read()
 
-        # Try both methods to load the file
+        method = CompressionMethod.SECURE if bundle_format.secure else CompressionMethod.STANDARD
         try:
-            # First try the standard method
-            self._load_standard(compressed_data)
-            self.compression_method = CompressionMethod.STANDARD
-        except Exception as e:
-            logger.debug(f"Standard loading failed, trying secure method: {str(e)}")
-            try:
-                # If that fails, try the secure method
+            if bundle_format.secure:
                 self._load_secure(compressed_data)
-                self.compression_method = CompressionMethod.SECURE
-            except Exception as e2:
-                # If both fail, raise an error
-                logger.error(f"Error loading MDZ bundle: {str(e2)}")
-                raise ValueError(f"Could not load MDZ file with either method. Standard error: {str(e)}, Secure error: {str(e2)}")
+            else:
+                self._load_standard(compressed_data)
+            self.compression_method = method
+        except Exception as e:
+            logger.error(f"Error loading MDZ bundle: {str(e)}")
+            raise ValueError(f"Could not load MDZ file with the {method} method: {str(e)}")
 
     def _load_standard(self, compressed_data: bytes) -> None:
         """
@@ -328,6 +326,9 @@ class UnifiedMDZ:
         # Extract the tar file
         with tarfile.open(fileobj=tar_data, mode='r') as tar:
             for member in tar.getmembers():
+                if member.name == DIGEST_MANIFEST:
+                    # Only used to verify the bundle
+                    continue
                 if member.isdir():
                     # Add directory to content
                     dir_path = member.name
@@ -378,6 +379,9 @@ class UnifiedMDZ:
         # Extract the zip file
         with zipfile.ZipFile(temp_zip.name, "r") as zipf:
             for info in zipf.infolist():
+                if info.filename == DIGEST_MANIFEST:
+                    # Only used to verify the bundle
+                    continue
                 if info.filename.endswith('/'):
                     # Add directory to content
                     self.content[info.filename] = {}
@@ -439,28 +443,60 @@ class UnifiedMDZ:
         # Clear extracted paths
         self.extracted_paths = {}
 
-        # Extract all files
-        for path, content in self.content.items():
-            if isinstance(content, dict):  # Directory
+        # Extract all files, one chunk at a time
+        for path in self.content:
+            if path.endswith('/'):  # Directory
                 # Create the directory
                 dir_path = os.path.join(output_dir, path)
                 os.makedirs(dir_path, exist_ok=True)
             else:  # File
-                # Create parent directories if they don't exist
-                file_path = os.path.join(output_dir, path)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-                # Write the file content
-                mode = 'wb' if isinstance(content, bytes) else 'w'
-                with open(file_path, mode) as f:
-                    f.write(content)
-
-                # Add to extracted paths
-                self.extracted_paths[path] = file_path
+                self.extracted_paths[path] = self.extract_file(path, os.path.join(output_dir, path))
 
         logger.info(f"Extracted MDZ bundle to {output_dir}")
         return self.extracted_paths
 
+    def open_asset(self, path: str) -> BinaryIO:
+        """
+        Open a file in the bundle as a read-only binary file object
+
+        Files of indexed bundles are decompressed from the mapped bundle as
+        they are read, without loading them into memory first.
+
+        Args:
+            path: Path within the bundle
+
+        Returns:
+            Binary file object
+
+        Raises:
+            KeyError: If the bundle has no such file
+        """
+        if isinstance(self.content, LazyContent):
+            return self.content.open(path)
+
+        content = self.content.get(path)
+        if content is None or isinstance(content, dict):
+            raise KeyError(path)
+        return io.BytesIO(content.encode('utf-8') if isinstance(content, str) else content)
+
+    def extract_file(self, path: str, output_path: str) -> str:
+        """
+        Extract a single file
+
+        Args:
+            path: Path within the bundle
+            output_path: Path to write the file to
+
+        Returns:
+            The output path
+        """
+        # Create parent directories if they don't exist
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+        with self.open_asset(path) as source, open(output_path, 'wb') as f:
+            shutil.copyfileobj(source, f, CHUNK_SIZE)
+        return output_path
+
     def extract_to_temp(self) -> Dict[str, str]:
         """
         Extract all files to a temporary directory
@@ -474,11 +510,37 @@ class UnifiedMDZ:
         # Extract to the temporary directory
         return self.extract_to_directory(self.temp_dir)
 
+    def get_asset_path(self, path: str) -> Optional[str]:
+        """
+        Get the path to an extracted file, extracting only that file if needed
+
+        Args:
+            path: Path within the bundle
+
+        Returns:
+            Path to the extracted file, or None if the bundle has no such file
+        """
+        if path in self.extracted_paths:
+            return self.extracted_paths[path]
+        if path.endswith('/') or path not in self.content:
+            return None
+
+        if not self.temp_dir:
+            self.temp_dir = tempfile.mkdtemp(prefix="mdz_extract_")
+
+        # Write only this file
+        self.extracted_paths[path] = self.extract_file(path, os.path.join(self.temp_dir, path))
+        return self.extracted_paths[path]
+
     def cleanup(self) -> None:
-        """Clean up temporary files"""
+        """Clean up temporary files and unmap the bundle file"""
         if self.temp_dir and os.path.exists(self.temp_dir):
             shutil.rmtree(self.temp_dir)
             self.temp_dir = None
+            self.extracted_paths = {}
+
+        if isinstance(self.content, LazyContent):
+            self.content.reader.close()
 
     def get_file_types(self) -> Dict[str, int]:
         """
@@ -489,7 +551,7 @@ class UnifiedMDZ:
         """
         file_types = {}
         for path in self.content:
-            if isinstance(self.content[path], dict):
+            if path.endswith('/'):
                 continue  # Skip directories
 
             # Get the file extension
@@ -510,9 +572,14 @@ class UnifiedMDZ:
         """
         file_sizes = {}
         for path in self.content:
-            if isinstance(self.content[path], dict):
+            if path.endswith('/'):
                 continue  # Skip directories
 
+            # Sizes of indexed files are known without decompressing them
+            if isinstance(self.content, LazyContent):
+                file_sizes[path] = self.content.get_size(path)
+                continue
+
             # Get the file size
             content = self.content[path]
             if isinstance(content, str):
@@ -542,9 +609,9 @@ class UnifiedMDZ:
             List of file paths
         """
         if file_type:
-            return [path for path in self.content if not isinstance(self.content[path], dict) and path.lower().endswith(file_type.lower())]
+            return [path for path in self.content if not path.endswith('/') and path.lower().endswith(file_type.lower())]
         else:
-            return [path for path in self.content if not isinstance(self.content[path], dict)]
+            return [path for path in self.content if not path.endswith('/')]
 
     def get_directory_list(self) -> List[str]:
         """
@@ -553,26 +620,28 @@ class UnifiedMDZ:
         Returns:
             List of directory paths
         """
-        return [path for path in self.content if isinstance(self.content[path], dict)]
+        return [path for path in self.content if path.endswith('/')]
 
 
 # Utility functions
 
 def create_mdz_from_markdown_file(markdown_file: str, output_file: str,
-                                 compression_level: int = 3,
+                                 compression_level: Union[int, str] = 3,
                                  compression_method: str = CompressionMethod.STANDARD,
                                  include_images: bool = True,
-                                 base_dir: Optional[str] = None) -> None:
+                                 base_dir: Optional[str] = None,
+                                 prerender: bool = False) -> None:
     """
     Create an MDZ bundle from a markdown file
 
     Args:
         markdown_file: Path to the markdown file
         output_file: Path to save the MDZ bundle
-        compression_level: Zstandard compression level (1-22, default: 3)
+        compression_level: Zstandard compression level (1-22 or "auto", default: 3)
         compression_method: Compression method to use (standard or secure)
         include_images: Whether to include referenced images
         base_dir: Base directory for resolving relative paths (defaults to markdown file's directory)
+        prerender: Whether to include the rendered diagrams, math and HTML in the cache/ section
     """
     # Determine base directory
     if base_dir is None:
@@ -618,6 +687,10 @@ def create_mdz_from_markdown_file(markdown_file: str, output_file: str,
                 except Exception as e:
                     logger.warning(f"Error adding image {image_ref}: {str(e)}")
 
+    # Render the document so readers can take the artifacts from the bundle
+    if prerender:
+        bundle.render(prune=True)
+
     # Save the bundle
     bundle.save(output_file)
 
@@ -659,12 +732,13 @@ def extract_mdz_to_markdown(mdz_file: str, output_file: str, extract_assets: boo
     return bundle.get_metadata()
 
 
-def get_mdz_info(mdz_file: str) -> Dict:
+def get_mdz_info(mdz_file: str, bundle: Optional[UnifiedMDZ] = None) -> Dict:
     """
     Get information about an MDZ file
 
     Args:
         mdz_file: Path to the MDZ file
+        bundle: The file, already loaded (loaded from mdz_file if None)
 
     Returns:
         Dictionary with MDZ file information
@@ -672,11 +746,12 @@ def get_mdz_info(mdz_file: str) -> Dict:
     # Get the file size
     file_size = os.path.getsize(mdz_file)
 
-    # Create a new MDZ bundle
-    bundle = UnifiedMDZ()
+    if bundle is None:
+        # Create a new MDZ bundle
+        bundle = UnifiedMDZ()
 
-    # Load the MDZ bundle
-    bundle.load(mdz_file)
+        # Load the MDZ bundle
+        bundle.load(mdz_file)
 
     # Get file information
     file_types = bundle.get_file_types()
@@ -689,10 +764,22 @@ def get_mdz_info(mdz_file: str) -> Dict:
     # Get metadata
     metadata = bundle.get_metadata()
 
+    # Count the files stored without compression, only indexed bundles have any
+    stored_file_count = 0
+    if isinstance(bundle.content, LazyContent):
+        reader = bundle.content.reader
+        stored_file_count = sum(1 for entry in reader.entries.values()
+                                if entry["frame"] is not None and reader.is_stored(entry["frame"]))
+
     # Return the information
     return {
         'file_size': file_size,
         'compression_method': bundle.compression_method,
+        'format_version': 2 if isinstance(bundle.content, LazyContent) else 1,
+        'dictionary_id': bundle.content.reader.dictionary_id if isinstance(bundle.content, LazyContent) else None,
+        'compression_settings': bundle.content.reader.compression if isinstance(bundle.content, LazyContent) else {},
+        'stored_file_count': stored_file_count,
+        'cached_artifacts': RenderCache(bundle.content).artifacts(),
         'file_types': file_types,
         'file_count': len(bundle.get_file_list()),
         'directory_count': len(bundle.get_directory_list()),
@@ -713,12 +800,14 @@ if __name__ == "__main__":
     create_parser = subparsers.add_parser('create', help='Create an MDZ bundle from a markdown file')
     create_parser.add_argument('markdown_file', help='Path to the markdown file')
     create_parser.add_argument('output_file', help='Path to save the MDZ bundle')
-    create_parser.add_argument('--compression', type=int, default=3,
-                              help='Zstandard compression level (1-22, default: 3)')
+    create_parser.add_argument('--compression', type=compression_level_arg, default=3,
+                              help='Zstandard compression level (1-22 or auto, default: 3)')
     create_parser.add_argument('--method', choices=['standard', 'secure'], default='standard',
                               help='Compression method to use (standard or secure, default: standard)')
     create_parser.add_argument('--no-images', action='store_true',
                               help='Do not include referenced images')
+    create_parser.add_argument('--prerender', action='store_true',
+                              help='Include the rendered diagrams, math and HTML in the bundle')
 
     # Extract command
     extract_parser = subparsers.add_parser('extract', help='Extract an MDZ bundle to a markdown file')
@@ -744,7 +833,8 @@ if __name__ == "__main__":
             args.output_file,
             compression_level=args.compression,
             compression_method=args.method,
-            include_images=not args.no_images
+            include_images=not args.no_images,
+            prerender=args.prerender
         )
     elif args.command == 'extract':
         extract_mdz_to_markdown(
@@ -759,6 +849,16 @@ if __name__ == "__main__":
         print(f"MDZ File: {args.mdz_file}")
         print(f"File Size: {info['file_size']} bytes")
         print(f"Compression Method: {info['compression_method']}")
+        print(f"Format Version: {info['format_version']}")
+        if info['dictionary_id']:
+            print(f"Text Dictionary: {info['dictionary_id']}")
+        settings = info['compression_settings']
+        if settings:
+            print(f"Compression Level: {settings['level']}{' (auto)' if settings['auto'] else ''}, "
+                  f"{settings['threads'] or 1} thread(s) for large frames")
+        print(f"Stored Without Compression: {info['stored_file_count']} files")
+        if info['cached_artifacts']:
+            print("Rendered Artifacts: " + ", ".join(f"{count} {kind}" for kind, count in sorted(info['cached_artifacts'].items())))
         print(f"Compression Ratio: {info['compression_ratio']:.2f}x")
         print(f"Total Uncompressed Size: {info['total_uncompressed_size']} bytes")
         print(f"File Count: {info['file_count']}")
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Shared Web Profile
+------------------
+A persistent QWebEngineProfile shared by every preview page.
+
+Vendor scripts (mermaid, MathJax, KaTeX, chart libraries) are served from
+the local resources through the mdzres:// URL scheme with long cache
+lifetimes. Because the profile keeps its HTTP cache on disk and the URLs are
+stable across reloads, Chromium can reuse V8's compiled code cache on the
+second and later preview loads instead of re-parsing the scripts.
+
+register_resource_scheme() must be called before the QApplication is
+created.
+"""
+
+import os
+import time
+import mimetypes
+import threading
+from typing import Dict, List, Optional
+from logging_config import get_logger
+
+logger = get_logger()
+
+try:
+    from PyQt6.QtCore import QBuffer, QByteArray, QIODevice
+    from PyQt6.QtWebEngineCore import (
+        QWebEngineProfile, QWebEnginePage, QWebEngineUrlScheme,
+        QWebEngineUrlSchemeHandler, QWebEngineUrlRequestJob
+    )
+    WEBENGINE_AVAILABLE = True
+except ImportError:
+    WEBENGINE_AVAILABLE = False
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEME_NAME = "mdzres"
+BASE_URL = f"{SCHEME_NAME}://app/"
+PROFILE_NAME = "markdown2pdf-preview"
+PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".mdz", "web_profile")
+HTTP_CACHE_SIZE = 256 * 1024 * 1024
+
+# Directories served under mdzres://app/<prefix>/...
+RESOURCE_ROOTS = {
+    "resources": os.path.join(APP_DIR, "resources"),
+    "katex": os.path.join(APP_DIR, "node_modules", "katex", "dist"),
+    "mermaid": os.path.join(APP_DIR, "node_modules", "mermaid", "dist"),
+}
+
+# Vendor files never change for a given URL, so they can be cached for a year
+CACHE_CONTROL = b"public, max-age=31536000, immutable"
+
+_scheme_registered = False
+_profile = None
+_scheme_handler = None
+_load_stats = []
+
+
+def register_resource_scheme() -> bool:
+    """
+    Register the mdzres:// scheme with QtWebEngine
+
+    Must be called before the QApplication is created.
+
+    Returns:
+        True if the scheme is registered, False otherwise
+    """
+    global _scheme_registered
+    if _scheme_registered:
+        return True
+    if not WEBENGINE_AVAILABLE:
+        return False
+
+    try:
+        scheme = QWebEngineUrlScheme(SCHEME_NAME.encode('ascii'))
+        scheme.setSyntax(QWebEngineUrlScheme.Syntax.Host)
+        scheme.setFlags(
+            QWebEngineUrlScheme.Flag.SecureScheme
+            | QWebEngineUrlScheme.Flag.LocalAccessAllowed
+            | QWebEngineUrlScheme.Flag.CorsEnabled
+            | QWebEngineUrlScheme.Flag.FetchApiAllowed
+        )
+        QWebEngineUrlScheme.registerScheme(scheme)
+        _scheme_registered = True
+        logger.info(f"Registered {SCHEME_NAME}:// resource scheme")
+    except Exception as e:
+        logger.warning(f"Could not register {SCHEME_NAME}:// scheme: {str(e)}")
+
+    return _scheme_registered
+
+
+def resolve_resource(url_path: str) -> Optional[str]:
+    """
+    Map a mdzres:// URL path to a local file
+
+    Args:
+        url_path: Path component of the URL, e.g. /resources/mermaid.min.js
+
+    Returns:
+        Absolute file path, or None if the path is outside the resource roots
+    """
+    prefix, _, relative = url_path.lstrip('/').partition('/')
+    root = RESOURCE_ROOTS.get(prefix)
+    if root is None or not relative:
+        return None
+
+    path = os.path.realpath(os.path.join(root, relative))
+    if not path.startswith(os.path.realpath(root) + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+
+def get_resource_url(path: str) -> Optional[str]:
+    """
+    Get the mdzres:// URL of a local vendor file
+
+    Args:
+        path: Absolute path of a file inside one of the resource roots
+
+    Returns:
+        mdzres:// URL, or None if the scheme is not registered or the file
+        is not served by it
+    """
+    if not _scheme_registered:
+        return None
+
+    path = os.path.realpath(path)
+    for prefix, root in RESOURCE_ROOTS.items():
+        root = os.path.realpath(root)
+        if path.startswith(root + os.sep):
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            return f"{BASE_URL}{prefix}/{relative}"
+    return None
+
+
+def get_vendor_url(*relative_paths: str) -> Optional[str]:
+    """
+    Get the mdzres:// URL of the first vendor file that exists
+
+    Args:
+        relative_paths: Candidate paths relative to the application directory
+
+    Returns:
+        mdzres:// URL, or None if no candidate is available locally
+    """
+    for relative_path in relative_paths:
+        path = os.path.join(APP_DIR, relative_path)
+        if os.path.isfile(path):
+            url = get_resource_url(path)
+            if url:
+                return url
+    return None
+
+
+if WEBENGINE_AVAILABLE:
+
+    class ResourceSchemeHandler(QWebEngineUrlSchemeHandler):
+        """Serves vendor files for the mdzres:// scheme from memory"""
+
+        def __init__(self, parent=None):
+            super().__init__(parent)
+            self._files = {}
+            self._lock = threading.Lock()
+
+        def requestStarted(self, job: QWebEngineUrlRequestJob):
+            """Answer a request with the file contents"""
+            path = resolve_resource(job.requestUrl().path())
+            if path is None:
+                job.fail(QWebEngineUrlRequestJob.Error.UrlNotFound)
+                return
+
+            try:
+                data = self._read(path)
+            except OSError as e:
+                logger.warning(f"Could not read {path}: {str(e)}")
+                job.fail(QWebEngineUrlRequestJob.Error.RequestFailed)
+                return
+
+            mime_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            if path.endswith(('.js', '.mjs')):
+                mime_type = 'text/javascript'
+
+            # Qt 6.6+ lets the handler send caching headers
+            if hasattr(job, 'setAdditionalResponseHeaders'):
+                job.setAdditionalResponseHeaders({QByteArray(b"Cache-Control"): QByteArray(CACHE_CONTROL)})
+
+            buffer = QBuffer(job)
+            buffer.setData(data)
+            buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+            job.reply(mime_type.encode('ascii'), buffer)
+
+        def _read(self, path: str) -> bytes:
+            """Read a file, keeping it in memory until it changes on disk"""
+            mtime = os.path.getmtime(path)
+            with self._lock:
+                cached = self._files.get(path)
+                if cached and cached[0] == mtime:
+                    return cached[1]
+
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            with self._lock:
+                self._files[path] = (mtime, data)
+            return data
+
+
+def get_shared_profile():
+    """
+    Get the persistent profile used by all preview pages
+
+    Returns:
+        QWebEngineProfile with a disk HTTP cache and the mdzres:// handler,
+        or None if QtWebEngine is not available
+    """
+    global _profile, _scheme_handler
+    if not WEBENGINE_AVAILABLE:
+        return None
+
+    if _profile is None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        _profile = QWebEngineProfile(PROFILE_NAME)
+        _profile.setPersistentStoragePath(os.path.join(PROFILE_DIR, "storage"))
+        _profile.setCachePath(os.path.join(PROFILE_DIR, "cache"))
+        _profile.setHttpCacheType(QWebEngineProfile.HttpCacheType.DiskHttpCache)
+        _profile.setHttpCacheMaximumSize(HTTP_CACHE_SIZE)
+
+        if _scheme_registered:
+            _scheme_handler = ResourceSchemeHandler(_profile)
+            _profile.installUrlSchemeHandler(SCHEME_NAME.encode('ascii'), _scheme_handler)
+        else:
+            logger.warning(f"{SCHEME_NAME}:// scheme was not registered before QApplication, vendor scripts load uncached")
+
+        logger.info(f"Created shared web profile in {PROFILE_DIR}")
+
+    return _profile
+
+
+def create_page(parent=None):
+    """
+    Create a preview page on the shared profile with load timing
+
+    Args:
+        parent: Parent QObject (usually the QWebEngineView)
+
+    Returns:
+        QWebEnginePage instance
+    """
+    profile = get_shared_profile()
+    page = QWebEnginePage(profile, parent) if profile is not None else QWebEnginePage(parent)
+    track_load_times(page)
+    return page
+
+
+# Collected after every load: time to DOMContentLoaded (which includes
+# parsing, compiling and running synchronous and deferred scripts) and the
+# time spent fetching scripts
+LOAD_TIMING_SCRIPT = """
+(function() {
+    var nav = performance.getEntriesByType('navigation')[0];
+    var scripts = performance.getEntriesByType('resource').filter(function(entry) {
+        return entry.initiatorType === 'script';
+    });
+    return {
+        domContentLoaded: nav ? nav.domContentLoadedEventEnd - nav.startTime : null,
+        scriptCount: scripts.length,
+        scriptFetch: scripts.reduce(function(total, entry) { return total + entry.duration; }, 0)
+    };
+})();
+"""
+
+
+def track_load_times(page) -> None:
+    """
+    Log how long each load of a page takes
+
+    Args:
+        page: QWebEnginePage to observe
+    """
+    state = {'started': None, 'loads': 0}
+
+    def on_started():
+        state['started'] = time.perf_counter()
+
+    def on_finished(ok):
+        if state['started'] is None:
+            return
+        elapsed = (time.perf_counter() - state['started']) * 1000
+        state['started'] = None
+        state['loads'] += 1
+        load_number = state['loads']
+
+        def on_timing(timing):
+            timing = timing or {}
+            entry = {
+                'load': load_number,
+                'ok': ok,
+                'total_ms': elapsed,
+                'dom_content_loaded_ms': timing.get('domContentLoaded'),
+                'script_count': timing.get('scriptCount', 0),
+                'script_fetch_ms': timing.get('scriptFetch', 0),
+            }
+            _load_stats.append(entry)
+            del _load_stats[:-100]
+            logger.info(
+                f"Preview load #{load_number}: {elapsed:.0f} ms total, "
+                f"DOMContentLoaded {entry['dom_content_loaded_ms'] or 0:.0f} ms, "
+                f"{entry['script_count']} scripts fetched in {entry['script_fetch_ms']:.0f} ms"
+            )
+
+        page.runJavaScript(LOAD_TIMING_SCRIPT, on_timing)
+
+    page.loadStarted.connect(on_started)
+    page.loadFinished.connect(on_finished)
+
+
+def get_load_stats() -> List[Dict]:
+    """
+    Get the timings of recent preview loads
+
+    Returns:
+        List of dictionaries, oldest first
+    """
+    return list(_load_stats)